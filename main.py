@@ -6,21 +6,58 @@ Author: Michael K. Steinberg
 Date: 25/09/2023
 """
 import argparse
-import re
+import importlib
 import sys
-from typing import List
-from src.patch.get_kbs import mapPatchKbsToDate
-from src.patch.patch_download import downloadPatches, downloadPatchesByKb
-# from patchactor import extract_patch, parse_express_psf_manifest, parse_manifests
-from src.iso.iso_extractor import extractInternalSourceFiles, extractInternalSourceFilesFromDir
-from src.iso.wim_extractor import extractFilesFromInstallWim, extractInternalSourceFilesFromWimDir
-from src.patch.delta_patch import handleExtrapolateMsu, handleExtrapolatePatch
-from src.psf.psf_extractor import extractFileFromPsf
-from src.psf.psf_manifest import parsePsfExpressManifest
-from src.sort.sort import sortBinaries, sortMsuAndCabFiles
-from src.utils.printer import printError, printInfo, printLog
-from src.utils.settings import getInterestingFiles, getInterestingFilesAsRegex, getOutputDirectory, getSettings, setAllowedToDownloadPdbsMode, setDownloadSettingsAllowDynamic, setDownloadSettingsPreferOld, setKeepTmpFilesMode, setVerboseMode
-from src.utils.utils import validateFilePath, validateFilePathDir, setOutputDirectory, validateRegex, walkFiles
+from typing import Callable, List
+from src.utils.printer import printError, printInfo, printLog, printSuccess
+from src.utils.settings import DEFAULT_EXTRAPOLATE_QUEUE_SIZE, DEFAULT_EXTRAPOLATE_WORKERS, DEFAULT_JOB_WORKERS, DEFAULT_METRICS_INTERVAL, DEFAULT_SERVICE_WORKERS, getInterestingFiles, getInterestingFilesAsRegex, getOutputDirectory, setAllowedToDownloadPdbsMode, setCatalogUrl, setArchiveCacheSize, setArchiveMode, setContentStoreLinks, setRemotePdbStore, setWinBIndexUrl, setDownloadSettingsAllowDynamic, setDownloadSettingsPreferOld, setHttpCacheDirectory, setKeepTmpFilesMode, setOfflineMode, setVerboseMode
+from src.utils.utils import validateFilePath, validateFilePathDir, setOutputDirectory, validateRegex
+
+
+def __lazy(module: str, name: str) -> Callable:
+    """
+    Returns a stand-in for `module.name` which imports the module on its first call.
+
+    Commands only import the subsystems they dispatch to, so `--help` and light commands start fast,
+    and a command does not fail on a host which lacks another command's dependencies (pywin32, msdelta).
+    """
+    function = None
+
+    def call(*args, **kwargs):
+        nonlocal function
+        if function is None:
+            function = getattr(importlib.import_module(module), name)
+        return function(*args, **kwargs)
+    return call
+
+
+printKbTimeline = __lazy('src.patch.kb_timeline', 'printKbTimeline')
+downloadPatches = __lazy('src.patch.catalog_crawler', 'downloadPatches')
+downloadPatchesByKb = __lazy('src.patch.catalog_crawler', 'downloadPatchesByKb')
+fetchWinBIndexFiles = __lazy('src.externals.winbindex', 'fetchWinBIndexFiles')
+extractInternalSourceFiles = __lazy('src.iso.iso_extractor', 'extractInternalSourceFiles')
+extractInternalSourceFilesFromDir = __lazy('src.iso.iso_extractor', 'extractInternalSourceFilesFromDir')
+extractFilesFromInstallWim = __lazy('src.iso.wim_extractor', 'extractFilesFromInstallWim')
+extractInternalSourceFilesFromWimDir = __lazy('src.iso.wim_extractor', 'extractInternalSourceFilesFromWimDir')
+handleExtrapolateMsu = __lazy('src.patch.delta_patch', 'handleExtrapolateMsu')
+handleExtrapolatePatch = __lazy('src.patch.delta_patch', 'handleExtrapolatePatch')
+ExtrapolatePipeline = __lazy('src.patch.extrapolate_pipeline', 'ExtrapolatePipeline')
+extractFileFromPsf = __lazy('src.psf.psf_extractor', 'extractFileFromPsf')
+sortBinaries = __lazy('src.sort.sort', 'sortBinaries')
+sortMsuAndCabFiles = __lazy('src.sort.sort', 'sortMsuAndCabFiles')
+publishSymbolStore = __lazy('src.symbols.publish', 'publishSymbolStore')
+downloadPdbsForDirectory = __lazy('src.symbols.symsrv', 'downloadPdbsForDirectory')
+runJobs = __lazy('src.jobs.job_runner', 'runJobs')
+serve = __lazy('src.service.server', 'serve')
+importIntoContentStore = __lazy('src.store.cas', 'importIntoContentStore')
+printContentStoreStats = __lazy('src.store.cas', 'printContentStoreStats')
+materializeArchived = __lazy('src.store.archive', 'materializeArchived')
+printArchiveStats = __lazy('src.store.archive', 'printArchiveStats')
+queryBinaryCatalog = __lazy('src.store.binary_catalog', 'queryBinaryCatalog')
+startTracing = __lazy('src.utils.trace', 'startTracing')
+stopTracing = __lazy('src.utils.trace', 'stopTracing')
+startMetricsExporter = __lazy('src.utils.metrics', 'startMetricsExporter')
+stopMetricsExporter = __lazy('src.utils.metrics', 'stopMetricsExporter')
 
 
 def parseSettingsFlags(args):
@@ -33,6 +70,20 @@ def parseSettingsFlags(args):
         printLog(f'Verbose mode is on.')
     if args.out:
         setOutputDirectory(args.out, args.accept)
+    if args.http_cache:
+        setHttpCacheDirectory(args.http_cache)
+    if args.offline:
+        setOfflineMode(args.offline)
+    if args.cas:
+        setContentStoreLinks('symlink' if args.cas_symlinks else 'hardlink')
+    if args.archive:
+        setArchiveMode(args.archive)
+    if args.archive_cache is not None:
+        setArchiveCacheSize(args.archive_cache * 1024 * 1024)
+    if args.trace:
+        startTracing()
+    if args.metrics:
+        startMetricsExporter(args.metrics, args.metrics_interval)
 
 
 __g_alias_map = {
@@ -54,25 +105,55 @@ def __makeAliases(command: str) -> List[str]:
     return __registerAliases(command, [command[0].lower(), command[0].upper(), command.upper(), command.capitalize()])
 
 
-def handleDownload(args):
-    args.download = __g_alias_map[args.download]
+def __parseDownloadOptions(args):
     if args.allow_dynamic:
         setDownloadSettingsAllowDynamic(True)
     if args.prefer_old:
         setDownloadSettingsPreferOld(True)
-    if args.download == 'patches':
+    if args.catalog_url:
+        setCatalogUrl(args.catalog_url)
+
+
+def __downloadUpdates(download: str, args, on_downloaded=None):
+    if download == 'patches':
         windows_major = args.major
         windows_minor = args.minor if (args.minor.lower() != 'none') else ''
         windows_bitness = args.bitness
         downloadPatches(windows_major, windows_minor,
-                        windows_bitness, getOutputDirectory())
-    elif args.download == 'kb':
+                        windows_bitness, getOutputDirectory(), args.refresh, on_downloaded=on_downloaded)
+    elif download == 'kb':
         if args.major:
             windows_major = args.major
-            downloadPatchesByKb(windows_major, getOutputDirectory())
+            downloadPatchesByKb(windows_major, getOutputDirectory(), refresh=args.refresh, on_downloaded=on_downloaded)
         elif args.kb_number:
             downloadPatchesByKb('', getOutputDirectory(),
-                                kb_number=args.kb_number)
+                                kb_number=args.kb_number, refresh=args.refresh, on_downloaded=on_downloaded)
+
+
+def handleDownload(args):
+    args.download = __g_alias_map[args.download]
+    # pdbs and winbindex are not parented on the download options, so they dispatch before those are parsed
+    if args.download == 'pdbs':
+        if args.symbol_server:
+            setRemotePdbStore(args.symbol_server)
+        downloadPdbsForDirectory(args.dir, args.file_name_regex, args.jobs)
+        return
+    if args.download == 'winbindex':
+        if args.winbindex_url:
+            setWinBIndexUrl(args.winbindex_url)
+        fetchWinBIndexFiles(args.file_names, args.arch, args.build, args.base_only, args.jobs)
+        return
+    __parseDownloadOptions(args)
+    __downloadUpdates(args.download, args)
+
+
+def handleFetchAndExtrapolate(args):
+    args.fetch = __g_alias_map[args.fetch]
+    if not args.fetch:
+        raise argparse.ArgumentTypeError('Please specify either "patches" or "kb"!')
+    __parseDownloadOptions(args)
+    with ExtrapolatePipeline(args, args.jobs, args.queue_size, int(args.min_scratch * 1024 * 1024 * 1024)) as pipeline:
+        __downloadUpdates(args.fetch, args, on_downloaded=pipeline.submit)
 
 
 def handleExtract(args):
@@ -114,12 +195,48 @@ def handleSort(args):
     args.sort = __g_alias_map[args.sort]
     if args.sort == 'bin':
         sortBinaries(args.dir, getOutputDirectory(),
-                     args.file_name_regex, args.cut, args.recursive)
+                     args.file_name_regex, args.cut, args.recursive, args.rescan)
     elif args.sort == 'builds':
-        mapPatchKbsToDate(args.major[0])
+        printKbTimeline(args.major[0], args.refresh)
     elif args.sort == 'msu':
         sortMsuAndCabFiles(args.dir, getOutputDirectory(),
-                           args.file_name_regex, args.cut, args.recursive)
+                           args.file_name_regex, args.cut, args.recursive, args.rescan)
+
+
+def handlePublish(args):
+    publishSymbolStore(args.dir, getOutputDirectory(), args.file_name_regex, args.cut, args.jobs)
+
+
+def handleRunJobs(args):
+    parser = __buildParser()
+    if runJobs(args.job_file, parser.parse_args, parseSettingsFlags, __dispatch, args.jobs):
+        sys.exit(1)
+
+
+def handleServe(args):
+    serve(args.host, args.port, args.socket, args.updates_dir, args.base_files_dir, args.jobs)
+
+
+def handleStore(args):
+    args.store = __g_alias_map[args.store]
+    if args.store == 'materialize':
+        materializeArchived(args.name, args.dest)
+        return
+    if args.store == 'archive-stats':
+        printArchiveStats()
+        return
+    # Managing the store implies using it
+    setContentStoreLinks('symlink' if args.cas_symlinks else 'hardlink')
+    if args.store == 'import':
+        importIntoContentStore()
+    elif args.store == 'stats':
+        printContentStoreStats()
+    else:
+        raise argparse.ArgumentTypeError('Please specify either "import", "stats", "materialize" or "archive-stats"!')
+
+
+def handleQuery(args):
+    queryBinaryCatalog(args.file_name, args.version, args.version_from, args.version_to, args.arch, args.kb, args.sha256, args.pdb, args.limit, args.json, args.scan)
 
 
 __s_command_handlers = {
@@ -127,162 +244,347 @@ __s_command_handlers = {
     'download': handleDownload,
     'extrapolate': handleExtrapolate,
     'sort': handleSort,
+    'publish': handlePublish,
+    'fetch-and-extrapolate': handleFetchAndExtrapolate,
+    'run-jobs': handleRunJobs,
+    'serve': handleServe,
+    'store': handleStore,
+    'query': handleQuery,
 }
 
 
+def __buildParser() -> argparse.ArgumentParser:
+    options_parser = argparse.ArgumentParser(add_help=False)
+    # Flags
+    verbosity_group = options_parser.add_mutually_exclusive_group()
+    verbosity_group.add_argument(
+        '-v', '--verbose', help="Verbose output", action='store_true')
+    verbosity_group.add_argument(
+        '-vl', '--verbosity', help="Verbose output", nargs=1, metavar='level')
+    options_parser.add_argument(
+        '-y', '--accept', help="Auto accept all prompts", action='store_true')
+    options_parser.add_argument(
+        '-dp', '--download-pdbs', help="Allow downloading of PDBs", action='store_true')
+    options_parser.add_argument(
+        '-k', '--keep', help="Keep temporary files", action='store_true')
+    options_parser.add_argument(
+        '--http-cache', help="Directory of the HTTP response cache", metavar='DIR')
+    options_parser.add_argument(
+        '--offline', help="Serve catalog and update history pages only from the HTTP cache", action='store_true')
+    options_parser.add_argument(
+        '--trace', help="Write a Chrome/Perfetto trace of the command's stages to FILE", metavar='FILE')
+    options_parser.add_argument(
+        '--metrics', help="Periodically write run metrics to FILE (Prometheus textfile if it ends with .prom, JSON lines otherwise)", metavar='FILE')
+    options_parser.add_argument(
+        '--metrics-interval', help=f"Seconds between metrics writes (default: {DEFAULT_METRICS_INTERVAL:g})", type=float, default=DEFAULT_METRICS_INTERVAL, metavar='SECONDS')
+    options_parser.add_argument(
+        '--cas', help="Store output binaries once by SHA256 (in .cas of the output directory) and hard link their versioned names to them", action='store_true')
+    options_parser.add_argument(
+        '--cas-symlinks', help="Link the versioned names of the content store with symbolic links instead of hard links", action='store_true')
+    options_parser.add_argument(
+        '--archive', help="Keep patched binaries as their base and forward delta (in .archive of the output directory) instead of writing them out", action='store_true')
+    options_parser.add_argument(
+        '--archive-cache', help="Size of the cache of binaries materialized from the archive (default: 1024)", type=int, metavar='MIB')
+
+    output_parser = argparse.ArgumentParser(add_help=False)
+    output_parser.add_argument(
+        '-o', '--out', help="Output directory for extracted files")
+
+    parser = argparse.ArgumentParser(
+        parents=[options_parser, output_parser])
+
+    subparsers = parser.add_subparsers(
+        title='Commands', dest='command', description='Available commands')
+
+    extract_command = subparsers.add_parser('extract', aliases=__registerAliases('extract', [
+                                            'x', 'X', 'EXTRACT', 'Extract']), allow_abbrev=True, description='Extract files from archives', help='Extracts files from complex Microsoft archives (MSU, PSF, WIM, ESD,...)', parents=[output_parser, options_parser])
+    download_command = subparsers.add_parser('download', aliases=__makeAliases(
+        'download'), allow_abbrev=True, description='Download files from Microsoft\'s servers', help='Download files from Microsoft\'s servers', parents=[output_parser, options_parser])
+    extrapolate_command = subparsers.add_parser('extrapolate', aliases=__makeAliases('extrapolate'), allow_abbrev=True, description='Extrapolate binaries with patches',
+                                                help='Combine base exe/dll files with patch files to extrapolate the patched binary', parents=[output_parser, options_parser])
+    sort_command = subparsers.add_parser('sort', aliases=__makeAliases('sort'), allow_abbrev=True, description='Sort relevant files',
+                                         help='Sorts binaries and pdbs in a scattered directory tree and renames the files correctly', parents=[output_parser, options_parser])
+
+    publish_command = subparsers.add_parser('publish', aliases=__makeAliases('publish'), allow_abbrev=True, description='Publish binaries & PDBs into a symbol store',
+                                            help='Lays out every binary and PDB in a directory into a symbol-server compatible tree (the output directory)', parents=[output_parser, options_parser])
+
+    fetch_command = subparsers.add_parser('fetch-and-extrapolate', aliases=__registerAliases('fetch-and-extrapolate', ['fetch', 'F', 'FETCH', 'Fetch']), allow_abbrev=True, description='Download updates and extrapolate them as they arrive',
+                                          help='Download updates from the catalog and extrapolate every update while the next ones are downloading', parents=[output_parser, options_parser])
+
+    run_jobs_command = subparsers.add_parser('run-jobs', aliases=__registerAliases('run-jobs', ['jobs', 'J', 'JOBS', 'Jobs']), allow_abbrev=True, description='Run a file of commands in one process',
+                                             help='Run the commands of a JSON/YAML job file in one process, independent ones in parallel', parents=[output_parser, options_parser])
+
+    serve_command = subparsers.add_parser('serve', aliases=__registerAliases('serve', ['daemon', 'SERVE', 'Serve']), allow_abbrev=True, description='Serve binaries by name, architecture and version over localhost HTTP or a Unix socket',
+                                          help='Run a service which serves binaries from the output directory, producing missing ones on demand', parents=[output_parser, options_parser])
+    store_command = subparsers.add_parser('store', aliases=__registerAliases('store', ['cas', 'STORE', 'Store']), allow_abbrev=True, description='Manage the content store of the output directory (see --cas)',
+                                          help='Manage the content-addressable store of the output directory', parents=[output_parser, options_parser])
+    query_command = subparsers.add_parser('query', aliases=__makeAliases('query'), allow_abbrev=True, description='Query the catalog of binaries produced into the output directory',
+                                          help='Look up produced binaries by name, version (range), architecture, KB, SHA256 or PDB', parents=[output_parser, options_parser])
+
+    # Extract
+    extract_type = extract_command.add_subparsers(dest='extract')
+
+    psf_group = extract_type.add_parser('psf', aliases=__registerAliases(
+        'psf', ['PSF']), description='Parse & extract PSF patch files', help='Parse & extract PSF patch files', parents=[output_parser, options_parser])
+    psf_group.add_argument('psf_file_path', help="Patch PSF binary file",
+                           type=validateFilePath, metavar='psf_file_path')
+    psf_group.add_argument('psf_xml_file_path', help="PSF XML file",
+                           type=validateFilePath, metavar='psf_xml_file_path')
+    psf_group.add_argument(
+        'file_name_regex', help='Names of files to extract as regex', type=validateRegex, nargs='?')
+
+    iso_group = extract_type.add_parser('iso', aliases=__registerAliases(
+        'iso', ['ISO']), description='Parse & extract image files', help='Parse & extract image files', parents=[output_parser, options_parser])
+    iso_args = iso_group.add_mutually_exclusive_group()
+    iso_args.add_argument('-f', '--file', help="File path for an ISO",
+                          type=validateFilePath, metavar='iso_file_path')
+    iso_args.add_argument('-d', '--dir', help="Path to a directory full of ISOs",
+                          type=validateFilePathDir, metavar='isos_directory')
+
+    wim_group = extract_type.add_parser('wim', aliases=__registerAliases(
+        'wim', ['WIM', 'esd', 'ESD']), description='Parse & extract WIM/ESD files', help='Parse & extract WIM/ESD files', parents=[output_parser, options_parser])
+    wim_args = wim_group.add_mutually_exclusive_group()
+    wim_args.add_argument('-f', '--file', help="File path for an install.wim",
+                          type=validateFilePath, metavar='wim_file_path')
+    wim_args.add_argument('-d', '--dir', help="Path to a directory full of install.wim & install.esd files",
+                          type=validateFilePathDir, metavar='wims_directory')
+
+    # Sort
+    sort_type = sort_command.add_subparsers(dest='sort')
+
+    binaries_group = sort_type.add_parser('bin', aliases=__registerAliases('bin', ['BIN', 'binary', 'binaries']), description='Sort binaries',
+                                          help='Sort & rename binaries and correct their names with unique and acurate names (including full version)', parents=[output_parser, options_parser])
+    builds_group = sort_type.add_parser('builds', aliases=__makeAliases(
+        'builds'), description='Show the KB timeline of a major (KB, release month and OS builds)', help='Show the KB timeline of a major', parents=[output_parser, options_parser])
+    msus_group = sort_type.add_parser('msu', aliases=__registerAliases(
+        'msu', ['MSU', 'CAB', 'cab', 'Msu', 'Cab']), description='Rename MSU & CAB files', help='Rename MSU & CAB files', parents=[output_parser, options_parser])
+
+    for g in (msus_group, binaries_group,):
+        g.add_argument('dir', help="Path to a directory to sort",
+                       type=validateFilePathDir, metavar='directory_path')
+        g.add_argument(
+            '-x', '--cut', help="Move files instead of copying them", action='store_true')
+        g.add_argument(
+            '-r', '--recursive', help="Recursively walk the directory", action='store_true')
+        g.add_argument(
+            '--rescan', help="Ignore the processed-file ledger and sort every file again", action='store_true')
+        g.add_argument(
+            'file_name_regex', help="Names of files to sort as regex", type=validateRegex, nargs='?')
+
+    builds_group.add_argument('major', nargs=1)
+    builds_group.add_argument(
+        '--refresh', help="Parse the update history page again, even if the KB timeline is fresh", action='store_true')
+
+    # Publish
+    publish_command.add_argument('dir', help="Path to a directory of binaries & PDBs",
+                                 type=validateFilePathDir, metavar='directory_path')
+    publish_command.add_argument(
+        '-x', '--cut', help="Move files instead of copying them", action='store_true')
+    publish_command.add_argument(
+        '-j', '--jobs', help="Amount of files to hash concurrently", type=int, default=8)
+    publish_command.add_argument(
+        'file_name_regex', help="Names of files to publish as regex", type=validateRegex, nargs='?')
+
+    # Extrapolate
+    extrapolate_type = extrapolate_command.add_subparsers(
+        dest='extrapolate')
+
+    patch_group = extrapolate_type.add_parser('patch', aliases=__makeAliases(
+        'patch'), help='Create a patched file from raw patch files (and possibly executable)', parents=[options_parser])
+    msu_group = extrapolate_type.add_parser('msu', aliases=__makeAliases(
+        'msu'), help='Apply an entire update and patch coresponding files', parents=[output_parser, options_parser])
+
+    patch_group_mode = patch_group.add_mutually_exclusive_group(
+        required=True)
+    patch_group_output = patch_group.add_mutually_exclusive_group(
+        required=True)
+    patch_group_mode.add_argument("-f", "--file",
+                                  help="File to patch (forward or reverse)")
+    patch_group_mode.add_argument("-n", "--null", action="store_true", default=False,
+                                  help="Create the output file from a null diff "
+                                  "(null diff must be the first one specified)")
+    patch_group_output.add_argument("-o", "--output-file")
+    patch_group_output.add_argument("-d", "--dry-run", action="store_true",
+                                    help="Don't write patch, just see if it would patch"
+                                    "correctly and get the resulting hash")
+    patch_group.add_argument("-l", "--legacy", action='store_true', default=False,
+                             help="Let the API use the PA19 legacy API (if required)")
+    patch_group.add_argument("patches", nargs='+', help="Patches to apply")
+
+    msu_group.add_argument('msu_file', type=validateFilePath,
+                           help='An MSU update file from the security catalog')
+    msu_group.add_argument('base_files_dir', type=validateFilePathDir,
+                           help='Root directory of base files onto which to apply the patches (not in-place)', nargs='?')
+    msu_group.add_argument('-n', '--name', type=validateRegex,
+                           help='Names of files to extrapolate as regex', nargs=1, metavar='REGEX_NAME')
+    msu_group.add_argument('-t', '--filter', type=validateRegex,
+                           help='File name filter - which patches to extrapolate', nargs=1, metavar='REGEX_NAME')
+    msu_group.add_argument(
+        '-d', '--directory', help='Treat "msu_file" as a directory full of MSU files', action='store_true')
+    msu_group.add_argument(
+        '-f', '--force', help='Skip checking if patch was already extracted', action='store_true')
+    msu_group.add_argument(
+        '--fetch-bases', help='Fetch missing base files from the symbol server (located through WinBIndex) and retry their patches', action='store_true')
+
+    # Download
+    download_type = download_command.add_subparsers(dest='download')
+    download_options = argparse.ArgumentParser(add_help=False)
+    download_options.add_argument(
+        '--allow-dynamic', help='Also download the "Dynamic" version of the update (preserves locales)', action='store_true')
+    download_options.add_argument(
+        '--prefer-old', help='Download oldest patch first', action='store_true')
+    download_options.add_argument(
+        '--catalog-url', help='Update catalog base URL (e.g. a mirror)', metavar='URL')
+    download_options.add_argument(
+        '--refresh', help='Repeat catalog searches which are already in the local catalog index', action='store_true')
+
+    patches_group = download_type.add_parser('patches', aliases=__registerAliases('patches', [
+                                             'PATCHES', 'Patches']), description='Download patches', help='Download patches', parents=[output_parser, options_parser, download_options])
+    patches_group.add_argument('major', help="Major windows version")
+    patches_group.add_argument('minor', help="Minor windows version")
+    patches_group.add_argument('bitness', help="Windows bitness")
+
+    kb_group = download_type.add_parser('kb', aliases=__registerAliases(
+        'kb', ['KB', 'Kb', 'kB']), description='Download by KBs', help='Download by kernel builds', parents=[output_parser, options_parser, download_options])
+    kb_group_choice = kb_group.add_mutually_exclusive_group(required=True)
+    kb_group_choice.add_argument('--major', help="Major windows version")
+    kb_group_choice.add_argument('--kb_number', help="KB exact number")
+
+    # Fetch and extrapolate
+    fetch_type = fetch_command.add_subparsers(dest='fetch')
+    fetch_options = argparse.ArgumentParser(add_help=False)
+    fetch_options.add_argument('-b', '--base-files-dir', type=validateFilePathDir, dest='base_files_dir',
+                               help='Root directory of base files onto which to apply the patches (not in-place)')
+    fetch_options.add_argument('-n', '--name', type=validateRegex,
+                               help='Names of files to extrapolate as regex', nargs=1, metavar='REGEX_NAME')
+    fetch_options.add_argument(
+        '--fetch-bases', help='Fetch missing base files from the symbol server (located through WinBIndex) and retry their patches', action='store_true')
+    fetch_options.add_argument(
+        '-j', '--jobs', help='Amount of updates to extrapolate concurrently', type=int, default=DEFAULT_EXTRAPOLATE_WORKERS)
+    fetch_options.add_argument(
+        '--queue-size', help='Amount of downloaded updates which may wait for extrapolation before downloads stall', type=int, default=DEFAULT_EXTRAPOLATE_QUEUE_SIZE)
+    fetch_options.add_argument(
+        '--min-scratch', help='Free space (GiB) to keep in the temporary directory, extrapolation waits for it', type=float, default=2.0, metavar='GIB')
+
+    fetch_patches_group = fetch_type.add_parser('patches', aliases=__registerAliases('patches', [
+                                                'PATCHES', 'Patches']), description='Download & extrapolate patches', help='Download & extrapolate patches', parents=[output_parser, options_parser, download_options, fetch_options])
+    fetch_patches_group.add_argument('major', help="Major windows version")
+    fetch_patches_group.add_argument('minor', help="Minor windows version")
+    fetch_patches_group.add_argument('bitness', help="Windows bitness")
+
+    fetch_kb_group = fetch_type.add_parser('kb', aliases=__registerAliases(
+        'kb', ['KB', 'Kb', 'kB']), description='Download & extrapolate by KBs', help='Download & extrapolate by kernel builds', parents=[output_parser, options_parser, download_options, fetch_options])
+    fetch_kb_group_choice = fetch_kb_group.add_mutually_exclusive_group(required=True)
+    fetch_kb_group_choice.add_argument('--major', help="Major windows version")
+    fetch_kb_group_choice.add_argument('--kb_number', help="KB exact number")
+
+    pdbs_group = download_type.add_parser('pdbs', aliases=__registerAliases(
+        'pdbs', ['PDBS', 'PDBs', 'Pdbs']), description='Download PDBs of binaries', help='Download the PDBs of every binary in a directory into the local symbol store', parents=[output_parser, options_parser])
+    pdbs_group.add_argument('dir', help="Path to a directory of binaries",
+                            type=validateFilePathDir, metavar='directory_path')
+    pdbs_group.add_argument(
+        'file_name_regex', help="Names of binaries as regex", type=validateRegex, nargs='?')
+    pdbs_group.add_argument(
+        '-j', '--jobs', help="Maximum concurrent downloads", type=int, default=8)
+    pdbs_group.add_argument(
+        '--symbol-server', help="Symbol server URL to download from", metavar='URL')
+
+    winbindex_group = download_type.add_parser('winbindex', aliases=__registerAliases(
+        'winbindex', ['WINBINDEX', 'WinBIndex', 'wbi']), description='Download binaries listed by WinBIndex', help='Download binaries listed by WinBIndex from the symbol server', parents=[output_parser, options_parser])
+    winbindex_group.add_argument('file_names', help="Names of files to download (e.g. ntoskrnl.exe)", nargs='+', metavar='file_name')
+    winbindex_group.add_argument(
+        '-a', '--arch', help="Architecture to download (may be repeated)", action='append')
+    winbindex_group.add_argument(
+        '-b', '--build', help="Windows build to download, e.g. 22621 (may be repeated)", type=int, action='append')
+    winbindex_group.add_argument(
+        '--base-only', help="Only download base (revision 1) files", action='store_true')
+    winbindex_group.add_argument(
+        '-j', '--jobs', help="Maximum concurrent downloads (default: 8)", type=int)
+    winbindex_group.add_argument(
+        '--winbindex-url', help="WinBIndex by_filename_compressed data URL", metavar='URL')
+
+    # Run jobs
+    run_jobs_command.add_argument('job_file', type=validateFilePath,
+                                  help='JSON (or YAML) list of jobs, each the arguments of one command (extract, extrapolate, sort, download, publish, ...)')
+    run_jobs_command.add_argument(
+        '-j', '--jobs', help="Amount of jobs to run concurrently", type=int, default=DEFAULT_JOB_WORKERS)
+
+    # Content store
+    store_type = store_command.add_subparsers(dest='store')
+    store_type.add_parser('import', aliases=__registerAliases('import', ['IMPORT', 'Import']), description='Move the files of the output directory into the content store',
+                          help='Move the files of the output directory into the content store, deduplicating them', parents=[output_parser, options_parser])
+    store_type.add_parser('stats', aliases=__registerAliases('stats', ['STATS', 'Stats']), description='Show the size of the content store',
+                          help='Show the size of the content store and the space it saves', parents=[output_parser, options_parser])
+    materialize_command = store_type.add_parser('materialize', aliases=__registerAliases('materialize', ['MATERIALIZE', 'Materialize']), description='Rebuild archived binaries (see --archive) from their base and delta',
+                                                help='Rebuild the archived binaries whose versioned names match a regex', parents=[output_parser, options_parser])
+    materialize_command.add_argument('name', type=validateRegex, help='Regex of the versioned names to materialize')
+    materialize_command.add_argument(
+        '-d', '--dest', help='Copy the materialized binaries into this directory (they are only kept in the archive cache otherwise)', metavar='DIR')
+    store_type.add_parser('archive-stats', aliases=__registerAliases('archive-stats', ['ARCHIVE-STATS', 'Archive-Stats']), description='Show the size of the archive',
+                          help='Show the size of the archive, the space it saves and its cache', parents=[output_parser, options_parser])
+
+    # Query
+    query_command.add_argument('file_name', nargs='?', help='Original file name (e.g. ntoskrnl.exe), or a glob of them (e.g. "nt*.dll")')
+    query_command.add_argument(
+        '--version', help="Version, or a prefix of one (e.g. 10.0.22621 matches every 10.0.22621.* build)")
+    query_command.add_argument(
+        '--from', dest='version_from', help="Lowest version (inclusive)", metavar='VERSION')
+    query_command.add_argument(
+        '--to', dest='version_to', help="Highest version (inclusive)", metavar='VERSION')
+    query_command.add_argument(
+        '-a', '--arch', help="Architecture (x64, x86, wow64, ...)")
+    query_command.add_argument(
+        '--kb', help="KB which produced the binary")
+    query_command.add_argument(
+        '--sha256', help="SHA256 of the binary")
+    query_command.add_argument(
+        '--pdb', help="PDB GUID, or GUID followed by the age (as in symbol server paths)")
+    query_command.add_argument(
+        '-n', '--limit', help="Show at most this many binaries", type=int)
+    query_command.add_argument(
+        '--json', help="Print the matches as JSON lines", action='store_true')
+    query_command.add_argument(
+        '--scan', help="First catalog the versioned binaries of the output directory which are not in the catalog yet", action='store_true')
+
+    # Serve
+    serve_command.add_argument(
+        '--host', help="Address to listen on (default: 127.0.0.1)")
+    serve_command.add_argument(
+        '--port', help="Port to listen on (default: 8377)", type=int)
+    serve_command.add_argument(
+        '--socket', help="Listen on a Unix socket at PATH instead of TCP", metavar='PATH')
+    serve_command.add_argument(
+        '--updates-dir', type=validateFilePathDir, help='Directory of downloaded updates to extrapolate files which the symbol server does not have')
+    serve_command.add_argument('-b', '--base-files-dir', type=validateFilePathDir, dest='base_files_dir',
+                               help='Root directory of base files for extrapolation (missing bases are fetched into it)')
+    serve_command.add_argument(
+        '-j', '--jobs', help="Amount of files to produce concurrently", type=int, default=DEFAULT_SERVICE_WORKERS)
+
+    return parser
+
+
+def __dispatch(args):
+    args.command = __g_alias_map[args.command]
+    if not args.command:
+        raise argparse.ArgumentTypeError('No command specified!')
+    __s_command_handlers[args.command](args)
+
+
 def main():
     try:
-        options_parser = argparse.ArgumentParser(add_help=False)
-        # Flags
-        verbosity_group = options_parser.add_mutually_exclusive_group()
-        verbosity_group.add_argument(
-            '-v', '--verbose', help="Verbose output", action='store_true')
-        verbosity_group.add_argument(
-            '-vl', '--verbosity', help="Verbose output", nargs=1, metavar='level')
-        options_parser.add_argument(
-            '-y', '--accept', help="Auto accept all prompts", action='store_true')
-        options_parser.add_argument(
-            '-dp', '--download-pdbs', help="Allow downloading of PDBs", action='store_true')
-        options_parser.add_argument(
-            '-k', '--keep', help="Keep temporary files", action='store_true')
-
-        output_parser = argparse.ArgumentParser(add_help=False)
-        output_parser.add_argument(
-            '-o', '--out', help="Output directory for extracted files")
-
-        parser = argparse.ArgumentParser(
-            parents=[options_parser, output_parser])
-
-        subparsers = parser.add_subparsers(
-            title='Commands', dest='command', description='Available commands')
-
-        extract_command = subparsers.add_parser('extract', aliases=__registerAliases('extract', [
-                                                'x', 'X', 'EXTRACT', 'Extract']), allow_abbrev=True, description='Extract files from archives', help='Extracts files from complex Microsoft archives (MSU, PSF, WIM, ESD,...)', parents=[output_parser, options_parser])
-        download_command = subparsers.add_parser('download', aliases=__makeAliases(
-            'download'), allow_abbrev=True, description='Download files from Microsoft\'s servers', help='Download files from Microsoft\'s servers', parents=[output_parser, options_parser])
-        extrapolate_command = subparsers.add_parser('extrapolate', aliases=__makeAliases('extrapolate'), allow_abbrev=True, description='Extrapolate binaries with patches',
-                                                    help='Combine base exe/dll files with patch files to extrapolate the patched binary', parents=[output_parser, options_parser])
-        sort_command = subparsers.add_parser('sort', aliases=__makeAliases('sort'), allow_abbrev=True, description='Sort relevant files',
-                                             help='Sorts binaries and pdbs in a scattered directory tree and renames the files correctly', parents=[output_parser, options_parser])
-
-        # Extract
-        extract_type = extract_command.add_subparsers(dest='extract')
-
-        psf_group = extract_type.add_parser('psf', aliases=__registerAliases(
-            'psf', ['PSF']), description='Parse & extract PSF patch files', help='Parse & extract PSF patch files', parents=[output_parser, options_parser])
-        psf_group.add_argument('psf_file_path', help="Patch PSF binary file",
-                               type=validateFilePath, metavar='psf_file_path')
-        psf_group.add_argument('psf_xml_file_path', help="PSF XML file",
-                               type=validateFilePath, metavar='psf_xml_file_path')
-        psf_group.add_argument(
-            'file_name_regex', help='Names of files to extract as regex', type=validateRegex, nargs='?')
-
-        iso_group = extract_type.add_parser('iso', aliases=__registerAliases(
-            'iso', ['ISO']), description='Parse & extract image files', help='Parse & extract image files', parents=[output_parser, options_parser])
-        iso_args = iso_group.add_mutually_exclusive_group()
-        iso_args.add_argument('-f', '--file', help="File path for an ISO",
-                              type=validateFilePath, metavar='iso_file_path')
-        iso_args.add_argument('-d', '--dir', help="Path to a directory full of ISOs",
-                              type=validateFilePathDir, metavar='isos_directory')
-
-        wim_group = extract_type.add_parser('wim', aliases=__registerAliases(
-            'wim', ['WIM', 'esd', 'ESD']), description='Parse & extract WIM/ESD files', help='Parse & extract WIM/ESD files', parents=[output_parser, options_parser])
-        wim_args = wim_group.add_mutually_exclusive_group()
-        wim_args.add_argument('-f', '--file', help="File path for an install.wim",
-                              type=validateFilePath, metavar='wim_file_path')
-        wim_args.add_argument('-d', '--dir', help="Path to a directory full of install.wim & install.esd files",
-                              type=validateFilePathDir, metavar='wims_directory')
-
-        # Sort
-        sort_type = sort_command.add_subparsers(dest='sort')
-
-        binaries_group = sort_type.add_parser('bin', aliases=__registerAliases('bin', ['BIN', 'binary', 'binaries']), description='Sort binaries',
-                                              help='Sort & rename binaries and correct their names with unique and acurate names (including full version)', parents=[output_parser, options_parser])
-        builds_group = sort_type.add_parser('builds', aliases=__makeAliases(
-            'builds'), description='Fetch meta-data about KBs', help='Fetch meta-data about KBs', parents=[output_parser, options_parser])
-        msus_group = sort_type.add_parser('msu', aliases=__registerAliases(
-            'msu', ['MSU', 'CAB', 'cab', 'Msu', 'Cab']), description='Rename MSU & CAB files', help='Rename MSU & CAB files', parents=[output_parser, options_parser])
-
-        for g in (msus_group, binaries_group,):
-            g.add_argument('dir', help="Path to a directory to sort",
-                           type=validateFilePathDir, metavar='directory_path')
-            g.add_argument(
-                '-x', '--cut', help="Move files instead of copying them", action='store_true')
-            g.add_argument(
-                '-r', '--recursive', help="Recursively walk the directory", action='store_true')
-            g.add_argument(
-                'file_name_regex', help="Names of files to sort as regex", type=validateRegex, nargs='?')
-
-        builds_group.add_argument('major', nargs=1)
-
-        # Extrapolate
-        extrapolate_type = extrapolate_command.add_subparsers(
-            dest='extrapolate')
-
-        patch_group = extrapolate_type.add_parser('patch', aliases=__makeAliases(
-            'patch'), help='Create a patched file from raw patch files (and possibly executable)', parents=[options_parser])
-        msu_group = extrapolate_type.add_parser('msu', aliases=__makeAliases(
-            'msu'), help='Apply an entire update and patch coresponding files', parents=[output_parser, options_parser])
-
-        patch_group_mode = patch_group.add_mutually_exclusive_group(
-            required=True)
-        patch_group_output = patch_group.add_mutually_exclusive_group(
-            required=True)
-        patch_group_mode.add_argument("-f", "--file",
-                                      help="File to patch (forward or reverse)")
-        patch_group_mode.add_argument("-n", "--null", action="store_true", default=False,
-                                      help="Create the output file from a null diff "
-                                      "(null diff must be the first one specified)")
-        patch_group_output.add_argument("-o", "--output-file")
-        patch_group_output.add_argument("-d", "--dry-run", action="store_true",
-                                        help="Don't write patch, just see if it would patch"
-                                        "correctly and get the resulting hash")
-        patch_group.add_argument("-l", "--legacy", action='store_true', default=False,
-                                 help="Let the API use the PA19 legacy API (if required)")
-        patch_group.add_argument("patches", nargs='+', help="Patches to apply")
-
-        msu_group.add_argument('msu_file', type=validateFilePath,
-                               help='An MSU update file from the security catalog')
-        msu_group.add_argument('base_files_dir', type=validateFilePathDir,
-                               help='Root directory of base files onto which to apply the patches (not in-place)', nargs='?')
-        msu_group.add_argument('-n', '--name', type=validateRegex,
-                               help='Names of files to extrapolate as regex', nargs=1, metavar='REGEX_NAME')
-        msu_group.add_argument('-t', '--filter', type=validateRegex,
-                               help='File name filter - which patches to extrapolate', nargs=1, metavar='REGEX_NAME')
-        msu_group.add_argument(
-            '-d', '--directory', help='Treat "msu_file" as a directory full of MSU files', action='store_true')
-        msu_group.add_argument(
-            '-f', '--force', help='Skip checking if patch was already extracted', action='store_true')
-
-        # Download
-        download_type = download_command.add_subparsers(dest='download')
-        download_options = argparse.ArgumentParser(add_help=False)
-        download_options.add_argument(
-            '--allow-dynamic', help='Also download the "Dynamic" version of the update (preserves locales)', action='store_true')
-        download_options.add_argument(
-            '--prefer-old', help='Download oldest patch first', action='store_true')
-
-        patches_group = download_type.add_parser('patches', aliases=__registerAliases('patches', [
-                                                 'PATCHES', 'Patches']), description='Download patches', help='Download patches', parents=[output_parser, options_parser, download_options])
-        patches_group.add_argument('major', help="Major windows version")
-        patches_group.add_argument('minor', help="Minor windows version")
-        patches_group.add_argument('bitness', help="Windows bitness")
-
-        kb_group = download_type.add_parser('kb', aliases=__registerAliases(
-            'kb', ['KB', 'Kb', 'kB']), description='Download by KBs', help='Download by kernel builds', parents=[output_parser, options_parser, download_options])
-        kb_group_choice = kb_group.add_mutually_exclusive_group(required=True)
-        kb_group_choice.add_argument('--major', help="Major windows version")
-        kb_group_choice.add_argument('--kb_number', help="KB exact number")
-
-        args = parser.parse_args()
+        args = __buildParser().parse_args()
 
         parseSettingsFlags(args)
 
-        args.command = __g_alias_map[args.command]
-        if not args.command:
-            raise argparse.ArgumentTypeError('No command specified!')
-
-        __s_command_handlers[args.command](args)
+        try:
+            __dispatch(args)
+        finally:
+            if args.trace:
+                stopTracing(args.trace)
+                printSuccess(f'Trace written to {args.trace}')
+            if args.metrics:
+                stopMetricsExporter()
+                printSuccess(f'Metrics written to {args.metrics}')
 
     except argparse.ArgumentTypeError as ex:
         printError(f'Argument error: {ex}')
@@ -0,0 +1,366 @@
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from types import NoneType
+from typing import Callable, Dict, List
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from src.bench.generators import SYNTHETIC_BUILD, buildPeImage, buildPeRevision, generateCatalogSearchPage, generateLegacyMsu, generatePeCorpus, generatePsf, generateUpdateHistoryPage, generateUpdateTree
+from src.utils.printer import printError, printInfo, printSuccess
+from src.utils.settings import getInterestingFilesAsRegex
+from src.utils.utils import SymbolManagerException
+
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+MAIN_PATH = os.path.join(REPO_ROOT, 'main.py')
+BENCH_RESULTS_VERSION = 1
+DEFAULT_RESULTS_DIR = 'bench_results'
+DEFAULT_REPEATS = 5
+# A benchmark regresses when its median grows by more than this over the compared run
+REGRESSION_TOLERANCE = 0.25
+# `main.py --help` only loads the CLI itself, every command's subsystems are imported on dispatch
+CLI_STARTUP_BUDGET_MS = 400
+# A kernel sized base binary for the archive benchmarks
+ARCHIVE_BENCH_CODE_SIZE = 8 * 1024 * 1024
+
+
+class BenchmarkSkippedException(SymbolManagerException):
+    pass
+
+
+class BenchRun:
+    """
+    The timed part of a benchmark. `reset` runs before every repetition, outside of the timing.
+    `info` is reported along with the timings (e.g. the sizes the benchmark's data takes).
+    """
+    def __init__(self, run: Callable[[], int], reset: Callable[[], NoneType] = None, info: dict = None) -> NoneType:
+        self.run = run
+        self.reset = reset
+        self.info = info
+
+
+class Benchmark:
+    """
+    A benchmark with a `budget_ms` fails its run when its median exceeds the budget, whatever it is compared against.
+    """
+    def __init__(self, name: str, description: str, setup: Callable[[str, int], BenchRun], end_to_end: bool = False, budget_ms: float = None) -> NoneType:
+        self.name = name
+        self.description = description
+        self.setup = setup
+        self.end_to_end = end_to_end
+        self.budget_ms = budget_ms
+
+
+def __freshDir(path: str) -> Callable[[], NoneType]:
+    def reset():
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+    return reset
+
+
+def __setupPsfManifest(work_dir: str, scale: int) -> BenchRun:
+    from src.psf.psf_manifest import parsePsfExpressManifest
+    _, manifest_path = generatePsf(work_dir, 5000 * scale)
+    return BenchRun(lambda: len(parsePsfExpressManifest(manifest_path, silent=True).tags))
+
+
+def __setupPsfExtract(work_dir: str, scale: int) -> BenchRun:
+    from src.psf.psf_extractor import extractFileFromPsf
+    psf_path, manifest_path = generatePsf(work_dir, 2000 * scale)
+    output_dir = os.path.join(work_dir, 'out')
+    return BenchRun(lambda: len(extractFileFromPsf(psf_path, manifest_path, getInterestingFilesAsRegex(), output_dir, silent=True)), __freshDir(output_dir))
+
+
+def __setupBinaryNames(work_dir: str, scale: int) -> BenchRun:
+    try:
+        from src.utils.smart_exe import getBinaryFileNameWithVersion
+        # smart_exe only loads COM once a file is queried, probe it here rather than fail the timed runs
+        import pythoncom
+    except ImportError as ex:
+        raise BenchmarkSkippedException(f'smart_exe is not importable here ({ex})')
+    paths = generatePeCorpus(work_dir, 20 * scale, nested=False)
+    return BenchRun(lambda: len([getBinaryFileNameWithVersion(path) for path in paths]))
+
+
+def __setupWalkFiles(work_dir: str, scale: int) -> BenchRun:
+    from src.utils.utils import walkFiles
+    generateUpdateTree(work_dir, 50 * scale)
+    def run() -> int:
+        matches = []
+        walkFiles(work_dir, lambda root, path: matches.append(path), getInterestingFilesAsRegex())
+        return len(matches)
+    return BenchRun(run)
+
+
+def __setupCatalogUrls(work_dir: str, scale: int) -> BenchRun:
+    from src.patch.patch_download import PatchDownloader
+    html = generateCatalogSearchPage(500 * scale)
+    return BenchRun(lambda: len(list(PatchDownloader(query='Cumulative Update', data=html).generatePatchDownloadUrls())))
+
+
+def __setupUpdateHistory(work_dir: str, scale: int) -> BenchRun:
+    from src.patch.catalog_parser import parseUpdateHistoryKbs, parseUpdateHistoryReleases
+    html = generateUpdateHistoryPage(300 * scale)
+    return BenchRun(lambda: len(parseUpdateHistoryReleases(html)) + len(parseUpdateHistoryKbs(html)))
+
+
+def __setupArchive(work_dir: str, scale: int, hot: bool) -> BenchRun:
+    try:
+        from src.patch.dpatch import create_delta_from_buffers
+    except ImportError as ex:
+        raise BenchmarkSkippedException(f'msdelta is not available here ({ex})')
+    from src.store.archive import DeltaArchive
+    base = buildPeImage(f'{SYNTHETIC_BUILD}.1', 'ntoskrnl.exe', code_size=ARCHIVE_BENCH_CODE_SIZE)
+    base_path = os.path.join(work_dir, f'ntoskrnl - {SYNTHETIC_BUILD}.1 x64.exe')
+    with open(base_path, 'wb') as f:
+        f.write(base)
+    # A cold cache only ever holds the last binary, so every run rebuilds all of them
+    archive = DeltaArchive(os.path.join(work_dir, 'out'), cache_size=len(base) * 64 * scale if hot else 0)
+    names = []
+    for revision in range(2, 2 + 8 * scale):
+        delta_path = os.path.join(work_dir, f'ntoskrnl_{revision}.exe PA30.patch')
+        with open(delta_path, 'wb') as f:
+            f.write(create_delta_from_buffers(base, buildPeRevision(base, revision)))
+        names.append(f'ntoskrnl - {SYNTHETIC_BUILD}.{revision} x64.exe')
+        archive.addDelta(names[-1], base_path, delta_path)
+    if hot:
+        for name in names:
+            archive.materialize(name)
+    stats = archive.getStats()
+    info = {
+        'materialized_bytes': len(base) + stats['logical_bytes'],
+        'archived_bytes': len(base) + stats['delta_bytes'],
+        'saved_bytes': stats['saved_bytes'],
+    }
+    return BenchRun(lambda: len([archive.materialize(name) for name in names]), info=info)
+
+
+def __setupArchiveCold(work_dir: str, scale: int) -> BenchRun:
+    return __setupArchive(work_dir, scale, hot=False)
+
+
+def __setupArchiveHot(work_dir: str, scale: int) -> BenchRun:
+    return __setupArchive(work_dir, scale, hot=True)
+
+
+g_cli_probe: str | None = None
+
+
+def __probeCli():
+    # main.py may not start on some platforms (e.g. a missing colorama or tqdm)
+    global g_cli_probe
+    if g_cli_probe is None:
+        proc = subprocess.run([sys.executable, MAIN_PATH, '--help'], cwd=REPO_ROOT, capture_output=True, text=True)
+        g_cli_probe = '' if proc.returncode == 0 else (proc.stderr.strip().splitlines() or ['exited with ' + str(proc.returncode)])[-1]
+    if g_cli_probe:
+        raise BenchmarkSkippedException(f'main.py does not start here: {g_cli_probe}')
+
+
+def __cliRun(args: List[str], output_dir: str) -> BenchRun:
+    def run() -> int:
+        proc = subprocess.run([sys.executable, MAIN_PATH, *args], cwd=REPO_ROOT, capture_output=True)
+        if proc.returncode != 0:
+            raise SymbolManagerException(f'main.py {" ".join(args[:2])} returned {proc.returncode}')
+        return sum(len(files) for _, _, files in os.walk(output_dir))
+    return BenchRun(run, __freshDir(output_dir))
+
+
+def __setupCliStartup(work_dir: str, scale: int) -> BenchRun:
+    __probeCli()
+    def run() -> int:
+        subprocess.run([sys.executable, MAIN_PATH, '--help'], cwd=REPO_ROOT, capture_output=True, check=True)
+        return 1
+    return BenchRun(run)
+
+
+def __setupCliExtractPsf(work_dir: str, scale: int) -> BenchRun:
+    __probeCli()
+    psf_path, manifest_path = generatePsf(os.path.join(work_dir, 'psf'), 2000 * scale)
+    output_dir = os.path.join(work_dir, 'out')
+    return __cliRun(['extract', 'psf', psf_path, manifest_path, '-o', output_dir], output_dir)
+
+
+def __setupCliSortBin(work_dir: str, scale: int) -> BenchRun:
+    __probeCli()
+    generatePeCorpus(os.path.join(work_dir, 'in'), 20 * scale)
+    output_dir = os.path.join(work_dir, 'out')
+    return __cliRun(['sort', 'bin', os.path.join(work_dir, 'in'), '-r', '--rescan', '-o', output_dir], output_dir)
+
+
+def __setupCliPublish(work_dir: str, scale: int) -> BenchRun:
+    __probeCli()
+    generatePeCorpus(os.path.join(work_dir, 'in'), 20 * scale)
+    output_dir = os.path.join(work_dir, 'store')
+    return __cliRun(['publish', os.path.join(work_dir, 'in'), '-o', output_dir], output_dir)
+
+
+def __setupCliExtrapolateMsu(work_dir: str, scale: int) -> BenchRun:
+    __probeCli()
+    msu_dir = os.path.join(work_dir, 'msu')
+    for index in range(2 * scale):
+        generateLegacyMsu(msu_dir, f'KB{5031356 + index * 7}', 3570 + index * 11)
+    output_dir = os.path.join(work_dir, 'out')
+    return __cliRun(['extrapolate', 'msu', msu_dir, '-d', '-f', '-o', output_dir], output_dir)
+
+
+BENCHMARKS = [
+    Benchmark('psf_manifest', 'parsePsfExpressManifest on an express manifest of 5000 deltas', __setupPsfManifest),
+    Benchmark('psf_extract', 'extractFileFromPsf of the interesting files out of 2000 deltas', __setupPsfExtract),
+    Benchmark('binary_names', 'getBinaryFileNameWithVersion of 20 PE files', __setupBinaryNames),
+    Benchmark('walk_files', 'walkFiles over 50 extracted updates (2250 files)', __setupWalkFiles),
+    Benchmark('catalog_urls', 'generatePatchDownloadUrls of a 500 result catalog page', __setupCatalogUrls),
+    Benchmark('update_history', 'Update history releases & KBs of a 300 release page', __setupUpdateHistory),
+    Benchmark('archive_cold', 'DeltaArchive.materialize of 8 kernel sized binaries from their base and delta', __setupArchiveCold),
+    Benchmark('archive_hot', 'DeltaArchive.materialize of 8 kernel sized binaries from the archive cache', __setupArchiveHot),
+    Benchmark('cli_startup', 'main.py --help (interpreter start, imports and parser construction)', __setupCliStartup, end_to_end=True, budget_ms=CLI_STARTUP_BUDGET_MS),
+    Benchmark('cli_extract_psf', 'main.py extract psf', __setupCliExtractPsf, end_to_end=True),
+    Benchmark('cli_sort_bin', 'main.py sort bin', __setupCliSortBin, end_to_end=True),
+    Benchmark('cli_publish', 'main.py publish', __setupCliPublish, end_to_end=True),
+    Benchmark('cli_extrapolate_msu', 'main.py extrapolate msu of 2 legacy updates', __setupCliExtrapolateMsu, end_to_end=True),
+]
+
+
+def runBenchmark(benchmark: Benchmark, scale: int, repeats: int) -> dict:
+    """
+    Generates the inputs of a benchmark in a temporary directory and times `repeats` runs of it.
+
+    Inputs grow linearly with `scale`.
+    """
+    with tempfile.TemporaryDirectory(prefix=f'bench_{benchmark.name}_') as work_dir:
+        try:
+            bench_run = benchmark.setup(work_dir, scale)
+        except BenchmarkSkippedException as ex:
+            return {'status': 'skipped', 'reason': str(ex)}
+        timings = []
+        items = 0
+        try:
+            for _ in range(repeats):
+                if bench_run.reset:
+                    bench_run.reset()
+                # The progress output of in-process benchmarks would otherwise be timed along
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    start = time.perf_counter()
+                    items = bench_run.run()
+                    timings.append(time.perf_counter() - start)
+        except (SymbolManagerException, OSError, subprocess.CalledProcessError) as ex:
+            return {'status': 'failed', 'reason': str(ex)}
+    return {
+        'status': 'ok',
+        'budget_ms': benchmark.budget_ms,
+        'items': items,
+        'runs': len(timings),
+        'min_ms': min(timings) * 1000,
+        'median_ms': statistics.median(timings) * 1000,
+        'mean_ms': statistics.fmean(timings) * 1000,
+        'items_per_second': items / statistics.median(timings) if items and statistics.median(timings) else 0,
+        'info': bench_run.info,
+    }
+
+
+def __gitRevision() -> str:
+    try:
+        proc = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, capture_output=True, text=True)
+        return proc.stdout.strip() if proc.returncode == 0 else ''
+    except OSError:
+        return ''
+
+
+def runBenchmarks(names: List[str] = None, scale: int = 1, repeats: int = DEFAULT_REPEATS, end_to_end: bool = True) -> dict:
+    results = {
+        'version': BENCH_RESULTS_VERSION,
+        'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'revision': __gitRevision(),
+        'platform': {
+            'system': platform.system(),
+            'release': platform.release(),
+            'machine': platform.machine(),
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+        },
+        'scale': scale,
+        'repeats': repeats,
+        'benchmarks': { },
+    }
+    for benchmark in BENCHMARKS:
+        if (names and benchmark.name not in names) or (benchmark.end_to_end and not end_to_end and not names):
+            continue
+        result = runBenchmark(benchmark, scale, repeats)
+        result['description'] = benchmark.description
+        results['benchmarks'][benchmark.name] = result
+        if result['status'] == 'ok':
+            printInfo(f'{benchmark.name:<22} {result["median_ms"]:10.2f} ms median {result["min_ms"]:10.2f} ms min {result["items"]:7} items' + (f' (budget {benchmark.budget_ms:g} ms)' if benchmark.budget_ms else ''))
+            if result['info']:
+                printInfo(f'{"":<22} ' + ', '.join(f'{key} {value}' for key, value in result['info'].items()))
+        else:
+            printInfo(f'{benchmark.name:<22} {result["status"]}: {result["reason"]}')
+    return results
+
+
+def checkBudgets(results: dict) -> List[str]:
+    return [f'{name}: median of {result["median_ms"]:.2f} ms is over its budget of {result["budget_ms"]:g} ms'
+            for name, result in results['benchmarks'].items()
+            if result['status'] == 'ok' and result.get('budget_ms') and result['median_ms'] > result['budget_ms']]
+
+
+def compareResults(results: dict, previous: dict, tolerance: float = REGRESSION_TOLERANCE) -> List[str]:
+    """
+    Compares the medians of two runs, benchmarks which did not run in both (or ran at different scales) are ignored.
+    """
+    regressions = []
+    if results['scale'] != previous.get('scale'):
+        printInfo(f'Runs are of different scales ({results["scale"]} and {previous.get("scale")}), nothing to compare')
+        return regressions
+    for name, result in results['benchmarks'].items():
+        before = previous.get('benchmarks', { }).get(name)
+        if result['status'] != 'ok' or not before or before.get('status') != 'ok':
+            continue
+        ratio = result['median_ms'] / before['median_ms'] if before['median_ms'] else 1
+        printInfo(f'{name:<22} {before["median_ms"]:10.2f} ms -> {result["median_ms"]:10.2f} ms ({ratio:5.2f}x)')
+        if ratio > 1 + tolerance:
+            regressions.append(f'{name}: median grew from {before["median_ms"]:.2f} ms to {result["median_ms"]:.2f} ms')
+    return regressions
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark the hot paths and CLI commands on synthetic inputs')
+    parser.add_argument('-b', '--benchmark', action='append', choices=[benchmark.name for benchmark in BENCHMARKS], help='Benchmarks to run (all by default)')
+    parser.add_argument('-s', '--scale', type=int, default=1, help='Multiplier of the generated input sizes')
+    parser.add_argument('-r', '--repeats', type=int, default=DEFAULT_REPEATS, help='Timed runs per benchmark')
+    parser.add_argument('--no-cli', action='store_true', help='Skip the end-to-end CLI benchmarks')
+    parser.add_argument('-o', '--output', help=f'Results JSON path (default: a timestamped file in {DEFAULT_RESULTS_DIR}/)')
+    parser.add_argument('-c', '--compare', help='A previous results JSON to compare against', metavar='RESULTS_JSON')
+    args = parser.parse_args(argv)
+
+    results = runBenchmarks(args.benchmark, args.scale, args.repeats, end_to_end=not args.no_cli)
+
+    output_path = args.output
+    if not output_path:
+        output_path = os.path.join(DEFAULT_RESULTS_DIR, f'bench-{datetime.datetime.now():%Y%m%d-%H%M%S}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, 'w', encoding='UTF-8') as f:
+        json.dump(results, f, indent=4)
+        f.write('\n')
+    printSuccess(f'Results written to {output_path}')
+
+    regressions = checkBudgets(results)
+    if args.compare:
+        with open(args.compare, 'r', encoding='UTF-8') as f:
+            previous = json.load(f)
+        regressions += compareResults(results, previous)
+    for regression in regressions:
+        printError(regression)
+    if args.compare and not regressions:
+        printSuccess('No regressions')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,204 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from typing import Callable, Dict, List
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from src.patch.catalog_parser import parseCatalogReleases, parseCatalogSearchPage, parseUpdateHistoryDates, parseUpdateHistoryKbs
+from src.utils.printer import printError, printInfo, printSuccess
+from src.utils.utils import monthToNumber
+
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baselines', 'bench_catalog.json')
+DEFAULT_REPEATS = 20
+# A benchmark regresses when its speedup over the legacy parser drops by more than this
+SPEEDUP_TOLERANCE = 0.3
+
+CATALOG_FIELDS = ('link_id', 'patch_full_name', 'patch_year', 'patch_month', 'windows_major', 'windows_minor', 'windows_bitness', 'kb_id', 'dynamic')
+
+# The full-page regexes the catalog and update history pages were parsed with before catalog_parser.
+# They are kept as the reference the new parser's results are compared against.
+LEGACY_CATALOG_REGEXES = [
+    r'<a\s+id=\'\w+-\w+-\w+-\w+-\w+_link\'\s+href=\s*"javascript:void\(0\);"\s*onclick=\'goToDetails\("(?P<link_id>(\w+-\w+-\w+-\w+-\w+))"\);\'\s+class="contentTextItemSpacerNoBreakLink">\s*(?P<patch_full_name>((?P<patch_year>\d+)-(?P<patch_month>\d+)\s+(((?P<dynamic>(Dynamic)\s+)?Cumulative Update )|((Security|(Preview of ))?\*(Monthly|Only) Quality Rollup ))(Preview )?for (Microsoft )?(Windows )?(?P<windows_major>\w+) (operating system,? )?(Version (?P<windows_minor>\w+) )?for (?P<windows_bitness>\w+)-based Systems \((?P<kb_id>\w+)\)))\s*<\/a>',
+    r'<a\s+id=\'\w+-\w+-\w+-\w+-\w+_link\'\s+href=\s*"javascript:void\(0\);"\s*onclick=\'goToDetails\("(?P<link_id>(\w+-\w+-\w+-\w+-\w+))"\);\'\s+class="contentTextItemSpacerNoBreakLink">\s*(?P<patch_full_name>((?P<patch_year>\d+)-(?P<patch_month>\d+)\s+(((?P<dynamic>(Dynamic)\s+)?Cumulative Update )|((Security|(Preview of ))?\s*(Monthly|Only)?\s*Quality Rollup ))?(Preview )?for (Microsoft )?(Windows )?(?P<windows_major>\w+) (operating system,? )?(Version (?P<windows_minor>\w+) )?for (?P<windows_bitness>\w+)-based Systems \((?P<kb_id>\w+)\)))\s*<\/a>',
+    r'<a\s+id=\'\w+-\w+-\w+-\w+-\w+_link\'\s+href=\s*"javascript:void\(0\);"\s*onclick=\'goToDetails\("(?P<link_id>(\w+-\w+-\w+-\w+-\w+))"\);\'\s+class="contentTextItemSpacerNoBreakLink">\s*(?P<patch_full_name>(((?P<patch_year>\d+)-(?P<patch_month>\d+))?(\w+\s+)*Update\s+for\s+(Microsoft\s+)?Windows\s+(?P<windows_major>((\w+\s+?)|((Server\s+\d+\s+(\w+\s+)?))))(\s+operating system,?\s+)?\s*?(\s*?for\s+?(?P<windows_bitness>\w+?)-based\s+Systems\s*?)?\s+\((?P<kb_id>\w+?)\)))\s*<\/a>',
+    r'<a\s+id=\'\w+-\w+-\w+-\w+-\w+_link\'\s+href=\s*"javascript:void\(0\);"\s*onclick=\'goToDetails\("(?P<link_id>(\w+-\w+-\w+-\w+-\w+))"\);\'\s+class="contentTextItemSpacerNoBreakLink">\s*(?P<patch_full_name>(((?P<patch_year>\d+)-(?P<patch_month>\d+))?Update\s+for\s+Windows\s+(?P<windows_major>\d+)\s+(for\s+(?P<windows_bitness>(x\d\d))-based\s+Systems\s+)?\((?P<kb_id>(KB\d+))\)))\s*<\/a>',
+]
+LEGACY_RELEASE_REGEX = r'\<a\s+id=\'(?P<download_link_id>(\w+-\w+-\w+-\w+-\w+))_link\'\s*href=\s*\"javascript:void\(0\);\"\s+onclick=\'goToDetails\(\"\w+-\w+-\w+-\w+-\w+\"\);\'\s+class=\"\w+\"\>\s*(?P<full_name>((?P<year>\d+)-(?P<month>\d+)\s+(Preview\s+)?(Security\s+)?((Monthly)?\s+)?(of\s+)?(Quality\s+)?(Rollup\s+)?(\w+\s+)*(for\s+)(\w+\s+)*(?P<windows_full_name>((Windows)\s+((7)|(8)|(8\.1)|(10)|(11)|(Server\s+\d+\s+\w+)))).*\s+for\s+(?P<bitness>(x\d+))-based\s+systems\s+\((?P<spec_kb>(KB\d+))\)))\s*\<\/a\>'
+LEGACY_UPDATE_HISTORY_KB_REGEX = r'<a\s+class="supLeftNavLink"\s+data-bi-slot="\d+"\s+href="\/en-us\/help\/\d+">\w+\s+\d+,\s+\d+(&#x\d+)?;(?P<kb>(KB\d+))(\s+\(((OS\s+Build\s+(?P<major>\d+)\.(?P<patch>\d+)))|(.+?\s+((Rollup)|Update))\)(\s+.*)?)?<\/a>'
+LEGACY_UPDATE_HISTORY_DATE_REGEX = r'\<a\s+class="\w+"\s+data-bi-slot="\d+"\s+href="\/\w+-\w+\/help\/(?=(\d+))\d+"\>(?P<month>\w+)\s+\d+,\s+(?P<year>\d+).*(?P<kb>(KB\w+))\s+\(OS\s+Builds?\s+'
+
+
+def __normalize(value: str | None) -> str | None:
+    return ' '.join(value.split()) if value else value
+
+
+def legacyCatalogSearchPage(html: str) -> List[Dict[str, str]]:
+    results = []
+    for reg in LEGACY_CATALOG_REGEXES:
+        for link in re.finditer(reg, html, re.IGNORECASE | re.MULTILINE):
+            results.append(link.groupdict())
+    return results
+
+
+def legacyReleaseEntries(html: str) -> List[Dict[str, str]]:
+    return [r.groupdict() for r in re.finditer(LEGACY_RELEASE_REGEX, html, re.I | re.M | re.DOTALL | re.S)]
+
+
+def legacyUpdateHistoryKbs(html: str) -> List[str]:
+    kbs = set()
+    for match in re.finditer(LEGACY_UPDATE_HISTORY_KB_REGEX, html, re.IGNORECASE | re.UNICODE | re.MULTILINE):
+        kbs.add((match.group('kb'), match.group('major'), match.group('patch')))
+    for match in re.finditer(r'(?P<kb>(KB\d+))', html, re.IGNORECASE | re.UNICODE | re.MULTILINE):
+        kbs.add((match.group('kb'), '', ''))
+    return sorted(kbs, key=str)
+
+
+def legacyUpdateHistoryDates(html: str) -> Dict[str, List[str]]:
+    version_map = { }
+    for v in re.finditer(LEGACY_UPDATE_HISTORY_DATE_REGEX, html, re.I | re.M):
+        version_map[v.group('kb')] = [v.group('year'), str(monthToNumber(v.group('month'))).zfill(2)]
+    return version_map
+
+
+def __catalogResults(entries: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    # Results are identified by their update ID, the first match of every ID wins
+    results = { }
+    for entry in entries:
+        if entry['link_id'] not in results:
+            results[entry['link_id']] = {field: __normalize(entry.get(field)) for field in CATALOG_FIELDS}
+    return sorted(results.values(), key=lambda entry: entry['link_id'])
+
+
+def __releaseResults(entries: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    return sorted(({field: __normalize(entry[field]) for field in ('download_link_id', 'windows_full_name', 'bitness', 'spec_kb', 'year', 'month')} for entry in entries), key=lambda entry: entry['download_link_id'])
+
+
+def newCatalogSearchPage(html: str) -> List[Dict[str, str]]:
+    return list(parseCatalogSearchPage(html))
+
+
+def newReleaseEntries(html: str) -> List[Dict[str, str]]:
+    return [dict(release, download_link_id=release['link_id']) for release in parseCatalogReleases(html)]
+
+
+def newUpdateHistoryKbs(html: str) -> List[tuple]:
+    return sorted(((kb.kb, kb.major, kb.patch) for kb in parseUpdateHistoryKbs(html)), key=str)
+
+
+def newUpdateHistoryDates(html: str) -> Dict[str, List[str]]:
+    return {kb: list(date) for kb, date in parseUpdateHistoryDates(html).items()}
+
+
+class CatalogBenchmark:
+    def __init__(self, name: str, fixture: str, legacy: Callable, new: Callable, normalize: Callable = lambda result: result, compare_legacy: bool = True) -> None:
+        self.name = name
+        self.compare_legacy = compare_legacy
+        self.fixture = fixture
+        self.legacy = legacy
+        self.new = new
+        self.normalize = normalize
+
+
+BENCHMARKS = [
+    CatalogBenchmark('catalog_search_kb', 'catalog_search_kb.html', legacyCatalogSearchPage, newCatalogSearchPage, __catalogResults),
+    CatalogBenchmark('catalog_search_month', 'catalog_search_month.html', legacyCatalogSearchPage, newCatalogSearchPage, __catalogResults),
+    # The legacy DOTALL regex runs across result rows (one match swallowing most of the page), so only the baseline guards these.
+    # That single match also ends its scan early, which caps the month page's speedup below what the parser gains per row.
+    CatalogBenchmark('catalog_release_month', 'catalog_search_month.html', legacyReleaseEntries, newReleaseEntries, __releaseResults, compare_legacy=False),
+    CatalogBenchmark('catalog_release_kb', 'catalog_search_kb.html', legacyReleaseEntries, newReleaseEntries, __releaseResults, compare_legacy=False),
+    CatalogBenchmark('update_history_kbs', 'update_history.html', legacyUpdateHistoryKbs, newUpdateHistoryKbs),
+    CatalogBenchmark('update_history_dates', 'update_history.html', legacyUpdateHistoryDates, newUpdateHistoryDates),
+]
+
+
+def __timeParser(parser: Callable, html: str, repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        parser(html)
+        timings.append(time.perf_counter() - start)
+    # The fastest run is the least disturbed by the rest of the machine
+    return min(timings)
+
+
+def __digest(result) -> str:
+    return hashlib.sha256(json.dumps(result, sort_keys=True, default=list).encode()).hexdigest()
+
+
+def runCatalogBenchmarks(repeats: int = DEFAULT_REPEATS) -> Dict[str, dict]:
+    """
+    Times the legacy regex parsers and catalog_parser on every fixture and checks both return the same data.
+    """
+    results = { }
+    for benchmark in BENCHMARKS:
+        with open(os.path.join(FIXTURES_DIR, benchmark.fixture), 'r', encoding='UTF-8') as f:
+            html = f.read()
+        legacy_result = json.loads(json.dumps(benchmark.normalize(benchmark.legacy(html)), default=list))
+        new_result = json.loads(json.dumps(benchmark.normalize(benchmark.new(html)), default=list))
+        legacy_seconds = __timeParser(benchmark.legacy, html, repeats)
+        new_seconds = __timeParser(benchmark.new, html, repeats)
+        results[benchmark.name] = {
+            'fixture': benchmark.fixture,
+            'page_bytes': len(html),
+            'items': len(new_result),
+            'matches_legacy': legacy_result == new_result or not benchmark.compare_legacy,
+            'result_digest': __digest(new_result),
+            'legacy_ms': legacy_seconds * 1000,
+            'new_ms': new_seconds * 1000,
+            'speedup': legacy_seconds / new_seconds if new_seconds else 0,
+        }
+    return results
+
+
+def checkAgainstBaseline(results: Dict[str, dict], baseline: Dict[str, dict]) -> List[str]:
+    regressions = []
+    for name, result in results.items():
+        if not result['matches_legacy']:
+            regressions.append(f'{name}: results differ from the legacy parser')
+        expected = baseline.get(name)
+        if not expected:
+            continue
+        if expected['result_digest'] != result['result_digest']:
+            regressions.append(f'{name}: parsed data changed from the baseline')
+        if result['speedup'] < expected['speedup'] * (1 - SPEEDUP_TOLERANCE):
+            regressions.append(f'{name}: speedup dropped to {result["speedup"]:.2f}x (baseline {expected["speedup"]:.2f}x)')
+    return regressions
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark the catalog & update history parsers against their recorded fixtures')
+    parser.add_argument('-r', '--repeats', type=int, default=DEFAULT_REPEATS, help='Timed runs per parser and fixture')
+    parser.add_argument('--update-baseline', action='store_true', help='Record these results as the new baseline')
+    args = parser.parse_args(argv)
+
+    results = runCatalogBenchmarks(args.repeats)
+    for name, result in results.items():
+        printInfo(f'{name:<24} {result["page_bytes"] / 1024:8.1f} KiB {result["items"]:5} items   legacy {result["legacy_ms"]:8.3f} ms   new {result["new_ms"]:8.3f} ms   {result["speedup"]:6.2f}x')
+
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+        with open(BASELINE_PATH, 'w', encoding='UTF-8') as f:
+            json.dump({name: {'result_digest': result['result_digest'], 'speedup': round(result['speedup'], 2)} for name, result in results.items()}, f, indent=4)
+            f.write('\n')
+        printSuccess(f'Baseline written to {BASELINE_PATH}')
+        return 0
+
+    baseline = { }
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, 'r', encoding='UTF-8') as f:
+            baseline = json.load(f)
+    regressions = checkAgainstBaseline(results, baseline)
+    for regression in regressions:
+        printError(regression)
+    if not regressions:
+        printSuccess('No regressions')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
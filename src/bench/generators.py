@@ -0,0 +1,373 @@
+"""
+Synthetic inputs for the benchmarks: express PSF manifests and blobs, nested MSU/CAB updates,
+PE files with version resources, and catalog & update history pages.
+
+Every generator is deterministic for a given seed, so runs on different machines time the same data.
+"""
+import datetime
+import hashlib
+import os
+import random
+import struct
+import uuid
+from typing import Dict, List, Tuple
+from xml.sax.saxutils import quoteattr
+
+
+# Files the generated updates are made of - all of them match `getInterestingFiles`
+SYNTHETIC_FILE_NAMES = [
+    'ntoskrnl.exe', 'ntdll.dll', 'kernel32.dll', 'kernelbase.dll', 'ws2_32.dll',
+    'dbghelp.dll', 'sechost.dll', 'msvcrt.dll', 'advapi32.dll', 'rpcrt4.dll',
+    'combase.dll', 'ucrtbase.dll', 'msvcp_win.dll', 'oleaut32.dll', 'clfs.sys',
+]
+# Files of an update which the benchmarks filter out
+SYNTHETIC_NOISE_FILE_NAMES = [
+    'shell32.dll', 'explorer.exe', 'mshtml.dll', 'win32kfull.sys', 'twinui.dll',
+    'edgehtml.dll', 'windows.storage.dll', 'ieframe.dll', 'wininet.dll', 'dxgkrnl.sys',
+]
+PSF_DELTA_TYPES = ('PA30', 'RAW')
+SYNTHETIC_BUILD = '10.0.19041'
+
+CAB_DATA_BLOCK_SIZE = 0x8000
+CAB_ATTRIBUTE_ARCHIVE = 0x20
+CAB_ATTRIBUTE_NAME_IS_UTF = 0x80
+
+PE_FILE_ALIGNMENT = 0x200
+PE_SECTION_ALIGNMENT = 0x1000
+IMAGE_DIRECTORY_ENTRY_RESOURCE = 2
+IMAGE_DIRECTORY_ENTRY_DEBUG = 6
+RT_VERSION = 16
+VS_FIXEDFILEINFO_SIGNATURE = 0xFEEF04BD
+# FileType of VS_FIXEDFILEINFO by extension
+VFT_BY_EXTENSION = {'.exe': 1, '.dll': 2, '.sys': 3}
+PE_MACHINES = {'x64': 0x8664, 'x86': 0x014c}
+WINSXS_ARCHES = {'x64': 'amd64', 'x86': 'x86'}
+
+
+def __align(value: int, alignment: int) -> int:
+    return (value + alignment - 1) // alignment * alignment
+
+
+def __pad(data: bytes, alignment: int) -> bytes:
+    return data.ljust(__align(len(data), alignment), b'\0')
+
+
+def makeWinSxSPath(file_name: str, version: str, arch: str = 'x64', patch_direction: str = '') -> str:
+    """
+    Returns the component path of a file as found in updates, e.g. `amd64_microsoft-windows-ntdll_31bf3856ad364e35_10.0.19041.3570_none_9e6a02c5e0b7c0e5\\f\\ntdll.dll`.
+    """
+    component = os.path.splitext(file_name)[0].lower().replace('_', '-')
+    digest = hashlib.sha1(f'{component}{version}{arch}'.encode()).hexdigest()[:16]
+    path = f'{WINSXS_ARCHES[arch]}_microsoft-windows-{component}_31bf3856ad364e35_{version}_none_{digest}'
+    if patch_direction:
+        path += '\\' + patch_direction
+    return path + '\\' + file_name
+
+
+def generatePsf(output_dir: str, file_count: int, average_delta_size: int = 4096, seed: int = 0, kb: str = 'KB5031356') -> Tuple[str, str]:
+    """
+    Writes an express PSF blob and its `express.psf.cix.xml` manifest with `file_count` deltas.
+
+    Every file appears with its forward and reverse deltas, like in cumulative updates.
+
+    Returns:
+        Tuple[str, str]: The paths of the PSF blob and of the manifest.
+    """
+    rand = random.Random(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    psf_path = os.path.join(output_dir, f'Windows10.0-{kb}-x64.psf')
+    manifest_path = os.path.join(output_dir, 'express.psf.cix.xml')
+    names = SYNTHETIC_FILE_NAMES + SYNTHETIC_NOISE_FILE_NAMES
+
+    file_elements = []
+    offset = 0
+    with open(psf_path, 'wb') as psf_file:
+        for index in range(file_count):
+            file_name = names[index % len(names)]
+            version = f'{SYNTHETIC_BUILD}.{1000 + index // len(names)}'
+            patch_direction = 'f' if index % 2 == 0 else 'r'
+            delta = rand.randbytes(max(1, int(rand.uniform(0.5, 1.5) * average_delta_size)))
+            psf_file.write(delta)
+            name = makeWinSxSPath(file_name, version, 'x64', patch_direction)
+            file_elements.append(
+                f'<File id="{index}" name={quoteattr(name)} length="{len(delta) * 3}" time="133414785550000000" attr="128">'
+                f'<Hash alg="SHA256" value="{hashlib.sha256(delta + b"full").hexdigest().upper()}"/>'
+                f'<Delta><Source type="{PSF_DELTA_TYPES[index % len(PSF_DELTA_TYPES)]}" offset="{offset}" length="{len(delta)}">'
+                f'<Hash alg="SHA256" value="{hashlib.sha256(delta).hexdigest().upper()}"/>'
+                f'</Source></Delta></File>')
+            offset += len(delta)
+
+    with open(manifest_path, 'w', encoding='UTF-8') as f:
+        f.write('<?xml version="1.0" encoding="utf-8"?>\n')
+        f.write(f'<Container xmlns="urn:ContainerIndex" name="Windows10.0-{kb}-x64.psf" type="PSF" size="{offset}" version="1">\n<Files>\n')
+        for file_element in file_elements:
+            f.write(file_element)
+            f.write('\n')
+        f.write('</Files>\n</Container>\n')
+    return psf_path, manifest_path
+
+
+def __versionBlock(key: str, value: bytes = b'', value_length: int = 0, is_text: bool = False, children: List[bytes] = None) -> bytes:
+    # A VS_VERSIONINFO style node: wLength, wValueLength, wType, szKey, padding, value, padding, children
+    block = struct.pack('<HHH', 0, value_length, 1 if is_text else 0) + (key + '\0').encode('utf-16-le')
+    block = __pad(block, 4) + value
+    for child in children or []:
+        block = __pad(block, 4) + child
+    return struct.pack('<H', len(block)) + block[2:]
+
+
+def buildVersionResource(version: str, original_name: str, description: str = 'Synthetic benchmark binary') -> bytes:
+    """
+    Builds a VS_VERSIONINFO resource, as read by `FileVersionInfo` and `GetFileVersionInfo`.
+    """
+    major, minor, build, revision = (int(part) for part in version.split('.'))
+    file_type = VFT_BY_EXTENSION.get(os.path.splitext(original_name)[1].lower(), 2)
+    fixed_info = struct.pack('<13I', VS_FIXEDFILEINFO_SIGNATURE, 0x10000, major << 16 | minor, build << 16 | revision,
+                             major << 16 | minor, build << 16 | revision, 0x3F, 0, 0x40004, file_type, 0, 0, 0)
+    strings = []
+    for name, text in (
+        ('CompanyName', 'Microsoft Corporation'),
+        ('FileDescription', description),
+        ('FileVersion', f'{version} (WinBuild.160101.0800)'),
+        ('InternalName', original_name),
+        ('OriginalFilename', original_name),
+        ('ProductName', 'Microsoft® Windows® Operating System'),
+        ('ProductVersion', version),
+    ):
+        strings.append(__versionBlock(name, (text + '\0').encode('utf-16-le'), len(text) + 1, is_text=True))
+    string_file_info = __versionBlock('StringFileInfo', is_text=True, children=[__versionBlock('040904B0', is_text=True, children=strings)])
+    var_file_info = __versionBlock('VarFileInfo', is_text=True, children=[__versionBlock('Translation', struct.pack('<HH', 0x409, 0x4B0), 4)])
+    return __versionBlock('VS_VERSION_INFO', fixed_info, len(fixed_info), children=[string_file_info, var_file_info])
+
+
+def __buildResourceSection(section_rva: int, version_resource: bytes) -> bytes:
+    # Type (RT_VERSION) -> name (1) -> language (en-US) -> the resource
+    def directory(entry_id: int, offset: int) -> bytes:
+        return struct.pack('<IIHHHH', 0, 0, 0, 0, 0, 1) + struct.pack('<II', entry_id, offset)
+    data_offset = 88
+    section = directory(RT_VERSION, 0x80000000 | 24) + directory(1, 0x80000000 | 48) + directory(0x409, 72)
+    section += struct.pack('<IIII', section_rva + data_offset, len(version_resource), 0, 0)
+    return section + version_resource
+
+
+def buildPeImage(version: str, original_name: str, arch: str = 'x64', seed: int = 0, code_size: int = 0x4000) -> bytes:
+    """
+    Builds a PE image with a version resource and a CodeView debug entry, so it can be sorted and published.
+
+    The code section is random filler - the image is never meant to run.
+    """
+    rand = random.Random(f'{seed}:{original_name}:{version}:{arch}')
+    machine = PE_MACHINES[arch]
+    is_64 = arch == 'x64'
+    optional_header_size = 240 if is_64 else 224
+    data_directories_offset = 112 if is_64 else 96
+    timestamp = rand.randrange(0x50000000, 0x70000000)
+
+    pdb_name = os.path.splitext(original_name)[0] + '.pdb'
+    codeview = b'RSDS' + uuid.UUID(int=rand.getrandbits(128)).bytes_le + struct.pack('<I', 1) + pdb_name.encode() + b'\0'
+
+    text_raw = rand.randbytes(code_size)
+    rdata_rva = __align(PE_SECTION_ALIGNMENT + len(text_raw), PE_SECTION_ALIGNMENT)
+    # The debug directory is followed by its CodeView entry
+    debug_directory_size = 28
+    rsrc_rva = __align(rdata_rva + debug_directory_size + len(codeview), PE_SECTION_ALIGNMENT)
+    rsrc_raw = __buildResourceSection(rsrc_rva, buildVersionResource(version, original_name))
+    size_of_image = __align(rsrc_rva + len(rsrc_raw), PE_SECTION_ALIGNMENT)
+
+    sections = [(b'.text', PE_SECTION_ALIGNMENT, text_raw, 0x60000020), (b'.rdata', rdata_rva, None, 0x40000040), (b'.rsrc', rsrc_rva, rsrc_raw, 0x40000040)]
+    headers_size = __align(0x80 + 4 + 20 + optional_header_size + 40 * len(sections), PE_FILE_ALIGNMENT)
+    raw_offset = headers_size
+    raw_offsets = []
+    for _, _, raw, _ in sections:
+        raw_offsets.append(raw_offset)
+        raw_offset += __align(len(raw) if raw is not None else debug_directory_size + len(codeview), PE_FILE_ALIGNMENT)
+    rdata_raw = struct.pack('<IIHHIIII', 0, timestamp, 0, 0, 2, len(codeview), rdata_rva + debug_directory_size, raw_offsets[1] + debug_directory_size) + codeview
+    sections[1] = (b'.rdata', rdata_rva, rdata_raw, 0x40000040)
+
+    optional_header = bytearray(optional_header_size)
+    struct.pack_into('<HBB', optional_header, 0, 0x20b if is_64 else 0x10b, 14, 0)
+    struct.pack_into('<III', optional_header, 4, len(text_raw), len(rdata_raw) + len(rsrc_raw), 0)
+    struct.pack_into('<II', optional_header, 16, PE_SECTION_ALIGNMENT, PE_SECTION_ALIGNMENT)
+    if is_64:
+        struct.pack_into('<Q', optional_header, 24, 0x140000000)
+    else:
+        struct.pack_into('<II', optional_header, 24, rdata_rva, 0x400000)
+    struct.pack_into('<II', optional_header, 32, PE_SECTION_ALIGNMENT, PE_FILE_ALIGNMENT)
+    struct.pack_into('<HHHHHH', optional_header, 40, 10, 0, 10, 0, 10, 0)
+    struct.pack_into('<III', optional_header, 56, size_of_image, headers_size, 0)
+    struct.pack_into('<HH', optional_header, 68, 3, 0x8160)
+    struct.pack_into('<I', optional_header, data_directories_offset - 4, 16)
+    struct.pack_into('<II', optional_header, data_directories_offset + 8 * IMAGE_DIRECTORY_ENTRY_RESOURCE, rsrc_rva, len(rsrc_raw))
+    struct.pack_into('<II', optional_header, data_directories_offset + 8 * IMAGE_DIRECTORY_ENTRY_DEBUG, rdata_rva, debug_directory_size)
+
+    characteristics = 0x22 if is_64 else 0x102
+    if original_name.lower().endswith(('.dll', '.sys')):
+        characteristics |= 0x2000
+    image = bytearray(b'MZ'.ljust(0x3c, b'\0') + struct.pack('<I', 0x80))
+    image = image.ljust(0x80, b'\0')
+    image += b'PE\0\0' + struct.pack('<HHIIIHH', machine, len(sections), timestamp, 0, 0, optional_header_size, characteristics)
+    image += optional_header
+    for (name, rva, raw, flags), offset in zip(sections, raw_offsets):
+        image += struct.pack('<8sIIIIIIHHI', name, len(raw), rva, __align(len(raw), PE_FILE_ALIGNMENT), offset, 0, 0, 0, 0, flags)
+    image = image.ljust(headers_size, b'\0')
+    for _, _, raw, _ in sections:
+        image += __pad(raw, PE_FILE_ALIGNMENT)
+    return bytes(image)
+
+
+def buildPeRevision(base_image: bytes, revision: int, change_count: int = 16, change_size: int = 32, seed: int = 0) -> bytes:
+    """
+    Returns `base_image` with `change_count` small runs of its sections rewritten, like a cumulative update's build of a binary -
+    a small delta away from its base.
+    """
+    rand = random.Random(f'{seed}:{revision}')
+    image = bytearray(base_image)
+    # Past the headers, which the sections start after
+    for _ in range(change_count):
+        offset = rand.randrange(0x400, len(image) - change_size)
+        image[offset:offset + change_size] = rand.randbytes(change_size)
+    return bytes(image)
+
+
+def generatePeFile(path: str, version: str, arch: str = 'x64', original_name: str = None, seed: int = 0, code_size: int = 0x4000) -> str:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(buildPeImage(version, original_name if original_name else os.path.basename(path), arch, seed, code_size))
+    return path
+
+
+def generatePeCorpus(output_dir: str, file_count: int, seed: int = 0, nested: bool = True) -> List[str]:
+    """
+    Writes `file_count` PE files of several versions and architectures, in a scattered tree when `nested`.
+    """
+    paths = []
+    for index in range(file_count):
+        file_name = SYNTHETIC_FILE_NAMES[index % len(SYNTHETIC_FILE_NAMES)]
+        arch = 'x64' if index % 3 else 'x86'
+        version = f'{SYNTHETIC_BUILD}.{1000 + index // len(SYNTHETIC_FILE_NAMES)}'
+        directory = os.path.join(output_dir, f'update_{index // 50}', makeWinSxSPath(file_name, version, arch).split('\\')[0]) if nested else output_dir
+        name = file_name if nested else f'{os.path.splitext(file_name)[0]}_{index}{os.path.splitext(file_name)[1]}'
+        paths.append(generatePeFile(os.path.join(directory, name), version, arch, original_name=file_name, seed=seed))
+    return paths
+
+
+def buildCabinet(files: List[Tuple[str, bytes]], timestamp: datetime.datetime = datetime.datetime(2023, 10, 10)) -> bytes:
+    """
+    Builds an uncompressed (store) cabinet, the container format of MSU and CAB updates.
+    """
+    header_size = 36
+    folder_size = 8
+    entries = b''
+    folder_offset = 0
+    date = (timestamp.year - 1980) << 9 | timestamp.month << 5 | timestamp.day
+    time_of_day = timestamp.hour << 11 | timestamp.minute << 5 | timestamp.second // 2
+    for name, data in files:
+        encoded_name = name.encode('UTF-8')
+        attributes = CAB_ATTRIBUTE_ARCHIVE | (CAB_ATTRIBUTE_NAME_IS_UTF if not name.isascii() else 0)
+        entries += struct.pack('<IIHHHH', len(data), folder_offset, 0, date, time_of_day, attributes) + encoded_name + b'\0'
+        folder_offset += len(data)
+
+    payload = b''.join(data for _, data in files)
+    blocks = [payload[offset:offset + CAB_DATA_BLOCK_SIZE] for offset in range(0, len(payload), CAB_DATA_BLOCK_SIZE)] or [b'']
+    data_offset = header_size + folder_size + len(entries)
+    # A zero checksum tells extractors not to verify the block
+    data = b''.join(struct.pack('<IHH', 0, len(block), len(block)) + block for block in blocks)
+    cabinet_size = data_offset + len(data)
+
+    header = b'MSCF' + struct.pack('<IIIIIBBHHHHH', 0, cabinet_size, 0, header_size + folder_size, 0, 3, 1, 1, len(files), 0, 0x1234, 0)
+    folder = struct.pack('<IHH', data_offset, len(blocks), 0)
+    return header + folder + entries + data
+
+
+def generateLegacyMsu(output_dir: str, kb: str, build_revision: int, files_per_arch: int = 8, seed: int = 0) -> str:
+    """
+    Writes a Windows 10 (legacy style) update: an MSU holding the update CAB, holding `Cab_1_for_<KB>.cab`
+    with the updated binaries under their component directories - as taken apart by `extractMsu`.
+    """
+    rand = random.Random(f'{seed}:{kb}')
+    version = f'{SYNTHETIC_BUILD}.{build_revision}'
+    with_noise = SYNTHETIC_FILE_NAMES[:files_per_arch] + SYNTHETIC_NOISE_FILE_NAMES
+    inner_files = []
+    for arch in WINSXS_ARCHES:
+        for file_name in with_noise:
+            inner_files.append((makeWinSxSPath(file_name, version, arch), buildPeImage(version, file_name, arch, seed + rand.randrange(1 << 16), code_size=0x2000)))
+
+    sub_cab = buildCabinet(inner_files)
+    main_cab = buildCabinet([(f'Cab_1_for_{kb}.cab', sub_cab), ('update.mum', b'<assembly/>')])
+    msu = buildCabinet([(f'Windows10.0-{kb}-x64.cab', main_cab), (f'Windows10.0-{kb}-x64-pkgProperties.txt', f'KB Article Number="{kb[2:]}"\r\n'.encode())])
+    os.makedirs(output_dir, exist_ok=True)
+    msu_path = os.path.join(output_dir, f'Windows 10 19041 x64 - {kb} - 2023-10.msu')
+    with open(msu_path, 'wb') as f:
+        f.write(msu)
+    return msu_path
+
+
+def generateUpdateTree(output_dir: str, update_count: int, files_per_update: int = 40, seed: int = 0) -> int:
+    """
+    Lays out the tree of extracted updates which `sort` and `walkFiles` scan: per update, its MSU and CABs
+    and the component directories of its files (empty placeholders).
+
+    Returns:
+        int: The number of files written.
+    """
+    rand = random.Random(seed)
+    names = SYNTHETIC_FILE_NAMES + SYNTHETIC_NOISE_FILE_NAMES
+    written = 0
+    for update in range(update_count):
+        kb = f'KB{5010000 + update * 7}'
+        update_dir = os.path.join(output_dir, f'{2020 + update // 12}-{update % 12 + 1:02}', kb)
+        os.makedirs(update_dir, exist_ok=True)
+        for name in (f'Windows10.0-{kb}-x64.msu', f'Windows10.0-{kb}-x64.cab', f'Cab_1_for_{kb}_PSFX.cab', f'SSU-19041.{update}-x64.cab', 'update.mum'):
+            open(os.path.join(update_dir, name), 'wb').close()
+            written += 1
+        for _ in range(files_per_update):
+            file_name = rand.choice(names)
+            arch = rand.choice(list(WINSXS_ARCHES))
+            path = os.path.join(update_dir, *makeWinSxSPath(file_name, f'{SYNTHETIC_BUILD}.{1000 + update}', arch, rand.choice('fr')).split('\\'))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, 'wb').close()
+            written += 1
+    return written
+
+
+def generateCatalogSearchPage(result_count: int, seed: int = 0) -> str:
+    """
+    Builds a catalog search results page with `result_count` rows of cumulative updates for several Windows versions.
+    """
+    rand = random.Random(seed)
+    versions = [('10', '22H2'), ('11', '22H2'), ('11', '23H2'), ('Server 2022', ''), ('10', '1809')]
+    rows = []
+    for index in range(result_count):
+        link_id = str(uuid.UUID(int=rand.getrandbits(128)))
+        major, minor = versions[index % len(versions)]
+        year, month = 2018 + index % 6, index % 12 + 1
+        bitness = ('x64', 'x86', 'ARM64')[index % 3]
+        version = f'Version {minor} ' if minor else ''
+        kind = 'Dynamic Cumulative Update' if index % 11 == 0 else 'Cumulative Update'
+        title = f'{year}-{month:02} {kind} for Windows {major} {version}for {bitness}-based Systems (KB{5000000 + index})'
+        rows.append(
+            f'<tr id="{link_id}_R{index}"><td class="resultsbottomBorder resultspadding" id="{link_id}_C1_R{index}">'
+            f'<a id=\'{link_id}_link\' href= "javascript:void(0);" onclick=\'goToDetails("{link_id}");\' class="contentTextItemSpacerNoBreakLink">\n'
+            f'                            {title}\n                        </a></td>'
+            f'<td class="resultsbottomBorder resultspadding">Windows {major}</td>'
+            f'<td class="resultsbottomBorder resultspadding"><span id="{link_id}_size">{rand.randrange(100, 900)}.{rand.randrange(10)} MB</span></td>'
+            f'<td><input id="{link_id}" class="flatBlueButtonDownload focus-only" type="button" value=\'Download\' /></td></tr>')
+    return ('<html><head><title>Microsoft Update Catalog</title></head><body><div id="tableContainer"><table class="resultsBorder" id="ctl00_catalogBody_updateMatches">\n'
+            + '\n'.join(rows) + '\n</table></div></body></html>\n')
+
+
+def generateUpdateHistoryPage(kb_count: int, build: int = 19045, seed: int = 0) -> str:
+    """
+    Builds an update history page whose navigation lists `kb_count` releases of `build`, newest first.
+    """
+    rand = random.Random(seed)
+    months = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October', 'November', 'December']
+    links = []
+    for index in range(kb_count):
+        release = kb_count - index
+        year, month = 2019 + release // 24, months[release // 2 % 12]
+        kb = 5000000 + release * 7
+        preview = ' Preview' if release % 2 else ''
+        links.append(f'<li><a class="supLeftNavLink" data-bi-slot="{index + 1}" href="/en-us/help/{kb}">{month} {rand.randrange(1, 28)}, {year}&#x2014;KB{kb} (OS Build {build}.{1000 + release * 11}){preview}</a></li>')
+    body = ''.join(f'<p>This update replaces KB{5000000 + rand.randrange(kb_count) * 7}. See the release notes for details.</p>' for _ in range(kb_count))
+    return f'<html><body><nav><ul class="supLeftNavArticles">{"".join(links)}</ul></nav><article>{body}</article></body></html>\n'
@@ -1,7 +1,11 @@
+import os
 import subprocess
+import time
 from colorama import Style
 import tqdm
 from src.utils.settings import isVerboseMode
+from src.utils.metrics import SUBPROCESS_SECONDS, SUBPROCESSES
+from src.utils.trace import traceSpan
 from src.utils.utils import SymbolManagerException
 
 
@@ -15,7 +19,16 @@ def run(params, *args, **kwargs) -> subprocess.CompletedProcess[str]:
         tqdm.tqdm.write(Style.DIM + '> ' + cmd_line_str + Style.RESET_ALL)
     if 'capture_output' not in kwargs:
         kwargs['capture_output'] = True
-    proc = subprocess.run(params, *args, **kwargs)
+    command = os.path.basename(str(params[0]))
+    with traceSpan(command, 'proc') as span:
+        if span:
+            span.set(cmdline=subprocess.list2cmdline(params))
+        start = time.perf_counter()
+        proc = subprocess.run(params, *args, **kwargs)
+        SUBPROCESS_SECONDS.inc(time.perf_counter() - start, command=command)
+        SUBPROCESSES.inc(command=command)
+        if span:
+            span.set(returncode=proc.returncode)
     if proc.returncode != 0:
         raise ExternalProcedureException(f'External procedure returned {proc.returncode}')
     return proc
\ No newline at end of file
@@ -1,81 +1,411 @@
 import gzip
+import io
 import json
-import requests
 import os
-
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from types import NoneType
+from typing import Any, Dict, Iterable, Iterator, List, Set, TextIO, Tuple
+import requests
 import tqdm
+from src.utils.download import downloadFile
+from src.utils.http import DEFAULT_TIMEOUT, getSession
+from src.utils.http_cache import HttpCacheMissException
+from src.utils.printer import printError, printInfo, printLog, printSuccess
+from src.utils.settings import getHttpCacheDirectory, getOutputDirectory, getRemotePdbStore, getWinBIndexUrl, isOfflineMode
+from src.store.binary_catalog import recordBinary
+from src.store.cas import getContentStore
+from src.utils.smart_exe import buildVersionedFileName
+from src.utils.utils import SymbolManagerException, calculateFileHash, normalizeDirtyBitness
+
+
+WINBINDEX_CACHE_DIR_NAME = 'winbindex'
+# Indexes are rebuilt daily, a cached one is revalidated after this many seconds
+WINBINDEX_INDEX_TTL = 24 * 60 * 60
+WINBINDEX_READ_SIZE = 1024 * 1024
+DEFAULT_INDEX_WORKERS = 4
+DEFAULT_DOWNLOAD_WORKERS = 8
+
+MACHINE_TYPES = {
+    0x14c: 'x86',
+    0x8664: 'x64',
+    0x1c4: 'arm',
+    0xaa64: 'arm64',
+}
+WOW_ON_ARM64_ARCHES = ('arm64.arm', 'arm64.x86')
+
+
+class WinBIndexException(SymbolManagerException):
+    pass
+
+
+def iterateJsonObject(stream: TextIO, read_size: int = WINBINDEX_READ_SIZE) -> Iterator[Tuple[str, Any]]:
+    """
+    Yields the (key, value) pairs of a top level JSON object one at a time.
+
+    Only the current value is decoded, so the memory used is bound by the largest value
+    rather than the whole document.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+
+    def fill() -> bool:
+        nonlocal buffer, pos, eof
+        if eof:
+            return False
+        chunk = stream.read(read_size)
+        if not chunk:
+            eof = True
+            return False
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        return True
+
+    def skipWhitespace():
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+                pos += 1
+            if pos < len(buffer) or not fill():
+                return
+
+    def expect(chars: str) -> str:
+        nonlocal pos
+        skipWhitespace()
+        if pos >= len(buffer) or buffer[pos] not in chars:
+            raise WinBIndexException(f'Malformed WinBIndex index: expected one of "{chars}"')
+        pos += 1
+        return buffer[pos - 1]
+
+    def decode() -> Any:
+        nonlocal pos
+        skipWhitespace()
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+                # A number may be cut at the end of the buffer
+                if end < len(buffer) or eof:
+                    pos = end
+                    return value
+            except json.JSONDecodeError as ex:
+                if eof:
+                    raise WinBIndexException(f'Malformed WinBIndex index: {ex}')
+            fill()
+
+    expect('{')
+    skipWhitespace()
+    if pos < len(buffer) and buffer[pos] == '}':
+        return
+    while True:
+        key = decode()
+        expect(':')
+        yield key, decode()
+        if expect(',}') == '}':
+            return
+
+
+class WinBIndexEntry:
+    """
+    A single file (identified by its SHA256) in a WinBIndex index.
+    """
+    def __init__(self, sha256: str, file_name: str, version: str, arch: str, kbs: List[str], file_info: dict) -> NoneType:
+        self.sha256 = sha256.lower()
+        self.file_name = file_name
+        self.version = version
+        self.arch = arch
+        self.kbs = kbs
+        self.size = file_info.get('size')
+        self.timestamp = file_info.get('timestamp')
+        self.virtual_size = file_info.get('virtualSize')
+
+    def getBuild(self) -> int:
+        return int(self.version.split('.')[2])
+
+    def getRevision(self) -> int:
+        return int(self.version.split('.')[3])
+
+    def isBase(self) -> bool:
+        return self.getRevision() == 1
+
+    def isDownloadable(self) -> bool:
+        return self.timestamp is not None and self.virtual_size is not None
+
+    def getDownloadUrl(self) -> str:
+        # Binaries are indexed on the symbol server by their unpadded PE timestamp and image size (see `PeDebugInfo.getPeStoreKey`)
+        return f'{getRemotePdbStore()}/{self.file_name}/{self.timestamp:X}{self.virtual_size:x}/{self.file_name}'
+
+    def getOutputName(self) -> str:
+        base, ext = os.path.splitext(self.file_name)
+        return buildVersionedFileName(base, self.version, self.arch, ext)
+
+    @staticmethod
+    def fromInfo(sha256: str, file_name: str, info: dict) -> 'WinBIndexEntry | None':
+        """
+        Builds an entry from its index value. Returns None for entries without a usable version or architecture.
+        """
+        file_info = info.get('fileInfo', { })
+        version = ''
+        dirty_arch = ''
+        kbs = []
+        for updates in info.get('windowsVersions', { }).values():
+            for kb, update in updates.items():
+                if kb != 'BASE':
+                    kbs.append(kb)
+                for assembly in update.get('assemblies', { }).values():
+                    identity = assembly.get('assemblyIdentity', { })
+                    version = version if version else identity.get('version', '')
+                    dirty_arch = dirty_arch if dirty_arch else identity.get('processorArchitecture', '')
+        if not version:
+            # Files of base releases are listed without assemblies
+            version = file_info.get('version', '').split(' ')[0]
+        if not dirty_arch:
+            dirty_arch = MACHINE_TYPES.get(file_info.get('machineType'), '')
+        if version.count('.') != 3:
+            return None
+        if dirty_arch in WOW_ON_ARM64_ARCHES:
+            # Would be named like the native arm/x86 binaries of the same version
+            return None
+        try:
+            arch = normalizeDirtyBitness(dirty_arch)
+        except SymbolManagerException:
+            return None
+        return WinBIndexEntry(sha256, file_name, version, arch, kbs, file_info)
+
+
+class WinBIndexFilter:
+    """
+    Selects the entries to download. Empty filters match everything.
+    """
+    def __init__(self, arches: Iterable[str] = None, builds: Iterable[int] = None, base_only: bool = False) -> NoneType:
+        self.arches = set(normalizeDirtyBitness(arch) for arch in arches) if arches else set()
+        self.builds = set(int(build) for build in builds) if builds else set()
+        self.base_only = base_only
 
+    def matches(self, entry: WinBIndexEntry) -> bool:
+        if self.arches and entry.arch not in self.arches:
+            return False
+        if self.builds and entry.getBuild() not in self.builds:
+            return False
+        if self.base_only and not entry.isBase():
+            return False
+        return entry.isDownloadable()
+
+
+class WinBIndexStats:
+    indexes = 0
+    cached_indexes = 0
+    entries = 0
+    selected = 0
+    downloaded = 0
+    present = 0
+    failed = 0
+
+    def __str__(self) -> str:
+        return f'{self.indexes} indexes ({self.cached_indexes} from the cache), {self.entries} entries, {self.selected} selected, {self.downloaded} downloaded, {self.present} already present, {self.failed} failed'
+
+
+class WinBIndexClient:
+    """
+    Fetches binaries listed by WinBIndex from the Microsoft symbol server.
+
+    The compressed per-file indexes are cached on disk (revalidated daily with ETag / Last-Modified)
+    and parsed incrementally, filtering entries as they are decoded. The selected binaries are downloaded
+    concurrently, skipping files which are already in the output directory, and verified against the
+    SHA256 the index lists.
+
+    Example:
+        ```python
+        client = WinBIndexClient()
+        stats = client.fetch(['ntoskrnl.exe'], WinBIndexFilter(arches=['x64'], builds=[22621], base_only=True))
+        ```
+    """
+    def __init__(self, output_dir: str = None, cache_dir: str = None, data_url: str = None, index_workers: int = DEFAULT_INDEX_WORKERS, download_workers: int = DEFAULT_DOWNLOAD_WORKERS) -> NoneType:
+        self.output_dir = output_dir if output_dir else getOutputDirectory()
+        self.cache_dir = cache_dir if cache_dir else os.path.join(getHttpCacheDirectory(), WINBINDEX_CACHE_DIR_NAME)
+        self.data_url = (data_url if data_url else getWinBIndexUrl()).rstrip('/')
+        self.index_workers = index_workers
+        self.download_workers = download_workers
+        self.stats = WinBIndexStats()
+        self.stats_lock = threading.Lock()
+        self.claimed_names: Set[str] = set()
+
+    def __count(self, counter: str, amount: int = 1):
+        with self.stats_lock:
+            setattr(self.stats, counter, getattr(self.stats, counter) + amount)
+
+    def getIndexUrl(self, file_name: str) -> str:
+        return f'{self.data_url}/{file_name.lower()}.json.gz'
+
+    def getIndexPath(self, file_name: str) -> str:
+        """
+        Makes sure an up to date compressed index of `file_name` is cached and returns its path.
+        """
+        index_path = os.path.join(self.cache_dir, f'{file_name.lower()}.json.gz')
+        meta_path = index_path + '.meta.json'
+        meta = { }
+        if os.path.exists(index_path) and os.path.exists(meta_path):
+            try:
+                with open(meta_path, 'r', encoding='UTF-8') as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                meta = { }
+        if meta and (isOfflineMode() or time.time() - meta.get('fetched_at', 0) < WINBINDEX_INDEX_TTL):
+            self.__count('cached_indexes')
+            return index_path
+        if isOfflineMode():
+            raise HttpCacheMissException(f'WinBIndex index of {file_name} is not cached (offline mode)')
+
+        headers = { }
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        url = self.getIndexUrl(file_name)
+        with getSession().get(url, headers=headers, stream=True, timeout=DEFAULT_TIMEOUT) as response:
+            if response.status_code == 304 and meta:
+                self.__count('cached_indexes')
+            elif response.status_code == 404:
+                raise WinBIndexException(f'WinBIndex has no index of {file_name}')
+            elif not response.ok:
+                raise WinBIndexException(f'WinBIndex returned {response.status_code} for {url}')
+            else:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                part_path = f'{index_path}.{threading.get_ident()}.part'
+                with open(part_path, 'wb') as f:
+                    for chunk in response.raw.stream(WINBINDEX_READ_SIZE, decode_content=False):
+                        f.write(chunk)
+                os.replace(part_path, index_path)
+                self.__count('indexes')
+                meta = {'url': url, 'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified')}
+        meta['fetched_at'] = time.time()
+        with open(meta_path, 'w', encoding='UTF-8') as f:
+            json.dump(meta, f)
+        return index_path
+
+    def iterateEntries(self, file_name: str, entry_filter: WinBIndexFilter = None) -> Iterator[WinBIndexEntry]:
+        with gzip.open(self.getIndexPath(file_name), 'rb') as f:
+            for sha256, info in iterateJsonObject(io.TextIOWrapper(f, encoding='UTF-8')):
+                self.__count('entries')
+                entry = WinBIndexEntry.fromInfo(sha256, file_name, info)
+                if entry and (entry_filter is None or entry_filter.matches(entry)):
+                    yield entry
+
+    def __claim(self, entry: WinBIndexEntry) -> bool:
+        """
+        Makes sure every output file is downloaded once, even if it is listed under several hashes.
+        """
+        with self.stats_lock:
+            if entry.getOutputName() in self.claimed_names:
+                return False
+            self.claimed_names.add(entry.getOutputName())
+            return True
+
+    def download(self, entry: WinBIndexEntry) -> str:
+        output_path = os.path.join(self.output_dir, entry.getOutputName())
+        if os.path.exists(output_path):
+            self.__count('present')
+            return output_path
+        store = getContentStore(self.output_dir)
+        if store and store.hasBlob(entry.sha256):
+            # The same binary is already stored under another name
+            store.link(entry.getOutputName(), entry.sha256)
+            recordBinary(output_path, 'winbindex', source=entry.getDownloadUrl(), sha256=entry.sha256)
+            self.__count('present')
+            return output_path
+        os.makedirs(self.output_dir, exist_ok=True)
+        tmp_path = output_path + '.winbindex'
+        downloadFile(entry.getDownloadUrl(), tmp_path, expected_size=entry.size, workers=1)
+        if calculateFileHash(tmp_path) != entry.sha256:
+            os.remove(tmp_path)
+            raise WinBIndexException(f'SHA256 mismatch for {entry.getOutputName()}')
+        if store:
+            store.putFile(tmp_path, entry.getOutputName(), move=True, sha256=entry.sha256)
+        else:
+            os.replace(tmp_path, output_path)
+        recordBinary(output_path, 'winbindex', source=entry.getDownloadUrl(), sha256=entry.sha256)
+        self.__count('downloaded')
+        printSuccess(f'Downloaded {entry.getOutputName()}')
+        return output_path
+
+    def __selectEntries(self, file_name: str, entry_filter: WinBIndexFilter) -> List[WinBIndexEntry]:
+        selected = [entry for entry in self.iterateEntries(file_name, entry_filter) if self.__claim(entry)]
+        self.__count('selected', len(selected))
+        printLog(f'Selected {len(selected)} {file_name} files')
+        return selected
+
+    def fetch(self, file_names: Iterable[str], entry_filter: WinBIndexFilter = None) -> WinBIndexStats:
+        """
+        Downloads the binaries selected by `entry_filter` for every file name.
+        Indexes are fetched and parsed in parallel with the downloads of already parsed ones.
+        """
+        with ThreadPoolExecutor(max_workers=self.index_workers) as index_executor, ThreadPoolExecutor(max_workers=self.download_workers) as download_executor:
+            index_futures = {index_executor.submit(self.__selectEntries, file_name, entry_filter): file_name for file_name in file_names}
+            download_futures = { }
+            for future in as_completed(index_futures):
+                try:
+                    for entry in future.result():
+                        download_futures[download_executor.submit(self.download, entry)] = entry
+                except (SymbolManagerException, requests.RequestException, OSError) as ex:
+                    printError(f'Failed to read the WinBIndex index of {index_futures[future]}: {ex}')
+            for future in tqdm.tqdm(as_completed(download_futures), total=len(download_futures), disable=not download_futures):
+                try:
+                    future.result()
+                except (SymbolManagerException, requests.RequestException, OSError) as ex:
+                    self.__count('failed')
+                    printError(f'Failed to download {download_futures[future].getOutputName()}: {ex}')
+        printInfo(f'WinBIndex fetch done: {self.stats}')
+        return self.stats
+
+
+def fetchWinBIndexFiles(file_names: Iterable[str], arches: Iterable[str] = None, builds: Iterable[int] = None, base_only: bool = False, jobs: int = None) -> WinBIndexStats:
+    return WinBIndexClient(download_workers=jobs if jobs else DEFAULT_DOWNLOAD_WORKERS).fetch(file_names, WinBIndexFilter(arches, builds, base_only))
+
+
+def getWinBinDexVersions(file_name: str) -> Dict[str, dict]:
+    """
+    Reads an entire index. Prefer `WinBIndexClient.iterateEntries`, which filters while parsing.
+    """
+    with gzip.open(WinBIndexClient().getIndexPath(file_name), 'rb') as f:
+        return dict(iterateJsonObject(io.TextIOWrapper(f, encoding='UTF-8')))
+
+
+def __entryOfInfo(info: dict) -> WinBIndexEntry:
+    file_name = ''
+    for updates in info.get('windowsVersions', { }).values():
+        for update in updates.values():
+            for assembly in update.get('assemblies', { }).values():
+                for attributes in assembly.get('attributes', []):
+                    file_name = file_name if file_name else attributes.get('name', '')
+    entry = WinBIndexEntry.fromInfo('', file_name, info)
+    if entry is None or not file_name:
+        raise WinBIndexException('WinBIndex entry has no usable file name, version or architecture')
+    return entry
 
-def getWinBinDexVersions(file_name: str) -> dict:
-    a = f'https://m417z.com/winbindex-data-insider/by_filename_compressed/{file_name}.json.gz'
-    # a = f'https://winbindex.m417z.com/data/by_filename_compressed/{file_name}.json.gz'
-    return json.loads(gzip.decompress(requests.get(a).content))
 
 def generateFileName(info: dict) -> str:
-    x = info['windowsVersions']
-    x = x[list(x.keys())[0]]
-    kb = list(x.keys())[0]
-    x = x[kb]
-    assm = x['assemblies']
-    assm = assm[list(assm.keys())[0]]
-    name = assm['attributes'][0]['name']
-    assm = assm[list(assm.keys())[0]]
-    updateInfo = x['updateInfo']
-    base, ext = os.path.splitext(name)
-    return f'{base} - {assm["version"]} {assm["processorArchitecture"]}{ext}'
+    """
+    The versioned output name of an index value, see `WinBIndexEntry.getOutputName`.
+    """
+    return __entryOfInfo(info).getOutputName()
 
 
 def generateDownloadUrl(info: dict) -> str:
-    fi = info['fileInfo']
-    hs = hex(fi['timestamp'])[2:].upper() + hex(fi['virtualSize'])[2:].lower()
-    a = info['windowsVersions']
-    a = a[list(a.keys())[0]]
-    a = a[list(a.keys())[0]]
-    a = a['assemblies']
-    a = a[list(a.keys())[0]]
-    a = a['attributes'][0]
-    name = a['name']
-    return f'https://msdl.microsoft.com/download/symbols/{name}/{hs}/{name}'
-
-
-def isWinBinDexFileBase(info: dict) -> bool:
-    a = info['windowsVersions']
-    a = a[list(a.keys())[0]]
-    a = a[list(a.keys())[0]]
-    assm = a['assemblies']
-    assm = assm[list(assm.keys())[0]]
-    if assm['assemblyIdentity']['processorArchitecture'] == 'arm64' or assm['assemblyIdentity']['processorArchitecture'] == 'arm64.arm' or assm['assemblyIdentity']['processorArchitecture'] == 'arm64.x86':
-        return False
-    ver = assm['assemblyIdentity']["version"]
-    maj = int(ver.split('.')[2])
-    if maj != 20348:
+    """
+    The symbol server URL of an index value, see `WinBIndexEntry.getDownloadUrl`.
+    """
+    return __entryOfInfo(info).getDownloadUrl()
+
+
+def isWinBinDexFileBase(info: dict, builds: Iterable[int] = None) -> bool:
+    """
+    Whether an index value is a base (revision 1) file of one of `builds`, or of any build by default.
+
+    This used to accept only non-arm64 files of build 20348, pass `builds=[20348]` for that build alone.
+    """
+    entry = WinBIndexEntry.fromInfo('', '', info)
+    if entry is None or not entry.isBase():
         return False
-    maj = int(ver.split('.')[3])
-    return maj == 1
-
-
-if __name__ == '__main__':
-    for file_name in tqdm.tqdm((
-            # 'ntoskrnl.exe', 'ntdll.dll', 'ntosext.sys', 
-             'kernel32.dll', # 'kernelbase.dll',
-            # 'ws2_32.dll', 'CRYPTBASE.DLL', 'dwrite.dll',
-            # 'dbghelp.dll', 'WINMM.dll', 'sechost.dll', 'sechost.dll',
-            # 'bcryptprimitives.dll', 'msvcrt.dll', 'advapi32.dll',
-            # 'RPCRT4.dll', 'combase.dll', 'ucrtbase.dll', 
-            # 'msvcp_win.dll', 'oleaut32.dll', 
-            )):
-        file_name = file_name.lower()
-        vers = getWinBinDexVersions(file_name)
-        for v in tqdm.tqdm(vers):
-            ver = vers[v]
-            if not isWinBinDexFileBase(ver):
-                continue
-            ver_file_name = generateFileName(ver)
-            out_path = os.path.join(r'C:\Users\mkupe\Downloads\KernelFiles\WinBinDex\BaseFiles', ver_file_name)
-            if os.path.exists(out_path):
-                tqdm.tqdm.write(f'Skipping file {ver_file_name}')
-                continue
-            dl = generateDownloadUrl(ver)
-            tqdm.tqdm.write(f'Found file {ver_file_name} : {dl}')
-            with open(out_path, 'wb') as f:
-                f.write(requests.get(dl).content)
+    return not builds or entry.getBuild() in set(int(build) for build in builds)
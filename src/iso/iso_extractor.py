@@ -23,7 +23,7 @@ def extractInternalSourceFiles(iso_path: str, output_dir: str, *file_names) -> L
         with TmpDir() as tmp_dir:
             install_wim = extractInstallWimFromIso(iso_path, tmp_dir)
             install_wim_path = os.path.join(tmp_dir, install_wim)
-            return extractFilesFromInstallWim(install_wim_path, output_dir, *file_names)
+            return extractFilesFromInstallWim(install_wim_path, output_dir, *file_names, source=iso_path)
     except SymbolManagerException as ex:
         printError(f'Failed to extract internal files: {ex}')
         return []
@@ -2,12 +2,20 @@ import os
 from typing import List
 from src.externals.z7 import z7ExtractFiles
 from src.iso.iso_extractor import genericExtractFromArchive
+from src.store.binary_catalog import recordBinary
 from src.utils.printer import printError, printLog, printSuccess
 from src.utils.utils import SymbolManagerException, walkFiles
 
-def extractFilesFromInstallWim(install_file_path: str, output_dir: str, *file_names) -> List[str]:
+def extractFilesFromInstallWim(install_file_path: str, output_dir: str, *file_names, source: str = None) -> List[str]:
+    """
+    Args:
+        source (str, optional): The artifact the install image came from (e.g. its ISO), recorded in the binary catalog.
+    """
     ext = os.path.splitext(install_file_path)[1]
-    return genericExtractFromArchive(install_file_path, output_dir, f'install.{ext}', *file_names)
+    extracted_files = genericExtractFromArchive(install_file_path, output_dir, f'install.{ext}', *file_names)
+    for extracted_file in extracted_files:
+        recordBinary(os.path.join(output_dir, extracted_file), 'extract', source=source if source else install_file_path)
+    return extracted_files
 
 
 def extractInternalSourceFilesFromWimDir(wim_dir_path: str, output_dir: str, *file_names) -> List[str]:
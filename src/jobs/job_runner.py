@@ -0,0 +1,232 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from types import NoneType
+from typing import Callable, Dict, List, Tuple
+from src.psf.psf_manifest import enableManifestCache
+from src.utils.printer import printError, printInfo, printSuccess
+from src.utils.settings import DEFAULT_JOB_WORKERS, restoreSettings, snapshotSettings
+from src.utils.utils import SymbolManagerException
+
+
+# Flags which end up in the process wide settings (directly, or through their command's handler).
+# Jobs only run side by side when all of these match.
+SETTINGS_FLAGS = ('out', 'verbose', 'download_pdbs', 'keep', 'http_cache', 'offline', 'allow_dynamic', 'prefer_old', 'catalog_url', 'symbol_server', 'winbindex_url', 'cas', 'cas_symlinks', 'archive', 'archive_cache')
+# Flags which are process wide, they are given to run-jobs itself
+PROCESS_FLAGS = ('trace', 'metrics')
+
+
+class JobFileException(SymbolManagerException):
+    pass
+
+
+class Job:
+    """
+    One command of a job file: the arguments `main.py` would get, and the ids of the jobs which must succeed before it runs.
+    """
+    def __init__(self, job_id: str, argv: List[str], after: List[str] = None) -> NoneType:
+        self.id = job_id
+        self.argv = argv
+        self.after = after if after else []
+        self.args: argparse.Namespace | None = None
+        self.status = 'pending'
+        self.error = ''
+        self.seconds = 0.0
+
+    def __str__(self) -> str:
+        return f'[{self.id}] {" ".join(self.argv)}'
+
+    def getSettingsKey(self) -> Tuple:
+        return tuple(getattr(self.args, flag, None) for flag in SETTINGS_FLAGS)
+
+
+def loadJobFile(file_path: str) -> List[Job]:
+    """
+    Reads a job file, a JSON (or YAML, with PyYAML installed) list of jobs, optionally under a "jobs" key.
+
+    A job is either the argument list of one command, or an object with that list as "args",
+    an optional "id" (the job's 1-based position by default) and the ids it must run "after".
+
+    Example:
+        ```json
+        {"jobs": [
+            {"id": "psf", "args": ["extract", "psf", "KB5031356.psf", "express.psf.cix.xml", "-o", "patches"]},
+            {"args": ["sort", "bin", "binaries", "-o", "sorted"]},
+            {"after": ["psf"], "args": ["extrapolate", "patch", "-f", "ntdll.dll", "-o", "ntdll.patched.dll", "patches/ntdll.dll PA30.patch"]}
+        ]}
+        ```
+    """
+    with open(file_path, 'r', encoding='UTF-8') as f:
+        if os.path.splitext(file_path)[1].lower() in ('.yaml', '.yml'):
+            try:
+                import yaml
+            except ImportError:
+                raise JobFileException('Reading YAML job files requires PyYAML (pip install pyyaml)')
+            data = yaml.safe_load(f)
+        else:
+            data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get('jobs')
+    if not isinstance(data, list):
+        raise JobFileException(f'"{file_path}" is not a list of jobs')
+
+    jobs: List[Job] = []
+    for index, entry in enumerate(data):
+        if isinstance(entry, list):
+            entry = {'args': entry}
+        if not isinstance(entry, dict) or not isinstance(entry.get('args'), list) or not entry['args']:
+            raise JobFileException(f'Job #{index + 1} has no argument list')
+        after = entry.get('after', [])
+        jobs.append(Job(str(entry.get('id', index + 1)), [str(arg) for arg in entry['args']], [after] if isinstance(after, str) else [str(job_id) for job_id in after]))
+
+    ids = set()
+    for job in jobs:
+        if job.id in ids:
+            raise JobFileException(f'Job id "{job.id}" is used twice')
+        ids.add(job.id)
+    for job in jobs:
+        unknown = [job_id for job_id in job.after if job_id not in ids]
+        if unknown:
+            raise JobFileException(f'Job "{job.id}" runs after unknown jobs: {", ".join(unknown)}')
+    return jobs
+
+
+class JobRunner:
+    """
+    Runs the jobs of a job file in this process, so they share its warm state: the HTTP session and
+    cache, the KB timeline, the PDB index, the symbol server fetcher and parsed PSF manifests.
+
+    A job starts once the jobs it runs after succeeded (it is skipped if one of them did not), and up to
+    `workers` jobs run side by side. The settings are process wide, so only jobs whose settings flags
+    (output directory, verbosity, URLs...) match run together; the runner waits for the running jobs
+    before it switches the settings to the next job's.
+    A job's arguments are parsed when it is about to start, so it may use the files of the jobs it runs after.
+
+    Example:
+        ```python
+        runner = JobRunner(loadJobFile('jobs.json'), parser.parse_args, parseSettingsFlags, dispatch, workers=8)
+        failed = runner.run()
+        ```
+    """
+    def __init__(self, jobs: List[Job], parse: Callable[[List[str]], argparse.Namespace], apply_settings: Callable[[argparse.Namespace], NoneType], dispatch: Callable[[argparse.Namespace], NoneType], workers: int = DEFAULT_JOB_WORKERS) -> NoneType:
+        self.jobs = jobs
+        self.parse = parse
+        self.apply_settings = apply_settings
+        self.dispatch = dispatch
+        self.workers = max(1, workers)
+        self.by_id: Dict[str, Job] = {job.id: job for job in jobs}
+
+    def __isReady(self, job: Job) -> bool:
+        return all(self.by_id[job_id].status == 'ok' for job_id in job.after)
+
+    def __isBlocked(self, job: Job) -> bool:
+        return any(self.by_id[job_id].status in ('failed', 'skipped') for job_id in job.after)
+
+    def __prepare(self, job: Job) -> bool:
+        if job.args is not None:
+            return True
+        try:
+            job.args = self.parse(job.argv)
+        except SystemExit:
+            # argparse already printed why
+            return self.__fail(job, 'invalid arguments')
+        if job.args.command is None:
+            return self.__fail(job, 'no command')
+        if hasattr(job.args, 'job_file'):
+            return self.__fail(job, 'job files can not run other job files')
+        process_flags = [flag for flag in PROCESS_FLAGS if getattr(job.args, flag, None)]
+        if process_flags:
+            return self.__fail(job, f'--{", --".join(process_flags)} can only be given to run-jobs itself')
+        # Nobody is there to answer prompts
+        job.args.accept = True
+        return True
+
+    def __fail(self, job: Job, error: str) -> bool:
+        job.status = 'failed'
+        job.error = error
+        printError(f'Job {job} failed: {error}')
+        return False
+
+    def __run(self, job: Job):
+        start = time.perf_counter()
+        try:
+            self.dispatch(job.args)
+            job.status = 'ok'
+        except SystemExit as ex:
+            job.status = 'failed'
+            job.error = f'exited with {ex.code}'
+        except Exception as ex:
+            # A failed job must not take the other jobs down with it
+            job.status = 'failed'
+            job.error = str(ex) or type(ex).__name__
+        job.seconds = time.perf_counter() - start
+        if job.status == 'ok':
+            printSuccess(f'Job [{job.id}] done in {job.seconds:.2f}s')
+        else:
+            printError(f'Job {job} failed: {job.error}')
+
+    def run(self) -> List[Job]:
+        """
+        Returns:
+            List[Job]: The jobs which failed or were skipped.
+        """
+        enableManifestCache()
+        base_settings = snapshotSettings()
+        settings_key = None
+        pending = list(self.jobs)
+        running: Dict[Future, Job] = { }
+        try:
+            with ThreadPoolExecutor(self.workers, thread_name_prefix='job') as pool:
+                while pending or running:
+                    settled = [job for job in pending if self.__isBlocked(job)]
+                    for job in settled:
+                        job.status = 'skipped'
+                        job.error = 'a job it runs after did not succeed'
+                    for job in [job for job in pending if self.__isReady(job)]:
+                        if len(running) >= self.workers:
+                            break
+                        if not self.__prepare(job):
+                            settled.append(job)
+                            continue
+                        key = job.getSettingsKey()
+                        if key != settings_key:
+                            if running:
+                                continue
+                            restoreSettings(base_settings)
+                            settings_key = None
+                            try:
+                                self.apply_settings(job.args)
+                            except SystemExit:
+                                self.__fail(job, 'invalid settings')
+                                settled.append(job)
+                                continue
+                            settings_key = key
+                        settled.append(job)
+                        job.status = 'running'
+                        printInfo(f'Job {job} started')
+                        running[pool.submit(self.__run, job)] = job
+                    pending = [job for job in pending if job not in settled]
+                    if not running:
+                        if not settled:
+                            for job in pending:
+                                self.__fail(job, 'its "after" jobs form a cycle')
+                            break
+                        continue
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        del running[future]
+        finally:
+            restoreSettings(base_settings)
+        return [job for job in self.jobs if job.status != 'ok']
+
+
+def runJobs(job_file: str, parse: Callable[[List[str]], argparse.Namespace], apply_settings: Callable[[argparse.Namespace], NoneType], dispatch: Callable[[argparse.Namespace], NoneType], workers: int = DEFAULT_JOB_WORKERS) -> List[Job]:
+    jobs = loadJobFile(job_file)
+    start = time.perf_counter()
+    unsuccessful = JobRunner(jobs, parse, apply_settings, dispatch, workers).run()
+    printInfo(f'Ran {len(jobs)} jobs in {time.perf_counter() - start:.2f}s: {len(jobs) - len(unsuccessful)} succeeded, {len([job for job in unsuccessful if job.status == "failed"])} failed, {len([job for job in unsuccessful if job.status == "skipped"])} skipped')
+    for job in unsuccessful:
+        printError(f'{job.status.capitalize()}: {job} - {job.error}')
+    return unsuccessful
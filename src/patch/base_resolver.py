@@ -0,0 +1,98 @@
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from types import NoneType
+from typing import Dict, Tuple
+import requests
+from src.externals.winbindex import WinBIndexClient, WinBIndexEntry, WinBIndexFilter
+from src.utils.printer import printError, printLog, printSuccess
+from src.utils.utils import SymbolManagerException, normalizeDirtyBitness
+
+
+DEFAULT_BASE_FETCH_WORKERS = 4
+
+BaseKey = Tuple[str, str, str]
+
+
+class BaseResolver:
+    """
+    Fetches base files which extrapolation is missing from the symbol server.
+
+    The symbol server URL of a base is derived from its WinBIndex entry (PE timestamp and image size).
+    Each file's index is read once from the on-disk WinBIndex cache and kept in memory, and every base
+    is fetched once - later requests for it share the same future. Fetches run in the background, so the
+    caller keeps patching other files and retries the missing ones once their bases arrive.
+
+    Example:
+        ```python
+        future = getBaseResolver(base_files_dir).request('ntoskrnl', '.exe', '10.0.22621.1', 'x64')
+        ...
+        if future.result():
+            doPatchOrCreateBase(...)
+        ```
+    """
+    def __init__(self, base_files_dir: str, workers: int = DEFAULT_BASE_FETCH_WORKERS) -> NoneType:
+        self.base_files_dir = base_files_dir
+        self.client = WinBIndexClient(output_dir=base_files_dir, download_workers=workers)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.lock = threading.Lock()
+        self.futures: Dict[BaseKey, Future] = { }
+        self.index_locks: Dict[str, threading.Lock] = { }
+        self.indexes: Dict[str, Dict[Tuple[str, str], WinBIndexEntry]] = { }
+
+    def __getIndex(self, file_name: str) -> Dict[Tuple[str, str], WinBIndexEntry]:
+        index_key = file_name.lower()
+        with self.lock:
+            index_lock = self.index_locks.setdefault(index_key, threading.Lock())
+        with index_lock:
+            if index_key not in self.indexes:
+                self.indexes[index_key] = {(entry.version, entry.arch): entry for entry in self.client.iterateEntries(file_name, WinBIndexFilter())}
+            return self.indexes[index_key]
+
+    def __fetch(self, file_name: str, version: str, arch: str) -> str | None:
+        try:
+            entry = self.__getIndex(file_name).get((version, arch))
+            if entry is None and arch == 'wow64':
+                # WinBIndex may list the 32-bit copy under x86
+                entry = self.__getIndex(file_name).get((version, 'x86'))
+            if entry is None:
+                printLog(f'WinBIndex does not list {file_name} {version} {arch}')
+                return None
+            path = self.client.download(entry)
+            printSuccess(f'Fetched base file {os.path.basename(path)}')
+            return path
+        except (SymbolManagerException, requests.RequestException, OSError) as ex:
+            printError(f'Failed to fetch base file {file_name} {version} {arch}: {ex}')
+            return None
+
+    def request(self, base_file_name: str, extension: str, base_version: str, bitness: str) -> Future:
+        """
+        Starts fetching a base file (unless it is already being fetched).
+
+        Returns:
+            Future: Resolves to the local path of the base, or None if it could not be fetched.
+        """
+        if extension[0] != '.':
+            extension = '.' + extension
+        file_name = base_file_name + extension
+        bitness = normalizeDirtyBitness(bitness)
+        key = (file_name.lower(), base_version, bitness)
+        with self.lock:
+            if key not in self.futures:
+                self.futures[key] = self.executor.submit(self.__fetch, file_name, base_version, bitness)
+            return self.futures[key]
+
+
+g_base_resolvers: Dict[str, BaseResolver] = { }
+g_base_resolvers_lock = threading.Lock()
+
+
+def getBaseResolver(base_files_dir: str) -> BaseResolver:
+    """
+    Returns the resolver of a base files directory, shared by every extrapolation in the process.
+    """
+    base_files_dir = os.path.abspath(base_files_dir)
+    with g_base_resolvers_lock:
+        if base_files_dir not in g_base_resolvers:
+            g_base_resolvers[base_files_dir] = BaseResolver(base_files_dir)
+        return g_base_resolvers[base_files_dir]
@@ -0,0 +1,315 @@
+import asyncio
+import os
+import urllib.parse
+from types import NoneType
+from typing import Callable, Dict, List, Set, Tuple
+import sqlite3
+from src.patch.catalog_db import CatalogIndex
+from src.patch.kb_timeline import getKbTimeline
+from src.patch.patch_download import DOWNLOAD_DIALOG_BATCH_SIZE, CatalogPatch, PatchDownloader, bootlegDownloadKB, parseDownloadDialog, requestDownloadDialog
+from src.utils.http import computeBackoff, createSession
+from src.utils.http_cache import getHttpCache
+from src.utils.printer import printError, printInfo, printLog, printSuccess
+from src.utils.retry_queue import RetryQueue
+from src.utils.settings import getCatalogUrl, isAllowedToDownloadDynamicUpdates, preferOldPatches
+from src.utils.utils import SymbolManagerException
+
+
+DEFAULT_REQUESTS_PER_HOST = 4
+DEFAULT_SEARCH_WORKERS = 4
+DEFAULT_RESOLVE_WORKERS = 4
+DEFAULT_DOWNLOAD_WORKERS = 2
+# Bounds how far the early stages may run ahead of the downloads
+STAGE_QUEUE_SIZE = 64
+# Failed searches and updates are retried this many more times within a crawl, after a growing delay
+RETRY_ROUNDS = 2
+RETRY_ROUND_DELAY = 30.0
+RETRY_QUEUE_SECTION = 'catalog'
+SEARCH_RETRY_PREFIX = 'search:'
+UPDATE_RETRY_PREFIX = 'update:'
+
+
+class CatalogQuery:
+    """
+    A single catalog search, with the filters PatchDownloader applies to its results.
+    """
+    def __init__(self, query: str, windowsMajor: str = '', windowsMinor: str = '', bitness: str | List[str] = '') -> NoneType:
+        self.query = query
+        self.windowsMajor = windowsMajor
+        self.windowsMinor = windowsMinor
+        self.bitness = bitness
+
+    def getIndexKey(self) -> str:
+        """
+        Identifies the search together with the filters applied to its results.
+        """
+        bitness = ','.join(self.bitness) if isinstance(self.bitness, list) else self.bitness
+        return f'{self.query}|{self.windowsMajor}|{self.windowsMinor}|{bitness}|{int(isAllowedToDownloadDynamicUpdates())}'
+
+    def toDict(self) -> dict:
+        return {
+            'query': self.query,
+            'windowsMajor': self.windowsMajor,
+            'windowsMinor': self.windowsMinor,
+            'bitness': self.bitness,
+        }
+
+    @staticmethod
+    def fromDict(data: dict) -> 'CatalogQuery':
+        return CatalogQuery(data['query'], data.get('windowsMajor', ''), data.get('windowsMinor', ''), data.get('bitness', ''))
+
+
+class CrawlStats:
+    searches = 0
+    indexed_searches = 0
+    dialogs = 0
+    entries = 0
+    resolved = 0
+    downloaded = 0
+    skipped = 0
+    failed = 0
+    retried = 0
+    pending_retries = 0
+
+    def __str__(self) -> str:
+        return f'{self.searches} searches ({self.indexed_searches} from the index), {self.dialogs} download dialogs, {self.entries} catalog entries, {self.resolved} resolved, {self.downloaded} downloaded, {self.skipped} already present, {self.failed} failed, {self.retried} retried, {self.pending_retries} left for the next run'
+
+
+class CatalogCrawler:
+    """
+    Crawls the update catalog with overlapping search, download-dialog and download stages.
+
+    All stages share one pooled session. Requests are run on worker threads and limited per host,
+    so the catalog is never hit by more than `requests_per_host` concurrent requests while
+    downloads from the CDN proceed in parallel.
+    Every stage is diffed against the catalog index: known searches, resolved entries and downloaded
+    files are not requested again (unless `refresh` is set, which repeats the searches).
+    `on_downloaded` is called with the path of every downloaded (or already present) file from a worker
+    thread; while it blocks, its download worker does not take new files.
+    Searches and updates which fail are put in a persistent retry queue: they are retried up to `retry_rounds`
+    times once the rest of the crawl is done, and whatever still fails is retried first by the next crawl.
+
+    Example:
+        ```python
+        crawler = CatalogCrawler(output_dir)
+        stats = asyncio.run(crawler.crawl([CatalogQuery('KB5031354')]))
+        ```
+    """
+    def __init__(self, output_dir: str, requests_per_host: int = DEFAULT_REQUESTS_PER_HOST, search_workers: int = DEFAULT_SEARCH_WORKERS, resolve_workers: int = DEFAULT_RESOLVE_WORKERS, download_workers: int = DEFAULT_DOWNLOAD_WORKERS, index: CatalogIndex = None, refresh: bool = False, on_downloaded: Callable[[str], NoneType] = None, retry_queue: RetryQueue = None, retry_rounds: int = RETRY_ROUNDS) -> NoneType:
+        self.output_dir = output_dir
+        self.index = index if index else CatalogIndex(output_dir)
+        self.retry_queue = retry_queue if retry_queue else RetryQueue(output_dir, RETRY_QUEUE_SECTION)
+        self.retry_rounds = retry_rounds
+        self.deferred_queries: Dict[str, CatalogQuery] = { }
+        self.deferred_updates: Set[str] = set()
+        self.refresh = refresh
+        self.on_downloaded = on_downloaded
+        self.requests_per_host = requests_per_host
+        self.search_workers = search_workers
+        self.resolve_workers = resolve_workers
+        self.download_workers = download_workers
+        self.session = createSession(max(requests_per_host, download_workers) * 2)
+        self.host_semaphores: Dict[str, asyncio.Semaphore] = { }
+        self.seen_update_ids: Set[str] = set()
+        self.seen_downloads: Set[str] = set()
+        self.stats = CrawlStats()
+
+    def __hostSemaphore(self, url: str) -> asyncio.Semaphore:
+        host = urllib.parse.urlsplit(url).netloc.lower()
+        if host not in self.host_semaphores:
+            self.host_semaphores[host] = asyncio.Semaphore(self.requests_per_host)
+        return self.host_semaphores[host]
+
+    async def __search(self, query: CatalogQuery, resolve_queue: asyncio.Queue, download_queue: asyncio.Queue):
+        index_key = query.getIndexKey()
+        if self.refresh or not self.index.isSearched(index_key):
+            url = PatchDownloader.buildCatalogSearchUrl(query.query)
+            async with self.__hostSemaphore(url):
+                response = await asyncio.to_thread(getHttpCache().get, url, session=self.session)
+            self.stats.searches += 1
+            if not response.ok:
+                raise SymbolManagerException(f'Catalog search "{query.query}" returned {response.status_code}')
+            downloader = PatchDownloader(query.windowsMajor, query.windowsMinor, query.bitness, query=query.query, data=response.text)
+            self.index.recordSearch(index_key, list(downloader.generatePatchDownloadUrls()))
+            self.retry_queue.remove(SEARCH_RETRY_PREFIX + index_key)
+        else:
+            self.stats.indexed_searches += 1
+        await self.__queueRows(self.index.getSearchResults(index_key), resolve_queue, download_queue)
+
+    async def __queueRows(self, rows: List[sqlite3.Row], resolve_queue: asyncio.Queue, download_queue: asyncio.Queue):
+        searchResults = []
+        for row in rows:
+            self.stats.entries += 1
+            if row['update_id'] in self.seen_update_ids:
+                continue
+            self.seen_update_ids.add(row['update_id'])
+            if CatalogIndex.isDownloaded(row):
+                self.stats.skipped += 1
+                if self.on_downloaded:
+                    await asyncio.to_thread(self.on_downloaded, row['local_path'])
+            elif CatalogIndex.isResolved(row):
+                await download_queue.put(CatalogIndex.toCatalogPatch(row))
+            else:
+                searchResults.append(CatalogIndex.toCatalogPatch(row))
+        # Batches are made per search page (rather than from whatever is queued) so the dialog
+        # requests are the same on every run and can be replayed from the HTTP cache
+        for batch_start in range(0, len(searchResults), DOWNLOAD_DIALOG_BATCH_SIZE):
+            await resolve_queue.put(searchResults[batch_start:batch_start + DOWNLOAD_DIALOG_BATCH_SIZE])
+
+    async def __resolve(self, searchResults: List[CatalogPatch], download_queue: asyncio.Queue):
+        async with self.__hostSemaphore(getCatalogUrl()):
+            downloadDialog = await asyncio.to_thread(requestDownloadDialog, searchResults, self.session)
+        self.stats.dialogs += 1
+        resolved = parseDownloadDialog(downloadDialog, searchResults)
+        self.stats.resolved += len(resolved)
+        self.stats.failed += len(searchResults) - len(resolved)
+        resolved_ids = set(catalog.link_id for catalog in resolved)
+        for searchResult in searchResults:
+            if searchResult.link_id not in resolved_ids:
+                self.index.recordFailed(searchResult.link_id)
+                self.__defer(searchResult, 'Missing from the download dialog')
+        for catalog in resolved:
+            self.index.recordResolved(catalog)
+            await download_queue.put(catalog)
+
+    async def __download(self, catalog: CatalogPatch):
+        download_name = catalog.getDownloadName()
+        output_path = os.path.join(self.output_dir, download_name)
+        if download_name in self.seen_downloads:
+            self.stats.skipped += 1
+            return
+        self.seen_downloads.add(download_name)
+        if os.path.exists(output_path):
+            self.stats.skipped += 1
+        else:
+            async with self.__hostSemaphore(catalog.download_link):
+                await asyncio.to_thread(catalog.download, output_path)
+            self.stats.downloaded += 1
+            printSuccess(f'Downloaded patch {download_name}')
+        self.index.recordDownloaded(catalog, output_path)
+        self.retry_queue.remove(UPDATE_RETRY_PREFIX + catalog.link_id)
+        if self.on_downloaded:
+            await asyncio.to_thread(self.on_downloaded, output_path)
+
+    def __defer(self, item: CatalogQuery | List[CatalogPatch] | CatalogPatch, error: str):
+        """
+        Puts a failed search, dialog batch or download in the retry queue.
+        """
+        if isinstance(item, CatalogQuery):
+            index_key = item.getIndexKey()
+            self.deferred_queries[index_key] = item
+            self.retry_queue.push(SEARCH_RETRY_PREFIX + index_key, item.toDict(), error)
+            return
+        if isinstance(item, CatalogPatch):
+            self.seen_downloads.discard(item.getDownloadName())
+        for catalog in (item if isinstance(item, list) else [item]):
+            self.deferred_updates.add(catalog.link_id)
+            self.seen_update_ids.discard(catalog.link_id)
+            self.retry_queue.push(UPDATE_RETRY_PREFIX + catalog.link_id, {'update_id': catalog.link_id}, error)
+
+    async def __worker(self, queue: asyncio.Queue, handler, *handler_args):
+        while True:
+            item = await queue.get()
+            try:
+                await handler(item, *handler_args)
+            except Exception as ex:
+                # A failed item must not take its worker down with it, or the stage's join() never returns
+                self.stats.failed += 1
+                printError(f'Failed on {str(ex)}')
+                self.__defer(item, str(ex))
+            finally:
+                queue.task_done()
+
+    async def __drain(self, queries: List[CatalogQuery], rows: List[sqlite3.Row]):
+        search_queue: asyncio.Queue = asyncio.Queue()
+        resolve_queue: asyncio.Queue = asyncio.Queue(maxsize=STAGE_QUEUE_SIZE)
+        download_queue: asyncio.Queue = asyncio.Queue(maxsize=STAGE_QUEUE_SIZE)
+        for query in queries:
+            search_queue.put_nowait(query)
+
+        workers = [asyncio.create_task(self.__worker(search_queue, self.__search, resolve_queue, download_queue)) for _ in range(self.search_workers)]
+        workers += [asyncio.create_task(self.__worker(resolve_queue, self.__resolve, download_queue)) for _ in range(self.resolve_workers)]
+        workers += [asyncio.create_task(self.__worker(download_queue, self.__download)) for _ in range(self.download_workers)]
+        await self.__queueRows(rows, resolve_queue, download_queue)
+
+        # Every stage only feeds the next one, so draining them in order drains the pipeline
+        await search_queue.join()
+        await resolve_queue.join()
+        await download_queue.join()
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    def __takeDeferred(self) -> Tuple[List[CatalogQuery], List[sqlite3.Row]]:
+        queries = list(self.deferred_queries.values())
+        rows = []
+        for update_id in self.deferred_updates:
+            row = self.index.getUpdate(update_id)
+            if row is not None:
+                rows.append(row)
+            else:
+                self.retry_queue.remove(UPDATE_RETRY_PREFIX + update_id)
+        self.deferred_queries = { }
+        self.deferred_updates = set()
+        return queries, rows
+
+    async def crawl(self, queries: List[CatalogQuery]) -> CrawlStats:
+        # Leftovers of previous crawls go first
+        for item in self.retry_queue.pending():
+            if item.key.startswith(SEARCH_RETRY_PREFIX):
+                self.deferred_queries[item.key[len(SEARCH_RETRY_PREFIX):]] = CatalogQuery.fromDict(item.payload)
+            elif item.key.startswith(UPDATE_RETRY_PREFIX):
+                self.deferred_updates.add(item.payload['update_id'])
+        pending_queries, pending_rows = self.__takeDeferred()
+        if pending_queries or pending_rows:
+            printInfo(f'Retrying {len(pending_queries) + len(pending_rows)} items which failed in a previous crawl')
+        index_keys = set(query.getIndexKey() for query in pending_queries)
+        await self.__drain(pending_queries + [query for query in queries if query.getIndexKey() not in index_keys], pending_rows)
+
+        for retry_round in range(self.retry_rounds):
+            deferred_queries, deferred_rows = self.__takeDeferred()
+            if not deferred_queries and not deferred_rows:
+                break
+            self.stats.retried += len(deferred_queries) + len(deferred_rows)
+            delay = computeBackoff(retry_round + 1, base=RETRY_ROUND_DELAY)
+            printInfo(f'Retrying {len(deferred_queries) + len(deferred_rows)} failed items in {delay:.0f}s')
+            await asyncio.sleep(delay)
+            await self.__drain(deferred_queries, deferred_rows)
+
+        self.retry_queue.save()
+        self.stats.pending_retries = len(self.retry_queue)
+        printInfo(f'Catalog crawl done: {self.stats}')
+        return self.stats
+
+
+def crawlCatalog(queries: List[CatalogQuery], outputDirectory: str, refresh: bool = False, **crawler_kwargs) -> CrawlStats:
+    with CatalogIndex(outputDirectory) as index, RetryQueue(outputDirectory, RETRY_QUEUE_SECTION) as retry_queue:
+        return asyncio.run(CatalogCrawler(outputDirectory, index=index, refresh=refresh, retry_queue=retry_queue, **crawler_kwargs).crawl(queries))
+
+
+def downloadPatches(major: str, minor: str, bitness: str, outputDirectory: str, refresh: bool = False, on_downloaded: Callable[[str], NoneType] = None):
+    queries = []
+    for year in range(2012, 2024):
+        for month in range(1, 13):
+            prefix = f'{year}-{str(month).zfill(2)} '
+            queries.append(CatalogQuery(PatchDownloader.buildQuery(major, minor, bitness, prefix), major, minor, bitness))
+    printLog(f'Crawling {len(queries)} catalog searches')
+    crawlCatalog(queries, outputDirectory, refresh, on_downloaded=on_downloaded)
+
+
+def downloadPatchesByKb(major: str, outputDirectory: str, kb_number: str = '', refresh: bool = False, on_downloaded: Callable[[str], NoneType] = None):
+    if kb_number:
+        try:
+            bootlegDownloadKB(kb_number)
+        except SymbolManagerException as ex:
+            printError(f'PatchDownloader failed on {kb_number}: {ex}')
+        crawlCatalog([CatalogQuery(kb_number)], outputDirectory, refresh, on_downloaded=on_downloaded)
+    else:
+        timeline = getKbTimeline()
+        timeline.ensure([major])
+        kbs = sorted(timeline.getPatchKbs(major), key=lambda x: x.kb, reverse=not preferOldPatches())
+        with CatalogIndex(outputDirectory) as index:
+            index.recordKbs(major, kbs)
+        queries = [CatalogQuery(kb.kb, windowsMajor=major, bitness=['x64', 'x86']) for kb in kbs]
+        printLog(f'Crawling {len(queries)} catalog searches')
+        crawlCatalog(queries, outputDirectory, refresh, on_downloaded=on_downloaded)
@@ -0,0 +1,186 @@
+import os
+import sqlite3
+import threading
+import time
+from types import NoneType
+from typing import Iterable, List
+from src.patch.common import PatchKB
+from src.patch.patch_download import CatalogPatch
+
+
+CATALOG_INDEX_FILE_NAME = '.catalog_index.sqlite'
+CATALOG_INDEX_VERSION = 1
+
+
+class UpdateState:
+    Found = 'found'
+    Resolved = 'resolved'
+    Downloaded = 'downloaded'
+    Failed = 'failed'
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS kbs (
+    major TEXT NOT NULL,
+    kb TEXT NOT NULL,
+    build TEXT,
+    revision TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (major, kb)
+);
+CREATE TABLE IF NOT EXISTS searches (
+    query TEXT PRIMARY KEY,
+    searched_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS search_results (
+    query TEXT NOT NULL,
+    update_id TEXT NOT NULL,
+    PRIMARY KEY (query, update_id)
+);
+CREATE TABLE IF NOT EXISTS updates (
+    update_id TEXT PRIMARY KEY,
+    kb TEXT,
+    major TEXT,
+    minor TEXT,
+    real_minor TEXT,
+    bitness TEXT,
+    dynamic INTEGER NOT NULL DEFAULT 0,
+    year TEXT,
+    month TEXT,
+    url TEXT,
+    ext TEXT,
+    sha1 TEXT,
+    size INTEGER,
+    state TEXT NOT NULL,
+    local_path TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS updates_kb ON updates (kb);
+'''
+
+
+class CatalogIndex:
+    """
+    A local SQLite index of the update catalog: KBs, catalog entries, their resolved URLs and downloads.
+
+    Searches which were already made, entries which were already resolved and files which were
+    already downloaded are answered from the index, so only new entries hit the network.
+    The index is stored inside the output directory.
+
+    Example:
+        ```python
+        with CatalogIndex(output_dir) as index:
+            if not index.isSearched(query):
+                ...
+                index.recordSearch(query, search_results)
+        ```
+    """
+    def __init__(self, output_dir: str) -> NoneType:
+        self.file_path = os.path.join(output_dir, CATALOG_INDEX_FILE_NAME)
+        os.makedirs(output_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.file_path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        if self.connection.execute('PRAGMA user_version').fetchone()[0] not in (0, CATALOG_INDEX_VERSION):
+            raise sqlite3.DatabaseError(f'Catalog index "{self.file_path}" has an unknown version')
+        self.connection.executescript(SCHEMA)
+        self.connection.execute(f'PRAGMA user_version={CATALOG_INDEX_VERSION}')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        with self.lock:
+            self.connection.commit()
+            self.connection.close()
+
+    def recordKbs(self, major: str, kbs: Iterable[PatchKB]):
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.executemany(
+                'INSERT INTO kbs (major, kb, build, revision, updated_at) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT (major, kb) DO UPDATE SET build = excluded.build, revision = excluded.revision, updated_at = excluded.updated_at',
+                [(major, kb.kb.upper(), kb.major, kb.patch, now) for kb in kbs])
+
+    def getKbs(self, major: str) -> List[PatchKB]:
+        with self.lock:
+            rows = self.connection.execute('SELECT kb, build, revision FROM kbs WHERE major = ?', (major, )).fetchall()
+        return [PatchKB(row['kb'], row['build'], row['revision']) for row in rows]
+
+    def isSearched(self, query: str) -> bool:
+        with self.lock:
+            return self.connection.execute('SELECT 1 FROM searches WHERE query = ?', (query, )).fetchone() is not None
+
+    def recordSearch(self, query: str, searchResults: List[CatalogPatch]):
+        """
+        Records the catalog entries a search returned. Entries already in the index keep their state.
+        """
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO searches (query, searched_at) VALUES (?, ?)', (query, now))
+            for catalog in searchResults:
+                self.connection.execute('INSERT OR IGNORE INTO search_results (query, update_id) VALUES (?, ?)', (query, catalog.link_id))
+                self.connection.execute(
+                    'INSERT OR IGNORE INTO updates (update_id, kb, major, minor, bitness, dynamic, year, month, state, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (catalog.link_id, catalog.kb, catalog.major, catalog.minor, catalog.bitness, int(bool(catalog.dynamic)), catalog.year, catalog.month, UpdateState.Found, now))
+
+    def getSearchResults(self, query: str) -> List[sqlite3.Row]:
+        with self.lock:
+            return self.connection.execute(
+                'SELECT updates.* FROM search_results JOIN updates ON updates.update_id = search_results.update_id WHERE search_results.query = ?',
+                (query, )).fetchall()
+
+    def recordResolved(self, catalog: CatalogPatch):
+        with self.lock, self.connection:
+            self.connection.execute(
+                'UPDATE updates SET kb = ?, major = ?, minor = ?, real_minor = ?, bitness = ?, dynamic = ?, year = ?, month = ?, url = ?, ext = ?, sha1 = ?, '
+                'state = CASE WHEN state = ? THEN state ELSE ? END, updated_at = ? WHERE update_id = ?',
+                (catalog.kb, catalog.major, catalog.minor, str(catalog.real_minor), catalog.bitness, int(bool(catalog.dynamic)), catalog.year, catalog.month,
+                 catalog.download_link, catalog.ext, catalog.sha1, UpdateState.Downloaded, UpdateState.Resolved, time.time(), catalog.link_id))
+
+    def recordDownloaded(self, catalog: CatalogPatch, local_path: str):
+        with self.lock, self.connection:
+            self.connection.execute('UPDATE updates SET state = ?, local_path = ?, size = ?, updated_at = ? WHERE update_id = ?',
+                                    (UpdateState.Downloaded, os.path.abspath(local_path), os.path.getsize(local_path), time.time(), catalog.link_id))
+
+    def recordFailed(self, update_id: str):
+        with self.lock, self.connection:
+            self.connection.execute('UPDATE updates SET state = ?, updated_at = ? WHERE update_id = ? AND state != ?',
+                                    (UpdateState.Failed, time.time(), update_id, UpdateState.Downloaded))
+
+    def getUpdate(self, update_id: str) -> sqlite3.Row | None:
+        with self.lock:
+            return self.connection.execute('SELECT * FROM updates WHERE update_id = ?', (update_id, )).fetchone()
+
+    @staticmethod
+    def isDownloaded(row: sqlite3.Row) -> bool:
+        return row['state'] == UpdateState.Downloaded and bool(row['local_path']) and os.path.exists(row['local_path'])
+
+    @staticmethod
+    def isResolved(row: sqlite3.Row) -> bool:
+        return bool(row['url'])
+
+    @staticmethod
+    def toCatalogPatch(row: sqlite3.Row) -> CatalogPatch:
+        """
+        Rebuilds a catalog entry (resolved or not) from its row.
+        """
+        catalog = CatalogPatch(None)
+        catalog.link_id = row['update_id']
+        catalog.kb = row['kb']
+        catalog.major = row['major']
+        catalog.minor = row['minor'] if row['minor'] else ''
+        catalog.real_minor = row['real_minor'] if row['real_minor'] else 0
+        catalog.bitness = row['bitness']
+        catalog.dynamic = bool(row['dynamic'])
+        catalog.year = row['year']
+        catalog.month = row['month']
+        catalog.download_link = row['url']
+        catalog.ext = row['ext']
+        catalog.sha1 = row['sha1']
+        return catalog
@@ -0,0 +1,194 @@
+import re
+import html as html_lib
+from types import NoneType
+from typing import Dict, Iterator, List, Set, Tuple
+from src.patch.common import PatchKB
+from src.utils.utils import monthToNumber
+
+
+# The title part of the catalog result regexes, tried in order (the first match wins)
+CATALOG_TITLE_REGEXES = [re.compile(reg, re.IGNORECASE) for reg in (
+    r'(?P<patch_year>\d+)-(?P<patch_month>\d+)\s+(((?P<dynamic>(Dynamic)\s+)?Cumulative Update )|((Security|(Preview of ))?\*(Monthly|Only) Quality Rollup ))(Preview )?for (Microsoft )?(Windows )?(?P<windows_major>\w+) (operating system,? )?(Version (?P<windows_minor>\w+) )?for (?P<windows_bitness>\w+)-based Systems \((?P<kb_id>\w+)\)',
+    r'(?P<patch_year>\d+)-(?P<patch_month>\d+)\s+(((?P<dynamic>(Dynamic)\s+)?Cumulative Update )|((Security|(Preview of ))?\s*(Monthly|Only)?\s*Quality Rollup ))?(Preview )?for (Microsoft )?(Windows )?(?P<windows_major>\w+) (operating system,? )?(Version (?P<windows_minor>\w+) )?for (?P<windows_bitness>\w+)-based Systems \((?P<kb_id>\w+)\)',
+    r'((?P<patch_year>\d+)-(?P<patch_month>\d+))?(\w+\s+)*Update\s+for\s+(Microsoft\s+)?Windows\s+(?P<windows_major>((\w+\s+?)|((Server\s+\d+\s+(\w+\s+)?))))(\s+operating system,?\s+)?\s*?(\s*?for\s+?(?P<windows_bitness>\w+?)-based\s+Systems\s*?)?\s+\((?P<kb_id>\w+?)\)',
+    r'((?P<patch_year>\d+)-(?P<patch_month>\d+))?Update\s+for\s+Windows\s+(?P<windows_major>\d+)\s+(for\s+(?P<windows_bitness>(x\d\d))-based\s+Systems\s+)?\((?P<kb_id>(KB\d+))\)',
+)]
+# Search results which are releases of Windows 7 to 11 and Server, as found by `bootlegDownloadKB`.
+# A targeted page regex: decoding every row with the tokenizer and matching its title afterwards was 2-4x slower.
+CATALOG_RELEASE_LINK_REGEX = re.compile(r'<a\s+id=\'(?P<link_id>\w+-\w+-\w+-\w+-\w+)_link\'[^>]*>\s*(?P<full_name>(?P<year>\d+)-(?P<month>\d+)\s+(?:\w+\s+)*for\s+(?:\w+\s+)*(?P<windows_full_name>Windows\s+(?:7|8|8\.1|10|11|Server\s+\d+\s+\w+))[^<]*\s+for\s+(?P<bitness>x\d+)-based\s+systems\s+\((?P<spec_kb>KB\d+)\))\s*</a\s*>', re.IGNORECASE)
+
+CATALOG_LINK_ID_REGEX = re.compile(r'goToDetails\("(?P<link_id>\w+-\w+-\w+-\w+-\w+)"\);')
+
+# `<a ...marker...>text</a>`, with the text loop unrolled so the scan never backtracks
+ANCHOR_TOKEN_PATTERN = r'<a\s(?P<attrs>[^>]*{marker}[^>]*)>(?P<text>[^<]*(?:<(?!/a\s*>)[^<]*)*)</a\s*>'
+ATTRIBUTE_REGEX = re.compile(r'(?P<name>[\w\-:]+)\s*=\s*(?:"(?P<dq>[^"]*)"|\'(?P<sq>[^\']*)\'|(?P<bare>[^\s>]+))')
+INNER_TAG_REGEX = re.compile(r'<[^>]*>')
+
+UPDATE_HISTORY_HREF_REGEX = re.compile(r'^/\w+-\w+/help/\d+$')
+UPDATE_HISTORY_KB_REGEX = re.compile(r'^\w+\s+\d+,\s+\d+\W*(?P<kb>(KB\d+))(\s+\(((OS\s+Build\s+(?P<major>\d+)\.(?P<patch>\d+)))|(.+?\s+((Rollup)|Update))\)(\s+.*)?)?$', re.IGNORECASE | re.UNICODE)
+# A targeted page regex as well, it runs over twice as fast as tokenizing every navigation link
+UPDATE_HISTORY_DATE_LINK_REGEX = re.compile(r'<a\s+class="\w+"\s+data-bi-slot="\d+"\s+href="/\w+-\w+/help/\d+">(?P<month>\w+)\s+\d+,\s+(?P<year>\d+)[^<]*(?P<kb>KB\w+)\s+\(OS\s+Builds?\s', re.IGNORECASE)
+UPDATE_HISTORY_RELEASE_REGEX = re.compile(r'^(?P<month>[a-z]+)\s+\d+,\s+(?P<year>\d+)\W*(?P<kb>(KB\d+))(\s+\((?P<details>[^)]*)\))?', re.IGNORECASE)
+# `build.revision` pairs of "(OS Builds 19044.3570 and 19045.3570)"
+OS_BUILD_REGEX = re.compile(r'(?P<build>\d{4,5})\.(?P<revision>\d+)')
+# Spelled out rather than IGNORECASE, which is over twice as slow on whole pages
+KB_MENTION_REGEX = re.compile(r'[Kk][Bb]\d+')
+
+
+class CatalogSearchRow:
+    """
+    A single result of a catalog search: its update ID and title.
+    """
+    def __init__(self, link_id: str, title: str) -> NoneType:
+        self.link_id = link_id
+        self.title = title
+
+
+class HtmlLink:
+    def __init__(self, raw_attrs: str, text: str) -> NoneType:
+        self.raw_attrs = raw_attrs
+        self.text = text
+        self.attrs: Dict[str, str] | None = None
+
+    def getAttribute(self, name: str, default: str = '') -> str:
+        # Attributes are only decoded when first asked for, most links are rejected by their text or href
+        if self.attrs is None:
+            self.attrs = { }
+            for attr in ATTRIBUTE_REGEX.finditer(self.raw_attrs):
+                value = attr.group('dq') if attr.group('dq') is not None else attr.group('sq') if attr.group('sq') is not None else attr.group('bare')
+                self.attrs[attr.group('name').lower()] = html_lib.unescape(value) if '&' in value else value
+        return self.attrs.get(name, default)
+
+
+g_anchor_token_regexes: Dict[str, re.Pattern[str]] = { }
+
+
+def iterateLinks(html: str, attrs_marker: str) -> Iterator[HtmlLink]:
+    """
+    Tokenizes the `<a>` elements whose raw attributes contain `attrs_marker` in a single pass.
+
+    The rest of the page costs one scan of the C regex engine; only the matching elements
+    have their attributes and text decoded.
+    """
+    if attrs_marker not in g_anchor_token_regexes:
+        g_anchor_token_regexes[attrs_marker] = re.compile(ANCHOR_TOKEN_PATTERN.format(marker=re.escape(attrs_marker)), re.IGNORECASE)
+    for token in g_anchor_token_regexes[attrs_marker].finditer(html):
+        text = token.group('text')
+        if '<' in text:
+            text = INNER_TAG_REGEX.sub('', text)
+        if '&' in text:
+            text = html_lib.unescape(text)
+        yield HtmlLink(token.group('attrs'), ' '.join(text.split()))
+
+
+def parseCatalogSearchRows(html: str) -> List[CatalogSearchRow]:
+    rows = []
+    for link in iterateLinks(html, '_link'):
+        if not link.getAttribute('id').endswith('_link'):
+            continue
+        match = CATALOG_LINK_ID_REGEX.search(link.getAttribute('onclick'))
+        if match and link.text:
+            rows.append(CatalogSearchRow(match.group('link_id'), link.text))
+    return rows
+
+
+def parseCatalogTitle(title: str) -> Dict[str, str] | None:
+    """
+    Parses a catalog result title into the fields `CatalogPatch` is built from.
+    """
+    for reg in CATALOG_TITLE_REGEXES:
+        match = reg.fullmatch(title)
+        if match:
+            return match.groupdict()
+    return None
+
+
+def parseCatalogSearchPage(html: str) -> Iterator[Dict[str, str]]:
+    """
+    Yields the fields of every recognized catalog result, including `link_id` and `patch_full_name`.
+
+    Example:
+        ```python
+        for fields in parseCatalogSearchPage(html):
+            catalogPatch = CatalogPatch(fields)
+        ```
+    """
+    for row in parseCatalogSearchRows(html):
+        fields = parseCatalogTitle(row.title)
+        if fields is None:
+            continue
+        fields['link_id'] = row.link_id
+        fields['patch_full_name'] = row.title
+        yield fields
+
+
+def parseCatalogReleases(html: str) -> List[Dict[str, str]]:
+    """
+    Finds the search results which are releases of a Windows version, with their `link_id`,
+    `full_name`, `year`, `month`, `windows_full_name`, `bitness` and `spec_kb`.
+
+    Example:
+        ```python
+        for release in parseCatalogReleases(html):
+            download_name = f'{release["windows_full_name"]} {release["bitness"]} - {release["spec_kb"]}'
+        ```
+    """
+    releases = []
+    for match in CATALOG_RELEASE_LINK_REGEX.finditer(html):
+        release = match.groupdict()
+        # The only fields which may span lines
+        release['full_name'] = ' '.join(release['full_name'].split())
+        release['windows_full_name'] = ' '.join(release['windows_full_name'].split())
+        releases.append(release)
+    return releases
+
+
+def iterateUpdateHistoryLinks(html: str, text_regex: re.Pattern[str]) -> Iterator[Tuple[HtmlLink, re.Match]]:
+    """
+    Yields the navigation links of an update history page whose text matches `text_regex`.
+    """
+    for link in iterateLinks(html, 'data-bi-slot'):
+        match = text_regex.match(link.text)
+        if match and UPDATE_HISTORY_HREF_REGEX.match(link.getAttribute('href')):
+            yield link, match
+
+
+def parseUpdateHistoryKbs(html: str) -> Set[PatchKB]:
+    """
+    Finds every KB in an update history page - with its OS build when the navigation link names it.
+    """
+    kbs: Set[PatchKB] = set()
+    for link, match in iterateUpdateHistoryLinks(html, UPDATE_HISTORY_KB_REGEX):
+        if link.getAttribute('class') == 'supLeftNavLink' and link.getAttribute('href').startswith('/en-us/'):
+            kbs.add(PatchKB(match.group('kb'), match.group('major'), match.group('patch')))
+    # Older entries are only mentioned in the article body
+    for kb in KB_MENTION_REGEX.findall(html):
+        kbs.add(PatchKB(kb, '', ''))
+    return kbs
+
+
+def parseUpdateHistoryDates(html: str) -> Dict[str, Tuple[str, str]]:
+    """
+    Maps the KBs of an update history page to their release (year, zero padded month).
+    """
+    version_map = { }
+    for match in UPDATE_HISTORY_DATE_LINK_REGEX.finditer(html):
+        version_map[match.group('kb')] = (match.group('year'), str(monthToNumber(match.group('month'))).zfill(2))
+    return version_map
+
+
+def parseUpdateHistoryReleases(html: str) -> Dict[str, Tuple[str, str, List[str]]]:
+    """
+    Maps the KBs of an update history page to their release (year, zero padded month, `build.revision` list).
+
+    Rollups of versions without OS builds (Windows 7 and 8.1) get an empty build list.
+    """
+    releases = { }
+    for link, match in iterateUpdateHistoryLinks(html, UPDATE_HISTORY_RELEASE_REGEX):
+        month = monthToNumber(match.group('month').capitalize())
+        if not isinstance(month, int):
+            continue
+        details = match.group('details') or ''
+        builds = [f'{build.group("build")}.{build.group("revision")}' for build in OS_BUILD_REGEX.finditer(details)] if 'build' in details.lower() else []
+        releases[match.group('kb').upper()] = (match.group('year'), str(month).zfill(2), builds)
+    return releases
@@ -3,19 +3,40 @@ import re
 import shutil
 import hashlib
 import base64
-from typing import List
+import time
+from concurrent.futures import Future
+from types import NoneType
+from typing import List, Tuple
+from src.patch.base_resolver import getBaseResolver
 from src.patch.dpatch import *
 from src.patch.extract_msu import MsuVersion, extractMsu
+from src.patch.kb_timeline import getKbTimeline
 from src.psf.psf_manifest import PsfExpressManifestTag
+from src.store.archive import getDeltaArchive
+from src.store.binary_catalog import BinaryStorage, getBinaryCatalog, recordBinary, recordSource
+from src.store.cas import writeOutputFile
+from src.utils.metrics import BYTES_READ, BYTES_WRITTEN, MSUS_PROCESSED, PATCH_LATENCY, PATCHES_APPLIED
 from src.utils.printer import printError, printInfo, printLog, printSuccess
-from src.utils.settings import getInterestingFilesAsRegex, getOutputDirectory
+from src.utils.settings import getInterestingFilesAsRegex, getOutputDirectory, isArchiveMode
 from src.utils.smart_exe import buildVersionedFileName
 from src.utils.tmps import TmpDir
+from src.utils.trace import traceSpan, traced
 from src.utils.utils import normalizeDirtyBitness, walkFiles
 
 
+class BaseFileMissingException(SymbolManagerException):
+    def __init__(self, base_versioned_name: str, base_file_name: str, extension: str, base_version: str, bitness: str) -> NoneType:
+        super().__init__(f'Base file "{base_versioned_name}" not found!')
+        self.base_file_name = base_file_name
+        self.extension = extension
+        self.base_version = base_version
+        self.bitness = bitness
+
+
+@traced('patch', describe=lambda input_file, output_file, *patch_files, **kwargs: {'output': os.path.basename(output_file) if output_file else None, 'patches': len(patch_files)})
 def patchFile(input_file, output_file, *patch_files, allow_legacy: bool = True) -> bytes:
     dry_run = output_file is None
+    start = time.perf_counter()
 
     if input_file is None:
         inbuf = b""
@@ -28,17 +49,24 @@ def patchFile(input_file, output_file, *patch_files, allow_legacy: bool = True)
     to_free = []
     try:
         for patch in patch_files:
-            buf, n = apply_patchfile_to_buffer(buf, n, patch, allow_legacy)
+            with traceSpan('ApplyDeltaB', 'patch', patch=os.path.basename(patch), bytes=n) as span:
+                buf, n = apply_patchfile_to_buffer(buf, n, patch, allow_legacy)
+                span.set(output_bytes=n)
             to_free.append(buf)
+            BYTES_READ.inc(os.path.getsize(patch), stage='patch')
 
         outbuf = bytes((c_ubyte*n).from_address(buf))
         if not dry_run:
-            with open(output_file, 'wb') as w:
-                w.write(outbuf)
+            with traceSpan('write', 'io', bytes=n):
+                writeOutputFile(output_file, outbuf)
+            BYTES_WRITTEN.inc(n, stage='patch')
     finally:
         for buf in to_free:
             DeltaFree(buf)
-    
+
+    BYTES_READ.inc(len(inbuf), stage='patch')
+    PATCHES_APPLIED.inc()
+    PATCH_LATENCY.observe(time.perf_counter() - start)
     return outbuf
 
 
@@ -54,6 +82,8 @@ def handleExtrapolatePatch(args):
         output_file = args.output_file
 
     outbuf = patchFile(input_file, output_file, *args.patches, allow_legacy=args.legacy)
+    if output_file:
+        recordBinary(output_file, 'extrapolate', source=args.patches[-1], data=outbuf)
 
     finalhash = hashlib.sha256(outbuf)
     printSuccess("Applied {} patch{} successfully"
@@ -79,10 +109,11 @@ def createBaseFileFromReverse(base_files_dir: str, base_file_name: str, extensio
 
     at_least_one_file_found = False
     def handleFile(root, path: str):
-        global at_least_one_file_found
+        nonlocal at_least_one_file_found
         at_least_one_file_found = True
         try:
-            patchFile(path, os.path.join(base_files_dir, base_versioned_name), patch_file, allow_legacy=True)
+            outbuf = patchFile(path, os.path.join(base_files_dir, base_versioned_name), patch_file, allow_legacy=True)
+            recordBinary(os.path.join(base_files_dir, base_versioned_name), 'extrapolate', source=path, data=outbuf)
             printSuccess(f'Built base {base_versioned_name} from reverse patch')
         except SymbolManagerException as ex:
             printLog(f'Error creating base from reverse: {ex}')
@@ -94,6 +125,14 @@ def createBaseFileFromReverse(base_files_dir: str, base_file_name: str, extensio
         # We can safely handle this here since we always verify the hash
         #  this file name regex only filters which files to even check.
         bitness_regex = r'(wow64|x86)'
+    # Binaries which the catalog knows of need no search
+    for arch in ((bitness, 'x86') if bitness.lower() == 'wow64' else (bitness, )):
+        for row in getBinaryCatalog().query(file_name=base_file_name + extension, version=target_version, arch=arch):
+            if os.path.isfile(row['path']):
+                handleFile(os.path.dirname(row['path']), row['path'])
+    if at_least_one_file_found:
+        return True
+
     if '_' in base_file_name:
         base_file_name_regex = r'((' + base_file_name + r')|(' + base_file_name.split('_')[0] + r'))'
     file_name_regex = r'^' + re.escape(base_file_name) + r'\s+.*\s*' + re.escape(target_version) + r'\s+.*\s*' + bitness_regex + r'(\s+-\s+((KB\d+)|(\d+-\d+-\d+)))?.*' + re.escape(extension)
@@ -109,7 +148,14 @@ def createBaseFileFromReverse(base_files_dir: str, base_file_name: str, extensio
     return True
 
 
-def doPatchOrCreateBase(base_files_dir: str, base_file_name: str, extension: str, target_version: str, base_version: str, bitness: str, kb: str, patch_direction: str, patch_file: str):
+@traced('patch', describe=lambda base_files_dir, base_file_name, extension, target_version, base_version, bitness, kb, patch_direction, patch_file, source=None: {'file': base_file_name + extension, 'base_version': base_version, 'target_version': target_version, 'bitness': bitness, 'direction': patch_direction})
+def doPatchOrCreateBase(base_files_dir: str, base_file_name: str, extension: str, target_version: str, base_version: str, bitness: str, kb: str, patch_direction: str, patch_file: str, source: str = None):
+    """
+    Args:
+        source (str, optional): The update the patch came from, recorded in the binary catalog (the patch file itself by default).
+    """
+    if source is None:
+        source = patch_file
     bitness = normalizeDirtyBitness(bitness)
     base_versioned_name = buildVersionedFileName(base_file_name, base_version, bitness, extension)
     target_versioned_name = buildVersionedFileName(base_file_name, target_version, bitness, extension, kb)
@@ -129,20 +175,106 @@ def doPatchOrCreateBase(base_files_dir: str, base_file_name: str, extension: str
             printSuccess(f'Built reverse base file {base_versioned_name}')
             # We created the base file, and that is all we shall do with the reverse patch :)
             return
-        raise SymbolManagerException(f'Base file "{base_versioned_name}" not found!')
+        raise BaseFileMissingException(base_versioned_name, base_file_name, extension, base_version, bitness)
 
     if os.path.exists(os.path.join(getOutputDirectory(), target_versioned_name)):
         printLog(f'Skipping {target_versioned_name}')
         return
 
+    if isArchiveMode():
+        # Keep the delta instead of the patched file, it is rebuilt on demand (see `DeltaArchive`)
+        archive = getDeltaArchive(create=True)
+        if archive.hasName(target_versioned_name):
+            printLog(f'Skipping archived {target_versioned_name}')
+            return
+        outbuf = archive.addDelta(target_versioned_name, None if patch_direction == 'n' else base_file, patch_file)
+        recordBinary(os.path.join(getOutputDirectory(), target_versioned_name), 'extrapolate', source=source, data=outbuf, storage=BinaryStorage.Archive)
+        printSuccess(f'Archived delta of {target_versioned_name}')
+        return
+
+    output_file = os.path.join(getOutputDirectory(), target_versioned_name)
     if patch_direction == 'n':
-        patchFile(None, os.path.join(getOutputDirectory(), target_versioned_name), patch_file, allow_legacy=True)
+        outbuf = patchFile(None, output_file, patch_file, allow_legacy=True)
     else:
-        patchFile(base_file, os.path.join(getOutputDirectory(), target_versioned_name), patch_file, allow_legacy=True)
+        outbuf = patchFile(base_file, output_file, patch_file, allow_legacy=True)
+    recordBinary(output_file, 'extrapolate', source=source, data=outbuf)
     printSuccess(f'Built patched file {target_versioned_name}')
 
 
+class PatchQueue:
+    """
+    Patches the files of an update, deferring the ones whose base file is missing.
+
+    With `--fetch-bases` a missing base is fetched in the background (see `BaseResolver`) while
+    the rest of the files are patched, and `retryDeferred` patches the deferred files once their
+    bases arrive. Without it a missing base fails the file as before.
+
+    Example:
+        ```python
+        patches = PatchQueue(args)
+        for ...:
+            patches.patch(base_files_dir=base_files_dir, ...)
+        failed = patches.retryDeferred()
+        ```
+    """
+    def __init__(self, args, source: str = None) -> NoneType:
+        self.source = source
+        self.resolver = getBaseResolver(args.base_files_dir) if getattr(args, 'fetch_bases', False) and args.base_files_dir else None
+        self.deferred: List[Tuple[Future, dict]] = []
+
+    def patch(self, **patch_args) -> bool:
+        """
+        Returns:
+            bool: False if the patch was deferred until its base file is fetched.
+        """
+        try:
+            doPatchOrCreateBase(source=self.source, **patch_args)
+            return True
+        except BaseFileMissingException as ex:
+            if self.resolver is None:
+                raise
+            printLog(f'{ex} Fetching it before retrying')
+            self.deferred.append((self.resolver.request(ex.base_file_name, ex.extension, ex.base_version, ex.bitness), patch_args))
+            return False
+
+    def retryDeferred(self) -> int:
+        """
+        Returns:
+            int: The number of deferred files which failed.
+        """
+        deferred, self.deferred = self.deferred, []
+        failed = 0
+        for future, patch_args in deferred:
+            try:
+                if not future.result():
+                    raise SymbolManagerException(f'Base file {patch_args["base_file_name"]} {patch_args["base_version"]} {patch_args["bitness"]} could not be fetched!')
+                doPatchOrCreateBase(source=self.source, **patch_args)
+            except SymbolManagerException as ex:
+                printError(f'Failed to extrapolate file! {str(ex)}')
+                failed += 1
+        return failed
+
+
+@traced('msu', describe=lambda msu_file, args: {'msu': os.path.basename(msu_file)})
 def extrapolateMsuFile(msu_file, args):
+    outcome = 'failed'
+    try:
+        failed = doExtrapolateMsuFile(msu_file, args)
+        outcome = 'partial' if failed else 'ok'
+        # A run of only some of the files (-n), or one where some failed, does not make the MSU done
+        if not args.name and not failed:
+            recordSource(msu_file, 'extrapolate')
+        elif failed:
+            printError(f'Failed to extrapolate {failed} files of "{os.path.basename(msu_file)}", it is retried on the next run')
+    finally:
+        MSUS_PROCESSED.inc(outcome=outcome)
+
+
+def doExtrapolateMsuFile(msu_file, args) -> int:
+    """
+    Returns:
+        int: The number of files which failed to extrapolate.
+    """
     regex_name = args.name
     if not regex_name:
         regex_name = getInterestingFilesAsRegex()
@@ -151,16 +283,16 @@ def extrapolateMsuFile(msu_file, args):
         r = extractMsu(msu_file, regex_name, patch_files_dir, silent=True)
         if r[0] == MsuVersion.WinServer:
             _, kb, extracted_files = r
-            extrapolateMsuWindowsServerFile(kb, extracted_files, args)
-            return
+            return extrapolateMsuWindowsServerFile(kb, extracted_files, args, msu_file)
         elif r[0] == MsuVersion.Win10:
             _, kb, extracted_files = r
-            extrapolateMsuWindowsLegacyFile(kb, extracted_files, args)
-            return
+            return extrapolateMsuWindowsLegacyFile(kb, extracted_files, args, msu_file)
         else:
             _, msu_metadata, kb, files = r
 
         base_files_dir = args.base_files_dir
+        patches = PatchQueue(args, msu_file)
+        failed = 0
 
         for man, path in files:
             try:
@@ -173,7 +305,7 @@ def extrapolateMsuFile(msu_file, args):
                     continue
                 printLog(f'{man.real_file_name} => {versioned_file_name}')
 
-                doPatchOrCreateBase(
+                if patches.patch(
                     base_files_dir=base_files_dir, 
                     base_file_name=base_name, 
                     extension=ext, 
@@ -183,15 +315,19 @@ def extrapolateMsuFile(msu_file, args):
                     kb=kb, 
                     patch_direction='f', 
                     patch_file=path
-                )
-
-                printSuccess(f'Built patched file {target_versioned_file_name}')
+                ):
+                    printSuccess(f'Built patched file {target_versioned_file_name}')
             except SymbolManagerException as ex:
                 printError(f'Failed to extrapolate file! {str(ex)}')
+                failed += 1
+        return failed + patches.retryDeferred()
 
 
-def extrapolateMsuWindowsServerFile(kb: str, extractedFiles: List[str], args):
+def extrapolateMsuWindowsServerFile(kb: str, extractedFiles: List[str], args, msu_file: str = None) -> int:
     base_files_dir = args.base_files_dir
+    patches = PatchQueue(args, msu_file)
+    timeline = getKbTimeline()
+    failed = 0
 
     patch_file_regex = r'(?P<dirty_bitness>(amd64|wow64|msil|x(86|64)))_microsoft-.*_(?P<verbose_build>((?P<verbose_build_no_patch>(\d+\.\d+\.(?P<build_major>\d+)\.))(?P<build_patch>\d+)))(_\w+)+\\(?P<patch_direction>(r|f|n))\\(?P<file_name>((?P<file_base_name>\w+)(?P<file_name_ext>(\.\w+))))$'
 
@@ -213,24 +349,29 @@ def extrapolateMsuWindowsServerFile(kb: str, extractedFiles: List[str], args):
 
             printLog(f'Filename: {extracted_file}')
 
-            doPatchOrCreateBase(
+            patches.patch(
                 base_files_dir=base_files_dir, 
                 base_file_name=base_name, 
                 extension=ext, 
                 target_version=os_target_version, 
                 base_version=os_base_version, 
                 bitness=bitness, 
-                kb=kb, 
+                # Files which did not change since an earlier update are named after the KB which built them
+                kb=timeline.findKbOfVersion(os_target_version, kb), 
                 patch_direction=patch_direction, 
                 patch_file=extracted_file
             )
 
         except SymbolManagerException as ex:
             printError(f'Failed to extrapolate file! {str(ex)}')
+            failed += 1
+    return failed + patches.retryDeferred()
 
 
-def extrapolateMsuWindowsLegacyFile(kb: str, extractedFiles: List[str], args):
+def extrapolateMsuWindowsLegacyFile(kb: str, extractedFiles: List[str], args, msu_file: str = None) -> int:
     printLog(f'Extrapolating files as legacy patch')
+    timeline = getKbTimeline()
+    failed = 0
     patch_file_regex = r'(?P<dirty_bitness>(amd64|wow64|msil|x(86|64)))_(microsoft|windows)-.*_(?P<verbose_build>((?P<verbose_build_no_patch>(\d+\.\d+\.(?P<build_major>\d+)\.))(?P<build_patch>\d+)))(_\w+)+\\(?P<file_name>((?P<file_base_name>\w+)(?P<file_name_ext>(\.\w+))))$'
     for extracted_file in extractedFiles:
         try:
@@ -242,15 +383,18 @@ def extrapolateMsuWindowsLegacyFile(kb: str, extractedFiles: List[str], args):
             base_name = reg.group('file_base_name')
             ext = reg.group('file_name_ext')
             os_target_version = reg.group('verbose_build')
-            target_versioned_file_name = buildVersionedFileName(base_name, os_target_version, bitness, ext, kb)
+            target_versioned_file_name = buildVersionedFileName(base_name, os_target_version, bitness, ext, timeline.findKbOfVersion(os_target_version, kb))
             output_file = os.path.join(getOutputDirectory(), target_versioned_file_name)
             if os.path.exists(output_file):
                 printLog(f'Skipping {target_versioned_file_name}')
                 continue
             shutil.move(extracted_file, output_file)
+            recordBinary(output_file, 'extrapolate', source=msu_file)
             printSuccess(f'Extracted file {target_versioned_file_name}')
         except SymbolManagerException as ex:
             printError(f'Failed to extrapolate file! {str(ex)}')
+            failed += 1
+    return failed
 
 
 def handleExtrapolateMsu(args):
@@ -270,6 +414,10 @@ def handleExtrapolateMsu(args):
                 if reg and not args.force:
                     # Check if we have already extracted this file
                     kkk = reg.group('kb')
+                    if getBinaryCatalog().isSourceComplete(msu):
+                        printLog(f'Skipping already extracted patch file {msu}')
+                        return
+                    # Outputs from before the binary catalog
                     if re.search(r'jscript.*\s+' + kkk + r'.*\.dll$', existing_files, re.I | re.M):
                         printLog(f'Skipping already extracted patch file {msu}')
                         return
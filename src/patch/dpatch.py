@@ -7,8 +7,10 @@ from src.utils.utils import SymbolManagerException
 
 # types and flags
 DELTA_FLAG_TYPE             = c_uint64
+DELTA_FILE_TYPE             = c_uint64
 DELTA_FLAG_NONE             = 0x00000000
 DELTA_APPLY_FLAG_ALLOW_PA19 = 0x00000001
+DELTA_FILE_TYPE_SET_EXECUTABLES = 0x0000000F
 
 
 # structures
@@ -32,6 +34,11 @@ ApplyDeltaB = windll.msdelta.ApplyDeltaB
 ApplyDeltaB.argtypes = [DELTA_FLAG_TYPE, DELTA_INPUT, DELTA_INPUT,
                         POINTER(DELTA_OUTPUT)]
 ApplyDeltaB.rettype = wintypes.BOOL
+CreateDeltaB = windll.msdelta.CreateDeltaB
+CreateDeltaB.argtypes = [DELTA_FILE_TYPE, DELTA_FLAG_TYPE, DELTA_FLAG_TYPE, DELTA_INPUT, DELTA_INPUT,
+                         DELTA_INPUT, DELTA_INPUT, DELTA_INPUT, wintypes.LPVOID, wintypes.UINT,
+                         POINTER(DELTA_OUTPUT)]
+CreateDeltaB.rettype = wintypes.BOOL
 DeltaFree = windll.msdelta.DeltaFree
 DeltaFree.argtypes = [wintypes.LPVOID]
 DeltaFree.rettype = wintypes.BOOL
@@ -83,6 +90,30 @@ def apply_patchfile_to_buffer(buf, buflen, patchpath, legacy):
     return (dout.lpStart, dout.uSize)
 
 
+def create_delta_from_buffers(source, target):
+    # a PA30 delta (without a CRC) which builds target out of source, as applied by apply_patchfile_to_buffer
+    ds = DELTA_INPUT()
+    dt = DELTA_INPUT()
+    dnone = DELTA_INPUT()
+    dout = DELTA_OUTPUT()
+
+    ds.lpcStart = cast(source, wintypes.LPVOID)
+    ds.uSize = len(source)
+    ds.Editable = False
+
+    dt.lpcStart = cast(target, wintypes.LPVOID)
+    dt.uSize = len(target)
+    dt.Editable = False
+
+    status = CreateDeltaB(DELTA_FILE_TYPE_SET_EXECUTABLES, DELTA_FLAG_NONE, DELTA_FLAG_NONE, ds, dt, dnone, dnone, dnone, None, 0, byref(dout))
+    if status == 0:
+        raise SymbolManagerException("Creating delta failed with error {}".format(gle()))
+    try:
+        return bytes((c_ubyte*dout.uSize).from_address(dout.lpStart))
+    finally:
+        DeltaFree(dout.lpStart)
+
+
 if __name__ == '__main__':
     import sys
     import base64
@@ -8,6 +8,7 @@ from src.psf.common import getChildByTag
 from src.psf.psf_extractor import extractFileFromPsf
 from src.utils.printer import printError, printInfo, printLog, printSuccess
 from src.utils.tmps import TmpDir
+from src.utils.trace import traced
 from src.externals.z7 import z7ExtractFiles, z7ListFiles
 from src.externals.expand import expandExtractFiles, expandListFiles
 from src.utils.utils import SymbolManagerException
@@ -185,6 +186,11 @@ class MsuMetadataBase:
         self.kb = kb
 
 
+def describeMsu(msu_file_path: str, *args, **kwargs) -> dict:
+    return {'msu': os.path.basename(msu_file_path), 'bytes': os.path.getsize(msu_file_path)}
+
+
+@traced('msu', describe=describeMsu)
 def getMsuMetadata(msu_file_path: str) -> MsuMetadataBase:
     with TmpDir() as tmp_dir:
         metadata_files = list(z7ExtractFiles(
@@ -234,6 +240,7 @@ def getMsuMetadata(msu_file_path: str) -> MsuMetadataBase:
             return MsuMetadataBase(msu_metadata.arch, msu_metadata.os_base_version.split('.')[2], msu_metadata.create_time, kb)
 
 
+@traced('msu', describe=describeMsu)
 def extractMsu(msu_file_path: str, file_name: re.Pattern[str], output_dir: str, silent: bool = False):
     with TmpDir() as tmp_dir, TmpDir() as cab_tmp_dir:
 
@@ -0,0 +1,159 @@
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+from types import NoneType
+from typing import List, Set
+from src.utils.printer import printError, printInfo, printLog
+from src.utils.settings import DEFAULT_EXTRAPOLATE_QUEUE_SIZE, DEFAULT_EXTRAPOLATE_WORKERS
+
+
+DEFAULT_MIN_FREE_SCRATCH = 2 * 1024 * 1024 * 1024
+# Extracting an update unpacks its cabinets and PSF into the scratch directory, this is a rough upper bound of their size
+SCRATCH_SPACE_FACTOR = 3
+SCRATCH_POLL_INTERVAL = 5
+
+
+class StageStats:
+    def __init__(self, name: str) -> NoneType:
+        self.name = name
+        self.items = 0
+        self.failed = 0
+        self.bytes = 0
+        self.busy = 0.0
+        self.blocked = 0.0
+        self.wall = 0.0
+
+    def __str__(self) -> str:
+        mib = self.bytes / (1024 * 1024)
+        rate = mib / self.wall if self.wall else 0.0
+        busy = f', {self.busy:.1f}s busy' if self.busy else ''
+        return f'{self.name}: {self.items} files ({self.failed} failed), {mib:.1f} MiB in {self.wall:.1f}s ({rate:.2f} MiB/s{busy}), {self.blocked:.1f}s blocked'
+
+
+class ExtrapolatePipeline:
+    """
+    Extrapolates updates while they are still being downloaded.
+
+    `submit` is handed the path of every downloaded update (e.g. as the `on_downloaded` callback of the
+    catalog crawler) and queues it for `workers` threads which run `extrapolateMsuFile` on it.
+    The queue is bounded, so when every worker is busy the downloads stall instead of piling up, and a worker
+    only starts on an update once the scratch directory has room for it (at least one update always runs).
+    The throughput of both stages is printed when the pipeline is closed.
+
+    Example:
+        ```python
+        with ExtrapolatePipeline(args) as pipeline:
+            downloadPatches('10', '22H2', 'x64', getOutputDirectory(), on_downloaded=pipeline.submit)
+        ```
+    """
+    def __init__(self, args, workers: int = DEFAULT_EXTRAPOLATE_WORKERS, queue_size: int = DEFAULT_EXTRAPOLATE_QUEUE_SIZE, min_free_scratch: int = DEFAULT_MIN_FREE_SCRATCH, scratch_dir: str = None) -> NoneType:
+        self.args = args
+        self.min_free_scratch = min_free_scratch
+        self.scratch_dir = scratch_dir if scratch_dir else tempfile.gettempdir()
+        self.queue: queue.Queue = queue.Queue(maxsize=max(1, queue_size))
+        self.condition = threading.Condition()
+        self.active = 0
+        self.reserved_scratch = 0
+        self.submitted: Set[str] = set()
+        self.download_stats = StageStats('download')
+        self.extrapolate_stats = StageStats('extrapolate')
+        self.started = time.perf_counter()
+        self.first_extrapolation = None
+        self.workers: List[threading.Thread] = [threading.Thread(target=self.__worker, daemon=True) for _ in range(max(1, workers))]
+        for worker in self.workers:
+            worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def submit(self, msu_path: str):
+        """
+        Queues a downloaded update. Blocks while the queue is full.
+        """
+        msu_path = os.path.abspath(msu_path)
+        with self.condition:
+            if msu_path in self.submitted:
+                return
+            self.submitted.add(msu_path)
+            self.download_stats.items += 1
+            self.download_stats.bytes += os.path.getsize(msu_path)
+            self.download_stats.wall = time.perf_counter() - self.started
+        start = time.perf_counter()
+        self.queue.put(msu_path)
+        with self.condition:
+            self.download_stats.blocked += time.perf_counter() - start
+
+    def __reserveScratch(self, size: int) -> int:
+        needed = size * SCRATCH_SPACE_FACTOR
+        start = time.perf_counter()
+        with self.condition:
+            # Reservations are only released once an update is done, so space its extraction already
+            # uses is counted twice - this errs on the side of waiting
+            while self.active and shutil.disk_usage(self.scratch_dir).free - self.reserved_scratch - needed < self.min_free_scratch:
+                self.condition.wait(SCRATCH_POLL_INTERVAL)
+            self.active += 1
+            self.reserved_scratch += needed
+            self.extrapolate_stats.blocked += time.perf_counter() - start
+            if self.first_extrapolation is None:
+                self.first_extrapolation = time.perf_counter()
+        if shutil.disk_usage(self.scratch_dir).free - needed < self.min_free_scratch:
+            printLog(f'Low on scratch space in {self.scratch_dir}, extrapolating a single update at a time')
+        return needed
+
+    def __releaseScratch(self, reserved: int):
+        with self.condition:
+            self.active -= 1
+            self.reserved_scratch -= reserved
+            self.condition.notify_all()
+
+    def __extrapolate(self, msu_path: str):
+        size = os.path.getsize(msu_path)
+        reserved = self.__reserveScratch(size)
+        start = time.perf_counter()
+        failed = False
+        try:
+            printLog(f'Extrapolating {os.path.basename(msu_path)}')
+            # Imported by the workers, so the CLI can read this module's defaults without loading msdelta
+            from src.patch.delta_patch import extrapolateMsuFile
+            extrapolateMsuFile(msu_path, self.args)
+        except Exception as ex:
+            # A failed update must not take its worker down with it
+            failed = True
+            printError(f'Failed to extrapolate MSU file "{msu_path}" {str(ex)}')
+        finally:
+            self.__releaseScratch(reserved)
+            end = time.perf_counter()
+            with self.condition:
+                self.extrapolate_stats.items += 1
+                self.extrapolate_stats.failed += int(failed)
+                self.extrapolate_stats.bytes += size
+                self.extrapolate_stats.busy += end - start
+                self.extrapolate_stats.wall = end - self.first_extrapolation
+
+    def __worker(self):
+        while True:
+            msu_path = self.queue.get()
+            try:
+                if msu_path is None:
+                    return
+                self.__extrapolate(msu_path)
+            finally:
+                self.queue.task_done()
+
+    def close(self):
+        """
+        Waits for every queued update to be extrapolated and prints the throughput of both stages.
+        """
+        for _ in self.workers:
+            self.queue.put(None)
+        for worker in self.workers:
+            worker.join()
+        printInfo(f'Pipeline done in {time.perf_counter() - self.started:.1f}s')
+        printInfo(str(self.download_stats))
+        printInfo(str(self.extrapolate_stats))
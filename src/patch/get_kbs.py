@@ -6,8 +6,10 @@ from typing import Dict, List, Set
 import requests
 from requests import session
 import urllib.parse
+from src.patch.catalog_parser import parseUpdateHistoryKbs
 from src.patch.common import PatchKB
-from src.utils.utils import SymbolManagerException, monthToNumber
+from src.utils.http_cache import getHttpCache
+from src.utils.utils import SymbolManagerException
 from src.utils.printer import printError, printLog, printSuccess
 
 WindowsVersionHistoryLink = str
@@ -27,46 +29,14 @@ class WindowsVersionHistoryLinks:
 
 
 def getAllKbs(versionHistoryLink: WindowsVersionHistoryLink) -> Set[PatchKB]:
-    req = requests.get(versionHistoryLink)
+    req = getHttpCache().get(versionHistoryLink)
     if not req.ok:
         raise SymbolManagerException(f'Failed to query WindowsVersionHistoryLink {versionHistoryLink} !')
     content = req.text
-
-    reg = re.compile(r'<a\s+class="supLeftNavLink"\s+data-bi-slot="\d+"\s+href="\/en-us\/help\/\d+">\w+\s+\d+,\s+\d+(&#x\d+)?;(?P<kb>(KB\d+))(\s+\(((OS\s+Build\s+(?P<major>\d+)\.(?P<patch>\d+)))|(.+?\s+((Rollup)|Update))\)(\s+.*)?)?<\/a>', re.IGNORECASE | re.UNICODE | re.MULTILINE)
-    matches = reg.finditer(content)
-
-    kbs : Set[PatchKB] = set()
-    for match in matches:
-        maj = match.group('major')
-        pat = match.group('patch')
-        kbs.add(PatchKB(match.group('kb'), maj, pat))
-
-    old_reg = re.compile(r'(?P<kb>(KB\d+))', re.IGNORECASE | re.UNICODE | re.MULTILINE)
-    old_patches = old_reg.finditer(content)
-    for match in old_patches:
-        kbs.add(PatchKB(match.group('kb'), '', ''))
-        
-    return set(kbs)
+    return parseUpdateHistoryKbs(content)
 
 
 def getAllKbsByMajor(major: str) -> Set[PatchKB]:
     versionLink = WindowsVersionHistoryLinks.LOOKUP_BY_MAJOR[major]
     return getAllKbs(versionLink)
 
-
-def mapPatchKbsToDate(major: str):
-    printLog(f'Major: {major}')
-    versionLink = WindowsVersionHistoryLinks.LOOKUP_BY_MAJOR[major]
-    data = requests.get(versionLink).text
-    reg = re.finditer(r'\<a\s+class="\w+"\s+data-bi-slot="\d+"\s+href="\/\w+-\w+\/help\/(?=(\d+))\d+"\>(?P<month>\w+)\s+\d+,\s+(?P<year>\d+).*(?P<kb>(KB\w+))\s+\(OS\s+Builds?\s+', data, re.I | re.M)
-
-    version_map = { }
-
-    for v in reg:
-        kb = v.group('kb')
-        year = v.group('year')
-        month = str(monthToNumber(v.group('month'))).zfill(2)
-        version_map[kb] = (year, month)
-        # printLog(f'{kb} {year}-{month}')
-
-    printLog(f'version_map: {version_map}')
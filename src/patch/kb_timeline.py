@@ -0,0 +1,281 @@
+import bisect
+import hashlib
+import os
+import threading
+import time
+from types import NoneType
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+import requests
+from src.patch.catalog_parser import parseUpdateHistoryKbs, parseUpdateHistoryReleases
+from src.patch.common import PatchKB
+from src.patch.get_kbs import WindowsVersionHistoryLinks
+from src.utils.http_cache import getHttpCache
+from src.utils.json_store import JsonStore
+from src.utils.printer import printError, printInfo, printLog
+from src.utils.settings import getHttpCacheDirectory, isOfflineMode
+from src.utils.utils import SymbolManagerException
+
+
+KB_TIMELINE_FILE_NAME = 'kb_timeline.json'
+KB_TIMELINE_VERSION = 1
+# Seconds before a major is checked against its update history page again
+KB_TIMELINE_TTL = 24 * 60 * 60
+
+
+def splitBuild(version: str) -> Tuple[int, int] | None:
+    """
+    Splits the build and revision out of a version: both `10.0.19045.3570` and `19045.3570` give (19045, 3570).
+    """
+    parts = version.strip().split('.')
+    if len(parts) < 2 or not parts[-2].isdigit() or not parts[-1].isdigit():
+        return None
+    return int(parts[-2]), int(parts[-1])
+
+
+class KbRelease:
+    """
+    A KB of an update history page: the OS builds it brings and when it was released.
+
+    KBs which are only mentioned in the page's body have no builds and no release date.
+    """
+    def __init__(self, kb: str, major: str, builds: List[str] = None, year: str = '', month: str = '') -> NoneType:
+        self.kb = kb
+        self.major = major
+        self.builds = builds if builds else []
+        self.year = year
+        self.month = month
+
+    def __str__(self) -> str:
+        return f'{self.kb} - {self.getDate() or "unknown date"} - {", ".join(self.builds) or "no build"}'
+
+    @staticmethod
+    def fromDict(kb: str, major: str, data: dict) -> 'KbRelease':
+        return KbRelease(kb, major, data.get('builds'), data.get('year', ''), data.get('month', ''))
+
+    def toDict(self) -> dict:
+        return {'builds': self.builds, 'year': self.year, 'month': self.month}
+
+    def getDate(self) -> str:
+        return f'{self.year}-{self.month}' if self.year else ''
+
+    def iterateBuilds(self) -> Iterator[Tuple[int, int]]:
+        for build in self.builds:
+            split = splitBuild(build)
+            if split:
+                yield split
+
+    def toPatchKb(self) -> PatchKB:
+        build, _, revision = self.builds[0].partition('.') if self.builds else ('', '', '')
+        return PatchKB(self.kb, build, revision, self.year, self.month)
+
+
+class KbTimeline:
+    """
+    A persisted timeline of the KBs of every Windows major: KB -> OS build.revision -> release year/month.
+
+    A major is refreshed from its update history page at most once per `ttl`, the page is revalidated
+    through the HTTP cache and only parsed again when its content changed. New KBs are merged into the
+    timeline, so KBs which were dropped from the page are still known. Lookups are served from
+    in-memory indexes, by KB and by build (sorted by revision, for range queries).
+
+    Example:
+        ```python
+        timeline = getKbTimeline()
+        timeline.ensure(['10'])
+        timeline.getRelease('KB5031356').builds # ['19044.3570', '19045.3570']
+        timeline.getKbsInBuildRange(19045, 3500, 3600)
+        ```
+    """
+    def __init__(self, file_path: str, ttl: int = KB_TIMELINE_TTL) -> NoneType:
+        self.file_path = file_path
+        self.store = JsonStore(file_path, KB_TIMELINE_VERSION, 'majors', 'KB timeline')
+        self.ttl = ttl
+        # major -> {'refreshed_at': float, 'digest': str, 'kbs': {kb: KbRelease.toDict()}}
+        self.majors: Dict[str, dict] = self.store.load({ })
+        self.lock = threading.RLock()
+        # Majors which were already brought up to date (or failed to) by this process
+        self.ensured: Set[str] = set()
+        self.by_major: Dict[str, List[KbRelease]] = { }
+        self.by_kb: Dict[str, KbRelease] = { }
+        self.by_build: Dict[int, List[Tuple[int, str]]] = { }
+        self.__reindex()
+
+    def __reindex(self):
+        by_major: Dict[str, List[KbRelease]] = { }
+        by_kb: Dict[str, KbRelease] = { }
+        by_build: Dict[int, List[Tuple[int, str]]] = { }
+        for major, data in self.majors.items():
+            releases = by_major.setdefault(major, [])
+            for kb, entry in data['kbs'].items():
+                release = KbRelease.fromDict(kb, major, entry)
+                releases.append(release)
+                # A page may mention the KBs of another major, the page which dates the KB wins
+                if kb not in by_kb or not by_kb[kb].year:
+                    by_kb[kb] = release
+                for build, revision in release.iterateBuilds():
+                    by_build.setdefault(build, []).append((revision, kb))
+        by_build = {build: sorted(set(revisions)) for build, revisions in by_build.items()}
+        self.by_major, self.by_kb, self.by_build = by_major, by_kb, by_build
+
+    def save(self):
+        with self.lock:
+            self.store.save(self.majors)
+
+    def isStale(self, major: str) -> bool:
+        with self.lock:
+            return time.time() - self.majors.get(major, { }).get('refreshed_at', 0) >= self.ttl
+
+    def refresh(self, major: str, force: bool = False) -> int:
+        """
+        Merges the update history page of `major` into the timeline.
+
+        Returns:
+            int: The number of new or changed KBs.
+        """
+        link = WindowsVersionHistoryLinks.LOOKUP_BY_MAJOR[major]
+        response = getHttpCache().get(link, ttl=self.ttl)
+        if not response.ok:
+            raise SymbolManagerException(f'Failed to query WindowsVersionHistoryLink {link} !')
+        digest = hashlib.sha256(response.content).hexdigest()
+        with self.lock:
+            data = self.majors.setdefault(major, {'refreshed_at': 0, 'digest': '', 'kbs': { }})
+            data['refreshed_at'] = time.time()
+            self.store.markDirty()
+            if data['digest'] == digest and not force:
+                return 0
+
+        html = response.text
+        releases = parseUpdateHistoryReleases(html)
+        mentioned = parseUpdateHistoryKbs(html)
+
+        changed = 0
+        with self.lock:
+            kbs = data['kbs']
+            for kb, (year, month, builds) in releases.items():
+                entry = KbRelease(kb, major, builds, year, month).toDict()
+                if kbs.get(kb) != entry:
+                    kbs[kb] = entry
+                    changed += 1
+            for patch_kb in mentioned:
+                kb = patch_kb.kb.upper()
+                if kb not in kbs:
+                    kbs[kb] = KbRelease(kb, major, [f'{patch_kb.major}.{patch_kb.patch}'] if patch_kb.major else []).toDict()
+                    changed += 1
+            data['digest'] = digest
+            if changed:
+                self.__reindex()
+        return changed
+
+    def ensure(self, majors: Iterable[str] = None):
+        """
+        Refreshes the stale majors (all of them by default), once per process.
+
+        A major whose page can not be fetched keeps its known timeline, and `--offline` keeps all of them.
+        """
+        if isOfflineMode():
+            return
+        for major in majors if majors else WindowsVersionHistoryLinks.LOOKUP_BY_MAJOR:
+            with self.lock:
+                if major in self.ensured:
+                    continue
+                self.ensured.add(major)
+            if not self.isStale(major):
+                continue
+            try:
+                changed = self.refresh(major)
+                if changed:
+                    printLog(f'KB timeline of Windows {major}: {changed} new or changed KBs')
+            except (SymbolManagerException, requests.RequestException) as ex:
+                printError(f'Failed to refresh the KB timeline of Windows {major}: {ex}')
+        self.save()
+
+    def getRelease(self, kb: str) -> KbRelease | None:
+        with self.lock:
+            return self.by_kb.get(kb.upper())
+
+    def findRelease(self, kb: str) -> KbRelease | None:
+        """
+        Returns the release of a KB, refreshing the stale majors first if the timeline does not know it.
+        """
+        release = self.getRelease(kb)
+        if release is None:
+            self.ensure()
+            release = self.getRelease(kb)
+        return release
+
+    def getReleases(self, major: str) -> List[KbRelease]:
+        """
+        Returns the KBs of a major, oldest release first (KBs without a release date last).
+        """
+        with self.lock:
+            releases = self.by_major.get(major, [])
+        return sorted(releases, key=lambda release: (not release.year, release.getDate(), int(release.kb[2:])))
+
+    def getPatchKbs(self, major: str) -> Set[PatchKB]:
+        return {release.toPatchKb() for release in self.getReleases(major)}
+
+    def getKbsInBuildRange(self, build: int, first_revision: int, last_revision: int) -> List[KbRelease]:
+        """
+        Returns the KBs which bring `build.first_revision` to `build.last_revision` (inclusive), by revision.
+        """
+        with self.lock:
+            revisions = self.by_build.get(build, [])
+            first = bisect.bisect_left(revisions, (first_revision, ''))
+            last = bisect.bisect_right(revisions, (last_revision, '\uffff'))
+            return [self.by_kb[kb] for _, kb in revisions[first:last]]
+
+    def getKbsOfVersion(self, version: str) -> List[KbRelease]:
+        """
+        Returns the KBs which bring an exact OS version (`10.0.19045.3570` or `19045.3570`).
+        """
+        split = splitBuild(version)
+        if not split:
+            return []
+        return self.getKbsInBuildRange(split[0], split[1], split[1])
+
+    def getKbOfVersion(self, version: str, default_kb: str = '') -> str:
+        """
+        Returns the KB which brought a file version, preferring `default_kb` when several KBs share it.
+        """
+        kbs = [release.kb for release in self.getKbsOfVersion(version)]
+        if not kbs or (default_kb and default_kb.upper() in kbs):
+            return default_kb
+        return kbs[0]
+
+    def findKbOfVersion(self, version: str, default_kb: str = '') -> str:
+        """
+        Like `getKbOfVersion`, refreshing the stale majors first if the timeline knows neither the version nor `default_kb`.
+
+        A timeline which knows `default_kb` already knows every earlier version, so it is not refreshed.
+        """
+        if not self.getKbsOfVersion(version) and not (default_kb and self.getRelease(default_kb)):
+            self.ensure()
+        return self.getKbOfVersion(version, default_kb)
+
+
+g_kb_timeline: KbTimeline | None = None
+g_kb_timeline_lock = threading.Lock()
+
+
+def getKbTimeline() -> KbTimeline:
+    """
+    Returns the process wide timeline, stored next to the HTTP cache.
+    """
+    global g_kb_timeline
+    file_path = os.path.join(getHttpCacheDirectory(), KB_TIMELINE_FILE_NAME)
+    with g_kb_timeline_lock:
+        if g_kb_timeline is None or g_kb_timeline.file_path != file_path:
+            g_kb_timeline = KbTimeline(file_path)
+        return g_kb_timeline
+
+
+def printKbTimeline(major: str, refresh: bool = False):
+    timeline = getKbTimeline()
+    if refresh:
+        timeline.refresh(major, force=True)
+        timeline.save()
+    else:
+        timeline.ensure([major])
+    printLog(f'Major: {major}')
+    for release in timeline.getReleases(major):
+        printInfo(str(release))
@@ -1,20 +1,28 @@
+import base64
 import json
 import os
 import re
 from types import NoneType
-from typing import Dict
+from typing import Callable, Dict, List
 import requests
 from requests import session
 import urllib.parse
 
-import tqdm
-from src.patch.get_kbs import getAllKbsByMajor
-from src.utils.utils import SymbolManagerException, downloadFileWithProgress
+from src.patch.catalog_parser import parseCatalogReleases, parseCatalogSearchPage, parseCatalogSearchRows
+from src.utils.download import downloadFile
+from src.utils.http import getSession
+from src.utils.http_cache import getHttpCache
+from src.utils.utils import SymbolManagerException
 from src.utils.printer import printError, printInfo, printLog, printSuccess
-from src.utils.settings import getOutputDirectory, isAllowedToDownloadDynamicUpdates, isVerboseMode, preferOldPatches
+from src.utils.settings import getCatalogUrl, getOutputDirectory, isAllowedToDownloadDynamicUpdates
 
 
-BASE_URL = 'https://www.catalog.update.microsoft.com/Search.aspx'
+def getCatalogSearchUrl() -> str:
+    return f'{getCatalogUrl()}/Search.aspx'
+
+
+def getCatalogDownloadDialogUrl() -> str:
+    return f'{getCatalogUrl()}/DownloadDialog.aspx'
 
 
 PROXIES = {
@@ -23,40 +31,64 @@ PROXIES = {
 }
 
 
+# The catalog accepts many update IDs per DownloadDialog request
+DOWNLOAD_DIALOG_BATCH_SIZE = 25
+
+
 class PatchCatalogException(SymbolManagerException):
     pass
 
 
+def buildDownloadDialogForm(update_ids: List[Dict[str, str]]) -> Dict[str, str]:
+    return {
+        'updateIDs': json.dumps(update_ids)
+    }
+
+
+def parseDownloadDigest(index: int, downloadDialog: str, downloadLink: str = '') -> str | None:
+    """
+    Finds the SHA1 of a download, from the dialog's `digest` (base64) or from the hash in the file name.
+    """
+    match = re.search(r'downloadInformation\[' + str(index) + r"\]\.files\[0\]\.digest\s*=\s*'(?P<digest>[\w+/=]+)'", downloadDialog)
+    if match:
+        try:
+            digest = base64.b64decode(match.group('digest'), validate=True)
+            if len(digest) == 20:
+                return digest.hex()
+        except ValueError:
+            pass
+    match = re.search(r'_(?P<sha1>[0-9a-f]{40})\.\w+$', downloadLink, re.IGNORECASE)
+    return match.group('sha1').lower() if match else None
+
+
 class CatalogPatch:
     dynamic = False
     ext = None
     major = None
     real_minor = 0
+    sha1 = None
 
-    def __init__(self, data: re.Match | None, windowsMajor: str = '') -> NoneType:
+    def __init__(self, data: re.Match | Dict[str, str] | None, windowsMajor: str = '') -> NoneType:
         self.download_link = None
         self.data_loaded = data is not None
         if self.data_loaded:
-            self.link_id = data.group('link_id')
-            self.kb = data.group('kb_id')
-            self.year = data.group('patch_year')
-            self.month = data.group('patch_month')
-            self.major = data.group('windows_major')
-            self.minor = data.group('windows_minor') if 'windows_minor' in data.groupdict() else ''
+            fields = data if isinstance(data, dict) else data.groupdict()
+            self.link_id = fields['link_id']
+            self.kb = fields['kb_id']
+            self.year = fields['patch_year']
+            self.month = fields['patch_month']
+            self.major = fields['windows_major']
+            self.minor = fields.get('windows_minor', '')
             # self.real_minor = data.group('real_minor')
-            self.bitness = data.group('windows_bitness')
-            self.dynamic = data.group('dynamic') if 'dynamic' in data.groupdict() else False
+            self.bitness = fields['windows_bitness']
+            self.dynamic = fields.get('dynamic', False)
         
         # Microsoft are stupid and sometime write Windows 10 even though it is 11
         if windowsMajor:
             self.major = windowsMajor
 
     def __getDownloadDialog(self) -> str:
-        req = requests.post('https://www.catalog.update.microsoft.com/DownloadDialog.aspx', data = {
-            'updateIDs': json.dumps([
-                self.getUpdateId()
-            ])
-        })
+        req = getHttpCache().post(getCatalogDownloadDialogUrl(), data = buildDownloadDialogForm([self.getUpdateId()]))
         return req.text
     
     def getUpdateId(self) -> Dict[str,str]:
@@ -87,11 +119,11 @@ class CatalogPatch:
             self.bitness = nameMatch.group('windows_bitness')
         self.kb = nameMatch.group('kb_id')
 
-        reg = r'downloadInformation\[' + str(index) + r"\]\.files\[0\]\.url\s*=\s*'(?P<link>(https?:\/\/catalog\.s\.download\.windowsupdate\.com\/(?P<download_prefix>\w+)\/msdownload\/update\/software\/(?P<updt>(secu|updt))\/(?P<year>\d+)\/(?P<month>\d+)\/windows(?P<major>\w+)\.(?P<real_minor>\w+)-(?P<kb>\w+)-(?P<bitness>\w+)_(?P<download_id>\w+)\.(?P<ext>(cab|msu))))';"
+        reg = r'downloadInformation\[' + str(index) + r"\]\.files\[0\]\.url\s*=\s*'(?P<link>(https?:\/\/[\w\.\-:]+\/(?P<download_prefix>\w+)\/msdownload\/update\/software\/(?P<updt>(secu|updt))\/(?P<year>\d+)\/(?P<month>\d+)\/windows(?P<major>\w+)\.(?P<real_minor>\w+)-(?P<kb>\w+)-(?P<bitness>\w+)_(?P<download_id>\w+)\.(?P<ext>(cab|msu))))';"
         self.updt = 'secu'
         match = re.search(reg, downloadDialog if downloadDialog else self.__getDownloadDialog(), re.IGNORECASE | re.MULTILINE)
         if not match:
-            reg = r'downloadInformation\[' + str(index) + r"\]\.files\[0\]\.url\s*=\s*" + r"'(?P<link>(https:\/\/catalog\.sf\.dl\.delivery\.mp\.microsoft\.com\/filestreamingservice\/files\/\w+-\w+-\w+-\w+-\w+\/public\/windows(?P<major>\w+)\.(?P<real_minor>\w+)-(?P<kb>\w+)-(?P<bitness>\w+)_\w+\.(?P<ext>(msu))))'"
+            reg = r'downloadInformation\[' + str(index) + r"\]\.files\[0\]\.url\s*=\s*" + r"'(?P<link>(https?:\/\/[\w\.\-:]+\/filestreamingservice\/files\/\w+-\w+-\w+-\w+-\w+\/public\/windows(?P<major>\w+)\.(?P<real_minor>\w+)-(?P<kb>\w+)-(?P<bitness>\w+)_\w+\.(?P<ext>(msu))))'"
             match = re.search(reg, downloadDialog if downloadDialog else self.__getDownloadDialog(), re.IGNORECASE | re.MULTILINE)
             if match:
                 self.download_link = match.group('link')
@@ -133,21 +165,12 @@ class CatalogPatch:
         printLog(f'Got download link {self.download_link}')
         if not self.ext:
             self.ext = os.path.splitext(self.download_link)[1]
+        self.sha1 = parseDownloadDigest(index, downloadDialog if downloadDialog else self.__getDownloadDialog(), self.download_link)
         return self.download_link
 
     def download(self, fileName: str = '') -> None:
         download_link = self.download_link if self.download_link else self.getDownloadLink()
-        if isVerboseMode():
-            return downloadFileWithProgress(download_link, fileName)
-        else:
-            req = requests.get(download_link)
-            if not req.ok:
-                return None
-            data = req.content
-            if not data:
-                raise SymbolManagerException(f'Failed to download {self.getDownloadName()}')
-            with open(fileName, 'wb') as f:
-                f.write(data)
+        downloadFile(download_link, fileName, expected_sha1=self.sha1)
 
     def getDownloadName(self) -> str:
         if self.major == '11' and not self.minor:
@@ -155,6 +178,83 @@ class CatalogPatch:
         return f'Windows {self.major} {self.minor} {self.bitness} - {"Dynamic " if self.dynamic else ""}{self.kb.upper()} - {self.year}-{self.month}.{self.ext if self.ext else "cab"}'
 
 
+def resolveCatalogPatch(catalog: CatalogPatch, searchResult: CatalogPatch) -> CatalogPatch:
+    """
+    Completes a patch resolved from a download dialog with the data of its search result.
+    """
+    catalog.link_id = searchResult.link_id
+    catalog.minor = searchResult.minor
+    if searchResult.year:
+        catalog.year = searchResult.year
+    if searchResult.month:
+        catalog.month = searchResult.month
+    if str(catalog.major) == '6' and str(catalog.real_minor) == '1':
+        catalog.major = '7'
+    if str(catalog.major) == '6' and str(catalog.real_minor) == '2':
+        catalog.major = '8'
+    if str(catalog.major) == '6' and str(catalog.real_minor) == '3':
+        catalog.major = '8.1'
+    return catalog
+
+
+def requestDownloadDialog(searchResults: List[CatalogPatch], session: requests.Session = None) -> str:
+    """
+    Requests the download dialog of many updates at once.
+    """
+    req = getHttpCache().post(getCatalogDownloadDialogUrl(), data = buildDownloadDialogForm([searchResult.getUpdateId() for searchResult in searchResults]), session=session)
+    req.raise_for_status()
+    return req.text
+
+
+def parseDownloadDialog(downloadDialog: str, searchResults: List[CatalogPatch]) -> List[CatalogPatch]:
+    """
+    Resolves every `downloadInformation[i]` entry of a batched download dialog.
+
+    Entries are matched back to their search result by update ID (falling back to the KB when a single
+    result has it, then to their position). An entry which fails to parse or is ambiguous is reported and
+    skipped without affecting the rest.
+
+    Example:
+        ```python
+        downloadDialog = requestDownloadDialog(searchResults)
+        for catalog in parseDownloadDialog(downloadDialog, searchResults):
+            catalog.download(catalog.getDownloadName())
+        ```
+    """
+    byUpdateId = {searchResult.link_id.lower(): searchResult for searchResult in searchResults}
+    byKb: Dict[str, List[CatalogPatch]] = { }
+    for searchResult in searchResults:
+        if searchResult.kb:
+            byKb.setdefault(searchResult.kb.lower(), []).append(searchResult)
+    indices = sorted(set(int(i) for i in re.findall(r'downloadInformation\[(\d+)\]\.', downloadDialog)))
+    resolved = []
+    for index in indices:
+        try:
+            catalog = CatalogPatch(None)
+            catalog.getDownloadLink(index, downloadDialog)
+            updateIdMatch = re.search(r'downloadInformation\[' + str(index) + r"\]\.updateID\s*=\s*'(?P<update_id>[\w\-]+)'", downloadDialog)
+            searchResult = None
+            if updateIdMatch:
+                searchResult = byUpdateId.get(updateIdMatch.group('update_id').lower())
+            if not searchResult and catalog.kb:
+                candidates = byKb.get(catalog.kb.lower(), [])
+                if len(candidates) == 1:
+                    searchResult = candidates[0]
+                elif candidates:
+                    # The KB is shared by several results (e.g. one per architecture), only the position can tell them apart
+                    if index >= len(searchResults) or not any(candidate is searchResults[index] for candidate in candidates):
+                        raise PatchCatalogException(f'Download dialog entry {index} ({catalog.kb}) matches {len(candidates)} requested updates')
+                    searchResult = searchResults[index]
+            if not searchResult and index < len(searchResults):
+                searchResult = searchResults[index]
+            if not searchResult:
+                raise PatchCatalogException(f'Download dialog entry {index} ({catalog.kb}) does not match any requested update')
+            resolved.append(resolveCatalogPatch(catalog, searchResult))
+        except Exception as ex:
+            printError(f'Failed on download dialog entry {index}: {str(ex)}')
+    return resolved
+
+
 class PatchDownloader:
     url = ''
     query = ''
@@ -162,19 +262,17 @@ class PatchDownloader:
     windowsMinor = ''
     bitness = ''
 
-    def __init__(self, windowsMajor: str = '', windowsMinor: str = '', bitness: str = '', prefix: str = '', query: str = ''):
+    def __init__(self, windowsMajor: str = '', windowsMinor: str = '', bitness: str = '', prefix: str = '', query: str = '', data: str = None):
         self.query = query
         if not self.query:
-            if windowsMinor:
-                self.query = f'{prefix}Cumulative Update for Windows {windowsMajor} Version {windowsMinor} for {bitness}-based Systems'
-            else:
-                self.query = f'{prefix}Cumulative Update for Windows {windowsMajor} for {bitness}-based Systems'
+            self.query = PatchDownloader.buildQuery(windowsMajor, windowsMinor, bitness, prefix)
         self.windowsMajor = windowsMajor
         self.windowsMinor = windowsMinor
         self.bitness = bitness
         self.url = PatchDownloader.buildCatalogSearchUrl(self.query)
         printLog(f'Catalog URL: {self.url}')
-        self.data = requests.get(self.url).text
+        # The search page may have been fetched already (e.g. by the catalog crawler)
+        self.data = data if data is not None else getHttpCache().get(self.url).text
 
     def isValidBitness(self, bitness) -> bool:
         if not self.bitness:
@@ -184,143 +282,90 @@ class PatchDownloader:
         return bitness in self.bitness
         
     def generatePatchDownloadUrls(self):
-        reg1 = r'<a\s+id=\'\w+-\w+-\w+-\w+-\w+_link\'\s+href=\s*"javascript:void\(0\);"\s*onclick=\'goToDetails\("(?P<link_id>(\w+-\w+-\w+-\w+-\w+))"\);\'\s+class="contentTextItemSpacerNoBreakLink">\s*(?P<patch_full_name>((?P<patch_year>\d+)-(?P<patch_month>\d+)\s+(((?P<dynamic>(Dynamic)\s+)?Cumulative Update )|((Security|(Preview of ))?\*(Monthly|Only) Quality Rollup ))(Preview )?for (Microsoft )?(Windows )?(?P<windows_major>\w+) (operating system,? )?(Version (?P<windows_minor>\w+) )?for (?P<windows_bitness>\w+)-based Systems \((?P<kb_id>\w+)\)))\s*<\/a>'
-        reg2 = r'<a\s+id=\'\w+-\w+-\w+-\w+-\w+_link\'\s+href=\s*"javascript:void\(0\);"\s*onclick=\'goToDetails\("(?P<link_id>(\w+-\w+-\w+-\w+-\w+))"\);\'\s+class="contentTextItemSpacerNoBreakLink">\s*(?P<patch_full_name>((?P<patch_year>\d+)-(?P<patch_month>\d+)\s+(((?P<dynamic>(Dynamic)\s+)?Cumulative Update )|((Security|(Preview of ))?\s*(Monthly|Only)?\s*Quality Rollup ))?(Preview )?for (Microsoft )?(Windows )?(?P<windows_major>\w+) (operating system,? )?(Version (?P<windows_minor>\w+) )?for (?P<windows_bitness>\w+)-based Systems \((?P<kb_id>\w+)\)))\s*<\/a>'
-        reg3 = r'<a\s+id=\'\w+-\w+-\w+-\w+-\w+_link\'\s+href=\s*"javascript:void\(0\);"\s*onclick=\'goToDetails\("(?P<link_id>(\w+-\w+-\w+-\w+-\w+))"\);\'\s+class="contentTextItemSpacerNoBreakLink">\s*(?P<patch_full_name>(((?P<patch_year>\d+)-(?P<patch_month>\d+))?(\w+\s+)*Update\s+for\s+(Microsoft\s+)?Windows\s+(?P<windows_major>((\w+\s+?)|((Server\s+\d+\s+(\w+\s+)?))))(\s+operating system,?\s+)?\s*?(\s*?for\s+?(?P<windows_bitness>\w+?)-based\s+Systems\s*?)?\s+\((?P<kb_id>\w+?)\)))\s*<\/a>'
-        reg4 = r'<a\s+id=\'\w+-\w+-\w+-\w+-\w+_link\'\s+href=\s*"javascript:void\(0\);"\s*onclick=\'goToDetails\("(?P<link_id>(\w+-\w+-\w+-\w+-\w+))"\);\'\s+class="contentTextItemSpacerNoBreakLink">\s*(?P<patch_full_name>(((?P<patch_year>\d+)-(?P<patch_month>\d+))?Update\s+for\s+Windows\s+(?P<windows_major>\d+)\s+(for\s+(?P<windows_bitness>(x\d\d))-based\s+Systems\s+)?\((?P<kb_id>(KB\d+))\)))\s*<\/a>'
-        # 	Security Monthly Quality Rollup for Windows 7 for x64-based Systems (KB5021291)
-        # reg_loose = r'<a\s+id=\'\w+-\w+-\w+-\w+-\w+_link\'\s+href=\s*"javascript:void\(0\);"\s*onclick=\'goToDetails\("(?P<link_id>(\w+-\w+-\w+-\w+-\w+))"\);\'\s+class="contentTextItemSpacerNoBreakLink">\s*(?P<patch_year>\d+)-(?P<patch_month>\d+)\s+(?P<dynamic>(Dynamic)\s+)?Cumulative Update (Preview )?for (Microsoft )?Windows (?P<windows_major>\w+) (Version (?P<windows_minor>\w+) )?for (?P<windows_bitness>\w+)-based Systems \((?P<kb_id>\w+)\)\s*<\/a>'
-        # reg2 = r'<a\s+id=\'\w+-\w+-\w+-\w+-\w+_link\'\s+href=\s*"javascript:void\(0\);"\s*onclick=\'goToDetails\("(?P<link_id>(\w+-\w+-\w+-\w+-\w+))"\);\'\s+class="contentTextItemSpacerNoBreakLink">\s*(?P<patch_year>\d+)-(?P<patch_month>\d+)\s+(?P<dynamic>(Dynamic)\s+)?Cumulative Update (Preview )?for Windows (?P<windows_major>\w+) for (?P<windows_bitness>\w+)-based Systems \((?P<kb_id>\w+)\)\s*<\/a>'
-        for reg in (reg1, reg2, reg3, reg4, ):
-            for link in re.finditer(reg, self.data, re.IGNORECASE | re.MULTILINE):
-                patch_full_name = link.group('patch_full_name')
-                if 'dynamic' in link.groups():
-                    if not isAllowedToDownloadDynamicUpdates() and link.group('dynamic'):
-                        printLog(f'Skipping "{patch_full_name}" (see --allow-dynamic)')
-                        continue
-                printInfo(f'Parsing catalog entry "{patch_full_name}"')
-                catalogPatch = CatalogPatch(link, windowsMajor=self.windowsMajor)
-                printInfo(str(catalogPatch.link_id))
-                if self.isValidBitness(catalogPatch.bitness):
-                    yield catalogPatch
-
-    def bulkDownload(self, outputDirectory: str):
-        catalogs = self.generatePatchDownloadUrls()
-        update_ids = []
-        kbs: Dict[str, CatalogPatch] = { }
-        for catalog in catalogs:
-            update_id = catalog.getUpdateId()
-            printLog(f"Found update id {update_id['updateID']} for {catalog.getDownloadName()}")
-            update_ids.append(update_id)
-            kbs[catalog.kb.lower()] = catalog
-            
-        for index, update_id in enumerate(update_ids):
-            req = requests.post('https://www.catalog.update.microsoft.com/DownloadDialog.aspx', data = {
-                'updateIDs': json.dumps([update_id])
-            } ) # , proxies=PROXIES, verify=False
+        for fields in parseCatalogSearchPage(self.data):
+            patch_full_name = fields['patch_full_name']
+            if not isAllowedToDownloadDynamicUpdates() and fields.get('dynamic'):
+                printLog(f'Skipping "{patch_full_name}" (see --allow-dynamic)')
+                continue
+            printInfo(f'Parsing catalog entry "{patch_full_name}"')
+            catalogPatch = CatalogPatch(fields, windowsMajor=self.windowsMajor)
+            printInfo(str(catalogPatch.link_id))
+            if self.isValidBitness(catalogPatch.bitness):
+                yield catalogPatch
+
+    def bulkDownload(self, outputDirectory: str, on_downloaded: Callable[[str], NoneType] = None):
+        # The search regexes overlap, keep a single result per update
+        searchResults = list({searchResult.link_id: searchResult for searchResult in self.generatePatchDownloadUrls()}.values())
+        for searchResult in searchResults:
+            printLog(f"Found update id {searchResult.link_id} for {searchResult.getDownloadName()}")
+        for batch_start in range(0, len(searchResults), DOWNLOAD_DIALOG_BATCH_SIZE):
+            batch = searchResults[batch_start:batch_start + DOWNLOAD_DIALOG_BATCH_SIZE]
             try:
-                catalog = CatalogPatch(None)
-                catalog.getDownloadLink(index, req.text)
-                catalog.minor = kbs[catalog.kb.lower()].minor
-                if kbs[catalog.kb.lower()].year:
-                    catalog.year = kbs[catalog.kb.lower()].year
-                if kbs[catalog.kb.lower()].month:
-                    catalog.month = kbs[catalog.kb.lower()].month
-                if str(catalog.major) == '6' and str(catalog.real_minor) == '1':
-                    catalog.major = '7'
-                if str(catalog.major) == '6' and str(catalog.real_minor) == '2':
-                    catalog.major = '8'
-                if str(catalog.major) == '6' and str(catalog.real_minor) == '3':
-                    catalog.major = '8.1'
-                if os.path.exists(os.path.join(outputDirectory, catalog.getDownloadName())):
-                    continue
+                downloadDialog = requestDownloadDialog(batch)
+            except requests.RequestException as ex:
+                printError(f'Failed on download dialog: {str(ex)}')
+                continue
+            for catalog in parseDownloadDialog(downloadDialog, batch):
                 downloadedPatchName = os.path.join(outputDirectory, catalog.getDownloadName())
-                catalog.download(downloadedPatchName)
-                printSuccess(f'Downloaded patch {catalog.getDownloadName()}')
-            except Exception as ex:
-                printError(f'Failed on {str(ex)}')
+                if not os.path.exists(downloadedPatchName):
+                    try:
+                        catalog.download(downloadedPatchName)
+                        printSuccess(f'Downloaded patch {catalog.getDownloadName()}')
+                    except Exception as ex:
+                        printError(f'Failed on {str(ex)}')
+                        continue
+                if on_downloaded:
+                    on_downloaded(downloadedPatchName)
 
     @staticmethod
-    def buildCatalogSearchUrl(query: str) -> str:
-        return f'{BASE_URL}?q={urllib.parse.quote(query)}'
-
+    def buildQuery(windowsMajor: str, windowsMinor: str, bitness: str, prefix: str = '') -> str:
+        if windowsMinor:
+            return f'{prefix}Cumulative Update for Windows {windowsMajor} Version {windowsMinor} for {bitness}-based Systems'
+        return f'{prefix}Cumulative Update for Windows {windowsMajor} for {bitness}-based Systems'
 
-def downloadPatches(major: str, minor: str, bitness: str, outputDirectory: str):
-    for year in range(2012, 2024):
-        for month in range(1, 13):
-            patch_downloader = PatchDownloader(major, minor, bitness, prefix=f'{year}-{str(month).zfill(2)} ')
-            patch_downloader.bulkDownload(outputDirectory)
+    @staticmethod
+    def buildCatalogSearchUrl(query: str) -> str:
+        return f'{getCatalogSearchUrl()}?q={urllib.parse.quote(query)}'
 
 
 def bootlegDownloadKB(kb: str) -> None:
-    query_url = f'{BASE_URL}?q={urllib.parse.quote(kb)}'
-    with requests.session() as session:
-        data = session.get(query_url).text
-        # regex = r'\<a\s+id=\'(?P<download_link_id>(\w+-\w+-\w+-\w+-\w+))_link\'\s*href=\s*\"javascript:void\(0\);\"\s+onclick=\'goToDetails\(\"\w+-\w+-\w+-\w+-\w+\"\);\'\+class=\"\w+\"\>.*\s*(?P<year>)-(?P<month>)\s+(Preview\s+)?(of\s+)?(Quality\s+)?(Rollup\s+)?for\s+(?P<windows_full_name>((Windows)\s+((7)|(8)|(8\.1)|(Server\s+\d+\s+\w+))))\s+for\s+(?P<bitness>(x\d+))-based\s+systems\s+\((?P<kb>(KB\d+))\)\<\/a\>'
-        regex = r'\<a\s+id=\'(?P<download_link_id>(\w+-\w+-\w+-\w+-\w+))_link\'\s*href=\s*\"javascript:void\(0\);\"\s+onclick=\'goToDetails\(\"\w+-\w+-\w+-\w+-\w+\"\);\'\s+class=\"\w+\"\>\s*(?P<full_name>((?P<year>\d+)-(?P<month>\d+)\s+(Preview\s+)?(Security\s+)?((Monthly)?\s+)?(of\s+)?(Quality\s+)?(Rollup\s+)?(\w+\s+)*(for\s+)(\w+\s+)*(?P<windows_full_name>((Windows)\s+((7)|(8)|(8\.1)|(10)|(11)|(Server\s+\d+\s+\w+)))).*\s+for\s+(?P<bitness>(x\d+))-based\s+systems\s+\((?P<spec_kb>(KB\d+))\)))\s*\<\/a\>'
-        reg = re.finditer(regex, data, re.I | re.M | re.DOTALL | re.S)
-        if not reg:
-            raise SymbolManagerException(f'Regex pattern did not match!')
-        for r in reg:
-            full_name = r.group("full_name")
-            windows_full_name = r.group('windows_full_name')
-            bitness = r.group('bitness')
-            spec_kb = r.group('spec_kb')
-            year = r.group('year')
-            month = r.group('month')
-            printLog(f'Parsing patch entry "{full_name}"')
-            link_id = r.group('download_link_id')
-            data_for_download = {
-                    "size": 0, 
-                    "languages": "", 
-                    "uidInfo": link_id, 
-                    "updateID": link_id
-                }
-            req = requests.post('https://www.catalog.update.microsoft.com/DownloadDialog.aspx', data = { 'updateIDs': json.dumps([ data_for_download ]) }).text
-            regex = r'downloadInformation\[0\]\.files\[0\]\.url\s*=\s*(\'|\")(?P<link>(https?:\/\/catalog\.\w+\.download\.windowsupdate\.com\/\w+\/msdownload\/(\w+\/)+\d+\/\d+\/windows\d+\.\d+-kb\d+-x\d+_\w+\.(?P<ext>(msu|cab))))(\'|\")'
-            download_reg = re.search(regex, req, re.I)
-            if not download_reg:
-                continue
-
-            ext = download_reg.group('ext')
-            download_name = f'{windows_full_name} {bitness} - {spec_kb.upper()} - {year}-{month}.{ext}'
-            output_file = os.path.join(getOutputDirectory(), download_name)
-
-            if os.path.exists(output_file):
-                printLog(f'Skipping downloaded file {download_name}')
-                continue
-
-            download_link = download_reg.group('link')
+    query_url = f'{getCatalogSearchUrl()}?q={urllib.parse.quote(kb)}'
+    session = getSession()
+    data = getHttpCache().get(query_url, session=session).text
+    releases = parseCatalogReleases(data)
+    if not releases and not parseCatalogSearchRows(data):
+        raise SymbolManagerException(f'No catalog entries found for {kb}!')
+    for release in releases:
+        full_name = release['full_name']
+        windows_full_name = release['windows_full_name']
+        bitness = release['bitness']
+        spec_kb = release['spec_kb']
+        year = release['year']
+        month = release['month']
+        printLog(f'Parsing patch entry "{full_name}"')
+        link_id = release['link_id']
+        data_for_download = {
+                "size": 0, 
+                "languages": "", 
+                "uidInfo": link_id, 
+                "updateID": link_id
+            }
+        req = getHttpCache().post(getCatalogDownloadDialogUrl(), data = buildDownloadDialogForm([ data_for_download ]), session=session).text
+        regex = r'downloadInformation\[0\]\.files\[0\]\.url\s*=\s*(\'|\")(?P<link>(https?:\/\/catalog\.\w+\.download\.windowsupdate\.com\/\w+\/msdownload\/(\w+\/)+\d+\/\d+\/windows\d+\.\d+-kb\d+-x\d+_\w+\.(?P<ext>(msu|cab))))(\'|\")'
+        download_reg = re.search(regex, req, re.I)
+        if not download_reg:
+            continue
 
-            if isVerboseMode():
-                printLog(f'Downloading {download_name}')
-                downloadFileWithProgress(download_link, output_file)
-            else:
-                with open(output_file, 'wb') as f:
-                    f.write(session.get(download_link).content)
-            printSuccess(f'Succesfully downloaded {download_name}')
+        ext = download_reg.group('ext')
+        download_name = f'{windows_full_name} {bitness} - {spec_kb.upper()} - {year}-{month}.{ext}'
+        output_file = os.path.join(getOutputDirectory(), download_name)
 
+        if os.path.exists(output_file):
+            printLog(f'Skipping downloaded file {download_name}')
+            continue
 
+        download_link = download_reg.group('link')
 
-def downloadPatchesByKb(major: str, outputDirectory: str, kb_number: str = ''):
-    if kb_number:
-        try:
-            bootlegDownloadKB(kb_number)
-            patch_downloader = PatchDownloader(query=kb_number)
-            patch_downloader.bulkDownload(outputDirectory)
-        except SymbolManagerException as ex:
-            printError(f'PatchDownloader failed on {kb_number}: {ex}')
-    else:
-        raw_kbs = getAllKbsByMajor(major)
-        kbs = list(raw_kbs)
-        kbs = sorted(kbs, key=lambda x: x.kb, reverse=not preferOldPatches())
-        for kb in tqdm.tqdm(kbs):
-            try:
-                # if major in ['7', '8', '8.1']:
-                #     bootlegDownloadKB(kb.kb)
-                #     continue
-                patch_downloader = PatchDownloader(query=kb.kb, bitness=['x64', 'x86'], windowsMajor=major)
-                patch_downloader.bulkDownload(outputDirectory)
-            except SymbolManagerException as ex:
-                printError(f'PatchDownloader failed on {kb.kb}: {ex}')
-                continue
+        printLog(f'Downloading {download_name}')
+        downloadFile(download_link, output_file, expected_sha1=parseDownloadDigest(0, req, download_link), session=session)
+        printSuccess(f'Succesfully downloaded {download_name}')
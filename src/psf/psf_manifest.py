@@ -1,12 +1,15 @@
 import os
 import re
-from typing import Any, Generator
+import threading
+from collections import OrderedDict
+from typing import Any, Generator, Tuple
 import xml.etree.ElementTree as XML
 import hashlib
 import tqdm
 from src.psf.common import getChildByTag, getTrueTag, parseManifestXml
 from src.utils.printer import printInfo, printLog, printSuccess
 from src.utils.settings import isVerboseMode
+from src.utils.trace import traced
 from src.utils.utils import SymbolManagerException
 
 
@@ -78,8 +81,46 @@ class PsfExpressManifest(PsfManifest):
             yield tag
 
 
+MANIFEST_CACHE_SIZE = 16
+
+
+class ManifestCache:
+    """
+    Keeps the last parsed manifests, keyed by path, size and modification time (so a rewritten manifest is parsed again).
+    """
+    def __init__(self, size: int = MANIFEST_CACHE_SIZE) -> None:
+        self.size = size
+        self.manifests: OrderedDict[Tuple[str, int, int], PsfExpressManifest] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, manifest_file: str) -> PsfExpressManifest:
+        stat = os.stat(manifest_file)
+        key = (os.path.abspath(manifest_file), stat.st_size, stat.st_mtime_ns)
+        with self.lock:
+            manifest = self.manifests.get(key)
+            if manifest is not None:
+                self.manifests.move_to_end(key)
+                return manifest
+        manifest = PsfExpressManifest(manifest_file)
+        with self.lock:
+            self.manifests[key] = manifest
+            while len(self.manifests) > self.size:
+                self.manifests.popitem(last=False)
+        return manifest
+
+
+# Only a process which handles many jobs (run-jobs) parses the same manifests again
+g_manifest_cache: ManifestCache | None = None
+
+
+def enableManifestCache(size: int = MANIFEST_CACHE_SIZE):
+    global g_manifest_cache
+    g_manifest_cache = ManifestCache(size)
+
+
+@traced('psf', describe=lambda manifest_file, *args, **kwargs: {'manifest': os.path.basename(manifest_file), 'bytes': os.path.getsize(manifest_file)})
 def parsePsfExpressManifest(manifest_file: str, silent: bool = False) -> PsfExpressManifest:
-    manifest = PsfExpressManifest(manifest_file)
+    manifest = g_manifest_cache.get(manifest_file) if g_manifest_cache else PsfExpressManifest(manifest_file)
     if not silent:
         printSuccess(f'Parsed manifest for patch "{manifest.getPatchName()}"')
     return manifest
@@ -0,0 +1,120 @@
+import json
+import os
+import shutil
+import signal
+import socket
+import socketserver
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src.service.service import BadRequestException, ExtractionService, FileNotAvailableException
+from src.utils.printer import printError, printInfo, printLog, printSuccess
+from src.utils.settings import DEFAULT_SERVICE_WORKERS, getOutputDirectory
+from src.utils.utils import SymbolManagerException
+
+
+DEFAULT_SERVICE_HOST = '127.0.0.1'
+DEFAULT_SERVICE_PORT = 8377
+SEND_BLOCK_SIZE = 1024 * 1024
+
+
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET /file?name=ntdll.dll&arch=x64&version=10.0.22621.2506    The file itself
+    GET /locate?name=ntdll.dll&arch=x64&version=10.0.22621.2506  {"path", "source"} (for clients on the same machine)
+    GET /stats                                                     Request counters
+    GET /health                                                    {"status": "ok"}
+    """
+    server_version = 'SymbolManager'
+    service: ExtractionService = None
+
+    def address_string(self) -> str:
+        # Unix socket clients have no address
+        return self.client_address[0] if isinstance(self.client_address, tuple) and self.client_address else 'unix'
+
+    def log_message(self, format: str, *args):
+        printLog(f'{self.address_string()} {format % args}')
+
+    def __sendJson(self, status: int, data: dict):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def __sendFile(self, path: str, source: str):
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Content-Length', str(size))
+            self.send_header('Content-Disposition', f'attachment; filename="{os.path.basename(path)}"')
+            self.send_header('X-File-Source', source)
+            self.end_headers()
+            shutil.copyfileobj(f, self.wfile, SEND_BLOCK_SIZE)
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        query = {name: values[0] for name, values in urllib.parse.parse_qs(url.query).items()}
+        try:
+            if url.path == '/health':
+                self.__sendJson(200, {'status': 'ok'})
+            elif url.path == '/stats':
+                self.__sendJson(200, self.service.getStats())
+            elif url.path in ('/file', '/locate'):
+                path, source = self.service.getFile(query.get('name', ''), query.get('arch', ''), query.get('version', ''))
+                if url.path == '/locate':
+                    self.__sendJson(200, {'path': os.path.abspath(path), 'source': source})
+                else:
+                    self.__sendFile(path, source)
+            else:
+                self.__sendJson(404, {'error': f'Unknown endpoint {url.path}'})
+        except BadRequestException as ex:
+            self.__sendJson(400, {'error': str(ex)})
+        except FileNotAvailableException as ex:
+            self.__sendJson(404, {'error': str(ex)})
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        except Exception as ex:
+            self.service.count('errors')
+            printError(f'Failed to handle {self.path}: {ex}')
+            self.__sendJson(500, {'error': str(ex)})
+
+
+def stopOnSignal(signum, frame):
+    # A service is usually stopped with SIGTERM, let it shut down like on Ctrl+C
+    raise KeyboardInterrupt()
+
+
+if hasattr(socket, 'AF_UNIX'):
+    class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+
+def serve(host: str = None, port: int = None, socket_path: str = None, updates_dir: str = None, base_files_dir: str = None, workers: int = DEFAULT_SERVICE_WORKERS):
+    """
+    Runs the extraction service until interrupted, on a Unix socket when `socket_path` is given and on `host:port` otherwise.
+    """
+    host = host if host else DEFAULT_SERVICE_HOST
+    port = port if port else DEFAULT_SERVICE_PORT
+    ServiceRequestHandler.service = ExtractionService(getOutputDirectory(), updates_dir, base_files_dir, workers)
+    if socket_path:
+        if not hasattr(socket, 'AF_UNIX'):
+            raise SymbolManagerException('Unix sockets are not supported on this platform, use --host/--port')
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = UnixHTTPServer(socket_path, ServiceRequestHandler)
+        address = socket_path
+    else:
+        server = ThreadingHTTPServer((host, port), ServiceRequestHandler)
+        address = f'http://{host}:{server.server_address[1]}'
+    printSuccess(f'Serving "{getOutputDirectory()}" on {address}')
+    signal.signal(signal.SIGTERM, stopOnSignal)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        printInfo('Stopping')
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
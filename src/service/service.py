@@ -0,0 +1,226 @@
+import argparse
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from types import NoneType
+from typing import Dict, Tuple
+from src.psf.psf_manifest import enableManifestCache
+from src.store.archive import ARCHIVE_DIR_NAME, getDeltaArchive
+from src.store.cas import CAS_DIR_NAME
+from src.utils.printer import printError, printInfo, printLog
+from src.utils.settings import DEFAULT_SERVICE_WORKERS
+from src.utils.utils import SymbolManagerException, normalizeDirtyBitness, parseVersionedFileName
+
+
+# A missing file rescans the output store at most this often (seconds)
+STORE_RESCAN_INTERVAL = 2.0
+VERSION_REGEX = re.compile(r'^\d+\.\d+\.\d+\.\d+$')
+
+FileKey = Tuple[str, str, str]
+
+
+class FileNotAvailableException(SymbolManagerException):
+    pass
+
+
+class BadRequestException(SymbolManagerException):
+    pass
+
+
+def makeFileKey(file_name: str, arch: str, version: str) -> FileKey:
+    """
+    Validates a request for a file and returns its key: (lower case file name, version, normalized architecture).
+    """
+    if not file_name or os.path.basename(file_name) != file_name or file_name in ('.', '..') or '\\' in file_name:
+        raise BadRequestException(f'Invalid file name "{file_name}"')
+    if not VERSION_REGEX.match(version or ''):
+        raise BadRequestException(f'Invalid version "{version}", expected e.g. 10.0.22621.2506')
+    try:
+        arch = normalizeDirtyBitness((arch or '').lower())
+    except SymbolManagerException as ex:
+        raise BadRequestException(str(ex))
+    return file_name.lower(), version, arch
+
+
+def getFileKeyOfName(file_name: str) -> FileKey | None:
+    versioned = parseVersionedFileName(file_name)
+    if versioned is None:
+        return None
+    return versioned.getOriginalFileName().lower(), versioned.version, versioned.arch.lower()
+
+
+class OutputStoreIndex:
+    """
+    Locates the files of an output directory by their versioned names (see `buildVersionedFileName`).
+
+    The directory is walked once and again on a miss, at most every `rescan_interval` seconds, so a burst
+    of requests for missing files does not walk a large store for each of them.
+    """
+    def __init__(self, root: str, rescan_interval: float = STORE_RESCAN_INTERVAL) -> NoneType:
+        self.root = root
+        self.rescan_interval = rescan_interval
+        self.files: Dict[FileKey, str] = { }
+        self.scanned_at = 0.0
+        self.lock = threading.Lock()
+
+    def rescan(self):
+        files: Dict[FileKey, str] = { }
+        for root, dirs, file_names in os.walk(self.root):
+            # Content store blobs are only reachable through their names, archived binaries through the archive
+            dirs[:] = [d for d in dirs if d not in (CAS_DIR_NAME, ARCHIVE_DIR_NAME)]
+            for file_name in file_names:
+                key = getFileKeyOfName(file_name)
+                if key is None:
+                    continue
+                # A file which was patched by several KBs is the same binary
+                files.setdefault(key, os.path.join(root, file_name))
+        with self.lock:
+            self.files = files
+            self.scanned_at = time.monotonic()
+        printLog(f'Indexed {len(files)} files in "{self.root}"')
+
+    def add(self, key: FileKey, path: str):
+        with self.lock:
+            self.files[key] = path
+
+    def find(self, key: FileKey) -> str | None:
+        with self.lock:
+            path = self.files.get(key)
+            stale = time.monotonic() - self.scanned_at >= self.rescan_interval
+        if path and os.path.isfile(path):
+            return path
+        if not stale:
+            return None
+        self.rescan()
+        with self.lock:
+            return self.files.get(key)
+
+
+class ExtractionService:
+    """
+    Serves binaries by name, architecture and version, keeping every index it needs warm between requests.
+
+    A file is served from the output store when it is there, otherwise it is produced on demand:
+    materialized from the output directory's archive (see `DeltaArchive`), fetched from the symbol server through WinBIndex and, failing that, extrapolated from the update
+    which brought that version (located with the KB timeline) when an updates directory is given.
+    Concurrent requests for the same file share a single production.
+
+    Example:
+        ```python
+        service = ExtractionService(getOutputDirectory(), updates_dir='Updates', base_files_dir='Bases')
+        path, source = service.getFile('ntdll.dll', 'x64', '10.0.22621.2506')
+        ```
+    """
+    def __init__(self, output_dir: str, updates_dir: str = None, base_files_dir: str = None, workers: int = DEFAULT_SERVICE_WORKERS) -> NoneType:
+        self.output_dir = output_dir
+        self.updates_dir = updates_dir
+        self.base_files_dir = base_files_dir
+        self.store = OutputStoreIndex(output_dir)
+        self.archive = getDeltaArchive()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='produce')
+        self.lock = threading.Lock()
+        self.productions: Dict[FileKey, Future] = { }
+        self.started_at = time.time()
+        self.stats = {'requests': 0, 'store': 0, 'archive': 0, 'winbindex': 0, 'msu': 0, 'unavailable': 0, 'errors': 0}
+        enableManifestCache()
+        self.store.rescan()
+
+    def count(self, counter: str):
+        with self.lock:
+            self.stats[counter] += 1
+
+    def getStats(self) -> dict:
+        with self.lock:
+            stats = dict(self.stats)
+        stats['uptime'] = time.time() - self.started_at
+        stats['store_files'] = len(self.store.files)
+        return stats
+
+    def getFile(self, file_name: str, arch: str, version: str) -> Tuple[str, str]:
+        """
+        Returns:
+            Tuple[str, str]: The path of the file and where it came from ('store', 'archive', 'winbindex' or 'msu').
+        """
+        key = makeFileKey(file_name, arch, version)
+        self.count('requests')
+        path = self.store.find(key)
+        if path:
+            self.count('store')
+            return path, 'store'
+        with self.lock:
+            future = self.productions.get(key)
+            if future is None:
+                future = self.productions[key] = self.executor.submit(self.__produce, key)
+        try:
+            path, source = future.result()
+        finally:
+            with self.lock:
+                if self.productions.get(key) is future:
+                    del self.productions[key]
+        if not path:
+            self.count('unavailable')
+            raise FileNotAvailableException(f'{file_name} {arch} {version} is neither in the output store nor could it be produced')
+        self.count(source)
+        return path, source
+
+    def __produce(self, key: FileKey) -> Tuple[str | None, str]:
+        path = self.__materialize(key)
+        if path:
+            return path, 'archive'
+        file_name, version, arch = key
+        base_name, extension = os.path.splitext(file_name)
+        from src.patch.base_resolver import getBaseResolver
+        path = getBaseResolver(self.output_dir).request(base_name, extension, version, arch).result()
+        if path:
+            self.store.add(key, path)
+            return path, 'winbindex'
+        if self.updates_dir and self.__extrapolate(key):
+            self.store.rescan()
+            # With --archive the extrapolated file went into the archive
+            return self.store.find(key) or self.__materialize(key), 'msu'
+        return None, ''
+
+    def __materialize(self, key: FileKey) -> str | None:
+        if self.archive is None:
+            # An extrapolation with --archive may have created it since
+            self.archive = getDeltaArchive()
+            if self.archive is None:
+                return None
+        for name, _ in self.archive.iterateNames():
+            if getFileKeyOfName(name) != key:
+                continue
+            try:
+                return self.archive.materialize(name)
+            except SymbolManagerException as ex:
+                printError(f'Failed to materialize {name}: {ex}')
+        return None
+
+    def __findUpdate(self, kb: str) -> str | None:
+        for root, _, file_names in os.walk(self.updates_dir):
+            for name in file_names:
+                if kb.lower() in name.lower() and os.path.splitext(name)[1].lower() in ('.msu', '.cab'):
+                    return os.path.join(root, name)
+        return None
+
+    def __extrapolate(self, key: FileKey) -> bool:
+        file_name, version, arch = key
+        from src.patch.delta_patch import extrapolateMsuFile
+        from src.patch.kb_timeline import getKbTimeline
+        kb = getKbTimeline().findKbOfVersion(version)
+        if not kb:
+            printLog(f'No KB is known to bring {version}')
+            return False
+        update_path = self.__findUpdate(kb)
+        if not update_path:
+            printLog(f'{kb} (which brings {version}) is not in "{self.updates_dir}"')
+            return False
+        printInfo(f'Extrapolating {file_name} {arch} {version} from {os.path.basename(update_path)}')
+        args = argparse.Namespace(name=rf'.*\b{re.escape(file_name)}$', base_files_dir=self.base_files_dir, fetch_bases=bool(self.base_files_dir))
+        try:
+            extrapolateMsuFile(update_path, args)
+        except Exception as ex:
+            printError(f'Failed to extrapolate {file_name} from "{update_path}": {ex}')
+            return False
+        return True
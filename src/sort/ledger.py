@@ -0,0 +1,116 @@
+import os
+from types import NoneType
+from typing import Dict, Tuple
+from src.utils.json_store import JsonStore
+
+
+LEDGER_FILE_NAME = '.sort_ledger.json'
+LEDGER_VERSION = 1
+# Flush the ledger to disk every so often so an interrupted run keeps its progress
+LEDGER_SAVE_INTERVAL = 64
+
+LedgerKey = Tuple[int, int, int, int]
+
+
+class LedgerOutcome:
+    Processed = 'processed'
+    Failed = 'failed'
+
+
+class LedgerEntry:
+    source = ''
+    output_name = ''
+    outcome = LedgerOutcome.Failed
+
+    def __init__(self, source: str, output_name: str, outcome: str) -> NoneType:
+        self.source = source
+        self.output_name = output_name
+        self.outcome = outcome
+
+    def toDict(self) -> dict:
+        return {
+            'source': self.source,
+            'output_name': self.output_name,
+            'outcome': self.outcome,
+        }
+
+
+class SortLedger:
+    """
+    A persistent record of files which were already handled by a sort pass.
+
+    Every source file is identified by its (device, inode, size, mtime_ns) stat tuple,
+    so a file which was not touched since the last run is recognized without re-parsing it.
+    The ledger is stored as JSON inside the output directory, one section per sort pass.
+
+    Example:
+        ```python
+        with SortLedger(output_dir, 'bin') as ledger:
+            if not ledger.isUpToDate(path, output_dir):
+                ...
+                ledger.record(path, fixed_file_name, LedgerOutcome.Processed)
+        ```
+    """
+    def __init__(self, output_dir: str, section: str, rescan: bool = False) -> NoneType:
+        self.store = JsonStore(os.path.join(output_dir, LEDGER_FILE_NAME), LEDGER_VERSION, 'sections', 'sort ledger', LEDGER_SAVE_INTERVAL)
+        self.section = section
+        self.rescan = rescan
+        self.entries: Dict[str, dict] = self.store.load({ }).get(section, { })
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.save()
+
+    @staticmethod
+    def makeKey(file_path: str) -> LedgerKey:
+        st = os.stat(file_path)
+        return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+    @staticmethod
+    def __serializeKey(key: LedgerKey) -> str:
+        return ':'.join(str(k) for k in key)
+
+    def lookup(self, file_path: str) -> LedgerEntry | None:
+        try:
+            key = self.__serializeKey(self.makeKey(file_path))
+        except OSError:
+            return None
+        entry = self.entries.get(key)
+        if not entry:
+            return None
+        return LedgerEntry(entry['source'], entry['output_name'], entry['outcome'])
+
+    def isUpToDate(self, file_path: str, output_dir: str) -> bool:
+        """
+        Checks whether a file was already processed successfully and its output still exists.
+
+        Failed entries are always retried, and `rescan` forces every file to be processed again.
+        """
+        if self.rescan:
+            return False
+        entry = self.lookup(file_path)
+        if not entry or entry.outcome != LedgerOutcome.Processed:
+            return False
+        if entry.output_name and not os.path.exists(os.path.join(output_dir, entry.output_name)):
+            return False
+        return True
+
+    def record(self, file_path: str, output_name: str, outcome: str, key: LedgerKey | None = None):
+        """
+        Records the outcome for a source file.
+
+        Pass `key` when the source is moved or deleted as part of processing (stat it beforehand).
+        """
+        if key is None:
+            try:
+                key = self.makeKey(file_path)
+            except OSError:
+                return
+        self.entries[self.__serializeKey(key)] = LedgerEntry(file_path, output_name, outcome).toDict()
+        if self.store.markDirty():
+            self.save()
+
+    def save(self):
+        self.store.saveSection(self.section, self.entries)
@@ -4,6 +4,10 @@ import shutil
 from types import NoneType
 from src.patch.extract_msu import getMsuMetadata
 from src.patch.delta_patch import patchFile
+from src.patch.kb_timeline import getKbTimeline
+from src.sort.ledger import LedgerOutcome, SortLedger
+from src.store.binary_catalog import recordBinary
+from src.store.cas import getContentStore
 from src.utils.printer import printError, printInfo, printLog, printSuccess
 from src.utils.smart_exe import buildVersionedFileName, getBinaryFileNameWithVersion, getFileProperties
 from src.utils.utils import SymbolManagerException, normalizeDirtyBitness, setOutputDirectory, walkFiles
@@ -18,16 +22,30 @@ def deleteEmptyDirTree(leaf: str) -> NoneType:
 # 11\Windows\WinSxS\amd64_microsoft-windows-os-kernel_31bf3856ad364e35_10.0.22000.194_none_674de4333985bb23\r\ntoskrnl.exe
 
 
-def sortBinaries(root_dir: str, output_dir: str, file_name_regex: re.Pattern[str] | str = r'.*\.((exe)|(dll)|(sys)|(blob))$', move_files: bool = False, recursive: bool = True):
+def sortBinaries(root_dir: str, output_dir: str, file_name_regex: re.Pattern[str] | str = r'.*\.((exe)|(dll)|(sys)|(blob))$', move_files: bool = False, recursive: bool = True, rescan: bool = False):
     if not file_name_regex:
         file_name_regex = r'.*\.((exe)|(dll)|(sys)|(blob))$'
 
+    bin_ledger = SortLedger(output_dir, 'bin', rescan)
+    winsxs_ledger = SortLedger(output_dir, 'winsxs', rescan)
+    store = getContentStore(output_dir)
+
     def renameBinary(root: str, binary_path: str):
+        path = os.path.join(root, binary_path)
+        if bin_ledger.isUpToDate(path, output_dir):
+            printLog(f'Skipping unchanged file "{path}"')
+            return
+        ledger_key = SortLedger.makeKey(path)
         try:
-            path = os.path.join(root, binary_path)
             fixed_file_name = getBinaryFileNameWithVersion(path)
             out_path = os.path.join(output_dir, fixed_file_name)
-            if move_files:
+            sha256 = None
+            if store:
+                # Copies (or moves) the bytes only if the store does not hold them yet
+                sha256 = store.putFile(path, fixed_file_name, move_files)
+                if move_files:
+                    deleteEmptyDirTree(os.path.split(path)[0])
+            elif move_files:
                 if not os.path.exists(out_path):
                     shutil.move(path, out_path)
                 else:
@@ -36,18 +54,26 @@ def sortBinaries(root_dir: str, output_dir: str, file_name_regex: re.Pattern[str
                 deleteEmptyDirTree(d)
             else:
                 shutil.copy2(path, out_path)
+            recordBinary(out_path, 'sort', source=path, sha256=sha256)
+            bin_ledger.record(path, fixed_file_name, LedgerOutcome.Processed, ledger_key)
             printSuccess(f'Processed "{fixed_file_name}"')
         except SymbolManagerException as ex:
+            bin_ledger.record(path, '', LedgerOutcome.Failed, ledger_key)
             printError(f'Error parsing file: {ex}')
 
     def extrapolateWinSxS(root: str, binary_path: str):
+        path = os.path.join(root, binary_path)
+        if winsxs_ledger.isUpToDate(path, getOutputDirectory()):
+            printLog(f'Skipping unchanged file "{path}"')
+            return
+        ledger_key = None
         try:
-            path = os.path.join(root, binary_path)
             # 10.0.22000.194
             reg = re.search(
                 r'WinSxS\\(?P<arch>\w+)_microsoft-windows-.*_\w+_(?P<full_version>((?P<win_maj>\d+)\.(?P<win_min>\d+)\.(?P<major>\d+)\.(?P<minor>\d+))).*\\r\\(?P<file_name>(\w+\.\w+))$', path)
             if not reg:
                 return
+            ledger_key = SortLedger.makeKey(path)
             file_name = reg.group('file_name')
             full_version = reg.group('full_version')
             major = reg.group('major')
@@ -62,29 +88,44 @@ def sortBinaries(root_dir: str, output_dir: str, file_name_regex: re.Pattern[str
             new_version = f'{win_maj}.{win_min}.{major}.1'
             target_file = buildVersionedFileName(
                 base_name, new_version, arch, ext)
-            patchFile(base_file, os.path.join(getOutputDirectory(),
+            outbuf = patchFile(base_file, os.path.join(getOutputDirectory(),
                       target_file), path, allow_legacy=True)
+            recordBinary(os.path.join(getOutputDirectory(), target_file), 'sort', source=path, data=outbuf)
             printSuccess(f'Built {target_file} from {path}')
+            winsxs_ledger.record(path, target_file, LedgerOutcome.Processed, ledger_key)
             if move_files:
                 os.remove(path)
                 deleteEmptyDirTree(os.path.split(path)[0])
         except SymbolManagerException as ex:
+            winsxs_ledger.record(path, '', LedgerOutcome.Failed, ledger_key)
             printError(f'Error parsing file: {ex}')
-    walkFiles(root_dir, renameBinary, file_name_regex, recursive)
-    walkFiles(root_dir, extrapolateWinSxS, file_name_regex, recursive)
+    with bin_ledger:
+        walkFiles(root_dir, renameBinary, file_name_regex, recursive)
+    with winsxs_ledger:
+        walkFiles(root_dir, extrapolateWinSxS, file_name_regex, recursive)
 
 
-def sortMsuAndCabFiles(root_dir: str, output_dir: str, file_name_regex: re.Pattern[str] | str = r'.*\.((msu)|(cab))$', move_files: bool = False, recursive: bool = True):
+def sortMsuAndCabFiles(root_dir: str, output_dir: str, file_name_regex: re.Pattern[str] | str = r'.*\.((msu)|(cab))$', move_files: bool = False, recursive: bool = True, rescan: bool = False):
     if not file_name_regex:
         file_name_regex = r'.*\.((msu)|(cab))$'
 
+    ledger = SortLedger(output_dir, 'msu', rescan)
+    timeline = getKbTimeline()
+
     def sortMsuOrCabFile(root: str, file_path: str):
         path = os.path.join(root, file_path)
+        if ledger.isUpToDate(path, output_dir):
+            printLog(f'Skipping unchanged file "{path}"')
+            return
+        ledger_key = SortLedger.makeKey(path)
         try:
             metadata = getMsuMetadata(path)
             ext = os.path.splitext(file_path)[1]
+            # Updates are built weeks before they are released, prefer the release month of the KB
+            release = timeline.findRelease(metadata.kb)
+            date = release.getDate() if release and release.year else metadata.date.strftime('%Y-%m')
             new_file_name = f'Windows {metadata.build} {normalizeDirtyBitness(
-                metadata.arch)} - {metadata.kb.upper()} - {metadata.date.strftime('%Y-%m')}{ext}'
+                metadata.arch)} - {metadata.kb.upper()} - {date}{ext}'
             printInfo(f'{file_path} => {new_file_name}')
             out_path = os.path.join(output_dir, new_file_name)
             if move_files:
@@ -96,7 +137,10 @@ def sortMsuAndCabFiles(root_dir: str, output_dir: str, file_name_regex: re.Patte
                 deleteEmptyDirTree(d)
             else:
                 shutil.copy2(path, out_path)
+            ledger.record(path, new_file_name, LedgerOutcome.Processed, ledger_key)
         except SymbolManagerException as ex:
+            ledger.record(path, '', LedgerOutcome.Failed, ledger_key)
             printError(f'Failed sorting file {file_path} : {str(ex)}')
 
-    walkFiles(root_dir, sortMsuOrCabFile, file_name_regex, recursive)
+    with ledger:
+        walkFiles(root_dir, sortMsuOrCabFile, file_name_regex, recursive)
@@ -0,0 +1,284 @@
+import atexit
+import hashlib
+import os
+import re
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from types import NoneType
+from typing import Dict, Iterator, List, Tuple
+from src.utils.json_store import JsonStore
+from src.utils.metrics import g_metrics
+from src.utils.printer import printError, printInfo, printLog, printSuccess
+from src.utils.settings import getArchiveCacheSize, getOutputDirectory
+from src.utils.utils import SymbolManagerException, calculateFileHash
+
+
+ARCHIVE_DIR_NAME = '.archive'
+ARCHIVE_DELTAS_DIR_NAME = 'deltas'
+ARCHIVE_CACHE_DIR_NAME = 'cache'
+ARCHIVE_INDEX_FILE_NAME = 'index.json'
+ARCHIVE_VERSION = 1
+# Flush the index to disk every so often so an interrupted run keeps its progress
+ARCHIVE_SAVE_INTERVAL = 64
+
+MATERIALIZATIONS = g_metrics.counter('archive_materializations_total', 'Archived binaries requested, by result (hits, misses)')
+MATERIALIZE_LATENCY = g_metrics.histogram('archive_materialize_seconds', 'Time to rebuild an archived binary from its base and delta')
+
+
+class ArchiveException(SymbolManagerException):
+    pass
+
+
+class DeltaArchive:
+    """
+    Keeps patched binaries of an output directory as their base plus the forward delta which builds them,
+    under `.archive`, instead of fully materialized.
+
+    A cumulative update's binary is a delta of a few hundred KB away from its `.1` base, so archiving
+    (see `--archive`) stores the PSF's PA30 delta once by SHA256 in `.archive/deltas` and indexes the
+    versioned name (see `buildVersionedFileName`) -> base, delta, size and SHA256 in `.archive/index.json`.
+    The delta is applied once while archiving, to verify it and record the binary's hash.
+
+    `materialize` rebuilds a binary with `patchFile` into `.archive/cache`, which keeps the most recently
+    used binaries up to `cache_size` bytes, so a hot binary is a single lookup. Bases must stay where they
+    were archived from.
+
+    Example:
+        ```python
+        archive = getDeltaArchive()
+        archive.addDelta('ntoskrnl - 10.0.22621.2506 x64 - KB5031354.exe', 'Bases/ntoskrnl - 10.0.22621.1 x64.exe', 'ntoskrnl.exe PA30.patch')
+        path = archive.materialize('ntoskrnl - 10.0.22621.2506 x64 - KB5031354.exe')
+        ```
+    """
+    def __init__(self, root: str, cache_size: int) -> NoneType:
+        self.root = root
+        self.cache_size = cache_size
+        self.archive_dir = os.path.join(root, ARCHIVE_DIR_NAME)
+        self.deltas_dir = os.path.join(self.archive_dir, ARCHIVE_DELTAS_DIR_NAME)
+        self.cache_dir = os.path.join(self.archive_dir, ARCHIVE_CACHE_DIR_NAME)
+        self.index_path = os.path.join(self.archive_dir, ARCHIVE_INDEX_FILE_NAME)
+        self.index_store = JsonStore(self.index_path, ARCHIVE_VERSION, 'entries', 'archive index', ARCHIVE_SAVE_INTERVAL)
+        self.entries: Dict[str, dict] = self.index_store.load({ })
+        # Cached name -> size, least recently used first
+        self.cached: OrderedDict[str, int] = OrderedDict()
+        self.cached_bytes = 0
+        self.lock = threading.Lock()
+        self.__loadCache()
+
+    def __loadCache(self):
+        if os.path.isdir(self.cache_dir):
+            cached = []
+            for name in os.listdir(self.cache_dir):
+                path = os.path.join(self.cache_dir, name)
+                if name.endswith('.tmp') or name not in self.entries:
+                    continue
+                stat = os.stat(path)
+                cached.append((stat.st_mtime, name, stat.st_size))
+            for _, name, size in sorted(cached):
+                self.cached[name] = size
+                self.cached_bytes += size
+
+    def save(self):
+        with self.lock:
+            self.index_store.save(self.entries)
+
+    def getDeltaPath(self, sha256: str) -> str:
+        return os.path.join(self.deltas_dir, sha256[:2], sha256)
+
+    def hasName(self, name: str) -> bool:
+        with self.lock:
+            return name in self.entries
+
+    def iterateNames(self) -> Iterator[Tuple[str, dict]]:
+        with self.lock:
+            entries = list(self.entries.items())
+        yield from entries
+
+    def __relative(self, path: str) -> str:
+        # Bases inside the output directory move along with it
+        path = os.path.abspath(path)
+        root = os.path.abspath(self.root)
+        return os.path.relpath(path, root) if os.path.commonpath([path, root]) == root else path
+
+    def __basePath(self, entry: dict) -> str | None:
+        base = entry['base']
+        if base is None:
+            return None
+        return base if os.path.isabs(base) else os.path.join(self.root, base)
+
+    def addDelta(self, name: str, base_file: str | None, delta_file: str) -> bytes:
+        """
+        Archives `name` as `delta_file` applied to `base_file` (None for a null delta).
+
+        Returns:
+            bytes: The archived binary, as built while verifying the delta.
+        """
+        from src.patch.delta_patch import patchFile
+        outbuf = patchFile(base_file, None, delta_file, allow_legacy=True)
+        sha256 = hashlib.sha256(outbuf).hexdigest()
+        delta_sha256 = calculateFileHash(delta_file)
+        delta_path = self.getDeltaPath(delta_sha256)
+        if not os.path.isfile(delta_path):
+            os.makedirs(os.path.dirname(delta_path), exist_ok=True)
+            tmp_path = f'{delta_path}.{threading.get_ident()}.tmp'
+            shutil.copyfile(delta_file, tmp_path)
+            os.replace(tmp_path, delta_path)
+        with self.lock:
+            self.entries[name] = {
+                'base': self.__relative(base_file) if base_file else None,
+                'delta': delta_sha256,
+                'size': len(outbuf),
+                'sha256': sha256,
+            }
+            save = self.index_store.markDirty()
+        if save:
+            self.save()
+        return outbuf
+
+    def __touch(self, name: str) -> str | None:
+        path = os.path.join(self.cache_dir, name)
+        with self.lock:
+            if name not in self.cached:
+                return None
+            self.cached.move_to_end(name)
+        try:
+            # The recency outlives the process through the file's modification time
+            os.utime(path)
+        except FileNotFoundError:
+            with self.lock:
+                self.cached_bytes -= self.cached.pop(name, 0)
+            return None
+        return path
+
+    def __evict(self, keep: str):
+        while True:
+            with self.lock:
+                if self.cached_bytes <= self.cache_size or len(self.cached) <= 1:
+                    return
+                name = next(iter(self.cached))
+                if name == keep:
+                    self.cached.move_to_end(name)
+                    name = next(iter(self.cached))
+                self.cached_bytes -= self.cached.pop(name)
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+            printLog(f'Evicted {name} from the archive cache')
+
+    def materialize(self, name: str) -> str:
+        """
+        Returns:
+            str: The path of the binary in the archive's cache, rebuilt from its base and delta unless it is cached.
+        """
+        path = self.__touch(name)
+        if path:
+            MATERIALIZATIONS.inc(result='hits')
+            return path
+        with self.lock:
+            entry = self.entries.get(name)
+        if entry is None:
+            raise ArchiveException(f'"{name}" is not archived')
+        base_file = self.__basePath(entry)
+        if base_file and not os.path.isfile(base_file):
+            raise ArchiveException(f'The base of "{name}" is gone ("{base_file}")')
+        MATERIALIZATIONS.inc(result='misses')
+        start = time.perf_counter()
+        from src.patch.delta_patch import patchFile
+        outbuf = patchFile(base_file, None, self.getDeltaPath(entry['delta']), allow_legacy=True)
+        if hashlib.sha256(outbuf).hexdigest() != entry['sha256']:
+            raise ArchiveException(f'Materializing "{name}" did not reproduce its SHA256, was its base modified?')
+        path = os.path.join(self.cache_dir, name)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(outbuf)
+        os.replace(tmp_path, path)
+        with self.lock:
+            self.cached_bytes += len(outbuf) - self.cached.pop(name, 0)
+            self.cached[name] = len(outbuf)
+        self.__evict(name)
+        MATERIALIZE_LATENCY.observe(time.perf_counter() - start)
+        return path
+
+    def getStats(self) -> dict:
+        entries = [entry for _, entry in self.iterateNames()]
+        deltas = set(entry['delta'] for entry in entries)
+        bases = set(entry['base'] for entry in entries if entry['base'])
+        delta_bytes = sum(os.path.getsize(self.getDeltaPath(delta)) for delta in deltas if os.path.isfile(self.getDeltaPath(delta)))
+        logical_bytes = sum(entry['size'] for entry in entries)
+        with self.lock:
+            cached, cached_bytes = len(self.cached), self.cached_bytes
+        return {'names': len(entries), 'bases': len(bases), 'deltas': len(deltas), 'delta_bytes': delta_bytes, 'logical_bytes': logical_bytes,
+                'saved_bytes': logical_bytes - delta_bytes, 'cached': cached, 'cached_bytes': cached_bytes}
+
+
+g_archives: Dict[str, DeltaArchive] = { }
+g_archives_lock = threading.Lock()
+
+
+def saveArchives():
+    with g_archives_lock:
+        archives = list(g_archives.values())
+    for archive in archives:
+        try:
+            archive.save()
+        except OSError as ex:
+            printError(f'Failed to save archive index "{archive.index_path}": {ex}')
+
+
+def getDeltaArchive(create: bool = False) -> DeltaArchive | None:
+    """
+    Returns the archive of the output directory, or None when it has none and `create` is not set.
+    """
+    root = os.path.abspath(getOutputDirectory())
+    with g_archives_lock:
+        if root not in g_archives:
+            if not create and not os.path.isdir(os.path.join(root, ARCHIVE_DIR_NAME)):
+                return None
+            if not g_archives:
+                atexit.register(saveArchives)
+            g_archives[root] = DeltaArchive(root, getArchiveCacheSize())
+        return g_archives[root]
+
+
+def __getArchiveOrFail() -> DeltaArchive:
+    archive = getDeltaArchive()
+    if archive is None:
+        raise ArchiveException(f'"{getOutputDirectory()}" has no archive, extrapolate with --archive to create it')
+    return archive
+
+
+def materializeArchived(name_regex: str, destination: str = None) -> List[str]:
+    """
+    Materializes every archived binary whose versioned name matches `name_regex`, copying them into `destination` if given.
+    """
+    archive = __getArchiveOrFail()
+    pattern = re.compile(name_regex, re.IGNORECASE)
+    paths = []
+    for name, _ in archive.iterateNames():
+        if not pattern.search(name):
+            continue
+        try:
+            path = archive.materialize(name)
+        except SymbolManagerException as ex:
+            printError(f'Failed to materialize {name}: {ex}')
+            continue
+        if destination:
+            os.makedirs(destination, exist_ok=True)
+            path = shutil.copyfile(path, os.path.join(destination, name))
+        printSuccess(f'Materialized {path}')
+        paths.append(path)
+    if not paths:
+        printInfo(f'No archived binary matches "{name_regex}"')
+    return paths
+
+
+def printArchiveStats():
+    stats = __getArchiveOrFail().getStats()
+    mib = 1024 * 1024
+    printInfo(f'{stats["names"]} archived names, {stats["bases"]} bases, {stats["deltas"]} deltas')
+    printInfo(f'{stats["delta_bytes"] / mib:.1f} MiB of deltas for {stats["logical_bytes"] / mib:.1f} MiB of binaries ({stats["saved_bytes"] / mib:.1f} MiB saved)')
+    printInfo(f'{stats["cached"]} binaries cached ({stats["cached_bytes"] / mib:.1f} MiB)')
@@ -0,0 +1,346 @@
+import atexit
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from types import NoneType
+from typing import Dict, List
+from src.symbols.pe import PeFormatException, readPeDebugInfo, readPeDebugInfoFromBytes
+from src.utils.printer import printError, printInfo, printLog, printSuccess
+from src.utils.settings import getOutputDirectory
+from src.utils.utils import SymbolManagerException, calculateFileHash, parseVersionedFileName
+
+
+BINARY_CATALOG_FILE_NAME = '.binary_catalog.sqlite'
+BINARY_CATALOG_VERSION = 1
+# Producers record a row per file, rows are committed in batches (and at exit)
+BINARY_CATALOG_COMMIT_INTERVAL = 64
+# Bits of each of the 4 parts of a version in its key
+VERSION_PART_BITS = 16
+VERSION_PART_MAX = (1 << VERSION_PART_BITS) - 1
+# A version or a prefix of one
+VERSION_REGEX = re.compile(r'^\d+(\.\d+){0,3}$')
+MACHINE_TYPE_ARCHES = {'X64': 'x64', 'I386': 'x86', 'ARM64': 'arm64', 'ARMNT': 'arm'}
+
+
+class BinaryStorage:
+    File = 'file'
+    Archive = 'archive'
+
+
+class BinaryCatalogException(SymbolManagerException):
+    pass
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS binaries (
+    path TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    file_name TEXT NOT NULL,
+    version TEXT,
+    version_key INTEGER,
+    arch TEXT,
+    kb TEXT,
+    sha256 TEXT,
+    size INTEGER,
+    pdb_name TEXT,
+    pdb_guid TEXT,
+    pdb_age INTEGER,
+    source TEXT,
+    producer TEXT NOT NULL,
+    storage TEXT NOT NULL,
+    produced_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS binaries_file_version ON binaries (file_name, version_key);
+CREATE INDEX IF NOT EXISTS binaries_version ON binaries (version_key);
+CREATE INDEX IF NOT EXISTS binaries_kb ON binaries (kb);
+CREATE INDEX IF NOT EXISTS binaries_sha256 ON binaries (sha256);
+CREATE INDEX IF NOT EXISTS binaries_pdb ON binaries (pdb_guid, pdb_age);
+CREATE INDEX IF NOT EXISTS binaries_source ON binaries (source);
+CREATE TABLE IF NOT EXISTS sources (
+    source TEXT PRIMARY KEY,
+    producer TEXT NOT NULL,
+    completed_at REAL NOT NULL
+);
+'''
+COLUMNS = ('path', 'name', 'file_name', 'version', 'version_key', 'arch', 'kb', 'sha256', 'size', 'pdb_name', 'pdb_guid', 'pdb_age', 'source', 'producer', 'storage', 'produced_at')
+
+
+def makeVersionKey(version: str, upper: bool = False) -> int:
+    """
+    Packs a version into an integer which sorts like the version, for range queries.
+
+    A partial version (e.g. "10.0.22621") is the lowest of the versions it prefixes, or the highest with `upper`.
+    """
+    parts = [int(part) for part in version.split('.') if part][:4]
+    parts += [VERSION_PART_MAX if upper else 0] * (4 - len(parts))
+    key = 0
+    for part in parts:
+        key = (key << VERSION_PART_BITS) | min(part, VERSION_PART_MAX)
+    return key
+
+
+class BinaryCatalog:
+    """
+    A local SQLite catalog of every binary the tool produced: its versioned name, version, architecture, KB,
+    SHA256, size, PDB name/GUID/age, the artifact it came from (update, patch, ISO...) and which command produced it.
+
+    Consumers query the catalog instead of parsing versioned names (see `buildVersionedFileName`) back with
+    regexes. Versions are also stored packed (see `makeVersionKey`), so version ranges are index range scans.
+    The catalog is stored inside the output directory.
+
+    Example:
+        ```python
+        with BinaryCatalog(output_dir) as catalog:
+            catalog.record(out_path, 'extrapolate', source=msu_path, data=outbuf)
+            rows = catalog.query(file_name='ntoskrnl.exe', arch='x64', version_from='10.0.22621.2000')
+        ```
+    """
+    def __init__(self, output_dir: str) -> NoneType:
+        self.file_path = os.path.join(output_dir, BINARY_CATALOG_FILE_NAME)
+        os.makedirs(output_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.uncommitted = 0
+        self.connection = sqlite3.connect(self.file_path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        if self.connection.execute('PRAGMA user_version').fetchone()[0] not in (0, BINARY_CATALOG_VERSION):
+            raise sqlite3.DatabaseError(f'Binary catalog "{self.file_path}" has an unknown version')
+        self.connection.executescript(SCHEMA)
+        self.connection.execute(f'PRAGMA user_version={BINARY_CATALOG_VERSION}')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def commit(self):
+        with self.lock:
+            self.connection.commit()
+            self.uncommitted = 0
+
+    def close(self):
+        with self.lock:
+            self.connection.commit()
+            self.connection.close()
+
+    @staticmethod
+    def normalizeSource(source: str) -> str:
+        return source if '://' in source else os.path.abspath(source)
+
+    def record(self, path: str, producer: str, source: str = None, data: bytes = None, sha256: str = None, storage: str = BinaryStorage.File) -> dict:
+        """
+        Records (or updates) the row of a produced binary.
+
+        Args:
+            data (bytes, optional): The binary's bytes, when the producer has them - saves reading the file.
+            sha256 (str, optional): The binary's already known SHA256.
+            storage (str, optional): `BinaryStorage.Archive` for a binary which was archived instead of written (`data` is required then).
+        """
+        name = os.path.basename(path)
+        versioned = parseVersionedFileName(name)
+        if data is not None:
+            sha256 = sha256 if sha256 else hashlib.sha256(data).hexdigest()
+            size = len(data)
+        else:
+            sha256 = sha256 if sha256 else calculateFileHash(path)
+            size = os.path.getsize(path)
+        try:
+            debug_info = readPeDebugInfoFromBytes(data, path) if data is not None else readPeDebugInfo(path)
+        except PeFormatException as ex:
+            printLog(f'No PE debug info for the catalog: {ex}')
+            debug_info = None
+        arch = versioned.arch.lower() if versioned else (MACHINE_TYPE_ARCHES.get(debug_info.machine_type) if debug_info else None)
+        row = {
+            'path': os.path.abspath(path),
+            'name': name,
+            'file_name': (versioned.getOriginalFileName() if versioned else name).lower(),
+            'version': versioned.version if versioned else None,
+            'version_key': makeVersionKey(versioned.version) if versioned else None,
+            'arch': arch,
+            'kb': versioned.kb.upper() if versioned and versioned.kb else None,
+            'sha256': sha256.lower(),
+            'size': size,
+            'pdb_name': debug_info.pdb_name if debug_info else None,
+            'pdb_guid': debug_info.pdb_signature if debug_info else None,
+            'pdb_age': debug_info.pdb_age if debug_info else None,
+            'source': self.normalizeSource(source) if source else None,
+            'producer': producer,
+            'storage': storage,
+            'produced_at': time.time(),
+        }
+        with self.lock:
+            self.connection.execute(f'INSERT OR REPLACE INTO binaries ({", ".join(COLUMNS)}) VALUES ({", ".join("?" * len(COLUMNS))})', [row[column] for column in COLUMNS])
+            self.uncommitted += 1
+            if self.uncommitted >= BINARY_CATALOG_COMMIT_INTERVAL:
+                self.connection.commit()
+                self.uncommitted = 0
+        return row
+
+    def recordSource(self, source: str, producer: str):
+        """
+        Records that every binary of `source` (e.g. an MSU) was produced, so it can be skipped from now on.
+        """
+        with self.lock, self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO sources (source, producer, completed_at) VALUES (?, ?, ?)', (self.normalizeSource(source), producer, time.time()))
+
+    def isSourceComplete(self, source: str) -> bool:
+        with self.lock:
+            return self.connection.execute('SELECT 1 FROM sources WHERE source = ?', (self.normalizeSource(source), )).fetchone() is not None
+
+    def query(self, file_name: str = None, version: str = None, version_from: str = None, version_to: str = None, arch: str = None, kb: str = None, sha256: str = None, pdb: str = None, limit: int = None, source: str = None) -> List[sqlite3.Row]:
+        """
+        Returns the rows matching every given filter, ordered by file name and version.
+
+        Args:
+            file_name (str, optional): An original file name (e.g. "ntoskrnl.exe"), or a glob of them ("nt*.exe").
+            version (str, optional): A version, or a prefix of one (e.g. "10.0.22621") which matches all the versions it prefixes.
+            version_from, version_to (str, optional): Inclusive version bounds, partial versions as with `version`.
+            pdb (str, optional): A PDB GUID, or its symbol server key (GUID followed by the age in hex).
+            source (str, optional): The file (or URL) the binaries were produced from.
+        """
+        conditions = []
+        parameters = []
+        if file_name:
+            conditions.append('file_name GLOB ?' if any(c in file_name for c in '*?[') else 'file_name = ?')
+            parameters.append(file_name.lower())
+        if version:
+            version_from = version_to = version
+        if version_from:
+            conditions.append('version_key >= ?')
+            parameters.append(makeVersionKey(version_from))
+        if version_to:
+            conditions.append('version_key <= ?')
+            parameters.append(makeVersionKey(version_to, upper=True))
+        if arch:
+            conditions.append('arch = ?')
+            parameters.append(arch.lower())
+        if kb:
+            conditions.append('kb = ?')
+            parameters.append(kb.upper() if kb.upper().startswith('KB') else f'KB{kb}')
+        if sha256:
+            conditions.append('sha256 = ?')
+            parameters.append(sha256.lower())
+        if pdb:
+            pdb = pdb.upper()
+            conditions.append('pdb_guid = ?')
+            parameters.append(pdb[:32])
+            if len(pdb) > 32:
+                conditions.append('pdb_age = ?')
+                parameters.append(int(pdb[32:], 16))
+        if source:
+            conditions.append('source = ?')
+            parameters.append(self.normalizeSource(source))
+        statement = 'SELECT * FROM binaries'
+        if conditions:
+            statement += ' WHERE ' + ' AND '.join(conditions)
+        statement += ' ORDER BY file_name, version_key, arch'
+        if limit:
+            statement += f' LIMIT {int(limit)}'
+        with self.lock:
+            return self.connection.execute(statement, parameters).fetchall()
+
+    def getPaths(self) -> Dict[str, str]:
+        """
+        Returns:
+            Dict[str, str]: The path -> SHA256 of every row.
+        """
+        with self.lock:
+            return {row['path']: row['sha256'] for row in self.connection.execute('SELECT path, sha256 FROM binaries')}
+
+    def remove(self, path: str):
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM binaries WHERE path = ?', (os.path.abspath(path), ))
+
+
+g_binary_catalogs: Dict[str, BinaryCatalog] = { }
+g_binary_catalogs_lock = threading.Lock()
+
+
+def closeBinaryCatalogs():
+    with g_binary_catalogs_lock:
+        catalogs = list(g_binary_catalogs.values())
+        g_binary_catalogs.clear()
+    for catalog in catalogs:
+        try:
+            catalog.close()
+        except sqlite3.Error as ex:
+            printError(f'Failed to save binary catalog "{catalog.file_path}": {ex}')
+
+
+def getBinaryCatalog() -> BinaryCatalog:
+    """
+    Returns the catalog of the output directory, which every producer of binaries records into.
+    """
+    root = os.path.abspath(getOutputDirectory())
+    with g_binary_catalogs_lock:
+        if root not in g_binary_catalogs:
+            if not g_binary_catalogs:
+                atexit.register(closeBinaryCatalogs)
+            g_binary_catalogs[root] = BinaryCatalog(root)
+        return g_binary_catalogs[root]
+
+
+def recordBinary(path: str, producer: str, source: str = None, data: bytes = None, sha256: str = None, storage: str = BinaryStorage.File):
+    """
+    Records a produced binary in the catalog of the output directory (see `BinaryCatalog.record`).
+
+    Producing the binary succeeded whatever happens to its row, so a failure to record it is only reported.
+    """
+    try:
+        getBinaryCatalog().record(path, producer, source, data, sha256, storage)
+    except (OSError, sqlite3.Error) as ex:
+        printError(f'Failed to record "{os.path.basename(path)}" in the binary catalog: {ex}')
+
+
+def recordSource(source: str, producer: str):
+    """
+    Records that every binary of `source` was produced (see `BinaryCatalog.recordSource`). A failure to record it is only reported.
+    """
+    try:
+        getBinaryCatalog().recordSource(source, producer)
+    except (OSError, sqlite3.Error) as ex:
+        printError(f'Failed to record "{os.path.basename(source)}" in the binary catalog: {ex}')
+
+
+def scanIntoBinaryCatalog() -> int:
+    """
+    Catalogs the versioned binaries in the root of the output directory which the catalog does not know yet (e.g. produced before it existed).
+    """
+    catalog = getBinaryCatalog()
+    known = catalog.getPaths()
+    root = os.path.abspath(getOutputDirectory())
+    recorded = 0
+    for name in sorted(os.listdir(root)):
+        path = os.path.join(root, name)
+        if path in known or parseVersionedFileName(name) is None or not os.path.isfile(path):
+            continue
+        recordBinary(path, 'scan')
+        recorded += 1
+    catalog.commit()
+    return recorded
+
+
+def queryBinaryCatalog(file_name: str = None, version: str = None, version_from: str = None, version_to: str = None, arch: str = None, kb: str = None, sha256: str = None, pdb: str = None, limit: int = None, as_json: bool = False, scan: bool = False) -> List[sqlite3.Row]:
+    if scan:
+        printSuccess(f'Cataloged {scanIntoBinaryCatalog()} more files of the output directory')
+    for bound in (version, version_from, version_to):
+        if bound and not VERSION_REGEX.match(bound):
+            raise BinaryCatalogException(f'Invalid version "{bound}", expected e.g. 10.0.22621.2506 or 10.0.22621')
+    start = time.perf_counter()
+    rows = getBinaryCatalog().query(file_name, version, version_from, version_to, arch, kb, sha256, pdb, limit)
+    elapsed = time.perf_counter() - start
+    for row in rows:
+        if as_json:
+            print(json.dumps({column: row[column] for column in COLUMNS}))
+            continue
+        pdb_key = f'{row["pdb_guid"]}{row["pdb_age"]:X}' if row['pdb_guid'] else '-'
+        printInfo(f'{row["name"]}  {row["sha256"]}  {row["size"]:>10}  {pdb_key:<34} {row["storage"]:<7} {row["source"] or "-"}')
+    if not as_json:
+        printInfo(f'{len(rows)} binaries matched in {elapsed * 1000:.2f} ms')
+    return rows
@@ -0,0 +1,272 @@
+import atexit
+import hashlib
+import os
+import shutil
+import threading
+from types import NoneType
+from typing import Dict, Iterator, Tuple
+from src.utils.json_store import JsonStore
+from src.utils.metrics import g_metrics
+from src.utils.printer import printError, printInfo, printLog, printSuccess
+from src.utils.settings import getContentStoreLinks, getOutputDirectory
+from src.utils.utils import SymbolManagerException, calculateFileHash
+
+
+CAS_DIR_NAME = '.cas'
+CAS_OBJECTS_DIR_NAME = 'objects'
+CAS_NAMES_FILE_NAME = 'names.json'
+CAS_VERSION = 1
+# Flush the name index to disk every so often so an interrupted run keeps its progress
+CAS_SAVE_INTERVAL = 64
+LINK_MODES = ('hardlink', 'symlink')
+
+DEDUPLICATED_BYTES = g_metrics.counter('cas_deduplicated_bytes_total', 'Bytes which were not written because the content store already had them')
+
+
+class ContentStoreException(SymbolManagerException):
+    pass
+
+
+class ContentStore:
+    """
+    Stores every binary of an output directory once, by SHA256, under `.cas/objects/<2 hex>/<sha256>`.
+
+    The versioned names (see `buildVersionedFileName`) stay where they were, as hard links (or symbolic
+    links) to their blob, so the same bytes under a KB suffixed and unsuffixed name, or as x86 and wow64,
+    take the disk space of one file and are written once. Whether an exact binary is already stored is a
+    single `stat` of its blob path. The name -> SHA256 mapping is kept in `.cas/names.json`.
+
+    Files must not be modified in place - a hard link shares its blob's bytes with every other name.
+
+    Example:
+        ```python
+        store = getContentStore()
+        if store:
+            sha256 = store.putBytes(outbuf, 'ntoskrnl - 10.0.22621.2506 x64 - KB5031354.exe')
+            store.hasBlob(sha256) # True
+        ```
+    """
+    def __init__(self, root: str, link_mode: str = 'hardlink') -> NoneType:
+        if link_mode not in LINK_MODES:
+            raise ContentStoreException(f'Unknown link mode "{link_mode}", expected one of {", ".join(LINK_MODES)}')
+        self.root = root
+        self.link_mode = link_mode
+        self.cas_dir = os.path.join(root, CAS_DIR_NAME)
+        self.objects_dir = os.path.join(self.cas_dir, CAS_OBJECTS_DIR_NAME)
+        self.names_path = os.path.join(self.cas_dir, CAS_NAMES_FILE_NAME)
+        self.names_store = JsonStore(self.names_path, CAS_VERSION, 'names', 'content store index', CAS_SAVE_INTERVAL)
+        self.names: Dict[str, str] = self.names_store.load({ })
+        self.lock = threading.Lock()
+
+    def save(self):
+        with self.lock:
+            self.names_store.save(self.names)
+
+    def getObjectPath(self, sha256: str) -> str:
+        sha256 = sha256.lower()
+        return os.path.join(self.objects_dir, sha256[:2], sha256)
+
+    def hasBlob(self, sha256: str) -> bool:
+        return os.path.isfile(self.getObjectPath(sha256))
+
+    def getNameHash(self, name: str) -> str | None:
+        with self.lock:
+            return self.names.get(name)
+
+    def iterateNames(self) -> Iterator[Tuple[str, str]]:
+        with self.lock:
+            names = list(self.names.items())
+        yield from names
+
+    def __record(self, name: str, sha256: str):
+        with self.lock:
+            if self.names.get(name) == sha256:
+                return
+            self.names[name] = sha256
+            save = self.names_store.markDirty()
+        if save:
+            self.save()
+
+    def __storeBlob(self, sha256: str, write) -> bool:
+        """
+        Writes a blob unless it is already stored. Returns whether it was written.
+        """
+        object_path = self.getObjectPath(sha256)
+        if os.path.isfile(object_path):
+            return False
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        tmp_path = f'{object_path}.{threading.get_ident()}.tmp'
+        write(tmp_path)
+        os.replace(tmp_path, object_path)
+        return True
+
+    def link(self, name: str, sha256: str) -> str:
+        """
+        Points `name` (relative to the store's root) at a stored blob, replacing whatever it pointed at.
+        """
+        object_path = self.getObjectPath(sha256)
+        path = os.path.join(self.root, name)
+        if os.path.lexists(path):
+            try:
+                if os.path.samefile(path, object_path):
+                    self.__record(name, sha256)
+                    return path
+            except OSError:
+                pass
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f'{path}.{threading.get_ident()}.link'
+        if self.link_mode == 'symlink':
+            os.symlink(os.path.relpath(object_path, os.path.dirname(os.path.abspath(path))), tmp_path)
+        else:
+            try:
+                os.link(object_path, tmp_path)
+            except OSError as ex:
+                # E.g. a file system without hard links, the name gets a copy (still deduplicated on writes)
+                printLog(f'Failed to hard link "{name}", copying it: {ex}')
+                shutil.copyfile(object_path, tmp_path)
+        os.replace(tmp_path, path)
+        self.__record(name, sha256)
+        return path
+
+    def putBytes(self, data: bytes, name: str) -> str:
+        """
+        Stores `data` under `name`, writing its bytes only if no other name holds them yet.
+
+        Returns:
+            str: The SHA256 of `data`.
+        """
+        sha256 = hashlib.sha256(data).hexdigest()
+        def write(tmp_path: str):
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+        if not self.__storeBlob(sha256, write):
+            DEDUPLICATED_BYTES.inc(len(data))
+        self.link(name, sha256)
+        return sha256
+
+    def putFile(self, file_path: str, name: str, move: bool = False, sha256: str = None) -> str:
+        """
+        Stores a file under `name`. With `move` the source is consumed (moved into the store, or deleted if it already holds its bytes).
+
+        Args:
+            sha256 (str, optional): The file's already verified SHA256, saves hashing it again.
+
+        Returns:
+            str: The SHA256 of the file.
+        """
+        sha256 = sha256.lower() if sha256 else calculateFileHash(file_path)
+        size = os.path.getsize(file_path)
+        if move:
+            stored = self.__storeBlob(sha256, lambda tmp_path: shutil.move(file_path, tmp_path))
+        else:
+            stored = self.__storeBlob(sha256, lambda tmp_path: shutil.copyfile(file_path, tmp_path))
+        if not stored:
+            DEDUPLICATED_BYTES.inc(size)
+        # Linking a file over itself (importing a name of the store) must not lose it
+        if move and os.path.exists(file_path) and os.path.abspath(file_path) != os.path.abspath(os.path.join(self.root, name)):
+            os.remove(file_path)
+        self.link(name, sha256)
+        return sha256
+
+    def importNames(self) -> Tuple[int, int]:
+        """
+        Moves the plain files in the root of the output directory into the store and links them back.
+
+        Returns:
+            Tuple[int, int]: The amount of imported files, and how many of them were duplicates.
+        """
+        imported = 0
+        duplicates = 0
+        for name in sorted(os.listdir(self.root)):
+            path = os.path.join(self.root, name)
+            if name.startswith('.') or os.path.islink(path) or not os.path.isfile(path):
+                continue
+            known = self.getNameHash(name)
+            if known and self.hasBlob(known) and os.path.samefile(path, self.getObjectPath(known)):
+                continue
+            sha256 = calculateFileHash(path)
+            if self.hasBlob(sha256):
+                duplicates += 1
+            self.putFile(path, name, move=True)
+            imported += 1
+        self.save()
+        return imported, duplicates
+
+    def getStats(self) -> dict:
+        blobs = 0
+        stored_bytes = 0
+        sizes: Dict[str, int] = { }
+        for root, _, file_names in os.walk(self.objects_dir):
+            for file_name in file_names:
+                if file_name.endswith('.tmp'):
+                    continue
+                size = os.path.getsize(os.path.join(root, file_name))
+                sizes[file_name] = size
+                blobs += 1
+                stored_bytes += size
+        names = list(self.iterateNames())
+        logical_bytes = sum(sizes.get(sha256, 0) for _, sha256 in names)
+        return {'names': len(names), 'blobs': blobs, 'stored_bytes': stored_bytes, 'logical_bytes': logical_bytes, 'saved_bytes': logical_bytes - stored_bytes}
+
+
+g_content_stores: Dict[str, ContentStore] = { }
+g_content_stores_lock = threading.Lock()
+
+
+def saveContentStores():
+    with g_content_stores_lock:
+        stores = list(g_content_stores.values())
+    for store in stores:
+        try:
+            store.save()
+        except OSError as ex:
+            printError(f'Failed to save content store index "{store.names_path}": {ex}')
+
+
+def getContentStore(directory: str = None) -> ContentStore | None:
+    """
+    Returns the content store of the output directory, or None when the store is off (see `--cas`) or
+    `directory` is not the output directory (e.g. a base files directory), which then gets plain files.
+    """
+    link_mode = getContentStoreLinks()
+    if not link_mode:
+        return None
+    root = os.path.abspath(getOutputDirectory())
+    if directory is not None and os.path.abspath(directory) != root:
+        return None
+    with g_content_stores_lock:
+        if root not in g_content_stores:
+            if not g_content_stores:
+                atexit.register(saveContentStores)
+            g_content_stores[root] = ContentStore(root, link_mode)
+        return g_content_stores[root]
+
+
+def writeOutputFile(path: str, data: bytes):
+    """
+    Writes a produced file, through the content store when it is on and the file is in the output directory.
+    """
+    store = getContentStore(os.path.dirname(path))
+    if store is None:
+        with open(path, 'wb') as f:
+            f.write(data)
+        return
+    store.putBytes(data, os.path.basename(path))
+
+
+def printContentStoreStats():
+    store = getContentStore()
+    if store is None:
+        raise ContentStoreException('The content store is off, enable it with --cas')
+    stats = store.getStats()
+    mib = 1024 * 1024
+    printInfo(f'{stats["names"]} names, {stats["blobs"]} blobs')
+    printInfo(f'{stats["stored_bytes"] / mib:.1f} MiB stored for {stats["logical_bytes"] / mib:.1f} MiB of names ({stats["saved_bytes"] / mib:.1f} MiB saved)')
+
+
+def importIntoContentStore():
+    store = getContentStore()
+    if store is None:
+        raise ContentStoreException('The content store is off, enable it with --cas')
+    imported, duplicates = store.importNames()
+    printSuccess(f'Imported {imported} files into the content store ({duplicates} were duplicates)')
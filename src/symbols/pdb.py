@@ -0,0 +1,135 @@
+import mmap
+import struct
+from types import NoneType
+from typing import List
+from src.utils.utils import SymbolManagerException
+
+
+MSF_7_MAGIC = b'Microsoft C/C++ MSF 7.00\r\n\x1aDS\x00\x00\x00'
+MSF_SUPERBLOCK = struct.Struct('<32sIIIIII')
+NIL_STREAM_SIZE = 0xFFFFFFFF
+
+PDB_INFO_STREAM = 1
+DBI_STREAM = 3
+
+# Version, Signature, Age, GUID
+PDB_INFO_HEADER = struct.Struct('<III16s')
+# VersionSignature, VersionHeader, Age
+DBI_HEADER = struct.Struct('<iII')
+
+
+class PdbFormatException(SymbolManagerException):
+    pass
+
+
+def guidToSignature(guid: bytes) -> str:
+    """
+    Formats a raw GUID the way symbol servers do (uppercase, no separators).
+    """
+    data1, data2, data3 = struct.unpack_from('<IHH', guid)
+    return f'{data1:08X}{data2:04X}{data3:04X}{guid[8:].hex().upper()}'
+
+
+class PdbSignature:
+    signature = ''
+    age = 0
+    pdb_info_age = 0
+
+    def __init__(self, signature: str, age: int, pdb_info_age: int) -> NoneType:
+        self.signature = signature
+        self.age = age
+        self.pdb_info_age = pdb_info_age
+
+    def __repr__(self) -> str:
+        return f'PdbSignature({self.signature}, {self.age})'
+
+
+class MsfFile:
+    """
+    Minimal reader for MSF 7.00 containers (the on-disk format of PDB files).
+
+    Only the stream directory is parsed, streams are read lazily and straight from the mapping.
+    """
+    def __init__(self, data: mmap.mmap | bytes, file_path: str = '') -> NoneType:
+        self.data = data
+        self.file_path = file_path
+        if len(data) < MSF_SUPERBLOCK.size:
+            raise PdbFormatException(f'"{file_path}" is too small to be a PDB')
+        magic, self.block_size, _, self.num_blocks, self.num_directory_bytes, _, self.block_map_addr = MSF_SUPERBLOCK.unpack_from(data)
+        if magic != MSF_7_MAGIC:
+            raise PdbFormatException(f'"{file_path}" is not an MSF 7.00 PDB')
+        if self.block_size not in (512, 1024, 2048, 4096, 8192, 16384, 32768):
+            raise PdbFormatException(f'"{file_path}" has an invalid block size {self.block_size}')
+        self.__parseDirectory()
+
+    def __blockCount(self, size: int) -> int:
+        return (size + self.block_size - 1) // self.block_size
+
+    def __readBlocks(self, blocks: List[int], size: int) -> bytes:
+        chunks = []
+        remaining = size
+        for block in blocks:
+            if block >= self.num_blocks:
+                raise PdbFormatException(f'"{self.file_path}" references block {block} out of {self.num_blocks}')
+            offset = block * self.block_size
+            length = min(self.block_size, remaining)
+            chunks.append(self.data[offset:offset + length])
+            remaining -= length
+            if remaining <= 0:
+                break
+        return b''.join(chunks)
+
+    def __parseDirectory(self):
+        directory_block_count = self.__blockCount(self.num_directory_bytes)
+        block_map_offset = self.block_map_addr * self.block_size
+        directory_blocks = list(struct.unpack_from(f'<{directory_block_count}I', self.data, block_map_offset))
+        directory = self.__readBlocks(directory_blocks, self.num_directory_bytes)
+
+        num_streams, = struct.unpack_from('<I', directory)
+        self.stream_sizes = list(struct.unpack_from(f'<{num_streams}I', directory, 4))
+        self.stream_blocks: List[List[int]] = []
+        offset = 4 + 4 * num_streams
+        for size in self.stream_sizes:
+            count = 0 if size == NIL_STREAM_SIZE else self.__blockCount(size)
+            self.stream_blocks.append(list(struct.unpack_from(f'<{count}I', directory, offset)))
+            offset += 4 * count
+
+    def readStream(self, index: int, size: int | None = None) -> bytes:
+        """
+        Reads the first `size` bytes of a stream (or all of it).
+        """
+        if index >= len(self.stream_sizes) or self.stream_sizes[index] == NIL_STREAM_SIZE:
+            raise PdbFormatException(f'"{self.file_path}" has no stream {index}')
+        stream_size = self.stream_sizes[index]
+        size = stream_size if size is None else min(size, stream_size)
+        return self.__readBlocks(self.stream_blocks[index], size)
+
+
+def readPdbSignature(pdb_file_path: str) -> PdbSignature:
+    """
+    Reads the GUID and age of a PDB file without any external tools.
+
+    The GUID comes from the PDB info stream (stream 1). The age reported is the DBI stream's age
+    (stream 3), which is the one recorded in the matching PE's CodeView entry; the info stream's
+    age is kept as `pdb_info_age`.
+    """
+    try:
+        with open(pdb_file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            msf = MsfFile(data, pdb_file_path)
+            info = msf.readStream(PDB_INFO_STREAM, PDB_INFO_HEADER.size)
+            if len(info) < PDB_INFO_HEADER.size:
+                raise PdbFormatException(f'"{pdb_file_path}" has a truncated PDB info stream')
+            _, _, info_age, guid = PDB_INFO_HEADER.unpack(info)
+            age = info_age
+            if DBI_STREAM < len(msf.stream_sizes) and msf.stream_sizes[DBI_STREAM] not in (0, NIL_STREAM_SIZE):
+                dbi = msf.readStream(DBI_STREAM, DBI_HEADER.size)
+                if len(dbi) == DBI_HEADER.size:
+                    age = DBI_HEADER.unpack(dbi)[2]
+            return PdbSignature(guidToSignature(guid), age, info_age)
+    except (OSError, ValueError, struct.error) as ex:
+        raise PdbFormatException(f'Failed to read PDB "{pdb_file_path}": {ex}')
+
+
+def readPdbSignatureTuple(pdb_file_path: str) -> tuple[str, int]:
+    signature = readPdbSignature(pdb_file_path)
+    return signature.signature, signature.age
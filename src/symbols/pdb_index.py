@@ -0,0 +1,167 @@
+import os
+from types import NoneType
+from typing import Callable, Dict, List, Tuple
+from src.symbols.pdb import readPdbSignatureTuple
+from src.utils.json_store import JsonStore
+from src.utils.printer import printLog
+from src.utils.utils import SymbolManagerException
+
+
+INDEX_FILE_NAME = '.pdb_index.json'
+INDEX_VERSION = 2
+# Flush the index to disk every so often while PDBs are recorded, so an interrupted publish keeps its progress
+INDEX_SAVE_INTERVAL = 64
+
+PdbKey = Tuple[str, str, int]
+PdbSignatureReader = Callable[[str], Tuple[str, int]]
+
+
+def makePdbKey(pdb_name: str, signature: str, age: int) -> PdbKey:
+    return (os.path.basename(pdb_name).lower(), signature.upper(), int(age))
+
+
+class PdbStoreIndex:
+    """
+    Index of every PDB under a single symbol store directory.
+
+    The signature of each PDB is cached together with its (size, mtime_ns), so refreshing
+    the index only reads PDBs which were added or changed since the last refresh.
+    The cache is persisted as JSON at the root of the store.
+    """
+    def __init__(self, store_dir: str, signature_reader: PdbSignatureReader) -> NoneType:
+        self.store_dir = store_dir
+        self.store = JsonStore(os.path.join(store_dir, INDEX_FILE_NAME), INDEX_VERSION, 'pdbs', 'PDB index', INDEX_SAVE_INTERVAL)
+        self.signature_reader = signature_reader
+        # Relative path -> {size, mtime_ns, signature, age}
+        self.entries: Dict[str, dict] = self.store.load({ })
+
+    def save(self):
+        try:
+            self.store.write(self.entries)
+        except OSError as ex:
+            # Read-only stores are still indexed, just not persisted
+            printLog(f'Could not persist PDB index "{self.store.file_path}": {ex}')
+
+    def record(self, pdb_file_path: str, signature: str, age: int):
+        """
+        Indexes a PDB which was just placed in the store, with its already known signature, so it is not read again.
+
+        Call `save` once done recording.
+        """
+        st = os.stat(pdb_file_path)
+        self.entries[os.path.relpath(pdb_file_path, self.store_dir)] = {
+            'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns,
+            'signature': signature,
+            'age': age,
+        }
+        if self.store.markDirty():
+            self.save()
+
+    def refresh(self) -> bool:
+        """
+        Walks the store and updates entries of new or modified PDBs.
+
+        Returns:
+            bool: True if the index changed.
+        """
+        seen = set()
+        changed = False
+        for r, ds, fs in os.walk(self.store_dir):
+            for f in fs:
+                if os.path.splitext(f)[1].lower() != '.pdb':
+                    continue
+                path = os.path.join(r, f)
+                rel_path = os.path.relpath(path, self.store_dir)
+                seen.add(rel_path)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entry = self.entries.get(rel_path)
+                if entry and entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns:
+                    continue
+                try:
+                    signature, age = self.signature_reader(path)
+                except SymbolManagerException as ex:
+                    printLog(f'Failed to read signature of "{path}": {ex}')
+                    signature, age = None, None
+                self.entries[rel_path] = {
+                    'size': st.st_size,
+                    'mtime_ns': st.st_mtime_ns,
+                    'signature': signature,
+                    'age': age,
+                }
+                changed = True
+        for rel_path in set(self.entries.keys()) - seen:
+            del self.entries[rel_path]
+            changed = True
+        if changed:
+            self.save()
+        return changed
+
+    def __iter__(self):
+        for rel_path, entry in self.entries.items():
+            if entry['signature'] is None:
+                continue
+            yield makePdbKey(rel_path, entry['signature'], entry['age']), os.path.join(self.store_dir, rel_path)
+
+
+class PdbIndex:
+    """
+    O(1) lookup of PDB files by (pdb name, signature, age) across several symbol stores.
+
+    Example:
+        ```python
+        index = PdbIndex(['PDBs', r'C:\\symbols'])
+        index.refresh()
+        pdb_path = index.lookup('ntkrnlmp.pdb', 'ABCDEF...', 1)
+        ```
+    """
+    def __init__(self, store_dirs: List[str], signature_reader: PdbSignatureReader = readPdbSignatureTuple) -> NoneType:
+        self.store_dirs = store_dirs
+        self.signature_reader = signature_reader
+        self.stores: Dict[str, PdbStoreIndex] = { }
+        self.lookup_table: Dict[PdbKey, str] = { }
+
+    def refresh(self):
+        for store_dir in self.store_dirs:
+            store_dir = os.path.abspath(store_dir)
+            if not os.path.isdir(store_dir):
+                continue
+            if store_dir not in self.stores:
+                self.stores[store_dir] = PdbStoreIndex(store_dir, self.signature_reader)
+            self.stores[store_dir].refresh()
+        self.lookup_table = { }
+        # Earlier stores take precedence
+        for store in reversed(list(self.stores.values())):
+            for key, path in store:
+                self.lookup_table[key] = path
+        printLog(f'PDB index holds {len(self.lookup_table)} PDBs')
+
+    def add(self, pdb_file_path: str):
+        """
+        Adds a single PDB (e.g. one which was just downloaded) without walking the stores.
+        """
+        signature, age = self.signature_reader(pdb_file_path)
+        self.lookup_table[makePdbKey(pdb_file_path, signature, age)] = pdb_file_path
+
+    def lookup(self, pdb_name: str, signature: str, age: int) -> str | None:
+        path = self.lookup_table.get(makePdbKey(pdb_name, signature, age))
+        if path and os.path.isfile(path):
+            return path
+        return None
+
+
+g_pdb_index: PdbIndex | None = None
+
+
+def getPdbIndex(store_dirs: List[str]) -> PdbIndex:
+    """
+    Returns the process wide PDB index, building it on first use.
+    """
+    global g_pdb_index
+    if g_pdb_index is None or g_pdb_index.store_dirs != store_dirs:
+        g_pdb_index = PdbIndex(store_dirs)
+        g_pdb_index.refresh()
+    return g_pdb_index
@@ -0,0 +1,167 @@
+import io
+import os
+import struct
+from types import NoneType
+from typing import BinaryIO, List, Tuple
+from src.symbols.pdb import guidToSignature
+from src.utils.utils import SymbolManagerException
+
+
+IMAGE_DOS_SIGNATURE = b'MZ'
+IMAGE_NT_SIGNATURE = b'PE\x00\x00'
+IMAGE_NT_OPTIONAL_HDR32_MAGIC = 0x10b
+IMAGE_NT_OPTIONAL_HDR64_MAGIC = 0x20b
+IMAGE_DIRECTORY_ENTRY_DEBUG = 6
+IMAGE_DEBUG_TYPE_CODEVIEW = 2
+CODEVIEW_RSDS_SIGNATURE = b'RSDS'
+
+# Machine, NumberOfSections, TimeDateStamp, PointerToSymbolTable, NumberOfSymbols, SizeOfOptionalHeader, Characteristics
+IMAGE_FILE_HEADER = struct.Struct('<HHIIIHH')
+# Name, VirtualSize, VirtualAddress, SizeOfRawData, PointerToRawData
+IMAGE_SECTION_HEADER = struct.Struct('<8sIIII16x')
+# Characteristics, TimeDateStamp, MajorVersion, MinorVersion, Type, SizeOfData, AddressOfRawData, PointerToRawData
+IMAGE_DEBUG_DIRECTORY = struct.Struct('<IIHHIIII')
+
+MACHINE_TYPE_MAP = {
+    0x014c: 'I386',
+    0x8664: 'X64',
+    0xaa64: 'ARM64',
+    0x01c4: 'ARMNT',
+}
+
+# The headers, section table and debug directory of every PE we care about fit in here
+PE_HEADER_READ_SIZE = 0x1000
+
+
+class PeFormatException(SymbolManagerException):
+    pass
+
+
+class PeDebugInfo:
+    """
+    The identifying fields of a PE file, as used by symbol servers.
+
+    Attributes:
+        machine_type (str): 'X64', 'I386', ... (same names dbh reports).
+        timestamp (int): COFF header TimeDateStamp.
+        size_of_image (int): Optional header SizeOfImage.
+        pdb_name (str): File name of the PDB from the CodeView entry, if any.
+        pdb_signature (str): PDB GUID formatted as in symbol server paths, if any.
+        pdb_age (int): PDB age from the CodeView entry, if any.
+    """
+    machine_type = ''
+    timestamp = 0
+    size_of_image = 0
+    pdb_name = None
+    pdb_signature = None
+    pdb_age = None
+
+    def __init__(self, machine_type: str, timestamp: int, size_of_image: int) -> NoneType:
+        self.machine_type = machine_type
+        self.timestamp = timestamp
+        self.size_of_image = size_of_image
+
+    def getPeStoreKey(self) -> str:
+        """
+        The 'TIMESTAMPSIZE' directory name symbol servers use for binaries.
+        """
+        return f'{self.timestamp:X}{self.size_of_image:x}'
+
+    def getPdbStoreKey(self) -> str | None:
+        """
+        The 'GUIDAGE' directory name symbol servers use for PDBs.
+        """
+        if not self.pdb_signature:
+            return None
+        return f'{self.pdb_signature}{self.pdb_age:X}'
+
+
+def __rvaToOffset(sections: List[Tuple[int, int, int, int]], rva: int) -> int | None:
+    for virtual_size, virtual_address, raw_size, raw_pointer in sections:
+        if virtual_address <= rva < virtual_address + max(virtual_size, raw_size):
+            return rva - virtual_address + raw_pointer
+    return None
+
+
+def readPeDebugInfo(pe_file_path: str) -> PeDebugInfo:
+    """
+    Reads the machine type, timestamp, image size and CodeView PDB reference of a PE file.
+    """
+    try:
+        with open(pe_file_path, 'rb') as f:
+            return __readPeDebugInfo(f, pe_file_path)
+    except OSError as ex:
+        raise PeFormatException(f'Failed to read PE "{pe_file_path}": {ex}')
+
+
+def readPeDebugInfoFromBytes(data: bytes, pe_file_path: str) -> PeDebugInfo:
+    """
+    Same as `readPeDebugInfo`, of a PE file which is in memory (e.g. just patched). `pe_file_path` only names it in errors.
+    """
+    return __readPeDebugInfo(io.BytesIO(data), pe_file_path)
+
+
+def __readPeDebugInfo(f: BinaryIO, pe_file_path: str) -> PeDebugInfo:
+    try:
+        header = f.read(PE_HEADER_READ_SIZE)
+        if header[:2] != IMAGE_DOS_SIGNATURE:
+            raise PeFormatException(f'"{pe_file_path}" is not a PE file')
+        nt_offset, = struct.unpack_from('<I', header, 0x3c)
+        if nt_offset + 4 + IMAGE_FILE_HEADER.size + 2 > len(header):
+            f.seek(0)
+            header = f.read(nt_offset + PE_HEADER_READ_SIZE)
+        if header[nt_offset:nt_offset + 4] != IMAGE_NT_SIGNATURE:
+            raise PeFormatException(f'"{pe_file_path}" has no NT headers')
+        machine, num_sections, timestamp, _, _, optional_header_size, _ = IMAGE_FILE_HEADER.unpack_from(header, nt_offset + 4)
+        optional_offset = nt_offset + 4 + IMAGE_FILE_HEADER.size
+        magic, = struct.unpack_from('<H', header, optional_offset)
+        if magic == IMAGE_NT_OPTIONAL_HDR32_MAGIC:
+            directories_offset = optional_offset + 96
+        elif magic == IMAGE_NT_OPTIONAL_HDR64_MAGIC:
+            directories_offset = optional_offset + 112
+        else:
+            raise PeFormatException(f'"{pe_file_path}" has an unknown optional header magic {magic:#x}')
+        size_of_image, = struct.unpack_from('<I', header, optional_offset + 56)
+        number_of_directories, = struct.unpack_from('<I', header, directories_offset - 4)
+
+        info = PeDebugInfo(MACHINE_TYPE_MAP.get(machine, f'{machine:#x}'), timestamp, size_of_image)
+        if number_of_directories <= IMAGE_DIRECTORY_ENTRY_DEBUG:
+            return info
+
+        sections_offset = optional_offset + optional_header_size
+        if sections_offset + num_sections * IMAGE_SECTION_HEADER.size > len(header):
+            f.seek(0)
+            header = f.read(sections_offset + num_sections * IMAGE_SECTION_HEADER.size)
+        sections = [IMAGE_SECTION_HEADER.unpack_from(header, sections_offset + i * IMAGE_SECTION_HEADER.size)[1:] for i in range(num_sections)]
+
+        debug_rva, debug_size = struct.unpack_from('<II', header, directories_offset + 8 * IMAGE_DIRECTORY_ENTRY_DEBUG)
+        debug_offset = __rvaToOffset(sections, debug_rva) if debug_rva else None
+        if debug_offset is None:
+            return info
+        f.seek(debug_offset)
+        debug_directory = f.read(debug_size)
+        for i in range(len(debug_directory) // IMAGE_DEBUG_DIRECTORY.size):
+            entry = IMAGE_DEBUG_DIRECTORY.unpack_from(debug_directory, i * IMAGE_DEBUG_DIRECTORY.size)
+            debug_type, data_size, data_pointer = entry[4], entry[5], entry[7]
+            if debug_type != IMAGE_DEBUG_TYPE_CODEVIEW or data_size < 24:
+                continue
+            f.seek(data_pointer)
+            codeview = f.read(data_size)
+            if codeview[:4] != CODEVIEW_RSDS_SIGNATURE:
+                continue
+            info.pdb_signature = guidToSignature(codeview[4:20])
+            info.pdb_age, = struct.unpack_from('<I', codeview, 20)
+            pdb_path = codeview[24:].split(b'\x00', 1)[0].decode('utf-8', errors='replace')
+            info.pdb_name = pdb_path.replace('/', '\\').split('\\')[-1]
+            break
+        return info
+    except (OSError, struct.error) as ex:
+        raise PeFormatException(f'Failed to read PE "{pe_file_path}": {ex}')
+
+
+def isPeFile(file_path: str) -> bool:
+    try:
+        with open(file_path, 'rb') as f:
+            return f.read(2) == IMAGE_DOS_SIGNATURE and os.path.getsize(file_path) > 0x40
+    except OSError:
+        return False
@@ -0,0 +1,198 @@
+import os
+import re
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from types import NoneType
+from typing import Dict, List
+from src.symbols.pdb import PdbFormatException, readPdbSignature, readPdbSignatureTuple
+from src.symbols.pdb_index import PdbStoreIndex
+from src.symbols.pe import PeFormatException, isPeFile, readPeDebugInfo
+from src.symbols.symsrv import SymbolRequest, makePdbRequest
+from src.utils.json_store import JsonStore
+from src.utils.printer import printError, printInfo, printLog, printSuccess
+from src.utils.utils import calculateFileHash, parseVersionedFileName, walkFiles
+
+
+SYMBOL_STORE_INDEX_FILE = 'symstore_index.json'
+SYMBOL_STORE_INDEX_VERSION = 1
+# symsrv checks for this file to decide the directory is a store
+SYMBOL_STORE_MARKER_FILE = 'pingme.txt'
+
+PUBLISH_FILE_NAME_REGEX = r'.*\.((exe)|(dll)|(sys)|(pdb))$'
+
+
+class PublishItem:
+    source_path = ''
+    request: SymbolRequest = None
+    kind = ''
+    sha256 = ''
+    size = 0
+    pdb_signature = None
+    pdb_age = None
+
+    def __init__(self, source_path: str, request: SymbolRequest, kind: str) -> NoneType:
+        self.source_path = source_path
+        self.request = request
+        self.kind = kind
+
+    def toIndexEntry(self) -> dict:
+        entry = {
+            'kind': self.kind,
+            'sha256': self.sha256,
+            'size': self.size,
+            'source': self.source_path,
+        }
+        if self.kind == 'pdb':
+            entry['signature'] = self.pdb_signature
+            entry['age'] = self.pdb_age
+        return entry
+
+
+class SymbolStoreIndex:
+    """
+    A JSON index of every file published into a symbol store, keyed by its `name/KEY/name` path.
+
+    Debuggers only need the SRV* layout itself; the index lets our own tooling answer
+    "is this file in the store, and with which content" without scanning the store.
+    """
+    def __init__(self, store_dir: str) -> NoneType:
+        self.store_dir = store_dir
+        self.store = JsonStore(os.path.join(store_dir, SYMBOL_STORE_INDEX_FILE), SYMBOL_STORE_INDEX_VERSION, 'files', 'symbol store index', indent=1)
+        self.entries: Dict[str, dict] = self.store.load({ })
+
+    @staticmethod
+    def makeKey(request: SymbolRequest) -> str:
+        return f'{request.file_name.lower()}/{request.store_key.upper()}/{request.file_name.lower()}'
+
+    def lookup(self, request: SymbolRequest) -> dict | None:
+        return self.entries.get(self.makeKey(request))
+
+    def add(self, item: PublishItem):
+        entry = item.toIndexEntry()
+        entry['path'] = item.request.getRelativePath()
+        self.entries[self.makeKey(item.request)] = entry
+
+    def save(self):
+        self.store.write(self.entries)
+
+
+def __describeFile(path: str) -> PublishItem | None:
+    if os.path.splitext(path)[1].lower() == '.pdb':
+        signature = readPdbSignature(path)
+        # PDB names are kept as they are, only strip our own versioned naming if present
+        versioned = parseVersionedFileName(path)
+        pdb_name = versioned.getOriginalFileName() if versioned else os.path.basename(path)
+        item = PublishItem(path, makePdbRequest(pdb_name, signature.signature, signature.age), 'pdb')
+        item.pdb_signature = signature.signature
+        item.pdb_age = signature.age
+        return item
+    if not isPeFile(path):
+        return None
+    info = readPeDebugInfo(path)
+    # Sorted binaries carry their version in the name, symbol servers use the original name
+    versioned = parseVersionedFileName(path)
+    file_name = versioned.getOriginalFileName() if versioned else os.path.basename(path)
+    item = PublishItem(path, SymbolRequest(file_name, info.getPeStoreKey()), 'pe')
+    item.pdb_signature = info.pdb_signature
+    item.pdb_age = info.pdb_age
+    return item
+
+
+def __placeFile(item: PublishItem, destination: str, move_files: bool):
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    tmp_destination = destination + '.tmp'
+    if move_files:
+        shutil.move(item.source_path, tmp_destination)
+    else:
+        shutil.copy2(item.source_path, tmp_destination)
+    os.replace(tmp_destination, destination)
+
+
+def publishSymbolStore(source_dir: str, store_dir: str, file_name_regex: re.Pattern[str] | str = None, move_files: bool = False, max_workers: int = 8) -> List[PublishItem]:
+    """
+    Lays out every binary and PDB under `source_dir` into `store_dir` using the symbol server layout.
+
+    Files are described and hashed in parallel, deduplicated by content, and then placed in one batch.
+    Files already in the store with the same content are skipped; different content under the same
+    store path is reported as a conflict and left in place.
+
+    Returns:
+        List[PublishItem]: The files which were newly added to the store.
+    """
+    if not file_name_regex:
+        file_name_regex = PUBLISH_FILE_NAME_REGEX
+    os.makedirs(store_dir, exist_ok=True)
+    store_index = SymbolStoreIndex(store_dir)
+    pdb_index = PdbStoreIndex(store_dir, readPdbSignatureTuple)
+
+    source_paths: List[str] = []
+    walkFiles(source_dir, lambda root, path: source_paths.append(path), file_name_regex)
+    store_abs = os.path.abspath(store_dir)
+    source_paths = [p for p in source_paths if not os.path.abspath(p).startswith(store_abs + os.sep)]
+    printInfo(f'Publishing {len(source_paths)} files into "{store_dir}"')
+
+    def describe(path: str) -> PublishItem | None:
+        try:
+            item = __describeFile(path)
+        except (PeFormatException, PdbFormatException) as ex:
+            printLog(f'Skipping {path}: {ex}')
+            return None
+        if item:
+            item.size = os.path.getsize(path)
+            item.sha256 = calculateFileHash(path)
+        return item
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        items = [item for item in executor.map(describe, source_paths) if item]
+
+    planned: Dict[str, PublishItem] = { }
+    duplicates: List[PublishItem] = []
+    conflicts = 0
+    for item in items:
+        key = SymbolStoreIndex.makeKey(item.request)
+        if key in planned:
+            if planned[key].sha256 != item.sha256:
+                printError(f'Conflicting content for {item.request.getRelativePath()}: "{planned[key].source_path}" & "{item.source_path}"')
+                conflicts += 1
+            else:
+                duplicates.append(item)
+            continue
+        destination = os.path.join(store_dir, item.request.getRelativePath())
+        if os.path.exists(destination):
+            existing = store_index.lookup(item.request)
+            existing_hash = existing['sha256'] if existing and existing['size'] == os.path.getsize(destination) else calculateFileHash(destination)
+            if existing_hash != item.sha256:
+                printError(f'File conflict {destination} & {item.source_path}')
+                conflicts += 1
+            else:
+                duplicates.append(item)
+            continue
+        planned[key] = item
+
+    published: List[PublishItem] = []
+    for item in planned.values():
+        destination = os.path.join(store_dir, item.request.getRelativePath())
+        try:
+            __placeFile(item, destination, move_files)
+        except OSError as ex:
+            printError(f'Failed to publish {item.source_path}: {ex}')
+            continue
+        store_index.add(item)
+        if item.kind == 'pdb':
+            pdb_index.record(destination, item.pdb_signature, item.pdb_age)
+        published.append(item)
+        printLog(f'Published {item.request.getRelativePath()}')
+
+    if move_files:
+        for item in duplicates:
+            os.remove(item.source_path)
+
+    store_index.save()
+    pdb_index.save()
+    marker = os.path.join(store_dir, SYMBOL_STORE_MARKER_FILE)
+    if not os.path.exists(marker):
+        with open(marker, 'w') as f:
+            f.write('Symbol store created by Windows Symbols Manager\n')
+
+    printSuccess(f'Published {len(published)} files ({len(duplicates)} duplicates skipped, {conflicts} conflicts)')
+    return published
@@ -0,0 +1,255 @@
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import NoneType
+from typing import Dict, Iterable, List
+import requests
+from src.externals.proc import ExternalProcedureException
+from src.externals.z7 import z7ExtractFiles
+from src.symbols.pdb import PdbFormatException, readPdbSignature
+from src.symbols.pe import PeFormatException, isPeFile, readPeDebugInfo
+from src.utils.http import DEFAULT_TIMEOUT, createSession
+from src.utils.printer import printError, printLog, printSuccess
+from src.utils.settings import getLocalPdbsDirectory, getRemotePdbStore
+from src.utils.utils import SymbolManagerException, walkFiles
+
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DEFAULT_MAX_WORKERS = 8
+PART_SUFFIX = '.part'
+
+
+class SymbolServerException(SymbolManagerException):
+    pass
+
+
+class SymbolRequest:
+    """
+    A single file in a symbol server, addressed as `name/KEY/name`.
+
+    For PDBs the key is GUID+age, for binaries it is TIMESTAMP+SizeOfImage.
+    """
+    def __init__(self, file_name: str, store_key: str) -> NoneType:
+        self.file_name = file_name
+        self.store_key = store_key
+
+    def getRelativePath(self) -> str:
+        return os.path.join(self.file_name, self.store_key, self.file_name)
+
+    def getUrlPath(self, compressed: bool = False) -> str:
+        file_name = self.file_name[:-1] + '_' if compressed else self.file_name
+        return f'{self.file_name}/{self.store_key}/{file_name}'
+
+    def __eq__(self, other):
+        if not isinstance(other, SymbolRequest):
+            return False
+        return self.file_name.lower() == other.file_name.lower() and self.store_key.upper() == other.store_key.upper()
+
+    def __hash__(self):
+        return hash((self.file_name.lower(), self.store_key.upper()))
+
+    def __repr__(self) -> str:
+        return f'SymbolRequest({self.file_name}, {self.store_key})'
+
+
+def makePdbRequest(pdb_name: str, signature: str, age: int) -> SymbolRequest:
+    return SymbolRequest(pdb_name, f'{signature.upper()}{age:X}')
+
+
+class SymbolServerFetcher:
+    """
+    Downloads files from a symbol server into a local store using the SRV* layout.
+
+    Downloads go to a `.part` file next to their destination and resume from it if interrupted.
+    Compressed (`.pd_`, CAB) responses are expanded, a fetched PDB must have the GUID and age of its
+    key, and the finished file is moved into place atomically, so the store never holds a partial
+    (or wrong) file under its final name.
+
+    Example:
+        ```python
+        fetcher = SymbolServerFetcher('https://msdl.microsoft.com/download/symbols', 'PDBs')
+        results = fetcher.fetchMany([makePdbRequest('ntkrnlmp.pdb', 'ABCD...', 1)])
+        ```
+    """
+    def __init__(self, server_url: str = None, local_store: str = None, max_workers: int = DEFAULT_MAX_WORKERS) -> NoneType:
+        self.server_url = (server_url if server_url else getRemotePdbStore()).rstrip('/')
+        self.local_store = local_store if local_store else getLocalPdbsDirectory()
+        self.max_workers = max_workers
+        self.session = createSession(max_workers)
+        # Request -> [its lock, the fetches holding or waiting on it], dropped once no fetch needs it
+        self.in_flight: Dict[SymbolRequest, list] = { }
+        self.in_flight_lock = threading.Lock()
+
+    def getLocalPath(self, request: SymbolRequest) -> str:
+        return os.path.join(self.local_store, request.getRelativePath())
+
+    def __acquireRequest(self, request: SymbolRequest) -> threading.Lock:
+        with self.in_flight_lock:
+            entry = self.in_flight.setdefault(request, [threading.Lock(), 0])
+            entry[1] += 1
+            return entry[0]
+
+    def __releaseRequest(self, request: SymbolRequest):
+        with self.in_flight_lock:
+            entry = self.in_flight[request]
+            entry[1] -= 1
+            if not entry[1]:
+                del self.in_flight[request]
+
+    def __downloadToPart(self, url: str, part_path: str) -> bool:
+        """
+        Downloads `url` into `part_path`, resuming from its current size.
+
+        Returns:
+            bool: False if the server does not have the file.
+        """
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {'Range': f'bytes={offset}-'} if offset else { }
+        with self.session.get(url, headers=headers, stream=True, timeout=DEFAULT_TIMEOUT) as response:
+            if response.status_code == 404:
+                return False
+            if response.status_code == 416:
+                # The part file already holds the entire file
+                return True
+            if not response.ok:
+                raise SymbolServerException(f'Symbol server returned {response.status_code} for {url}')
+            mode = 'ab' if response.status_code == 206 else 'wb'
+            with open(part_path, mode) as f:
+                for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+        return True
+
+    def __expandCompressed(self, compressed_path: str, expanded_dir: str, request: SymbolRequest) -> str:
+        os.makedirs(expanded_dir, exist_ok=True)
+        try:
+            extracted = z7ExtractFiles(compressed_path, expanded_dir)
+        except ExternalProcedureException as ex:
+            raise SymbolServerException(f'Failed to expand compressed {request.file_name}: {ex}')
+        if len(extracted) != 1:
+            raise SymbolServerException(f'Compressed {request.file_name} held {len(extracted)} files')
+        return os.path.join(expanded_dir, extracted[0])
+
+    def __verify(self, path: str, request: SymbolRequest):
+        """
+        Deletes a fetched PDB whose GUID and age are not those of the requested key.
+        """
+        if not request.file_name.lower().endswith('.pdb'):
+            return
+        try:
+            signature = readPdbSignature(path)
+        except PdbFormatException as ex:
+            os.remove(path)
+            raise SymbolServerException(f'Fetched {request.getRelativePath()} is not a valid PDB: {ex}')
+        store_key = f'{signature.signature}{signature.age:X}'
+        if store_key != request.store_key.upper():
+            os.remove(path)
+            raise SymbolServerException(f'Fetched {request.getRelativePath()} is the PDB of {store_key} instead')
+
+    def fetch(self, request: SymbolRequest) -> str:
+        """
+        Makes sure the requested file exists in the local store, downloading it if needed.
+
+        Returns:
+            str: The local path of the file.
+        """
+        lock = self.__acquireRequest(request)
+        try:
+            with lock:
+                return self.__fetchLocked(request)
+        finally:
+            self.__releaseRequest(request)
+
+    def __fetchLocked(self, request: SymbolRequest) -> str:
+        local_path = self.getLocalPath(request)
+        if os.path.exists(local_path):
+            return local_path
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        part_path = local_path + PART_SUFFIX
+        url = f'{self.server_url}/{request.getUrlPath()}'
+        printLog(f'Fetching {url}')
+        if self.__downloadToPart(url, part_path):
+            self.__verify(part_path, request)
+            os.replace(part_path, local_path)
+            return local_path
+
+        compressed_part_path = local_path[:-1] + '_' + PART_SUFFIX
+        url = f'{self.server_url}/{request.getUrlPath(compressed=True)}'
+        printLog(f'Fetching {url}')
+        if not self.__downloadToPart(url, compressed_part_path):
+            try:
+                os.removedirs(os.path.dirname(local_path))
+            except OSError:
+                pass
+            raise SymbolServerException(f'{request.getRelativePath()} is not available on {self.server_url}')
+        # A compressed file which fails to expand (or to verify) is downloaded again next time
+        expanded_dir = compressed_part_path + '.d'
+        try:
+            expanded_path = self.__expandCompressed(compressed_part_path, expanded_dir, request)
+            self.__verify(expanded_path, request)
+            os.replace(expanded_path, local_path)
+        finally:
+            shutil.rmtree(expanded_dir, ignore_errors=True)
+            os.remove(compressed_part_path)
+        return local_path
+
+    def fetchMany(self, requests_to_fetch: Iterable[SymbolRequest]) -> Dict[SymbolRequest, str | Exception]:
+        """
+        Fetches many files concurrently (bounded by `max_workers`).
+
+        Returns:
+            Dict[SymbolRequest, str | Exception]: The local path, or the error, of every request.
+        """
+        unique_requests = list(dict.fromkeys(requests_to_fetch))
+        results: Dict[SymbolRequest, str | Exception] = { }
+
+        def fetchOne(request: SymbolRequest):
+            try:
+                results[request] = self.fetch(request)
+            except (SymbolManagerException, requests.RequestException, OSError) as ex:
+                results[request] = ex
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            list(executor.map(fetchOne, unique_requests))
+        return results
+
+
+g_fetcher: SymbolServerFetcher | None = None
+
+
+def getSymbolServerFetcher() -> SymbolServerFetcher:
+    global g_fetcher
+    if g_fetcher is None or g_fetcher.server_url != getRemotePdbStore().rstrip('/') or g_fetcher.local_store != getLocalPdbsDirectory():
+        g_fetcher = SymbolServerFetcher()
+    return g_fetcher
+
+
+def downloadPdbsForDirectory(root_dir: str, file_name_regex: str = None, max_workers: int = DEFAULT_MAX_WORKERS) -> List[str]:
+    """
+    Downloads the PDB of every PE file under `root_dir` into the local PDB store.
+    """
+    if not file_name_regex:
+        file_name_regex = r'.*\.((exe)|(dll)|(sys))$'
+    pdb_requests: List[SymbolRequest] = []
+
+    def collect(root: str, path: str):
+        if not isPeFile(path):
+            return
+        try:
+            info = readPeDebugInfo(path)
+        except PeFormatException as ex:
+            printLog(f'Skipping {path}: {ex}')
+            return
+        if info.pdb_signature:
+            pdb_requests.append(makePdbRequest(info.pdb_name, info.pdb_signature, info.pdb_age))
+
+    walkFiles(root_dir, collect, file_name_regex)
+    fetcher = SymbolServerFetcher(max_workers=max_workers)
+    downloaded = []
+    for request, result in fetcher.fetchMany(pdb_requests).items():
+        if isinstance(result, Exception):
+            printError(f'Failed to download {request.getRelativePath()}: {result}')
+        else:
+            downloaded.append(result)
+    printSuccess(f'{len(downloaded)} of {len(set(pdb_requests))} PDBs are available in {fetcher.local_store}')
+    return downloaded
@@ -0,0 +1,228 @@
+import hashlib
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import NoneType
+from typing import List
+import requests
+import tqdm
+from src.utils.http import DEFAULT_TIMEOUT, getSession
+from src.utils.json_store import JsonStore
+from src.utils.metrics import BYTES_WRITTEN, DOWNLOADS
+from src.utils.printer import printLog
+from src.utils.settings import isVerboseMode
+from src.utils.utils import SymbolManagerException
+
+
+SEGMENT_SIZE = 32 * 1024 * 1024
+BUFFER_SIZE = 4 * 1024 * 1024
+# Segment progress is persisted at least this often
+STATE_SAVE_INTERVAL = 16 * 1024 * 1024
+DEFAULT_SEGMENT_WORKERS = 4
+SEGMENT_ATTEMPTS = 3
+PART_SUFFIX = '.part'
+STATE_SUFFIX = '.part.json'
+DOWNLOAD_STATE_VERSION = 1
+
+
+class DownloadException(SymbolManagerException):
+    pass
+
+
+class DownloadSegment:
+    def __init__(self, start: int, end: int, written: int = 0) -> NoneType:
+        # `end` is exclusive
+        self.start = start
+        self.end = end
+        self.written = written
+
+    def isDone(self) -> bool:
+        return self.start + self.written >= self.end
+
+
+class SegmentedDownload:
+    """
+    Downloads a file over HTTP in parallel Range segments into a preallocated `.part` file.
+
+    Segment progress is kept in a `.part.json` file next to it, so an interrupted download
+    resumes where each segment stopped. Once every segment is done the size and (optionally)
+    SHA1 are verified and the file is atomically renamed to its destination.
+    Servers which do not support ranges are downloaded as one stream.
+
+    Example:
+        ```python
+        SegmentedDownload(url, 'Windows 10 22H2 x64 - KB5031356 - 2023-10.msu', expected_sha1=sha1).run()
+        ```
+    """
+    def __init__(self, url: str, destination: str, expected_size: int = None, expected_sha1: str = None, workers: int = DEFAULT_SEGMENT_WORKERS, session: requests.Session = None) -> NoneType:
+        self.url = url
+        self.destination = destination
+        self.expected_size = expected_size
+        self.expected_sha1 = expected_sha1.lower() if expected_sha1 else None
+        self.workers = workers
+        self.session = session if session else getSession()
+        self.part_path = destination + PART_SUFFIX
+        self.state_path = destination + STATE_SUFFIX
+        self.state_store = JsonStore(self.state_path, DOWNLOAD_STATE_VERSION, None, 'download state')
+        self.size = 0
+        self.segments: List[DownloadSegment] = []
+        self.state_lock = threading.Lock()
+        self.unsaved_bytes = 0
+        self.progress: tqdm.tqdm | None = None
+
+    def __probe(self) -> bool:
+        """
+        Finds the size of the file.
+
+        Returns:
+            bool: True if the server supports Range requests.
+        """
+        with self.session.get(self.url, headers={'Range': 'bytes=0-0'}, stream=True, timeout=DEFAULT_TIMEOUT) as response:
+            if not response.ok:
+                raise DownloadException(f'Server returned {response.status_code} for {self.url}')
+            content_range = re.match(r'bytes\s+0-0/(\d+)', response.headers.get('Content-Range', ''))
+            if response.status_code == 206 and content_range:
+                self.size = int(content_range.group(1))
+                return True
+            self.size = int(response.headers.get('Content-Length', 0))
+            return False
+
+    def __loadState(self) -> bool:
+        if not os.path.exists(self.state_path) or not os.path.exists(self.part_path):
+            return False
+        state = self.state_store.load()
+        if state is None or state.get('url') != self.url or state.get('size') != self.size:
+            return False
+        if os.path.getsize(self.part_path) != self.size:
+            return False
+        self.segments = [DownloadSegment(*segment) for segment in state['segments']]
+        return True
+
+    def __saveState(self):
+        self.state_store.write({
+            'url': self.url,
+            'size': self.size,
+            'segments': [[segment.start, segment.end, segment.written] for segment in self.segments],
+        })
+
+    def __preallocate(self):
+        self.segments = [DownloadSegment(start, min(start + SEGMENT_SIZE, self.size)) for start in range(0, self.size, SEGMENT_SIZE)]
+        with open(self.part_path, 'wb') as f:
+            f.truncate(self.size)
+        self.__saveState()
+
+    def __advance(self, segment: DownloadSegment, length: int):
+        with self.state_lock:
+            segment.written += length
+            self.unsaved_bytes += length
+            if self.progress is not None:
+                self.progress.update(length)
+
+    def __checkpoint(self, force: bool = False):
+        with self.state_lock:
+            if force or self.unsaved_bytes >= STATE_SAVE_INTERVAL:
+                self.__saveState()
+                self.unsaved_bytes = 0
+
+    def __downloadSegment(self, segment: DownloadSegment):
+        for attempt in range(SEGMENT_ATTEMPTS):
+            try:
+                return self.__downloadSegmentOnce(segment)
+            except (requests.RequestException, DownloadException) as ex:
+                if attempt + 1 == SEGMENT_ATTEMPTS:
+                    raise
+                printLog(f'Retrying segment {segment.start}-{segment.end} of {os.path.basename(self.destination)}: {ex}')
+
+    def __downloadSegmentOnce(self, segment: DownloadSegment):
+        if segment.isDone():
+            return
+        offset = segment.start + segment.written
+        headers = {'Range': f'bytes={offset}-{segment.end - 1}'}
+        with self.session.get(self.url, headers=headers, stream=True, timeout=DEFAULT_TIMEOUT) as response:
+            if response.status_code != 206:
+                raise DownloadException(f'Server returned {response.status_code} for a range of {self.url}')
+            with open(self.part_path, 'r+b', buffering=0) as f:
+                f.seek(offset)
+                for chunk in response.iter_content(BUFFER_SIZE):
+                    chunk = chunk[:segment.end - (segment.start + segment.written)]
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    self.__advance(segment, len(chunk))
+                    self.__checkpoint()
+        if not segment.isDone():
+            raise DownloadException(f'Segment {segment.start}-{segment.end} of {self.url} ended early')
+
+    def __downloadStream(self):
+        with self.session.get(self.url, stream=True, timeout=DEFAULT_TIMEOUT) as response:
+            if not response.ok:
+                raise DownloadException(f'Server returned {response.status_code} for {self.url}')
+            with open(self.part_path, 'wb') as f:
+                for chunk in response.iter_content(BUFFER_SIZE):
+                    f.write(chunk)
+                    if self.progress is not None:
+                        self.progress.update(len(chunk))
+
+    def __verify(self):
+        actual_size = os.path.getsize(self.part_path)
+        if self.size and actual_size != self.size:
+            raise DownloadException(f'Downloaded {actual_size} bytes of {self.url}, expected {self.size}')
+        if self.expected_sha1:
+            sha1 = hashlib.sha1()
+            with open(self.part_path, 'rb') as f:
+                while chunk := f.read(BUFFER_SIZE):
+                    sha1.update(chunk)
+            if sha1.hexdigest() != self.expected_sha1:
+                raise DownloadException(f'SHA1 mismatch for {self.url}: {sha1.hexdigest()} != {self.expected_sha1}')
+
+    def __discard(self):
+        for path in (self.part_path, self.state_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def run(self) -> str:
+        """
+        Returns:
+            str: The destination path.
+        """
+        supports_ranges = self.__probe()
+        if self.expected_size is not None and self.size and self.size != self.expected_size:
+            raise DownloadException(f'{self.url} is {self.size} bytes, expected {self.expected_size}')
+        if isVerboseMode():
+            self.progress = tqdm.tqdm(total=self.size, unit='iB', unit_scale=True, colour='yellow')
+        try:
+            if supports_ranges and self.size:
+                if self.__loadState():
+                    printLog(f'Resuming download of {os.path.basename(self.destination)}')
+                    if self.progress is not None:
+                        self.progress.update(sum(segment.written for segment in self.segments))
+                else:
+                    self.__preallocate()
+                try:
+                    with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                        list(executor.map(self.__downloadSegment, self.segments))
+                finally:
+                    self.__checkpoint(force=True)
+            else:
+                self.__downloadStream()
+        finally:
+            if self.progress is not None:
+                self.progress.close()
+
+        try:
+            self.__verify()
+        except DownloadException:
+            self.__discard()
+            raise
+        os.replace(self.part_path, self.destination)
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+        return self.destination
+
+
+def downloadFile(url: str, destination: str, expected_size: int = None, expected_sha1: str = None, workers: int = DEFAULT_SEGMENT_WORKERS, session: requests.Session = None) -> str:
+    path = SegmentedDownload(url, destination, expected_size, expected_sha1, workers, session).run()
+    DOWNLOADS.inc()
+    BYTES_WRITTEN.inc(os.path.getsize(path), stage='download')
+    return path
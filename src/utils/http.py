@@ -0,0 +1,150 @@
+import email.utils
+import random
+import threading
+import time
+import urllib.parse
+from types import NoneType
+from typing import Dict, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+from src.utils.printer import printLog
+
+
+DEFAULT_POOL_SIZE = 16
+DEFAULT_TIMEOUT = (15, 120)
+DEFAULT_RETRIES = 4
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+# Longest `Retry-After` a server may impose on a single attempt
+RETRY_AFTER_CAP = 300.0
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+RETRY_EXCEPTIONS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+
+# (requests per second, burst) of every host, hosts which are not listed get `DEFAULT_HOST_RATE_LIMIT`
+HOST_RATE_LIMITS: Dict[str, Tuple[float, int]] = {
+    'www.catalog.update.microsoft.com': (2.0, 4),
+    'catalog.update.microsoft.com': (2.0, 4),
+    'support.microsoft.com': (1.0, 2),
+    'm417z.com': (4.0, 8),
+    'winbindex.m417z.com': (4.0, 8),
+    'msdl.microsoft.com': (8.0, 16),
+}
+DEFAULT_HOST_RATE_LIMIT = (8.0, 16)
+
+g_session: requests.Session | None = None
+g_session_lock = threading.Lock()
+
+
+def computeBackoff(attempt: int, base: float = BACKOFF_BASE, cap: float = BACKOFF_CAP) -> float:
+    """
+    Exponential backoff with full jitter, so clients which failed together do not retry together.
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def parseRetryAfter(response: requests.Response) -> float:
+    retry_after = response.headers.get('Retry-After', '').strip()
+    if not retry_after:
+        return 0.0
+    if retry_after.isdigit():
+        return min(float(retry_after), RETRY_AFTER_CAP)
+    try:
+        return min(max(email.utils.parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0), RETRY_AFTER_CAP)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class TokenBucket:
+    """
+    Allows `rate` acquisitions per second on average and bursts of up to `burst`.
+    """
+    def __init__(self, rate: float, burst: int) -> NoneType:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+g_host_buckets: Dict[str, TokenBucket] = { }
+g_host_buckets_lock = threading.Lock()
+
+
+def getHostBucket(host: str) -> TokenBucket:
+    host = host.lower()
+    with g_host_buckets_lock:
+        if host not in g_host_buckets:
+            g_host_buckets[host] = TokenBucket(*HOST_RATE_LIMITS.get(host, DEFAULT_HOST_RATE_LIMIT))
+        return g_host_buckets[host]
+
+
+class ResilientSession(requests.Session):
+    """
+    A requests session which is rate limited per host and retries transient failures.
+
+    Every request first takes a token from its host's bucket (shared by all sessions in the process).
+    Connection errors, timeouts and 429/5xx responses are retried `retries` times with jittered
+    exponential backoff, honoring `Retry-After`. Requests without a timeout get `DEFAULT_TIMEOUT`.
+
+    Example:
+        ```python
+        response = ResilientSession().get('https://www.catalog.update.microsoft.com/Search.aspx?q=KB5031354')
+        ```
+    """
+    def __init__(self, retries: int = DEFAULT_RETRIES) -> NoneType:
+        super().__init__()
+        self.retries = retries
+
+    def request(self, method, url, *args, **kwargs) -> requests.Response:
+        kwargs.setdefault('timeout', DEFAULT_TIMEOUT)
+        bucket = getHostBucket(urllib.parse.urlsplit(url).netloc)
+        for attempt in range(self.retries + 1):
+            bucket.acquire()
+            try:
+                response = super().request(method, url, *args, **kwargs)
+            except RETRY_EXCEPTIONS as ex:
+                if attempt == self.retries:
+                    raise
+                delay = computeBackoff(attempt)
+                printLog(f'{method} {url} failed ({ex}), retrying in {delay:.1f}s')
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt == self.retries:
+                    return response
+                delay = max(computeBackoff(attempt), parseRetryAfter(response))
+                printLog(f'{method} {url} returned {response.status_code}, retrying in {delay:.1f}s')
+                response.close()
+            time.sleep(delay)
+
+
+def createSession(pool_size: int = DEFAULT_POOL_SIZE, retries: int = DEFAULT_RETRIES) -> requests.Session:
+    """
+    Creates a rate limited, retrying session whose connection pool can serve `pool_size` concurrent requests per host.
+    """
+    session = ResilientSession(retries)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def getSession() -> requests.Session:
+    """
+    Returns the process wide session, so connections are reused across subsystems.
+    """
+    global g_session
+    with g_session_lock:
+        if g_session is None:
+            g_session = createSession()
+        return g_session
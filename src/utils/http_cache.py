@@ -0,0 +1,216 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from types import NoneType
+from typing import Dict, List, Tuple
+import requests
+from src.utils.http import DEFAULT_TIMEOUT, getSession
+from src.utils.metrics import HTTP_CACHE_REQUESTS
+from src.utils.settings import getHttpCacheDirectory, isOfflineMode
+from src.utils.utils import SymbolManagerException
+
+
+HTTP_CACHE_VERSION = 1
+
+TTL_UPDATE_HISTORY = 7 * 24 * 60 * 60
+TTL_CATALOG_DIALOG = 24 * 60 * 60
+TTL_CATALOG_SEARCH = 60 * 60
+
+# (url regex, seconds) - the first match decides how long a response stays fresh
+CACHE_TTL_RULES: List[Tuple[str, int]] = [
+    (r'^https?://support\.microsoft\.com/', TTL_UPDATE_HISTORY),
+    (r'/DownloadDialog\.aspx', TTL_CATALOG_DIALOG),
+    (r'/Search\.aspx', TTL_CATALOG_SEARCH),
+]
+
+REVALIDATION_HEADERS = ('ETag', 'Last-Modified')
+
+
+class HttpCacheMissException(SymbolManagerException):
+    pass
+
+
+class CachedResponse:
+    """
+    The parts of a `requests.Response` our callers use, backed by a cache entry.
+    """
+    def __init__(self, url: str, status_code: int, headers: Dict[str, str], content: bytes, encoding: str = None, from_cache: bool = False) -> NoneType:
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.encoding = encoding if encoding else 'utf-8'
+        self.from_cache = from_cache
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.status_code < 400
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding, errors='replace')
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise requests.HTTPError(f'{self.status_code} for url {self.url}')
+
+
+def getCacheTtl(url: str) -> int:
+    for pattern, ttl in CACHE_TTL_RULES:
+        if re.search(pattern, url, re.IGNORECASE):
+            return ttl
+    return 0
+
+
+class HttpCache:
+    """
+    An on-disk cache of HTTP responses keyed by method, URL and body.
+
+    Fresh entries (see `CACHE_TTL_RULES`) are served without touching the network. Stale entries
+    are revalidated with `If-None-Match`/`If-Modified-Since` when the server sent a validator.
+    In offline mode every request is served from the cache, regardless of age, and a miss raises
+    `HttpCacheMissException` - so runs can be reproduced exactly.
+
+    Example:
+        ```python
+        cache = HttpCache('.http_cache')
+        html = cache.request('GET', 'https://www.catalog.update.microsoft.com/Search.aspx?q=KB5031354').text
+        ```
+    """
+    def __init__(self, cache_dir: str, offline: bool = False) -> NoneType:
+        self.cache_dir = cache_dir
+        self.offline = offline
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.stats_lock = threading.Lock()
+
+    @staticmethod
+    def makeKey(method: str, url: str, body: bytes | str | Dict | None = None) -> str:
+        if isinstance(body, dict):
+            body = json.dumps(body, sort_keys=True)
+        if isinstance(body, str):
+            body = body.encode()
+        digest = hashlib.sha256()
+        digest.update(method.upper().encode())
+        digest.update(b'\0')
+        digest.update(url.encode())
+        digest.update(b'\0')
+        digest.update(body if body else b'')
+        return digest.hexdigest()
+
+    def __entryPaths(self, key: str) -> Tuple[str, str]:
+        entry_dir = os.path.join(self.cache_dir, key[:2])
+        return os.path.join(entry_dir, key + '.json'), os.path.join(entry_dir, key + '.body')
+
+    def __load(self, key: str) -> Tuple[dict, bytes] | None:
+        meta_path, body_path = self.__entryPaths(key)
+        try:
+            with open(meta_path, 'r', encoding='UTF-8') as f:
+                meta = json.load(f)
+            if meta.get('version') != HTTP_CACHE_VERSION:
+                return None
+            with open(body_path, 'rb') as f:
+                return meta, f.read()
+        except (OSError, ValueError):
+            return None
+
+    def __store(self, key: str, meta: dict, content: bytes | None):
+        meta_path, body_path = self.__entryPaths(key)
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        suffix = f'.{os.getpid()}.{threading.get_ident()}.tmp'
+        if content is not None:
+            with open(body_path + suffix, 'wb') as f:
+                f.write(content)
+            os.replace(body_path + suffix, body_path)
+        meta['version'] = HTTP_CACHE_VERSION
+        with open(meta_path + suffix, 'w', encoding='UTF-8') as f:
+            json.dump(meta, f)
+        os.replace(meta_path + suffix, meta_path)
+
+    def __count(self, counter: str):
+        with self.stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+        HTTP_CACHE_REQUESTS.inc(result=counter)
+
+    def request(self, method: str, url: str, data: Dict | str | None = None, ttl: int = None, session: requests.Session = None, **kwargs) -> CachedResponse:
+        """
+        Performs a request through the cache. Only successful responses are cached.
+
+        Args:
+            ttl (int, optional): Seconds a response stays fresh. Defaults to `getCacheTtl(url)`.
+            session (requests.Session, optional): Session for network requests. Defaults to the process wide session.
+        """
+        method = method.upper()
+        ttl = getCacheTtl(url) if ttl is None else ttl
+        key = self.makeKey(method, url, data)
+        cached = self.__load(key)
+
+        if self.offline:
+            if cached is None:
+                raise HttpCacheMissException(f'{method} {url} is not cached (offline mode)')
+            self.__count('hits')
+            return self.__toResponse(cached, url)
+
+        if cached is not None and time.time() - cached[0]['fetched_at'] < ttl:
+            self.__count('hits')
+            return self.__toResponse(cached, url)
+
+        headers = dict(kwargs.pop('headers', None) or { })
+        if cached is not None and method == 'GET':
+            if cached[0]['headers'].get('ETag'):
+                headers['If-None-Match'] = cached[0]['headers']['ETag']
+            if cached[0]['headers'].get('Last-Modified'):
+                headers['If-Modified-Since'] = cached[0]['headers']['Last-Modified']
+
+        kwargs.setdefault('timeout', DEFAULT_TIMEOUT)
+        response = (session if session else getSession()).request(method, url, data=data, headers=headers, **kwargs)
+
+        if response.status_code == 304 and cached is not None:
+            meta, content = cached
+            meta['fetched_at'] = time.time()
+            self.__store(key, meta, None)
+            self.__count('revalidated')
+            return self.__toResponse((meta, content), url)
+
+        self.__count('misses')
+        result = CachedResponse(url, response.status_code, dict(response.headers), response.content, response.encoding)
+        if response.ok and ttl > 0:
+            self.__store(key, {
+                'method': method,
+                'url': url,
+                'status_code': response.status_code,
+                'encoding': response.encoding,
+                'headers': {h: response.headers[h] for h in REVALIDATION_HEADERS if h in response.headers},
+                'fetched_at': time.time(),
+            }, response.content)
+        return result
+
+    def __toResponse(self, cached: Tuple[dict, bytes], url: str) -> CachedResponse:
+        meta, content = cached
+        return CachedResponse(url, meta['status_code'], meta['headers'], content, meta.get('encoding'), from_cache=True)
+
+    def get(self, url: str, **kwargs) -> CachedResponse:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, data: Dict | str | None = None, **kwargs) -> CachedResponse:
+        return self.request('POST', url, data=data, **kwargs)
+
+
+g_http_cache: HttpCache | None = None
+g_http_cache_lock = threading.Lock()
+
+
+def getHttpCache() -> HttpCache:
+    """
+    Returns the process wide cache, following the cache directory and offline settings.
+    """
+    global g_http_cache
+    with g_http_cache_lock:
+        if g_http_cache is None or g_http_cache.cache_dir != getHttpCacheDirectory():
+            g_http_cache = HttpCache(getHttpCacheDirectory())
+        g_http_cache.offline = isOfflineMode()
+        return g_http_cache
@@ -0,0 +1,92 @@
+import json
+import os
+from types import NoneType
+from typing import Any, Dict
+from src.utils.printer import printError, printLog
+
+
+class JsonStore:
+    """
+    A versioned JSON file which an index, ledger or queue persists its state in.
+
+    The state is kept under `field` next to a `version`, a file of another version (or which
+    fails to parse) loads as empty. Writes go through a `.tmp` file and `os.replace`, so a reader
+    never sees a partial file. Changes are counted with `markDirty`, which tells the owner when
+    `save_interval` changes went unsaved, so an interrupted run keeps its progress.
+
+    Files shared by several consumers are split into sections (`field` maps section -> state).
+    `saveSection` re-reads the file and only replaces its own section, so consumers which loaded
+    the file at the same time do not drop each other's changes.
+
+    The owner serializes calls with its own lock, if it has one.
+
+    Example:
+        ```python
+        store = JsonStore(os.path.join(output_dir, '.sort_ledger.json'), 1, 'sections', 'sort ledger', save_interval=64)
+        entries = store.load({ }).get('bin', { })
+        entries[key] = entry
+        if store.markDirty():
+            store.saveSection('bin', entries)
+        ```
+    """
+    def __init__(self, file_path: str, version: int, field: str | None, description: str, save_interval: int = 0, indent: int | None = None) -> NoneType:
+        self.file_path = file_path
+        self.version = version
+        # None keeps the state's keys at the top level, next to the version
+        self.field = field
+        self.description = description
+        self.save_interval = save_interval
+        self.indent = indent
+        self.dirty = False
+        self.changes_since_save = 0
+
+    def load(self, default: Any = None) -> Any:
+        if not os.path.exists(self.file_path):
+            return default
+        try:
+            with open(self.file_path, 'r', encoding='UTF-8') as f:
+                data = json.load(f)
+            if data.get('version') != self.version:
+                printLog(f'Ignoring {self.description} with unknown version "{self.file_path}"')
+                return default
+            if self.field is None:
+                data.pop('version')
+                return data
+            return data.get(self.field, default)
+        except (OSError, ValueError) as ex:
+            printError(f'Failed to read {self.description} "{self.file_path}": {ex}')
+            return default
+
+    def markDirty(self) -> bool:
+        """
+        Returns:
+            bool: True once `save_interval` changes are unsaved.
+        """
+        self.dirty = True
+        self.changes_since_save += 1
+        return bool(self.save_interval) and self.changes_since_save >= self.save_interval
+
+    def write(self, value: Any):
+        """
+        Writes `value` whether or not it changed.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self.file_path)), exist_ok=True)
+        data = {'version': self.version, **value} if self.field is None else {'version': self.version, self.field: value}
+        tmp_path = self.file_path + '.tmp'
+        with open(tmp_path, 'w', encoding='UTF-8') as f:
+            json.dump(data, f, indent=self.indent)
+        os.replace(tmp_path, self.file_path)
+        self.dirty = False
+        self.changes_since_save = 0
+
+    def save(self, value: Any):
+        if self.dirty:
+            self.write(value)
+
+    def saveSection(self, section: str, value: Any):
+        if not self.dirty:
+            return
+        # Other consumers of the file saved their sections since this one was loaded
+        sections: Dict[str, Any] = self.load({ })
+        sections[section] = value
+        self.write(sections)
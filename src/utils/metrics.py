@@ -0,0 +1,218 @@
+import bisect
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from types import NoneType
+from typing import Dict, List, Tuple
+from src.utils.printer import printError
+from src.utils.settings import DEFAULT_METRICS_INTERVAL
+
+
+METRICS_PREFIX = 'symbol_manager_'
+# Seconds - from a small delta up to a full kernel image
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def formatLabels(labels: Labels, extra: Labels = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ''
+    return '{' + ','.join(name + '="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"' for name, value in pairs) + '}'
+
+
+class Counter:
+    """
+    A monotonically increasing value per label set.
+    """
+    def __init__(self, name: str, help: str) -> NoneType:
+        self.name = METRICS_PREFIX + name
+        self.help = help
+        self.values: Dict[Labels, float] = { }
+        self.lock = threading.Lock()
+
+    def inc(self, value: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def collect(self) -> Dict[Labels, float]:
+        with self.lock:
+            return dict(self.values)
+
+    def toPrometheus(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for labels, value in sorted(self.collect().items()):
+            lines.append(f'{self.name}{formatLabels(labels)} {value:g}')
+        return lines
+
+    def toDict(self) -> dict:
+        return {formatLabels(labels) or 'total': value for labels, value in self.collect().items()}
+
+
+class Histogram:
+    """
+    Counts observations into cumulative buckets, like Prometheus histograms.
+    """
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> NoneType:
+        self.name = METRICS_PREFIX + name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def collect(self) -> Tuple[List[int], float, int]:
+        with self.lock:
+            return list(self.counts), self.sum, self.count
+
+    def toPrometheus(self) -> List[str]:
+        counts, total, count = self.collect()
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'), ), counts):
+            cumulative += bucket_count
+            lines.append(f'{self.name}_bucket{formatLabels((), (("le", "+Inf" if bound == float("inf") else f"{bound:g}"), ))} {cumulative}')
+        lines.append(f'{self.name}_sum {total:g}')
+        lines.append(f'{self.name}_count {count}')
+        return lines
+
+    def toDict(self) -> dict:
+        counts, total, count = self.collect()
+        return {'buckets': dict(zip([f'{bound:g}' for bound in self.buckets] + ['+Inf'], counts)), 'sum': total, 'count': count}
+
+
+class MetricsRegistry:
+    def __init__(self) -> NoneType:
+        self.metrics: Dict[str, Counter | Histogram] = { }
+        self.lock = threading.Lock()
+
+    def counter(self, name: str, help: str) -> Counter:
+        with self.lock:
+            return self.metrics.setdefault(name, Counter(name, help))
+
+    def histogram(self, name: str, help: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        with self.lock:
+            return self.metrics.setdefault(name, Histogram(name, help, buckets))
+
+    def toPrometheus(self) -> str:
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return '\n'.join(line for metric in metrics for line in metric.toPrometheus()) + '\n'
+
+    def toDict(self) -> dict:
+        with self.lock:
+            metrics = list(self.metrics.items())
+        return {name: metric.toDict() for name, metric in metrics}
+
+
+g_metrics = MetricsRegistry()
+
+MSUS_PROCESSED = g_metrics.counter('msus_processed_total', 'Updates (MSU/CAB) extrapolated, by outcome')
+PATCHES_APPLIED = g_metrics.counter('patches_applied_total', 'Files built by applying delta patches')
+BYTES_READ = g_metrics.counter('bytes_read_total', 'Bytes read from base, patch and PSF files, by stage')
+BYTES_WRITTEN = g_metrics.counter('bytes_written_total', 'Bytes written to output files, by stage')
+SUBPROCESS_SECONDS = g_metrics.counter('subprocess_seconds_total', 'Wall time spent in external processes, by command')
+SUBPROCESSES = g_metrics.counter('subprocesses_total', 'External processes started, by command')
+HTTP_CACHE_REQUESTS = g_metrics.counter('http_cache_requests_total', 'Requests through the HTTP cache, by result (hits, revalidated, misses)')
+DOWNLOADS = g_metrics.counter('downloads_total', 'Files downloaded')
+PATCH_LATENCY = g_metrics.histogram('patch_seconds', 'Time to build one file from its base and patches')
+
+
+def getMetrics() -> MetricsRegistry:
+    return g_metrics
+
+
+class MetricsExporter:
+    """
+    Writes the metrics every `interval` seconds, and once more when stopped.
+
+    Paths ending with `.prom` get the Prometheus text format, replaced atomically so the node exporter's
+    textfile collector never reads a partial file. Any other path gets a JSON object appended per
+    interval (JSON lines), stamped with the time, host and process.
+
+    Example:
+        ```python
+        with MetricsExporter('/var/lib/node_exporter/symbol_manager.prom', 15):
+            handleExtrapolateMsu(args)
+        ```
+    """
+    def __init__(self, path: str, interval: float = DEFAULT_METRICS_INTERVAL, registry: MetricsRegistry = None) -> NoneType:
+        self.path = path
+        self.interval = interval
+        self.registry = registry if registry else g_metrics
+        self.is_prometheus = path.lower().endswith('.prom')
+        self.started_at = time.time()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.__run, name='metrics-exporter', daemon=True)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+        self.write()
+
+    def __run(self):
+        while not self.stop_event.wait(self.interval):
+            self.write()
+
+    def write(self):
+        try:
+            if self.is_prometheus:
+                tmp_path = f'{self.path}.{os.getpid()}.tmp'
+                with open(tmp_path, 'w', encoding='UTF-8') as f:
+                    f.write(self.registry.toPrometheus())
+                os.replace(tmp_path, self.path)
+            else:
+                now = time.time()
+                record = {
+                    'time': now,
+                    'uptime': now - self.started_at,
+                    'host': socket.gethostname(),
+                    'pid': os.getpid(),
+                    'argv': sys.argv[1:],
+                    'metrics': self.registry.toDict(),
+                }
+                with open(self.path, 'a', encoding='UTF-8') as f:
+                    f.write(json.dumps(record) + '\n')
+        except OSError as ex:
+            printError(f'Failed to write metrics to "{self.path}": {ex}')
+
+
+g_exporter: MetricsExporter | None = None
+
+
+def startMetricsExporter(path: str, interval: float = DEFAULT_METRICS_INTERVAL) -> MetricsExporter:
+    global g_exporter
+    g_exporter = MetricsExporter(path, interval)
+    g_exporter.start()
+    return g_exporter
+
+
+def stopMetricsExporter():
+    global g_exporter
+    exporter, g_exporter = g_exporter, None
+    if exporter is not None:
+        exporter.stop()
@@ -1,21 +1,28 @@
 import subprocess
-from colorama import Fore, Style
-import tqdm
 from src.utils.settings import isVerboseMode
 
 
+def __write(s, *args, **kwargs):
+    # tqdm and colorama are imported on the first print, so a command which prints nothing (--help) does not load them
+    import tqdm
+    tqdm.tqdm.write(s, *args, **kwargs)
+
+
 def printInfo(s, *args, **kwargs):
-    tqdm.tqdm.write('[~] ' + s, *args, **kwargs)
+    __write('[~] ' + s, *args, **kwargs)
 
 
 def printLog(s, *args, **kwargs):
     if isVerboseMode():
-        tqdm.tqdm.write(Fore.YELLOW + '[=] ' + s + Style.RESET_ALL, *args, **kwargs)
+        from colorama import Fore, Style
+        __write(Fore.YELLOW + '[=] ' + s + Style.RESET_ALL, *args, **kwargs)
 
 
 def printSuccess(s, *args, **kwargs):
-    tqdm.tqdm.write(Fore.CYAN + '[+] ' + s + Style.RESET_ALL, *args, **kwargs)
+    from colorama import Fore, Style
+    __write(Fore.CYAN + '[+] ' + s + Style.RESET_ALL, *args, **kwargs)
 
 
 def printError(s, *args, **kwargs):
-    tqdm.tqdm.write(Fore.RED + '[!] ' + s + Style.RESET_ALL, *args, **kwargs)
+    from colorama import Fore, Style
+    __write(Fore.RED + '[!] ' + s + Style.RESET_ALL, *args, **kwargs)
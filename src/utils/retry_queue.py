@@ -0,0 +1,79 @@
+import os
+import threading
+import time
+from types import NoneType
+from typing import Dict, List
+from src.utils.json_store import JsonStore
+
+
+RETRY_QUEUE_FILE_NAME = '.retry_queue.json'
+RETRY_QUEUE_VERSION = 1
+
+
+class RetryItem:
+    def __init__(self, key: str, payload: dict, attempts: int = 0, last_error: str = '', updated_at: float = 0.0) -> NoneType:
+        self.key = key
+        self.payload = payload
+        self.attempts = attempts
+        self.last_error = last_error
+        self.updated_at = updated_at
+
+    def toDict(self) -> dict:
+        return {
+            'payload': self.payload,
+            'attempts': self.attempts,
+            'last_error': self.last_error,
+            'updated_at': self.updated_at,
+        }
+
+
+class RetryQueue:
+    """
+    A persistent queue of items which failed even after their requests were retried.
+
+    Items are re-attempted later in the same run and, if they keep failing, at the start of the next one.
+    An item leaves the queue once it succeeds. The queue is stored as JSON inside the output directory,
+    one section per consumer.
+
+    Example:
+        ```python
+        with RetryQueue(output_dir, 'catalog') as retry_queue:
+            for item in retry_queue.pending():
+                ...
+            retry_queue.push('update:' + update_id, {'update_id': update_id}, str(ex))
+        ```
+    """
+    def __init__(self, output_dir: str, section: str) -> NoneType:
+        self.store = JsonStore(os.path.join(output_dir, RETRY_QUEUE_FILE_NAME), RETRY_QUEUE_VERSION, 'sections', 'retry queue')
+        self.section = section
+        self.entries: Dict[str, dict] = self.store.load({ }).get(section, { })
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.save()
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.entries)
+
+    def pending(self) -> List[RetryItem]:
+        with self.lock:
+            return [RetryItem(key, **entry) for key, entry in self.entries.items()]
+
+    def push(self, key: str, payload: dict, error: str = ''):
+        with self.lock:
+            attempts = self.entries.get(key, { }).get('attempts', 0) + 1
+            self.entries[key] = RetryItem(key, payload, attempts, error, time.time()).toDict()
+            self.store.markDirty()
+
+    def remove(self, key: str):
+        with self.lock:
+            if self.entries.pop(key, None) is not None:
+                self.store.markDirty()
+
+    def save(self):
+        with self.lock:
+            self.store.saveSection(self.section, self.entries)
@@ -1,17 +1,33 @@
+import os
 import re
 from typing import List
 
 # Aliases
 
+# Defaults of command line flags, kept here so building the parser imports none of the commands' modules
+DEFAULT_EXTRAPOLATE_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+DEFAULT_EXTRAPOLATE_QUEUE_SIZE = 4
+DEFAULT_JOB_WORKERS = 4
+DEFAULT_SERVICE_WORKERS = 4
+DEFAULT_METRICS_INTERVAL = 30.0
+
 
 class Settings:
     s_output_dir = 'KernelFiles'
     s_allowed_to_download_pdbs = False
     s_local_pdbs_dir = 'PDBs'
+    s_remote_pdb_store = 'https://msdl.microsoft.com/download/symbols'
+    s_catalog_url = 'https://www.catalog.update.microsoft.com'
+    s_winbindex_url = 'https://m417z.com/winbindex-data-insider/by_filename_compressed'
+    s_http_cache_dir = '.http_cache'
+    s_offline = False
     s_keep_tmp_files = False
     s_verbose = False
     s_allowed_to_download_dynamic_updates = False
     s_download_old_updates_first = False
+    s_content_store_links = ''
+    s_archive_mode = False
+    s_archive_cache_size = 1024 * 1024 * 1024
 
 g_settings = Settings()
 
@@ -19,6 +35,18 @@ def getSettings() -> Settings:
     return g_settings
 
 
+def snapshotSettings() -> Settings:
+    snapshot = Settings()
+    snapshot.__dict__.update(getSettings().__dict__)
+    return snapshot
+
+
+def restoreSettings(snapshot: Settings):
+    settings = getSettings()
+    settings.__dict__.clear()
+    settings.__dict__.update(snapshot.__dict__)
+
+
 def isVerboseMode() -> bool:
     return getSettings().s_verbose
 
@@ -49,6 +77,18 @@ def setAllowedToDownloadPdbsMode(mode: bool = True):
     getSettings().s_allowed_to_download_pdbs = mode
 
 
+def getLocalPdbsDirectory() -> str:
+    return getSettings().s_local_pdbs_dir
+
+
+def getRemotePdbStore() -> str:
+    return getSettings().s_remote_pdb_store
+
+
+def setRemotePdbStore(url: str):
+    getSettings().s_remote_pdb_store = url
+
+
 def isAllowedToDownloadDynamicUpdates() -> bool:
     return getSettings().s_allowed_to_download_dynamic_updates
 
@@ -65,6 +105,62 @@ def setDownloadSettingsPreferOld(mode: bool = True):
     getSettings().s_download_old_updates_first = mode
 
 
+def getCatalogUrl() -> str:
+    return getSettings().s_catalog_url
+
+
+def setCatalogUrl(url: str):
+    getSettings().s_catalog_url = url.rstrip('/')
+
+
+def getWinBIndexUrl() -> str:
+    return getSettings().s_winbindex_url
+
+
+def setWinBIndexUrl(url: str):
+    getSettings().s_winbindex_url = url.rstrip('/')
+
+
+def getHttpCacheDirectory() -> str:
+    return getSettings().s_http_cache_dir
+
+
+def setHttpCacheDirectory(path: str):
+    getSettings().s_http_cache_dir = path
+
+
+def getContentStoreLinks() -> str:
+    return getSettings().s_content_store_links
+
+
+def setContentStoreLinks(link_mode: str):
+    getSettings().s_content_store_links = link_mode
+
+
+def isArchiveMode() -> bool:
+    return getSettings().s_archive_mode
+
+
+def setArchiveMode(mode: bool = True):
+    getSettings().s_archive_mode = mode
+
+
+def getArchiveCacheSize() -> int:
+    return getSettings().s_archive_cache_size
+
+
+def setArchiveCacheSize(size: int):
+    getSettings().s_archive_cache_size = size
+
+
+def isOfflineMode() -> bool:
+    return getSettings().s_offline
+
+
+def setOfflineMode(mode: bool = True):
+    getSettings().s_offline = mode
+
+
 def getInterestingFiles() -> List[str]:
     return [
         '*ntos*.exe', '*ntdll*.dll', '*ntos*.sys', 
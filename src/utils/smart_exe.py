@@ -6,12 +6,16 @@ Created: 29/09/2023
 import sys
 import os
 import re
-import pythoncom
-from win32com.client import Dispatch
+import threading
+import requests
 from src.externals.proc import run
-from src.utils.printer import printLog
+from src.symbols.pdb import PdbFormatException, readPdbSignature
+from src.symbols.pdb_index import getPdbIndex
+from src.symbols.pe import PeDebugInfo, readPeDebugInfo
+from src.symbols.symsrv import getSymbolServerFetcher, makePdbRequest
+from src.utils.printer import printError, printLog
+from src.utils.settings import getLocalPdbsDirectory, isAllowedToDownloadPdbs
 from src.utils.utils import SymbolManagerException, normalizeDirtyBitness
-pythoncom.CoInitialize()
 
 DUMPBIN_PATH = os.path.join(os.path.split(sys.argv[0])[0], r'external\dumpbin\dumpbin.exe')
 
@@ -19,6 +23,21 @@ ROOT_PDB_SEARCH_DIRS = [
     r'C:\symbols',
 ]
 
+g_com_state = threading.local()
+
+
+def getShell():
+    """
+    Returns a WScript.Shell of the calling thread. COM is only loaded (and initialized per thread) once a file's properties are queried.
+    """
+    shell = getattr(g_com_state, 'shell', None)
+    if shell is None:
+        import pythoncom
+        from win32com.client import Dispatch
+        pythoncom.CoInitialize()
+        shell = g_com_state.shell = Dispatch('WScript.Shell')
+    return shell
+
 class FileProperties:
     original_name = ''
     win_build_major = ''
@@ -27,7 +46,7 @@ class FileProperties:
 
 def getFileProperties(file_path: str, version_only:bool = False) -> FileProperties:
     properties = FileProperties()
-    shell = Dispatch('WScript.Shell')
+    shell = getShell()
     if not version_only:
         properties.original_name = shell.Exec(f"C:\\Windows\\System32\\WindowsPowerShell\\v1.0\\powershell.exe $file = Get-ChildItem '{file_path}'; $file.VersionInfo.InternalName").StdOut.ReadAll().strip()
         properties.win_build_major = shell.Exec(f"C:\\Windows\\System32\\WindowsPowerShell\\v1.0\\powershell.exe $file = Get-ChildItem '{file_path}'; $file.VersionInfo.FileBuildPart").StdOut.ReadAll().strip()
@@ -50,6 +69,26 @@ def dumpBinaryFileData(file_path: str) -> BinaryFileData:
     return data
 
 
+class PeInfo:
+    ARCH_LOCALE_MAP = {
+        'X64': 'x64',
+        'I386': 'x86'
+    }
+    def __init__(self, pe_info: PeDebugInfo):
+        if not pe_info.pdb_signature:
+            raise SymbolManagerException(f'Failed to get PE info!')
+        self.m_pdb_name = pe_info.pdb_name
+        self.m_pdb_sig_70 = pe_info.pdb_signature
+        self.m_pdb_age = pe_info.pdb_age
+        self.m_pdb_classic_path = os.path.join(self.m_pdb_name, pe_info.getPdbStoreKey(), self.m_pdb_name)
+        self.m_pe_classic_dir = pe_info.getPeStoreKey()
+        self.m_arch = self.ARCH_LOCALE_MAP[pe_info.machine_type]
+
+
+def getPdbStoreDirectories() -> list[str]:
+    return [os.path.abspath(getLocalPdbsDirectory())] + ROOT_PDB_SEARCH_DIRS
+
+
 class SmartExe:
     m_file_path = ''
     m_pdb_file_path = ''
@@ -65,26 +104,23 @@ class SmartExe:
         self.get_info_for_pe()
         if not pdb_file_path:
             pdb_file_path = self.m_pe_info.m_pdb_name
-        self.m_pdb_file_path = self.extrapolate_pdb_path(pdb_file_path, [self.m_root_dir, self.m_rel_dir, os.path.abspath(get_settings().m_local_pdbs_dir)] + ROOT_PDB_SEARCH_DIRS)
+        self.m_pdb_file_path = self.find_pdb_path(pdb_file_path)
         if not self.m_pdb_file_path:
-            if not get_settings().m_allowed_to_download_pdbs:
+            if not isAllowedToDownloadPdbs():
                 raise SymbolManagerException(f'No PDB found for file {pe_file_path}')
-            env_sym_path = os.environ.get('_NT_SYMBOL_PATH')
-            sym_path = f'SRV*{os.path.abspath(os.path.join("./", get_settings().m_local_pdbs_dir))}*{REMOTE_PDB_STORE}'
-            if env_sym_path:
-                sym_path += ';' + env_sym_path
-            out = verbose_subprocess_run([SYMCHK_PATH, os.path.abspath(self.m_file_path), '/s', sym_path, '/oc', os.path.abspath(get_settings().m_local_pdbs_dir)])
-            if 0 != out.returncode:
-                print_error(f'Failed to download PDB for {self.m_file_path}')
-                raise SymbolManagerException(f'Failed to download PDB for file {pe_file_path}')
-        self.m_pdb_file_path = self.extrapolate_pdb_path(pdb_file_path, [self.m_root_dir, self.m_rel_dir, os.path.abspath(get_settings().m_local_pdbs_dir)] + ROOT_PDB_SEARCH_DIRS)
+            try:
+                downloaded_pdb = getSymbolServerFetcher().fetch(makePdbRequest(self.m_pe_info.m_pdb_name, self.m_pe_info.m_pdb_sig_70, self.m_pe_info.m_pdb_age))
+                getPdbIndex(getPdbStoreDirectories()).add(downloaded_pdb)
+            except (SymbolManagerException, OSError, requests.RequestException) as ex:
+                printError(f'Failed to download PDB for {self.m_file_path}')
+                raise SymbolManagerException(f'Failed to download PDB for file {pe_file_path}: {ex}')
+        self.m_pdb_file_path = self.find_pdb_path(pdb_file_path)
         if not self.m_pdb_file_path:
             raise SymbolManagerException(f'No PDB found for {self.m_file_path} even after downloading it!')
         self.m_classic_pdb_path = os.path.join(root_dir, self.m_pe_info.m_pdb_classic_path)
         self.m_is_pdb_in_classic_path = os.path.abspath(self.m_classic_pdb_path) == os.path.abspath(self.m_pdb_file_path)
-        self.m_dbh_fii = dbh_fii(os.path.abspath(self.m_file_path))
-        self.m_classic_pe_path = os.path.join(root_dir, self.m_dbh_fii["file"], f'{self.m_dbh_fii["timestamp"][2:].upper()}{self.m_dbh_fii["size"][2:].lower()}', self.m_dbh_fii["file"])
-        self.m_file_name = self.m_dbh_fii["file"]
+        self.m_file_name = os.path.basename(self.m_file_path)
+        self.m_classic_pe_path = os.path.join(root_dir, self.m_file_name, self.m_pe_info.m_pe_classic_dir, self.m_file_name)
         self.m_is_pe_in_classic_path = os.path.abspath(self.m_classic_pe_path) == os.path.abspath(self.m_file_path)
         self.get_file_properties()
 
@@ -97,7 +133,14 @@ class SmartExe:
         self.m_properties['version'] = properties.raw_version
 
     def get_info_for_pe(self):
-        self.m_pe_info = PeInfo(dbh_info(self.m_file_path))
+        self.m_pe_info = PeInfo(readPeDebugInfo(self.m_file_path))
+
+    def find_pdb_path(self, pdb_path_guess: str) -> str | None:
+        # The configured symbol stores are indexed, only the ad-hoc directories near the PE are probed
+        indexed = getPdbIndex(getPdbStoreDirectories()).lookup(self.m_pe_info.m_pdb_name, self.m_pe_info.m_pdb_sig_70, self.m_pe_info.m_pdb_age)
+        if indexed:
+            return indexed
+        return self.extrapolate_pdb_path(pdb_path_guess, [self.m_root_dir, self.m_rel_dir])
 
     def extrapolate_pdb_path(self, pdb_path_guess: str, root_pdb_search_dirs: list[str]) -> str | None:
         for root_pdb_dir in root_pdb_search_dirs:
@@ -116,7 +159,7 @@ class SmartExe:
                 return pdb_path_guess
             elif os.path.isdir(pdb_path_guess):
                 # Either the directory is flat, or it uses the pdb signatures (classic representation)
-                pdb_sig = f'{self.m_pe_info.m_pdb_sig_70}{self.m_pe_info.m_pdb_age}'
+                pdb_sig = f'{self.m_pe_info.m_pdb_sig_70}{self.m_pe_info.m_pdb_age:X}'
                 if os.path.exists(os.path.join(pdb_path_guess, pdb_sig)):
                     if os.path.isfile(os.path.join(pdb_path_guess, pdb_sig)):
                         # Odd, but maybe the dir looks like "./ntkrnlmp.pdb/ff123abc", being 'ff123abc' is the pdb file (and the signature)
@@ -128,10 +171,12 @@ class SmartExe:
         return None
 
     def validate_pdb_file(self, pdb_file_path: str) -> bool:
-        pdb_info = dbh_info(pdb_file_path)
-        signature = pdb_sig_70_to_str(pdb_info['PdbSig70'])
-        age = int(pdb_info['PdbAge'], 16)
-        return (signature == self.m_pe_info.m_pdb_sig_70) and (age == self.m_pe_info.m_pdb_age)
+        try:
+            pdb_signature = readPdbSignature(pdb_file_path)
+        except PdbFormatException as ex:
+            printLog(f'Not a valid PDB: {ex}')
+            return False
+        return (pdb_signature.signature == self.m_pe_info.m_pdb_sig_70.upper()) and (pdb_signature.age == self.m_pe_info.m_pdb_age)
 
 
 def buildVersionedFileName(file_base_name: str, raw_version: str, architecture: str, file_extension: str, kb: str = None) -> str:
@@ -0,0 +1,172 @@
+import functools
+import json
+import os
+import threading
+import time
+from types import NoneType
+from typing import Callable, Dict, List
+
+
+class NullSpan:
+    """
+    The span handed out while tracing is off - it records nothing and is falsy, so callers can skip computing span arguments.
+    """
+    def __bool__(self) -> bool:
+        return False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def set(self, **args):
+        pass
+
+    def addBytes(self, count: int):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class TraceSpan:
+    __slots__ = ('tracer', 'name', 'category', 'args', 'start')
+
+    def __init__(self, tracer: 'Tracer', name: str, category: str, args: dict) -> NoneType:
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = 0
+
+    def __bool__(self) -> bool:
+        return True
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.args['error'] = f'{exc_type.__name__}: {exc_value}'
+        self.tracer.record(self.name, self.category, self.start, time.perf_counter_ns(), self.args)
+        return False
+
+    def set(self, **args):
+        self.args.update(args)
+
+    def addBytes(self, count: int):
+        self.args['bytes'] = self.args.get('bytes', 0) + count
+
+
+class Tracer:
+    """
+    Collects spans as Chrome trace events ("X" complete events, one track per worker thread).
+
+    The written file opens in Perfetto (ui.perfetto.dev) and chrome://tracing. Spans nest by time
+    on their thread's track; their arguments (file names, bytes processed, errors) show on selection.
+    """
+    def __init__(self) -> NoneType:
+        self.origin = time.perf_counter_ns()
+        self.pid = os.getpid()
+        self.events: List[dict] = []
+        self.worker_ids: Dict[int, int] = { }
+        self.lock = threading.Lock()
+
+    def __workerId(self) -> int:
+        ident = threading.get_ident()
+        worker_id = self.worker_ids.get(ident)
+        if worker_id is None:
+            with self.lock:
+                worker_id = len(self.worker_ids) + 1
+                self.worker_ids[ident] = worker_id
+                self.events.append({'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': worker_id, 'args': {'name': threading.current_thread().name}})
+        return worker_id
+
+    def record(self, name: str, category: str, start: int, end: int, args: dict):
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': (start - self.origin) / 1000,
+            'dur': (end - start) / 1000,
+            'pid': self.pid,
+            'tid': self.__workerId(),
+            'args': args,
+        }
+        with self.lock:
+            self.events.append(event)
+
+    def write(self, path: str):
+        with self.lock:
+            events = list(self.events)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='UTF-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, default=str)
+        os.replace(tmp_path, path)
+
+
+g_tracer: Tracer | None = None
+
+
+def startTracing() -> Tracer:
+    global g_tracer
+    g_tracer = Tracer()
+    return g_tracer
+
+
+def stopTracing(path: str):
+    """
+    Writes the collected trace to `path` and stops tracing.
+    """
+    global g_tracer
+    tracer, g_tracer = g_tracer, None
+    if tracer is not None:
+        tracer.write(path)
+
+
+def traceSpan(name: str, category: str = '', **args) -> TraceSpan | NullSpan:
+    """
+    Times a block as a span. While tracing is off this is a single global check.
+
+    Example:
+        ```python
+        with traceSpan('ApplyDeltaB', 'patch', patch=patch_path) as span:
+            ...
+            if span:
+                span.addBytes(len(output))
+        ```
+    """
+    tracer = g_tracer
+    if tracer is None:
+        return NULL_SPAN
+    return TraceSpan(tracer, name, category, args)
+
+
+def traced(category: str = '', name: str = None, describe: Callable[..., dict] = None):
+    """
+    Times every call of the decorated function as a span.
+
+    Args:
+        describe (Callable[..., dict], optional): Called with the function's arguments (only while tracing) to build the span's arguments.
+
+    Example:
+        ```python
+        @traced('msu', describe=lambda msu_file_path, *args, **kwargs: {'msu': os.path.basename(msu_file_path)})
+        def extractMsu(msu_file_path: str, ...):
+        ```
+    """
+    def decorator(func: Callable) -> Callable:
+        span_name = name if name else func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            tracer = g_tracer
+            if tracer is None:
+                return func(*args, **kwargs)
+            with TraceSpan(tracer, span_name, category, describe(*args, **kwargs) if describe else { }):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,11 +1,10 @@
 import argparse
+import hashlib
 import os
 import re
 from types import NoneType
 from typing import Callable
 
-import requests
-import tqdm
 from src.utils.printer import printError, printLog
 from src.utils.tmps import TmpDir as TmpDir
 from src.utils.settings import *
@@ -115,11 +114,14 @@ def setOutputDirectory(new_dir: str, allow_implicit_dir_creation: bool) -> NoneT
 
 
 def downloadFileWithProgress(url: str, fileName: str):
-    response = requests.get(url, stream=True)
+    # Imported here, requests is the heaviest import of every command
+    from src.utils.http import getSession
+    response = getSession().get(url, stream=True)
 
     totalSizeInBytes = int(response.headers.get('content-length', 0))
     blockSize = 1024  # 1 Kibibyte
 
+    import tqdm
     progressBar = tqdm.tqdm(total=totalSizeInBytes, unit='iB', unit_scale=True, colour='yellow')
 
     with open(fileName, 'wb') as file:
@@ -142,9 +144,50 @@ def normalizeDirtyBitness(dirty_bitness: str) -> str:
         return dirty_bitness
     if dirty_bitness == 'wow64':
         return dirty_bitness
+    if dirty_bitness == 'arm64' or dirty_bitness == 'arm':
+        return dirty_bitness
     raise SymbolManagerException(f'Bitness "{dirty_bitness}" is not recognized!')
 
 
+class VersionedFileName:
+    base_name = ''
+    version = ''
+    arch = ''
+    kb = None
+    extension = ''
+
+    def __init__(self, base_name: str, version: str, arch: str, extension: str, kb: str | None = None) -> NoneType:
+        self.base_name = base_name
+        self.version = version
+        self.arch = arch
+        self.extension = extension
+        self.kb = kb
+
+    def getOriginalFileName(self) -> str:
+        return f'{self.base_name}{self.extension}'
+
+
+VERSIONED_FILE_NAME_REGEX = re.compile(r'^(?P<base_name>[^\s]+)\s+-\s+(?P<version>\d+(\.\d+)+)\s+(?P<arch>\w+)(\s+-\s+(?P<kb>KB\d+))?(?P<extension>\.\w+)$', re.I)
+
+
+def parseVersionedFileName(file_name: str) -> VersionedFileName | None:
+    """
+    Parses a file name produced by `buildVersionedFileName` (e.g. "ntoskrnl - 10.0.22621.1 x64 - KB5031354.exe").
+    """
+    reg = VERSIONED_FILE_NAME_REGEX.match(os.path.basename(file_name))
+    if not reg:
+        return None
+    return VersionedFileName(reg.group('base_name'), reg.group('version'), reg.group('arch'), reg.group('extension'), reg.group('kb'))
+
+
+def calculateFileHash(file_path: str, block_size: int = 4 * 1024 * 1024) -> str:
+    hasher = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        while block := f.read(block_size):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
 def monthToNumber(monthName: str) -> str | int:
     """Translate month name to month number."""
     monthDict = {
@@ -0,0 +1,107 @@
+import http.server
+import json
+import threading
+import urllib.parse
+from typing import Dict, List
+
+
+SEARCH_ENTRY = '''<tr id="{update_id}_R1">
+    <td class="resultsbottomBorder resultspadding" id="{update_id}_C1_R1">
+        <a id='{update_id}_link' href= "javascript:void(0);" onclick='goToDetails("{update_id}");' class="contentTextItemSpacerNoBreakLink">
+            {title}
+        </a>
+    </td>
+</tr>
+'''
+
+DIALOG_ENTRY = '''downloadInformation[{index}] = new Object();
+downloadInformation[{index}].enTitle ='{title}';
+downloadInformation[{index}].files = new Array();
+downloadInformation[{index}].files[0] = new Object();
+downloadInformation[{index}].files[0].url = '{url}';
+'''
+
+
+class CatalogUpdate:
+    def __init__(self, update_id: str, title: str, file_name: str, data: bytes) -> None:
+        self.update_id = update_id
+        self.title = title
+        self.file_name = file_name
+        self.data = data
+
+
+class FakeCatalog:
+    """
+    A stand-in for the update catalog: the search page, the download dialog and the CDN, on one local server.
+
+    Searches match updates by a case-insensitive substring of their title. Every request is recorded in
+    `requests` as (method, path), and requests whose URL contains a key of `failures` get its status
+    (a list of statuses fails that many requests, the rest are answered).
+    """
+    def __init__(self) -> None:
+        self.updates: Dict[str, CatalogUpdate] = { }
+        self.failures: Dict[str, int | List[int]] = { }
+        self.requests: List[tuple] = []
+        self.lock = threading.Lock()
+        catalog = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                catalog.handle(self, 'GET')
+
+            def do_POST(self):
+                catalog.handle(self, 'POST')
+
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def add(self, update_id: str, title: str, kb: str, bitness: str = 'x64', year: int = 2023, month: int = 10, major: str = '11') -> CatalogUpdate:
+        file_name = f'windows{major}.0-{kb.lower()}-{bitness}_{update_id.replace("-", "")[:16]}.msu'
+        update = CatalogUpdate(update_id, title, f'/c/msdownload/update/software/secu/{year}/{month:02}/{file_name}', f'MSU {kb}'.encode())
+        self.updates[update_id] = update
+        return update
+
+    def downloadUrl(self, update: CatalogUpdate) -> str:
+        return self.url + update.file_name
+
+    def handle(self, handler: http.server.BaseHTTPRequestHandler, method: str):
+        url = urllib.parse.urlsplit(handler.path)
+        with self.lock:
+            self.requests.append((method, url.path))
+            status = next((status for pattern, status in self.failures.items() if pattern in handler.path), None)
+            if isinstance(status, list):
+                status = status.pop(0) if status else None
+        if status is not None:
+            return self.reply(handler, status, b'')
+        if method == 'GET' and url.path == '/Search.aspx':
+            query = urllib.parse.parse_qs(url.query).get('q', [''])[0].lower()
+            body = ''.join(SEARCH_ENTRY.format(update_id=u.update_id, title=u.title) for u in self.updates.values() if query in u.title.lower())
+            return self.reply(handler, 200, f'<table>{body}</table>'.encode())
+        if method == 'POST' and url.path == '/DownloadDialog.aspx':
+            form = urllib.parse.parse_qs(handler.rfile.read(int(handler.headers['Content-Length'])).decode())
+            update_ids = [u['updateID'] for u in json.loads(form['updateIDs'][0])]
+            body = ''.join(DIALOG_ENTRY.format(index=i, title=self.updates[u].title, url=self.downloadUrl(self.updates[u])) for i, u in enumerate(update_ids) if u in self.updates)
+            return self.reply(handler, 200, f'<script>var downloadInformation = new Array();\n{body}</script>'.encode())
+        for update in self.updates.values():
+            if method == 'GET' and url.path == update.file_name:
+                return self.reply(handler, 200, update.data)
+        self.reply(handler, 404, b'')
+
+    @staticmethod
+    def reply(handler: http.server.BaseHTTPRequestHandler, status: int, body: bytes):
+        handler.send_response(status)
+        handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.server.shutdown()
+        self.server.server_close()
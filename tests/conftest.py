@@ -0,0 +1,56 @@
+import functools
+import http.server
+import os
+import sys
+import threading
+import pytest
+
+# The tests import the tool's modules the way main.py does, relative to the repository root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def http_root(tmp_path):
+    """
+    Serves a temporary directory over a local HTTP server, as a stand-in for a remote server.
+
+    Yields the directory and its base URL.
+    """
+    root = tmp_path / 'http_root'
+    root.mkdir()
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(QuietHandler, directory=str(root)))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield root, f'http://127.0.0.1:{server.server_address[1]}'
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    """
+    Retries of failed requests, and retry rounds of the crawler, happen without waiting.
+    """
+    monkeypatch.setattr('src.utils.http.computeBackoff', lambda *args, **kwargs: 0.0)
+    monkeypatch.setattr('src.patch.catalog_crawler.computeBackoff', lambda *args, **kwargs: 0.0)
+
+
+@pytest.fixture
+def catalog(monkeypatch, tmp_path_factory, no_backoff):
+    """
+    A local stand-in for the update catalog, which the catalog URL setting points at.
+
+    Responses are cached in the test's own HTTP cache directory.
+    """
+    from catalog_server import FakeCatalog
+    with FakeCatalog() as fake_catalog:
+        monkeypatch.setattr('src.utils.settings.Settings.s_catalog_url', fake_catalog.url)
+        monkeypatch.setattr('src.utils.settings.Settings.s_http_cache_dir', str(tmp_path_factory.mktemp('http_cache')))
+        yield fake_catalog
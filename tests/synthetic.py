@@ -0,0 +1,40 @@
+import struct
+import uuid
+
+
+PDB_BLOCK_SIZE = 512
+
+
+def buildPdb(guid: uuid.UUID, age: int, pdb_info_age: int | None = None) -> bytes:
+    """
+    Builds a minimal MSF 7.00 PDB: a PDB info stream (1) and a DBI header (3), one block each.
+    """
+    pdb_info = struct.pack('<III16s', 20000404, 0, age if pdb_info_age is None else pdb_info_age, guid.bytes_le)
+    dbi = struct.pack('<iII', -1, 19990903, age)
+    # Superblock, free block map, block map, directory, info stream, DBI stream
+    directory = struct.pack('<I4I', 4, 0, len(pdb_info), 0, len(dbi)) + struct.pack('<II', 4, 5)
+    superblock = struct.pack('<32sIIIIII', b'Microsoft C/C++ MSF 7.00\r\n\x1aDS\x00\x00\x00', PDB_BLOCK_SIZE, 1, 6, len(directory), 0, 2)
+    blocks = [superblock, b'', struct.pack('<I', 3), directory, pdb_info, dbi]
+    return b''.join(block.ljust(PDB_BLOCK_SIZE, b'\x00') for block in blocks)
+
+
+def buildPe(timestamp: int, size_of_image: int, pdb_name: str | None = None, guid: uuid.UUID | None = None, age: int = 1, machine: int = 0x8664) -> bytes:
+    """
+    Builds a minimal PE32+ image with one section holding the debug directory and its RSDS entry.
+    """
+    data = bytearray(0x400)
+    data[0:2] = b'MZ'
+    struct.pack_into('<I', data, 0x3c, 0x80)
+    data[0x80:0x84] = b'PE\x00\x00'
+    struct.pack_into('<HHIIIHH', data, 0x84, machine, 1, timestamp, 0, 0, 240, 0x22)
+    optional = 0x84 + 20
+    struct.pack_into('<H', data, optional, 0x20b)
+    struct.pack_into('<I', data, optional + 56, size_of_image)
+    struct.pack_into('<I', data, optional + 108, 16)
+    struct.pack_into('<8sIIII16x', data, optional + 240, b'.rdata', 0x200, 0x1000, 0x200, 0x200)
+    if pdb_name:
+        codeview = b'RSDS' + guid.bytes_le + struct.pack('<I', age) + pdb_name.encode() + b'\x00'
+        struct.pack_into('<II', data, optional + 112 + 8 * 6, 0x1000, 28)
+        struct.pack_into('<IIHHIIII', data, 0x200, 0, timestamp, 0, 0, 2, len(codeview), 0x1020, 0x220)
+        data[0x220:0x220 + len(codeview)] = codeview
+    return bytes(data)
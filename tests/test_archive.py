@@ -0,0 +1,70 @@
+import hashlib
+import os
+import sys
+from types import SimpleNamespace
+import pytest
+from src.store.archive import ArchiveException, DeltaArchive
+
+
+def __patchFile(base_file, _, delta_file, allow_legacy=False):
+    # Stands in for msdelta: the "patched" binary is the base followed by the delta
+    base = open(base_file, 'rb').read() if base_file else b''
+    return base + open(delta_file, 'rb').read()
+
+
+@pytest.fixture
+def archive(tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, 'src.patch.delta_patch', SimpleNamespace(patchFile=__patchFile))
+    (tmp_path / 'Bases').mkdir()
+    (tmp_path / 'Bases' / 'ntoskrnl - 10.0.22621.1 x64.exe').write_bytes(b'MZ base ')
+    for build in ('2506', '2715'):
+        (tmp_path / f'{build}.patch').write_bytes(f'PA30 {build}'.encode())
+    return DeltaArchive(str(tmp_path / 'out'), cache_size=32)
+
+
+def __add(archive: DeltaArchive, tmp_path, build: str) -> bytes:
+    return archive.addDelta(f'ntoskrnl - 10.0.22621.{build} x64.exe', str(tmp_path / 'Bases' / 'ntoskrnl - 10.0.22621.1 x64.exe'), str(tmp_path / f'{build}.patch'))
+
+
+def test_index_is_persisted_and_reloaded(archive, tmp_path):
+    outbuf = __add(archive, tmp_path, '2506')
+    archive.save()
+
+    reloaded = DeltaArchive(archive.root, archive.cache_size)
+
+    assert outbuf == b'MZ base PA30 2506'
+    sha256 = hashlib.sha256(outbuf).hexdigest()
+    assert reloaded.hasName('ntoskrnl - 10.0.22621.2506 x64.exe')
+    (name, entry), = reloaded.iterateNames()
+    assert entry['sha256'] == sha256 and entry['size'] == len(b'MZ base PA30 2506')
+    assert os.path.isfile(reloaded.getDeltaPath(entry['delta']))
+
+
+def test_materialize_caches_and_evicts_least_recently_used(archive, tmp_path):
+    __add(archive, tmp_path, '2506')
+    __add(archive, tmp_path, '2715')
+
+    first = archive.materialize('ntoskrnl - 10.0.22621.2506 x64.exe')
+    assert open(first, 'rb').read() == b'MZ base PA30 2506'
+    second = archive.materialize('ntoskrnl - 10.0.22621.2715 x64.exe')
+
+    # Both binaries do not fit in 32 bytes, so the older one is evicted
+    assert not os.path.exists(first) and os.path.isfile(second)
+    stats = archive.getStats()
+    assert (stats['names'], stats['bases'], stats['deltas'], stats['cached']) == (2, 1, 2, 1)
+    assert stats['saved_bytes'] == stats['logical_bytes'] - stats['delta_bytes']
+    archive.save()
+    assert list(DeltaArchive(archive.root, archive.cache_size).cached) == ['ntoskrnl - 10.0.22621.2715 x64.exe']
+
+
+def test_materialize_fails_for_unknown_or_modified_bases(archive, tmp_path):
+    __add(archive, tmp_path, '2506')
+
+    with pytest.raises(ArchiveException):
+        archive.materialize('ntdll - 10.0.22621.2506 x64.dll')
+    (tmp_path / 'Bases' / 'ntoskrnl - 10.0.22621.1 x64.exe').write_bytes(b'MZ other')
+    with pytest.raises(ArchiveException):
+        archive.materialize('ntoskrnl - 10.0.22621.2506 x64.exe')
+    os.remove(tmp_path / 'Bases' / 'ntoskrnl - 10.0.22621.1 x64.exe')
+    with pytest.raises(ArchiveException):
+        archive.materialize('ntoskrnl - 10.0.22621.2506 x64.exe')
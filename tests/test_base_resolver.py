@@ -0,0 +1,45 @@
+import os
+import threading
+import pytest
+
+
+def __resolverModule():
+    try:
+        import src.patch.base_resolver as base_resolver
+    except Exception as ex:
+        pytest.skip(f'base_resolver is not importable here ({ex})')
+    return base_resolver
+
+
+class FakeEntry:
+    def __init__(self, version: str, arch: str) -> None:
+        self.version = version
+        self.arch = arch
+
+
+def test_bases_are_fetched_once_and_wow64_falls_back_to_x86(tmp_path):
+    base_resolver = __resolverModule()
+    resolver = base_resolver.BaseResolver(str(tmp_path))
+    index_reads = []
+    downloads = []
+    release = threading.Event()
+    def iterateEntries(file_name: str, entry_filter=None):
+        index_reads.append(file_name)
+        return [FakeEntry('10.0.22621.1', 'x64'), FakeEntry('10.0.22621.1', 'x86')]
+    def download(entry: FakeEntry) -> str:
+        release.wait(5)
+        downloads.append((entry.version, entry.arch))
+        return os.path.join(str(tmp_path), f'ntdll - {entry.version} {entry.arch}.dll')
+    resolver.client.iterateEntries = iterateEntries
+    resolver.client.download = download
+
+    first = resolver.request('ntdll', 'dll', '10.0.22621.1', 'amd64')
+    second = resolver.request('ntdll', '.dll', '10.0.22621.1', 'x64')
+    release.set()
+
+    assert first is second
+    assert first.result().endswith('ntdll - 10.0.22621.1 x64.dll')
+    assert resolver.request('ntdll', '.dll', '10.0.22621.1', 'wow64').result().endswith('ntdll - 10.0.22621.1 x86.dll')
+    assert resolver.request('ntdll', '.dll', '10.0.22621.2428', 'x64').result() is None
+    assert index_reads == ['ntdll.dll']
+    assert downloads == [('10.0.22621.1', 'x64'), ('10.0.22621.1', 'x86')]
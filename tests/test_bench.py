@@ -0,0 +1,42 @@
+import json
+import sys
+from src.bench import bench, generators
+from src.patch.catalog_parser import parseCatalogSearchPage, parseUpdateHistoryReleases
+from src.symbols.pe import readPeDebugInfo
+
+
+def test_generators_are_deterministic_and_parseable(tmp_path):
+    assert generators.generateCatalogSearchPage(20, seed=1) == generators.generateCatalogSearchPage(20, seed=1)
+    assert len(list(parseCatalogSearchPage(generators.generateCatalogSearchPage(20)))) == 20
+    assert len(parseUpdateHistoryReleases(generators.generateUpdateHistoryPage(30))) == 30
+    assert generators.buildPeImage('10.0.19041.1', 'ntdll.dll', seed=2) == generators.buildPeImage('10.0.19041.1', 'ntdll.dll', seed=2)
+
+    pe_info = readPeDebugInfo(generators.generatePeFile(str(tmp_path / 'ntdll.dll'), '10.0.19041.1', arch='x86'))
+
+    assert pe_info.machine_type == 'I386'
+
+
+def test_run_writes_results_and_compares_them(tmp_path):
+    previous_path = tmp_path / 'previous.json'
+    results_path = tmp_path / 'results.json'
+    assert bench.main(['-b', 'catalog_urls', '-b', 'update_history', '-r', '1', '-o', str(previous_path)]) == 0
+    previous = json.loads(previous_path.read_text())
+    assert [result['status'] for result in previous['benchmarks'].values()] == ['ok', 'ok']
+    assert previous['benchmarks']['catalog_urls']['items'] > 0
+
+    # Every benchmark looks 10 times slower the next time
+    for result in previous['benchmarks'].values():
+        result['median_ms'] /= 10
+    previous_path.write_text(json.dumps(previous))
+
+    assert bench.main(['-b', 'catalog_urls', '-r', '1', '-o', str(results_path), '-c', str(previous_path)]) == 1
+    assert bench.compareResults(json.loads(results_path.read_text()), dict(previous, scale=2)) == []
+
+
+def test_benchmarks_needing_com_are_skipped_without_it(tmp_path, monkeypatch):
+    # None in sys.modules makes the import fail, as where pythoncom is not installed
+    monkeypatch.setitem(sys.modules, 'pythoncom', None)
+    results_path = tmp_path / 'results.json'
+
+    assert bench.main(['-b', 'binary_names', '-r', '1', '-o', str(results_path)]) == 0
+    assert json.loads(results_path.read_text())['benchmarks']['binary_names']['status'] == 'skipped'
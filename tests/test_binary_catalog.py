@@ -0,0 +1,69 @@
+import os
+import uuid
+import pytest
+from src.store import binary_catalog
+from src.store.binary_catalog import BinaryCatalog, BinaryCatalogException, BinaryStorage, makeVersionKey, queryBinaryCatalog
+from synthetic import buildPe
+
+
+GUID = uuid.UUID('3844dbb9-2017-4967-be2e-8a4f9cd6b1a5')
+
+
+def test_version_keys_sort_like_versions():
+    assert makeVersionKey('10.0.22621.2506') < makeVersionKey('10.0.22621.10000') < makeVersionKey('10.0.22631.1')
+    assert makeVersionKey('10.0.22621') <= makeVersionKey('10.0.22621.2506') <= makeVersionKey('10.0.22621', upper=True)
+
+
+def test_rows_carry_the_versioned_name_and_pe_debug_info(tmp_path):
+    pe = buildPe(0x5A1B2C3D, 0x1046000, 'ntkrnlmp.pdb', GUID, 3)
+    path = tmp_path / 'ntoskrnl - 10.0.22621.2506 x64 - KB5031354.exe'
+    path.write_bytes(pe)
+
+    with BinaryCatalog(str(tmp_path)) as catalog:
+        catalog.record(str(path), 'extrapolate', source=str(tmp_path / 'windows11.0-kb5031354-x64.msu'))
+        catalog.record(str(tmp_path / 'ntoskrnl - 10.0.22621.1 x64.exe'), 'reverse', data=pe, storage=BinaryStorage.Archive)
+
+    with BinaryCatalog(str(tmp_path)) as catalog:
+        (row, ) = catalog.query(kb='5031354')
+        assert (row['file_name'], row['version'], row['arch'], row['size']) == ('ntoskrnl.exe', '10.0.22621.2506', 'x64', len(pe))
+        assert (row['pdb_name'], row['pdb_guid'], row['pdb_age']) == ('ntkrnlmp.pdb', GUID.hex.upper(), 3)
+        assert row['source'] == str(tmp_path / 'windows11.0-kb5031354-x64.msu')
+        assert len(catalog.query(pdb=f'{GUID.hex.upper()}3')) == 2
+        assert catalog.query(pdb=f'{GUID.hex.upper()}4') == []
+
+
+def test_query_filters(tmp_path, monkeypatch):
+    monkeypatch.setattr('src.utils.settings.Settings.s_output_dir', str(tmp_path))
+    monkeypatch.setattr(binary_catalog, 'g_binary_catalogs', { })
+    for name in ('ntoskrnl - 10.0.22621.1 x64.exe', 'ntoskrnl - 10.0.22621.2506 x64.exe', 'ntoskrnl - 10.0.22631.2506 x64.exe',
+                 'ntdll - 10.0.22621.2506 x86.dll', 'notes.txt'):
+        (tmp_path / name).write_bytes(name.encode())
+
+    assert len(queryBinaryCatalog(scan=True)) == 4
+    assert [row['version'] for row in queryBinaryCatalog(file_name='NTOSKRNL.exe', version='10.0.22621')] == ['10.0.22621.1', '10.0.22621.2506']
+    assert [row['version'] for row in queryBinaryCatalog(file_name='nt*', version_from='10.0.22621.2', version_to='10.0.22621')] == ['10.0.22621.2506', '10.0.22621.2506']
+    assert [row['arch'] for row in queryBinaryCatalog(arch='X86')] == ['x86']
+    assert len(queryBinaryCatalog(limit=1)) == 1
+    with pytest.raises(BinaryCatalogException):
+        queryBinaryCatalog(version='22H2')
+    binary_catalog.closeBinaryCatalogs()
+
+
+def test_sources_are_complete_per_file(tmp_path):
+    updates_dir = tmp_path / 'updates'
+    updates_dir.mkdir()
+    x64_msu = str(updates_dir / 'Windows 11 22H2 x64 - KB5031354 - 2023-10.msu')
+    arm64_msu = str(updates_dir / 'Windows 11 22H2 arm64 - KB5031354 - 2023-10.msu')
+    binary = tmp_path / 'ntoskrnl - 10.0.22621.2506 x64 - KB5031354.exe'
+    binary.write_bytes(b'MZ')
+
+    with BinaryCatalog(str(tmp_path / 'out')) as catalog:
+        catalog.record(str(binary), 'extrapolate', source=x64_msu)
+        assert not catalog.isSourceComplete(x64_msu)
+        catalog.recordSource(x64_msu, 'extrapolate')
+
+        assert catalog.isSourceComplete(os.path.relpath(x64_msu))
+        # Another architecture of the same KB is not done
+        assert not catalog.isSourceComplete(arm64_msu)
+        assert [row['name'] for row in catalog.query(source=x64_msu)] == [binary.name]
+        assert catalog.query(source=arm64_msu) == []
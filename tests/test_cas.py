@@ -0,0 +1,61 @@
+import os
+import pytest
+from src.store import cas
+from src.store.cas import ContentStore, ContentStoreException, getContentStore, writeOutputFile
+
+
+def test_same_bytes_are_stored_once(tmp_path):
+    store = ContentStore(str(tmp_path))
+
+    first = store.putBytes(b'MZ ntoskrnl', 'ntoskrnl - 10.0.22621.2506 x64.exe')
+    second = store.putBytes(b'MZ ntoskrnl', 'ntoskrnl - 10.0.22621.2506 x64 - KB5031354.exe')
+    store.save()
+
+    assert first == second and store.hasBlob(first)
+    assert os.path.samefile(tmp_path / 'ntoskrnl - 10.0.22621.2506 x64.exe', store.getObjectPath(first))
+    assert os.path.samefile(tmp_path / 'ntoskrnl - 10.0.22621.2506 x64 - KB5031354.exe', store.getObjectPath(first))
+    stats = store.getStats()
+    assert (stats['names'], stats['blobs'], stats['saved_bytes']) == (2, 1, len(b'MZ ntoskrnl'))
+    assert ContentStore(str(tmp_path)).getNameHash('ntoskrnl - 10.0.22621.2506 x64.exe') == first
+
+
+def test_symlinks_and_renamed_contents(tmp_path):
+    store = ContentStore(str(tmp_path), 'symlink')
+    store.putBytes(b'old', 'ntdll - 10.0.22621.1 x64.dll')
+
+    sha256 = store.putBytes(b'new', 'ntdll - 10.0.22621.1 x64.dll')
+
+    path = tmp_path / 'ntdll - 10.0.22621.1 x64.dll'
+    assert path.is_symlink() and path.read_bytes() == b'new'
+    assert store.getNameHash(path.name) == sha256
+    with pytest.raises(ContentStoreException):
+        ContentStore(str(tmp_path), 'copy')
+
+
+def test_import_moves_plain_files_into_the_store(tmp_path):
+    (tmp_path / 'a - 10.0.1.1 x64.dll').write_bytes(b'same')
+    (tmp_path / 'b - 10.0.1.1 x86.dll').write_bytes(b'same')
+    (tmp_path / 'c - 10.0.1.1 x64.dll').write_bytes(b'other')
+    store = ContentStore(str(tmp_path))
+
+    assert store.importNames() == (3, 1)
+    assert store.importNames() == (0, 0)
+    assert store.getStats()['blobs'] == 2
+    assert (tmp_path / 'b - 10.0.1.1 x86.dll').read_bytes() == b'same'
+
+
+def test_output_files_go_through_the_store_only_when_it_is_on(tmp_path, monkeypatch):
+    monkeypatch.setattr('src.utils.settings.Settings.s_output_dir', str(tmp_path / 'out'))
+    monkeypatch.setattr(cas, 'g_content_stores', { })
+    (tmp_path / 'out').mkdir()
+    (tmp_path / 'bases').mkdir()
+    writeOutputFile(str(tmp_path / 'out' / 'plain.dll'), b'MZ')
+    assert getContentStore() is None
+
+    monkeypatch.setattr('src.utils.settings.Settings.s_content_store_links', 'hardlink')
+    writeOutputFile(str(tmp_path / 'out' / 'stored.dll'), b'MZ')
+    writeOutputFile(str(tmp_path / 'bases' / 'base.dll'), b'MZ')
+
+    assert getContentStore().getNameHash('stored.dll') is not None
+    assert getContentStore().getNameHash('plain.dll') is None
+    assert os.stat(tmp_path / 'bases' / 'base.dll').st_nlink == 1
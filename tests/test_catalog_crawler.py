@@ -0,0 +1,116 @@
+import os
+from src.patch import catalog_crawler
+from src.patch.catalog_crawler import CatalogQuery, crawlCatalog
+from src.utils import http, http_cache
+from src.utils.retry_queue import RetryQueue
+
+
+TITLE = '2023-10 Cumulative Update for Windows 11 Version 22H2 for {bitness}-based Systems ({kb})'
+
+
+def test_crawl_searches_resolves_and_downloads(catalog, tmp_path):
+    x64 = catalog.add('11111111-1111-1111-1111-111111111111', TITLE.format(bitness='x64', kb='KB5031354'), 'KB5031354')
+    catalog.add('22222222-2222-2222-2222-222222222222', TITLE.format(bitness='arm64', kb='KB5031354'), 'KB5031354', 'arm64')
+    catalog.add('33333333-3333-3333-3333-333333333333', TITLE.format(bitness='x64', kb='KB5031455'), 'KB5031455')
+
+    stats = crawlCatalog([CatalogQuery('KB5031354', '11', bitness='x64')], str(tmp_path))
+
+    assert [name for name in os.listdir(tmp_path) if name.endswith('.msu')] == ['Windows 11 22H2 x64 - KB5031354 - 2023-10.msu']
+    assert (tmp_path / 'Windows 11 22H2 x64 - KB5031354 - 2023-10.msu').read_bytes() == x64.data
+    assert (stats.searches, stats.resolved, stats.downloaded, stats.failed) == (1, 1, 1, 0)
+
+
+def test_crawl_skips_present_downloads_and_counts_failures(catalog, tmp_path):
+    catalog.add('11111111-1111-1111-1111-111111111111', TITLE.format(bitness='x64', kb='KB5031354'), 'KB5031354')
+    (tmp_path / 'Windows 11 22H2 x64 - KB5031354 - 2023-10.msu').write_bytes(b'MSU')
+    # The update is found by both searches, but only resolved once
+    queries = [CatalogQuery('KB5031354', '11', bitness='x64'), CatalogQuery('2023-10 Cumulative', '11', bitness='x64')]
+    catalog.failures['KB5031455'] = 500
+
+    stats = crawlCatalog(queries + [CatalogQuery('KB5031455')], str(tmp_path))
+
+    # The failed search is retried in two more rounds
+    assert (stats.searches, stats.resolved, stats.skipped, stats.downloaded, stats.failed) == (5, 1, 1, 0, 3)
+    assert (stats.retried, stats.pending_retries) == (2, 1)
+    assert (tmp_path / 'Windows 11 22H2 x64 - KB5031354 - 2023-10.msu').read_bytes() == b'MSU'
+
+
+def test_second_crawl_is_answered_from_the_index(catalog, tmp_path):
+    catalog.add('11111111-1111-1111-1111-111111111111', TITLE.format(bitness='x64', kb='KB5031354'), 'KB5031354')
+    query = CatalogQuery('KB5031354', '11', bitness='x64')
+    crawlCatalog([query], str(tmp_path))
+    requests_made = len(catalog.requests)
+
+    stats = crawlCatalog([query], str(tmp_path))
+
+    assert len(catalog.requests) == requests_made
+    assert (stats.searches, stats.indexed_searches, stats.skipped, stats.downloaded) == (0, 1, 1, 0)
+
+
+def test_refresh_repeats_searches_and_resolves_only_new_entries(catalog, tmp_path, monkeypatch):
+    catalog.add('11111111-1111-1111-1111-111111111111', TITLE.format(bitness='x64', kb='KB5031354'), 'KB5031354')
+    query = CatalogQuery('2023-10 Cumulative', '11', bitness='x64')
+    crawlCatalog([query], str(tmp_path))
+    catalog.add('33333333-3333-3333-3333-333333333333', TITLE.format(bitness='x64', kb='KB5031455'), 'KB5031455')
+    # The cached search page went stale in the meantime
+    monkeypatch.setattr(http_cache, 'CACHE_TTL_RULES', [])
+
+    stats = crawlCatalog([query], str(tmp_path), refresh=True)
+
+    assert (stats.searches, stats.resolved, stats.skipped, stats.downloaded) == (1, 1, 1, 1)
+    assert (tmp_path / 'Windows 11 22H2 x64 - KB5031455 - 2023-10.msu').exists()
+
+
+def test_on_downloaded_sees_downloaded_and_present_files(catalog, tmp_path):
+    catalog.add('11111111-1111-1111-1111-111111111111', TITLE.format(bitness='x64', kb='KB5031354'), 'KB5031354')
+    catalog.add('33333333-3333-3333-3333-333333333333', TITLE.format(bitness='x64', kb='KB5031455'), 'KB5031455')
+    (tmp_path / 'Windows 11 22H2 x64 - KB5031354 - 2023-10.msu').write_bytes(b'MSU')
+    downloaded = []
+
+    crawlCatalog([CatalogQuery('2023-10 Cumulative', '11', bitness='x64')], str(tmp_path), on_downloaded=downloaded.append)
+
+    assert sorted(os.path.basename(path) for path in downloaded) == ['Windows 11 22H2 x64 - KB5031354 - 2023-10.msu', 'Windows 11 22H2 x64 - KB5031455 - 2023-10.msu']
+
+
+def test_failed_search_is_retried_within_the_crawl(catalog, tmp_path):
+    catalog.add('11111111-1111-1111-1111-111111111111', TITLE.format(bitness='x64', kb='KB5031354'), 'KB5031354')
+    # Outlasts the session's retries, but not the crawler's retry round
+    catalog.failures['/Search.aspx'] = [503] * (http.DEFAULT_RETRIES + 1)
+
+    stats = crawlCatalog([CatalogQuery('KB5031354', '11', bitness='x64')], str(tmp_path))
+
+    assert (stats.failed, stats.retried, stats.downloaded, stats.pending_retries) == (1, 1, 1, 0)
+    assert len(RetryQueue(str(tmp_path), 'catalog')) == 0
+
+
+def test_next_crawl_retries_what_is_left(catalog, tmp_path):
+    catalog.add('11111111-1111-1111-1111-111111111111', TITLE.format(bitness='x64', kb='KB5031354'), 'KB5031354')
+    catalog.failures['.msu'] = 404
+    crawlCatalog([CatalogQuery('KB5031354', '11', bitness='x64')], str(tmp_path))
+    assert [item.key for item in RetryQueue(str(tmp_path), 'catalog').pending()] == ['update:11111111-1111-1111-1111-111111111111']
+    del catalog.failures['.msu']
+
+    stats = crawlCatalog([], str(tmp_path))
+
+    assert stats.downloaded == 1
+    assert (tmp_path / 'Windows 11 22H2 x64 - KB5031354 - 2023-10.msu').exists()
+    assert len(RetryQueue(str(tmp_path), 'catalog')) == 0
+
+
+def test_unexpected_error_fails_the_item_and_the_crawl_goes_on(catalog, tmp_path, monkeypatch):
+    catalog.add('11111111-1111-1111-1111-111111111111', TITLE.format(bitness='x64', kb='KB5031354'), 'KB5031354')
+    parse = catalog_crawler.parseDownloadDialog
+    calls = []
+
+    def parseOnceUnexpected(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 1:
+            raise ValueError('Unexpected page layout')
+        return parse(*args, **kwargs)
+
+    monkeypatch.setattr(catalog_crawler, 'parseDownloadDialog', parseOnceUnexpected)
+
+    stats = crawlCatalog([CatalogQuery('KB5031354', '11', bitness='x64')], str(tmp_path))
+
+    assert (stats.failed, stats.retried, stats.downloaded, stats.pending_retries) == (1, 1, 1, 0)
+    assert (tmp_path / 'Windows 11 22H2 x64 - KB5031354 - 2023-10.msu').exists()
@@ -0,0 +1,43 @@
+import os
+import pytest
+from src.bench import bench_catalog
+from src.patch.catalog_parser import parseCatalogSearchPage
+from src.patch.patch_download import PatchDownloader
+
+
+def __fixture(name: str) -> str:
+    with open(os.path.join(bench_catalog.FIXTURES_DIR, name), 'r', encoding='UTF-8') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('benchmark', [b for b in bench_catalog.BENCHMARKS if b.compare_legacy], ids=lambda b: b.name)
+def test_parser_matches_the_legacy_regexes(benchmark):
+    html = __fixture(benchmark.fixture)
+
+    new = benchmark.normalize(benchmark.new(html))
+
+    assert new
+    assert new == benchmark.normalize(benchmark.legacy(html))
+
+
+def test_row_with_inner_markup_and_entities():
+    html = (
+        "<a id='11111111-2222-3333-4444-555555555555_link' href=\"javascript:void(0);\" onclick='goToDetails(\"11111111-2222-3333-4444-555555555555\");' class=\"contentTextItemSpacerNoBreakLink\">\n"
+        '    2023-10 Cumulative Update for Windows&nbsp;11 Version 22H2 for <b>x64</b>-based Systems (KB5031354)\n'
+        '</a>'
+    )
+
+    (fields, ) = parseCatalogSearchPage(html)
+
+    assert fields['link_id'] == '11111111-2222-3333-4444-555555555555'
+    assert (fields['windows_major'], fields['windows_minor'], fields['windows_bitness'], fields['kb_id']) == ('11', '22H2', 'x64', 'KB5031354')
+
+
+def test_dynamic_updates_need_allow_dynamic(monkeypatch):
+    html = __fixture('catalog_search_kb.html')
+    downloader = PatchDownloader('10', bitness='x64', query='KB5031356', data=html)
+
+    assert not any(patch.dynamic for patch in downloader.generatePatchDownloadUrls())
+
+    monkeypatch.setattr('src.utils.settings.Settings.s_allowed_to_download_dynamic_updates', True)
+    assert any(patch.dynamic for patch in downloader.generatePatchDownloadUrls())
@@ -0,0 +1,46 @@
+from types import SimpleNamespace
+import pytest
+from src.store import binary_catalog
+from src.store.binary_catalog import getBinaryCatalog
+
+
+def __deltaPatchModule():
+    try:
+        import src.patch.delta_patch as delta_patch
+    except Exception as ex:
+        pytest.skip(f'delta_patch is not importable here ({ex})')
+    return delta_patch
+
+
+def __extrapolateLegacyMsu(tmp_path, monkeypatch, file_names) -> str:
+    delta_patch = __deltaPatchModule()
+    extracted_dir = tmp_path / 'extracted'
+    extracted_dir.mkdir()
+    for name in file_names:
+        (extracted_dir / name).write_bytes(b'MZ')
+    msu_file = str(tmp_path / 'Windows 10 1809 x64 - KB5031361 - 2023-10.msu')
+    monkeypatch.setattr('src.utils.settings.Settings.s_output_dir', str(tmp_path / 'out'))
+    monkeypatch.setattr(binary_catalog, 'g_binary_catalogs', { })
+    monkeypatch.setattr(delta_patch, 'extractMsu', lambda *args, **kwargs: (delta_patch.MsuVersion.Win10, 'KB5031361', [str(extracted_dir / name) for name in file_names]))
+    monkeypatch.setattr(delta_patch, 'getKbTimeline', lambda: SimpleNamespace(findKbOfVersion=lambda version, kb: kb))
+    (tmp_path / 'out').mkdir()
+
+    delta_patch.extrapolateMsuFile(msu_file, SimpleNamespace(name=None, base_files_dir=None))
+    return msu_file
+
+
+def test_msu_is_recorded_once_every_file_is_extrapolated(tmp_path, monkeypatch):
+    msu_file = __extrapolateLegacyMsu(tmp_path, monkeypatch, ['amd64_microsoft-windows-ntdll_31bf3856ad364e35_10.0.17763.4974_none_0\\ntdll.dll'])
+
+    assert (tmp_path / 'out' / 'ntdll - 10.0.17763.4974 x64 - KB5031361.dll').exists()
+    assert getBinaryCatalog().isSourceComplete(msu_file)
+    binary_catalog.closeBinaryCatalogs()
+
+
+def test_msu_with_a_failed_file_is_not_recorded(tmp_path, monkeypatch):
+    msu_file = __extrapolateLegacyMsu(tmp_path, monkeypatch, ['amd64_microsoft-windows-ntdll_31bf3856ad364e35_10.0.17763.4974_none_0\\ntdll.dll', 'unexpected.dll'])
+
+    # The other file is still extrapolated, but the MSU is retried on the next run
+    assert (tmp_path / 'out' / 'ntdll - 10.0.17763.4974 x64 - KB5031361.dll').exists()
+    assert not getBinaryCatalog().isSourceComplete(msu_file)
+    binary_catalog.closeBinaryCatalogs()
@@ -0,0 +1,102 @@
+import hashlib
+import http.server
+import json
+import re
+import threading
+import pytest
+from src.utils import download
+from src.utils.download import DownloadException, downloadFile
+
+
+DATA = bytes(range(256)) * 40
+
+
+class RangeServer:
+    """
+    Serves DATA at /file, honoring single Range requests unless `ranges` is off.
+    """
+    def __init__(self, ranges: bool = True) -> None:
+        self.ranges = ranges
+        self.requested: list = []
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+                if not server.ranges or not match:
+                    server.requested.append(None)
+                    return self.reply(200, DATA)
+                start, end = int(match.group(1)), int(match.group(2) or len(DATA) - 1)
+                server.requested.append((start, end))
+                self.reply(206, DATA[start:end + 1], {'Content-Range': f'bytes {start}-{end}/{len(DATA)}'})
+
+            def reply(self, status: int, body: bytes, headers: dict = None):
+                self.send_response(status)
+                for name, value in (headers or { }).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.http = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.http.server_address[1]}/file'
+        threading.Thread(target=self.http.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.http.shutdown()
+        self.http.server_close()
+
+
+@pytest.fixture
+def small_segments(monkeypatch):
+    monkeypatch.setattr(download, 'SEGMENT_SIZE', 1024)
+
+
+def test_segments_are_downloaded_and_verified(tmp_path, small_segments):
+    server = RangeServer()
+    try:
+        destination = str(tmp_path / 'update.msu')
+        downloadFile(server.url, destination, expected_size=len(DATA), expected_sha1=hashlib.sha1(DATA).hexdigest(), workers=3)
+    finally:
+        server.close()
+    assert open(destination, 'rb').read() == DATA
+    assert sorted(tmp_path.iterdir()) == [tmp_path / 'update.msu']
+    # The probe, then one request per segment
+    assert len(server.requested) == 1 + 10
+
+
+def test_sha1_mismatch_discards_the_download(tmp_path, small_segments):
+    server = RangeServer()
+    try:
+        with pytest.raises(DownloadException):
+            downloadFile(server.url, str(tmp_path / 'update.msu'), expected_sha1='00' * 20)
+    finally:
+        server.close()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_interrupted_download_resumes_unfinished_segments(tmp_path, small_segments):
+    destination = tmp_path / 'update.msu'
+    server = RangeServer()
+    # The first two segments were written before the previous run stopped
+    (tmp_path / 'update.msu.part').write_bytes(DATA[:2048] + b'\x00' * (len(DATA) - 2048))
+    segments = [[start, min(start + 1024, len(DATA)), 1024 if start < 2048 else 0] for start in range(0, len(DATA), 1024)]
+    (tmp_path / 'update.msu.part.json').write_text(json.dumps({'version': download.DOWNLOAD_STATE_VERSION, 'url': server.url, 'size': len(DATA), 'segments': segments}))
+    try:
+        downloadFile(server.url, str(destination), expected_sha1=hashlib.sha1(DATA).hexdigest())
+    finally:
+        server.close()
+    assert destination.read_bytes() == DATA
+    assert all(start >= 2048 for start, _ in server.requested[1:])
+
+
+def test_servers_without_ranges_are_streamed(tmp_path):
+    server = RangeServer(ranges=False)
+    try:
+        downloadFile(server.url, str(tmp_path / 'update.msu'))
+    finally:
+        server.close()
+    assert (tmp_path / 'update.msu').read_bytes() == DATA
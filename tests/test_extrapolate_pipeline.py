@@ -0,0 +1,30 @@
+import os
+import threading
+import pytest
+from src.patch.extrapolate_pipeline import ExtrapolatePipeline
+
+
+def test_pipeline_extrapolates_every_update_once(tmp_path, monkeypatch):
+    try:
+        import src.patch.delta_patch as delta_patch
+    except Exception as ex:
+        pytest.skip(f'delta_patch is not importable here ({ex})')
+    extrapolated = []
+    lock = threading.Lock()
+    def extrapolateMsuFile(msu_path: str, args):
+        with lock:
+            extrapolated.append(os.path.basename(msu_path))
+        if msu_path.endswith('broken.msu'):
+            raise ValueError('corrupt cabinet')
+    monkeypatch.setattr(delta_patch, 'extrapolateMsuFile', extrapolateMsuFile)
+    paths = []
+    for name in ('a.msu', 'b.msu', 'broken.msu'):
+        (tmp_path / name).write_bytes(b'MSU')
+        paths.append(str(tmp_path / name))
+
+    with ExtrapolatePipeline(None, workers=2, queue_size=1, min_free_scratch=0, scratch_dir=str(tmp_path)) as pipeline:
+        for path in paths + paths[:1]:
+            pipeline.submit(path)
+
+    assert sorted(extrapolated) == ['a.msu', 'b.msu', 'broken.msu']
+    assert (pipeline.download_stats.items, pipeline.extrapolate_stats.items, pipeline.extrapolate_stats.failed) == (3, 3, 1)
@@ -0,0 +1,45 @@
+from src.utils import http
+from src.utils.http import TokenBucket, createSession
+
+
+def test_transient_failures_are_retried(catalog):
+    catalog.failures['/Search.aspx'] = [503, 429]
+
+    response = createSession().get(catalog.url + '/Search.aspx?q=KB5031354')
+
+    assert response.status_code == 200
+    assert len(catalog.requests) == 3
+
+
+def test_last_failure_is_returned_and_client_errors_are_not_retried(catalog):
+    catalog.failures['/Search.aspx'] = 503
+    catalog.failures['/missing'] = 404
+    session = createSession(retries=2)
+
+    assert session.get(catalog.url + '/Search.aspx?q=KB5031354').status_code == 503
+    assert session.get(catalog.url + '/missing').status_code == 404
+    assert len(catalog.requests) == 4
+
+
+def test_retry_after_is_honored_and_capped():
+    class Response:
+        headers = {'Retry-After': '7'}
+    assert http.parseRetryAfter(Response()) == 7.0
+    Response.headers = {'Retry-After': '86400'}
+    assert http.parseRetryAfter(Response()) == http.RETRY_AFTER_CAP
+
+
+def test_token_bucket_allows_bursts_then_paces(monkeypatch):
+    now = [0.0]
+    sleeps = []
+    def sleep(seconds: float):
+        sleeps.append(seconds)
+        now[0] += seconds
+    monkeypatch.setattr(http.time, 'monotonic', lambda: now[0])
+    monkeypatch.setattr(http.time, 'sleep', sleep)
+    bucket = TokenBucket(2.0, 3)
+
+    for _ in range(4):
+        bucket.acquire()
+
+    assert sleeps == [0.5]
@@ -0,0 +1,54 @@
+import pytest
+from src.utils.http_cache import HttpCache, HttpCacheMissException, getCacheTtl
+
+
+def test_fresh_responses_are_served_from_the_cache(http_root, tmp_path):
+    root, url = http_root
+    (root / 'Search.aspx').write_text('results')
+    cache = HttpCache(str(tmp_path / 'cache'))
+
+    first = cache.get(url + '/Search.aspx?q=KB5031354')
+    (root / 'Search.aspx').write_text('changed')
+    second = cache.get(url + '/Search.aspx?q=KB5031354')
+
+    assert not first.from_cache and second.from_cache
+    assert second.text == 'results'
+    assert (cache.misses, cache.hits) == (1, 1)
+
+
+def test_stale_responses_are_revalidated(http_root, tmp_path):
+    root, url = http_root
+    (root / 'page.html').write_text('history')
+    cache = HttpCache(str(tmp_path / 'cache'))
+    cache.get(url + '/page.html', ttl=3600)
+
+    # The file server answers If-Modified-Since with 304
+    response = cache.get(url + '/page.html', ttl=1e-9)
+
+    assert response.from_cache and response.text == 'history'
+    assert cache.revalidated == 1
+
+
+def test_failures_are_not_cached(http_root, tmp_path):
+    root, url = http_root
+    cache = HttpCache(str(tmp_path / 'cache'))
+    assert cache.get(url + '/Search.aspx', ttl=3600).status_code == 404
+    (root / 'Search.aspx').write_text('results')
+    assert cache.get(url + '/Search.aspx', ttl=3600).text == 'results'
+
+
+def test_offline_mode_serves_only_the_cache(http_root, tmp_path):
+    root, url = http_root
+    (root / 'DownloadDialog.aspx').write_text('dialog')
+    HttpCache(str(tmp_path / 'cache')).get(url + '/DownloadDialog.aspx')
+    offline = HttpCache(str(tmp_path / 'cache'), offline=True)
+
+    assert offline.get(url + '/DownloadDialog.aspx').text == 'dialog'
+    with pytest.raises(HttpCacheMissException):
+        offline.get(url + '/Search.aspx')
+
+
+def test_ttl_per_endpoint():
+    assert getCacheTtl('https://support.microsoft.com/en-us/topic/windows-11') > getCacheTtl('https://www.catalog.update.microsoft.com/DownloadDialog.aspx')
+    assert getCacheTtl('https://www.catalog.update.microsoft.com/DownloadDialog.aspx') > getCacheTtl('https://www.catalog.update.microsoft.com/Search.aspx?q=KB1')
+    assert getCacheTtl('https://example.com/file.msu') == 0
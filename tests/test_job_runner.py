@@ -0,0 +1,98 @@
+import argparse
+import json
+import threading
+import time
+import os
+import pytest
+from src.bench.generators import generatePsf
+from src.psf import psf_manifest
+from src.jobs.job_runner import JobFileException, JobRunner, loadJobFile
+from src.utils.settings import getOutputDirectory, getSettings
+
+
+def __writeJobs(tmp_path, jobs) -> str:
+    path = tmp_path / 'jobs.json'
+    path.write_text(json.dumps(jobs))
+    return str(path)
+
+
+def __parse(argv):
+    # "<command> [--out DIR] [fail]"
+    return argparse.Namespace(command=argv[0], out=argv[argv.index('--out') + 1] if '--out' in argv else None, fail='fail' in argv)
+
+
+def __applySettings(args):
+    if args.out:
+        getSettings().s_output_dir = args.out
+
+
+@pytest.fixture(autouse=True)
+def manifest_cache(monkeypatch):
+    # The runner enables the manifest cache for the rest of the process
+    monkeypatch.setattr(psf_manifest, 'g_manifest_cache', None)
+
+
+def test_job_file_validation(tmp_path):
+    jobs = loadJobFile(__writeJobs(tmp_path, {'jobs': [['sort', 'bin', 'a'], {'id': 'x', 'args': ['publish', 'b'], 'after': '1'}]}))
+    assert [(job.id, job.argv, job.after) for job in jobs] == [('1', ['sort', 'bin', 'a'], []), ('x', ['publish', 'b'], ['1'])]
+
+    with pytest.raises(JobFileException):
+        loadJobFile(__writeJobs(tmp_path, [{'id': 'a', 'args': ['sort']}, {'id': 'a', 'args': ['sort']}]))
+    with pytest.raises(JobFileException):
+        loadJobFile(__writeJobs(tmp_path, [{'args': ['sort'], 'after': ['missing']}]))
+    with pytest.raises(JobFileException):
+        loadJobFile(__writeJobs(tmp_path, [{'args': []}]))
+
+
+def test_dependencies_failures_and_cycles(tmp_path):
+    jobs = loadJobFile(__writeJobs(tmp_path, [
+        {'id': 'a', 'args': ['one']},
+        {'id': 'b', 'args': ['two', 'fail'], 'after': ['a']},
+        {'id': 'c', 'args': ['three'], 'after': ['b']},
+        {'id': 'd', 'args': ['four'], 'after': ['e']},
+        {'id': 'e', 'args': ['five'], 'after': ['d']},
+    ]))
+    order = []
+    def dispatch(args):
+        order.append(args.command)
+        if args.fail:
+            raise ValueError('broken')
+
+    unsuccessful = JobRunner(jobs, __parse, __applySettings, dispatch).run()
+
+    assert order == ['one', 'two']
+    assert {job.id: job.status for job in unsuccessful} == {'b': 'failed', 'c': 'skipped', 'd': 'failed', 'e': 'failed'}
+
+
+def test_jobs_with_other_settings_do_not_run_side_by_side(tmp_path):
+    jobs = loadJobFile(__writeJobs(tmp_path, [['a', '--out', 'first'], ['b', '--out', 'first'], ['c', '--out', 'second']]))
+    original_output = getOutputDirectory()
+    lock = threading.Lock()
+    running = []
+    overlaps = []
+    def dispatch(args):
+        with lock:
+            running.append(args)
+            overlaps.append({(other.command, getOutputDirectory()) for other in running})
+        time.sleep(0.05)
+        with lock:
+            running.remove(args)
+
+    assert JobRunner(jobs, __parse, __applySettings, dispatch, workers=3).run() == []
+
+    assert {('a', 'first'), ('b', 'first')} in overlaps
+    assert all(len({command for command, _ in overlap} & {'a', 'c'}) < 2 for overlap in overlaps)
+    assert ('c', 'second') in set().union(*overlaps)
+    assert getOutputDirectory() == original_output
+
+
+def test_manifest_cache_parses_a_changed_manifest_again(tmp_path):
+    _, manifest_path = generatePsf(str(tmp_path), 10)
+    psf_manifest.enableManifestCache()
+
+    first = psf_manifest.parsePsfExpressManifest(manifest_path, silent=True)
+    assert psf_manifest.parsePsfExpressManifest(manifest_path, silent=True) is first
+
+    stat = os.stat(manifest_path)
+    os.utime(manifest_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert psf_manifest.parsePsfExpressManifest(manifest_path, silent=True) is not first
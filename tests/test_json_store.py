@@ -0,0 +1,43 @@
+import json
+from src.utils.json_store import JsonStore
+
+
+def test_load_ignores_other_versions(tmp_path):
+    file_path = str(tmp_path / 'index.json')
+    JsonStore(file_path, 1, 'entries', 'index').write({'a': 1})
+    assert JsonStore(file_path, 1, 'entries', 'index').load({ }) == {'a': 1}
+    assert JsonStore(file_path, 2, 'entries', 'index').load({ }) == { }
+
+
+def test_load_ignores_broken_files(tmp_path):
+    file_path = tmp_path / 'index.json'
+    file_path.write_text('{"version": 1, "entries": ')
+    assert JsonStore(str(file_path), 1, 'entries', 'index').load({ }) == { }
+
+
+def test_top_level_state(tmp_path):
+    file_path = str(tmp_path / 'state.json')
+    JsonStore(file_path, 1, None, 'state').write({'url': 'http://localhost', 'size': 3})
+    with open(file_path, 'r', encoding='UTF-8') as f:
+        assert json.load(f) == {'version': 1, 'url': 'http://localhost', 'size': 3}
+    assert JsonStore(file_path, 1, None, 'state').load() == {'url': 'http://localhost', 'size': 3}
+
+
+def test_save_interval(tmp_path):
+    store = JsonStore(str(tmp_path / 'index.json'), 1, 'entries', 'index', save_interval=2)
+    assert not store.markDirty()
+    assert store.markDirty()
+    store.save({ })
+    assert not store.dirty and not store.markDirty()
+
+
+def test_sections_are_merged_on_save(tmp_path):
+    # Both consumers load the file before either saves
+    file_path = str(tmp_path / 'sections.json')
+    first = JsonStore(file_path, 1, 'sections', 'sections')
+    second = JsonStore(file_path, 1, 'sections', 'sections')
+    first.markDirty()
+    first.saveSection('first', {'a': 1})
+    second.markDirty()
+    second.saveSection('second', {'b': 2})
+    assert JsonStore(file_path, 1, 'sections', 'sections').load({ }) == {'first': {'a': 1}, 'second': {'b': 2}}
@@ -0,0 +1,84 @@
+import shutil
+from src.bench import bench_catalog
+from src.patch.get_kbs import WindowsVersionHistoryLinks
+from src.patch.kb_timeline import KbTimeline, splitBuild
+
+
+def __serveHistory(http_root, monkeypatch) -> str:
+    root, url = http_root
+    shutil.copy(f'{bench_catalog.FIXTURES_DIR}/update_history.html', root / 'update_history.html')
+    monkeypatch.setitem(WindowsVersionHistoryLinks.LOOKUP_BY_MAJOR, '10', url + '/update_history.html')
+    return url
+
+
+def test_split_build():
+    assert splitBuild('10.0.19045.3570') == (19045, 3570)
+    assert splitBuild('19045.3570') == (19045, 3570)
+    assert splitBuild('19045') is None
+
+
+def test_timeline_is_built_persisted_and_queried(http_root, tmp_path, monkeypatch):
+    __serveHistory(http_root, monkeypatch)
+    monkeypatch.setattr('src.utils.settings.Settings.s_http_cache_dir', str(tmp_path / 'http_cache'))
+    file_path = str(tmp_path / 'kb_timeline.json')
+    timeline = KbTimeline(file_path)
+
+    timeline.ensure(['10'])
+
+    release = timeline.getRelease('kb5031356')
+    assert (release.getDate(), release.builds) == ('2023-12', ['19045.3570'])
+    assert [release.kb for release in timeline.getKbsInBuildRange(19045, 3515, 3537)] == ['KB5031321', 'KB5031328', 'KB5031335']
+    assert timeline.getKbOfVersion('10.0.19045.3559') == 'KB5031349'
+    # Reloaded from the file, without the page
+    assert KbTimeline(file_path).getRelease('KB5031356').builds == ['19045.3570']
+
+
+def test_unchanged_page_is_not_parsed_again(http_root, tmp_path, monkeypatch):
+    __serveHistory(http_root, monkeypatch)
+    monkeypatch.setattr('src.utils.settings.Settings.s_http_cache_dir', str(tmp_path / 'http_cache'))
+    timeline = KbTimeline(str(tmp_path / 'kb_timeline.json'))
+
+    assert timeline.refresh('10') > 0
+    assert timeline.refresh('10') == 0
+    assert not timeline.isStale('10')
+
+
+def __staleTimeline(http_root, tmp_path, monkeypatch) -> tuple:
+    url = __serveHistory(http_root, monkeypatch)
+    monkeypatch.setattr(WindowsVersionHistoryLinks, 'LOOKUP_BY_MAJOR', {'10': url + '/update_history.html'})
+    monkeypatch.setattr('src.utils.settings.Settings.s_http_cache_dir', str(tmp_path / 'http_cache'))
+    file_path = str(tmp_path / 'kb_timeline.json')
+    KbTimeline(file_path).ensure()
+    # Every major of the saved timeline is stale
+    timeline = KbTimeline(file_path, ttl=0)
+    refreshed = []
+    refresh = timeline.refresh
+    monkeypatch.setattr(timeline, 'refresh', lambda major, force=False: refreshed.append(major) or refresh(major, force))
+    return timeline, refreshed
+
+
+def test_known_kbs_do_not_refresh(http_root, tmp_path, monkeypatch):
+    timeline, refreshed = __staleTimeline(http_root, tmp_path, monkeypatch)
+
+    assert timeline.findRelease('KB5031356').getDate() == '2023-12'
+    assert timeline.findKbOfVersion('10.0.19045.3559') == 'KB5031349'
+    # The timeline knows the KB being extrapolated, so it knows its earlier versions too
+    assert timeline.findKbOfVersion('10.0.19045.9999', 'KB5031356') == 'KB5031356'
+    assert refreshed == []
+
+
+def test_unknown_kbs_refresh_once(http_root, tmp_path, monkeypatch):
+    timeline, refreshed = __staleTimeline(http_root, tmp_path, monkeypatch)
+
+    assert timeline.findRelease('KB5099999') is None
+    assert timeline.findKbOfVersion('10.0.22631.9999', 'KB5099999') == 'KB5099999'
+    assert refreshed == ['10']
+
+
+def test_offline_does_not_refresh(http_root, tmp_path, monkeypatch):
+    timeline, refreshed = __staleTimeline(http_root, tmp_path, monkeypatch)
+    monkeypatch.setattr('src.utils.settings.Settings.s_offline', True)
+
+    assert timeline.findRelease('KB5099999') is None
+    assert timeline.findRelease('KB5031356').builds == ['19045.3570']
+    assert refreshed == []
@@ -0,0 +1,38 @@
+import pytest
+import main
+
+
+def __dispatchCommand(argv):
+    args = getattr(main, '__buildParser')().parse_args(argv)
+    getattr(main, '__dispatch')(args)
+
+
+def test_download_pdbs_does_not_need_download_options(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(main, 'downloadPdbsForDirectory', lambda *args: calls.append(args))
+
+    __dispatchCommand(['download', 'pdbs', str(tmp_path), '-j', '2'])
+
+    assert calls == [(str(tmp_path), None, 2)]
+
+
+def test_download_winbindex_does_not_need_download_options(monkeypatch):
+    calls = []
+    monkeypatch.setattr(main, 'fetchWinBIndexFiles', lambda *args: calls.append(args))
+
+    __dispatchCommand(['download', 'winbindex', 'ntoskrnl.exe', '-b', '22621', '-a', 'arm64'])
+
+    assert calls == [(['ntoskrnl.exe'], ['arm64'], [22621], False, None)]
+
+
+def test_run_jobs_fails_when_a_job_fails(tmp_path, monkeypatch):
+    job_file = tmp_path / 'jobs.json'
+    job_file.write_text('[]')
+    monkeypatch.setattr(main, 'runJobs', lambda *args: ['sort bin'])
+
+    with pytest.raises(SystemExit) as ex:
+        __dispatchCommand(['run-jobs', str(job_file)])
+
+    assert ex.value.code == 1
+    monkeypatch.setattr(main, 'runJobs', lambda *args: [])
+    __dispatchCommand(['run-jobs', str(job_file)])
@@ -0,0 +1,19 @@
+import json
+import os
+import subprocess
+import sys
+
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+# Only the commands which use them may import these
+HEAVY_MODULES = ('requests', 'pythoncom', 'win32com', 'tqdm', 'colorama', 'src.patch.delta_patch', 'src.patch.catalog_crawler', 'src.patch.extrapolate_pipeline',
+                 'src.utils.smart_exe', 'src.utils.metrics', 'src.utils.trace', 'src.jobs.job_runner', 'src.service.service')
+
+
+def test_help_does_not_import_the_commands_subsystems():
+    script = 'import json, sys, runpy\nsys.argv = ["main.py", "--help"]\ntry:\n    runpy.run_path("main.py", run_name="__main__")\nexcept SystemExit:\n    pass\nprint(json.dumps(sorted(sys.modules)))'
+    proc = subprocess.run([sys.executable, '-c', script], cwd=REPO_ROOT, capture_output=True, text=True)
+
+    assert proc.returncode == 0, proc.stderr
+    loaded = set(json.loads(proc.stdout.splitlines()[-1]))
+    assert [module for module in HEAVY_MODULES if module in loaded] == []
@@ -0,0 +1,53 @@
+import json
+import sys
+from src.externals.proc import run
+from src.utils.metrics import SUBPROCESSES, MetricsExporter, MetricsRegistry
+
+
+def __registry() -> MetricsRegistry:
+    registry = MetricsRegistry()
+    registry.counter('msus_processed_total', 'Updates').inc(outcome='ok')
+    registry.counter('msus_processed_total', 'Updates').inc(2, outcome='failed')
+    latency = registry.histogram('patch_seconds', 'Patch time', buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        latency.observe(value)
+    return registry
+
+
+def test_prometheus_textfile_is_replaced(tmp_path):
+    path = tmp_path / 'metrics' / 'symbol_manager.prom'
+
+    with MetricsExporter(str(path), interval=60, registry=__registry()):
+        pass
+
+    lines = path.read_text().splitlines()
+    assert 'symbol_manager_msus_processed_total{outcome="failed"} 2' in lines
+    assert 'symbol_manager_msus_processed_total{outcome="ok"} 1' in lines
+    assert [line for line in lines if line.startswith('symbol_manager_patch_seconds_bucket')] == [
+        'symbol_manager_patch_seconds_bucket{le="0.1"} 1',
+        'symbol_manager_patch_seconds_bucket{le="1"} 2',
+        'symbol_manager_patch_seconds_bucket{le="+Inf"} 3',
+    ]
+    assert 'symbol_manager_patch_seconds_count 3' in lines
+    assert [p.name for p in path.parent.iterdir()] == ['symbol_manager.prom']
+
+
+def test_json_lines_are_appended(tmp_path):
+    path = tmp_path / 'metrics.jsonl'
+    exporter = MetricsExporter(str(path), interval=60, registry=__registry())
+
+    exporter.write()
+    exporter.write()
+
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(records) == 2
+    assert records[-1]['metrics']['msus_processed_total'] == {'{outcome="ok"}': 1, '{outcome="failed"}': 2}
+    assert records[-1]['metrics']['patch_seconds']['count'] == 3
+
+
+def test_subprocesses_are_counted():
+    before = SUBPROCESSES.collect()
+    run([sys.executable, '-c', 'pass'])
+    after = SUBPROCESSES.collect()
+
+    assert sum(after.values()) == sum(before.values()) + 1
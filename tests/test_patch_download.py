@@ -0,0 +1,63 @@
+import os
+from src.patch.patch_download import CatalogPatch, PatchDownloader, parseDownloadDialog, requestDownloadDialog
+
+
+TITLE = '2023-10 Cumulative Update for Windows 11 Version 22H2 for x64-based Systems ({kb})'
+
+
+def __addUpdates(catalog, count: int):
+    return [catalog.add(f'{i:08}-1111-1111-1111-111111111111', TITLE.format(kb=f'KB50313{i:02}'), f'KB50313{i:02}') for i in range(count)]
+
+
+def __searchResult(link_id: str, kb: str, bitness: str) -> CatalogPatch:
+    return CatalogPatch({'link_id': link_id, 'kb_id': kb, 'patch_year': '2023', 'patch_month': '10', 'windows_major': '11',
+                         'windows_minor': '22H2', 'windows_bitness': bitness})
+
+
+def __dialogEntry(index: int, kb: str, bitness: str) -> str:
+    return (f"downloadInformation[{index}].enTitle ='2023-10 Cumulative Update for Windows 11 Version 22H2 for {bitness}-based Systems ({kb})';\n"
+            f"downloadInformation[{index}].files[0].url = 'https://catalog.s.download.windowsupdate.com/c/msdownload/update/software/secu/2023/10/"
+            f"windows11.0-{kb.lower()}-{bitness}_0123456789abcdef0123456789abcdef01234567.msu';\n")
+
+
+def test_bulk_download_resolves_a_batch_in_one_dialog_request(catalog, tmp_path):
+    __addUpdates(catalog, 3)
+
+    PatchDownloader('11', bitness='x64', query='2023-10 Cumulative').bulkDownload(str(tmp_path))
+
+    assert sorted(os.listdir(tmp_path)) == [f'Windows 11 22H2 x64 - KB50313{i:02} - 2023-10.msu' for i in range(3)]
+    assert [request for request in catalog.requests if request[0] == 'POST'] == [('POST', '/DownloadDialog.aspx')]
+
+
+def test_failed_dialog_entry_does_not_affect_the_rest(catalog):
+    updates = __addUpdates(catalog, 3)
+    searchResults = list({r.link_id: r for r in PatchDownloader('11', bitness='x64', query='2023-10 Cumulative').generatePatchDownloadUrls()}.values())
+    downloadDialog = requestDownloadDialog(searchResults)
+    # The second entry's link is mangled
+    downloadDialog = downloadDialog.replace(catalog.downloadUrl(updates[1]), 'https://localhost/broken')
+
+    resolved = parseDownloadDialog(downloadDialog, searchResults)
+
+    assert [patch.kb.upper() for patch in resolved] == ['KB5031300', 'KB5031302']
+    assert [patch.download_link for patch in resolved] == [catalog.downloadUrl(updates[0]), catalog.downloadUrl(updates[2])]
+
+
+def test_shared_kb_resolves_by_position():
+    searchResults = [__searchResult('id-x64', 'KB5031354', 'x64'), __searchResult('id-arm64', 'KB5031354', 'arm64')]
+    dialog = __dialogEntry(0, 'KB5031354', 'x64') + __dialogEntry(1, 'KB5031354', 'arm64')
+
+    resolved = parseDownloadDialog(dialog, searchResults)
+
+    assert [(patch.link_id, patch.bitness) for patch in resolved] == [('id-x64', 'x64'), ('id-arm64', 'arm64')]
+
+
+def test_shared_kb_out_of_position_is_unmatched():
+    searchResults = [__searchResult('id-other', 'KB5031356', 'x64'), __searchResult('id-x64', 'KB5031354', 'x64'), __searchResult('id-arm64', 'KB5031354', 'arm64')]
+
+    assert parseDownloadDialog(__dialogEntry(0, 'KB5031354', 'x64'), searchResults) == []
+
+
+def test_unique_kb_resolves_out_of_position():
+    searchResults = [__searchResult('id-other', 'KB5031356', 'x64'), __searchResult('id-x64', 'KB5031354', 'x64')]
+
+    assert [patch.link_id for patch in parseDownloadDialog(__dialogEntry(0, 'KB5031354', 'x64'), searchResults)] == ['id-x64']
@@ -0,0 +1,65 @@
+import os
+from src.symbols import pdb_index
+from src.symbols.pdb_index import PdbIndex, PdbStoreIndex
+
+
+def __writePdb(path, data: bytes = b'PDB') -> str:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return str(path)
+
+
+class __SignatureReader:
+    def __init__(self, signatures: dict) -> None:
+        self.signatures = signatures
+        self.reads = []
+
+    def __call__(self, path: str):
+        self.reads.append(os.path.basename(path))
+        return self.signatures[os.path.basename(path)]
+
+
+def test_lookup_by_name_signature_and_age(tmp_path):
+    store_dir = str(tmp_path / 'PDBs')
+    pdb_path = __writePdb(os.path.join(store_dir, 'ntkrnlmp.pdb', 'ABC1', 'ntkrnlmp.pdb'))
+    index = PdbIndex([store_dir], __SignatureReader({'ntkrnlmp.pdb': ('abc', 1)}))
+    index.refresh()
+    assert index.lookup('NTKRNLMP.pdb', 'ABC', 1) == pdb_path
+    assert index.lookup('ntkrnlmp.pdb', 'ABC', 2) is None
+
+
+def test_refresh_only_reads_new_or_changed_pdbs(tmp_path):
+    store_dir = str(tmp_path / 'PDBs')
+    __writePdb(os.path.join(store_dir, 'a.pdb'))
+    reader = __SignatureReader({'a.pdb': ('A', 1), 'b.pdb': ('B', 1)})
+    PdbIndex([store_dir], reader).refresh()
+    __writePdb(os.path.join(store_dir, 'b.pdb'))
+    # A new process loads the persisted signatures of the store
+    index = PdbIndex([store_dir], reader)
+    index.refresh()
+    assert reader.reads == ['a.pdb', 'b.pdb']
+    assert index.lookup('a.pdb', 'A', 1) and index.lookup('b.pdb', 'B', 1)
+
+
+def test_earlier_stores_take_precedence(tmp_path):
+    first = __writePdb(os.path.join(str(tmp_path / 'first'), 'a.pdb'))
+    __writePdb(os.path.join(str(tmp_path / 'second'), 'a.pdb'))
+    index = PdbIndex([str(tmp_path / 'first'), str(tmp_path / 'second')], __SignatureReader({'a.pdb': ('A', 1)}))
+    index.refresh()
+    assert index.lookup('a.pdb', 'A', 1) == first
+
+
+def test_recorded_pdbs_are_persisted_and_not_read_again(tmp_path, monkeypatch):
+    monkeypatch.setattr(pdb_index, 'INDEX_SAVE_INTERVAL', 2)
+    store_dir = str(tmp_path / 'PDBs')
+    reader = __SignatureReader({ })
+    store = PdbStoreIndex(store_dir, reader)
+    for name in ('a.pdb', 'b.pdb'):
+        store.record(__writePdb(os.path.join(store_dir, name, 'A1', name)), name[0].upper(), 1)
+
+    # Saved once the interval was reached, without an explicit save
+    index = PdbIndex([store_dir], reader)
+    index.refresh()
+    assert reader.reads == []
+    assert index.lookup('b.pdb', 'B', 1) == os.path.join(store_dir, 'b.pdb', 'A1', 'b.pdb')
@@ -0,0 +1,53 @@
+import json
+import os
+import uuid
+from src.symbols.pdb_index import PdbIndex
+from src.symbols.publish import SYMBOL_STORE_INDEX_FILE, publishSymbolStore
+from synthetic import buildPdb, buildPe
+
+
+GUID = uuid.UUID('3844dbb9-2017-4967-be1a-a4e5e6b2c6b0')
+
+
+def __writeSources(source_dir, pe: bytes = None):
+    source_dir.mkdir(exist_ok=True)
+    (source_dir / 'ntoskrnl.exe').write_bytes(pe or buildPe(0x5A1B2C3D, 0x1046000, 'ntkrnlmp.pdb', GUID, 3))
+    (source_dir / 'ntkrnlmp.pdb').write_bytes(buildPdb(GUID, 3))
+
+
+def __unexpectedRead(path: str):
+    raise AssertionError(f'{path} was read again')
+
+
+def test_publish_lays_out_the_symbol_server_paths(tmp_path):
+    store_dir = tmp_path / 'store'
+    __writeSources(tmp_path / 'src')
+
+    published = publishSymbolStore(str(tmp_path / 'src'), str(store_dir))
+
+    pdb_key = GUID.hex.upper() + '3'
+    assert sorted(item.request.getRelativePath() for item in published) == [
+        os.path.join('ntkrnlmp.pdb', pdb_key, 'ntkrnlmp.pdb'),
+        os.path.join('ntoskrnl.exe', '5A1B2C3D1046000', 'ntoskrnl.exe'),
+    ]
+    with open(store_dir / SYMBOL_STORE_INDEX_FILE, 'r', encoding='UTF-8') as f:
+        assert f'ntkrnlmp.pdb/{pdb_key}/ntkrnlmp.pdb' in json.load(f)['files']
+    # The published PDB is already indexed, a lookup does not need to read it again
+    index = PdbIndex([str(store_dir)], __unexpectedRead)
+    index.refresh()
+    assert index.lookup('ntkrnlmp.pdb', GUID.hex, 3) == str(store_dir / 'ntkrnlmp.pdb' / pdb_key / 'ntkrnlmp.pdb')
+
+
+def test_publish_skips_duplicates_and_reports_conflicts(tmp_path):
+    store_dir = tmp_path / 'store'
+    __writeSources(tmp_path / 'first')
+    publishSymbolStore(str(tmp_path / 'first'), str(store_dir))
+    __writeSources(tmp_path / 'second')
+    assert publishSymbolStore(str(tmp_path / 'second'), str(store_dir)) == []
+
+    # Same store key, different content
+    changed = bytearray(buildPe(0x5A1B2C3D, 0x1046000, 'ntkrnlmp.pdb', GUID, 3))
+    changed[-1] = 1
+    __writeSources(tmp_path / 'third', bytes(changed))
+    assert publishSymbolStore(str(tmp_path / 'third'), str(store_dir)) == []
+    assert (store_dir / 'ntoskrnl.exe' / '5A1B2C3D1046000' / 'ntoskrnl.exe').read_bytes() == (tmp_path / 'first' / 'ntoskrnl.exe').read_bytes()
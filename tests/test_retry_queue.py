@@ -0,0 +1,26 @@
+from src.utils.retry_queue import RetryQueue
+
+
+def test_consumers_keep_each_others_sections(tmp_path):
+    catalog = RetryQueue(str(tmp_path), 'catalog')
+    symbols = RetryQueue(str(tmp_path), 'symbols')
+    with catalog:
+        catalog.push('search:KB5031354', {'query': 'KB5031354'}, 'timed out')
+    with symbols:
+        symbols.push('pdb:ntdll.pdb', {'name': 'ntdll.pdb'})
+
+    assert [item.key for item in RetryQueue(str(tmp_path), 'catalog').pending()] == ['search:KB5031354']
+    assert [item.key for item in RetryQueue(str(tmp_path), 'symbols').pending()] == ['pdb:ntdll.pdb']
+
+
+def test_attempts_are_counted_until_the_item_succeeds(tmp_path):
+    with RetryQueue(str(tmp_path), 'catalog') as retry_queue:
+        retry_queue.push('update:1', {'update_id': '1'}, 'first')
+        retry_queue.push('update:1', {'update_id': '1'}, 'second')
+    (item, ) = RetryQueue(str(tmp_path), 'catalog').pending()
+    assert (item.attempts, item.last_error) == (2, 'second')
+
+    with RetryQueue(str(tmp_path), 'catalog') as retry_queue:
+        retry_queue.remove('update:1')
+
+    assert len(RetryQueue(str(tmp_path), 'catalog')) == 0
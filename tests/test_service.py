@@ -0,0 +1,95 @@
+import json
+import sys
+import threading
+import time
+import types
+import urllib.error
+import urllib.request
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import ThreadingHTTPServer
+import pytest
+from src.service.server import ServiceRequestHandler
+from src.service.service import ExtractionService
+
+
+class FakeBaseResolver:
+    """
+    Stands in for the WinBIndex base resolver: "fetches" a file into the store once `release` is set.
+    """
+    def __init__(self, output_dir) -> None:
+        self.output_dir = output_dir
+        self.release = threading.Event()
+        self.requests = []
+
+    def request(self, base_name: str, extension: str, version: str, arch: str) -> Future:
+        self.requests.append((base_name, extension, version, arch))
+        future = Future()
+        def fetch():
+            self.release.wait(5)
+            if version.endswith('.404'):
+                return future.set_result(None)
+            path = self.output_dir / f'{base_name} - {version} {arch}{extension}'
+            path.write_bytes(b'MZ fetched')
+            future.set_result(str(path))
+        threading.Thread(target=fetch, daemon=True).start()
+        return future
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    (tmp_path / 'ntdll - 10.0.22621.1 x64.dll').write_bytes(b'MZ stored')
+    resolver = FakeBaseResolver(tmp_path)
+    monkeypatch.setitem(sys.modules, 'src.patch.base_resolver', types.SimpleNamespace(getBaseResolver=lambda output_dir: resolver))
+    monkeypatch.setattr('src.psf.psf_manifest.g_manifest_cache', None)
+    monkeypatch.setattr(ServiceRequestHandler, 'service', ExtractionService(str(tmp_path)))
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ServiceRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield f'http://127.0.0.1:{server.server_address[1]}', resolver
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def __get(url: str):
+    try:
+        with urllib.request.urlopen(url, timeout=10) as response:
+            return response.status, response.headers, response.read()
+    except urllib.error.HTTPError as ex:
+        return ex.code, ex.headers, ex.read()
+
+
+def test_stored_files_are_served(service):
+    url, _ = service
+
+    status, headers, body = __get(url + '/file?name=NTDLL.dll&arch=amd64&version=10.0.22621.1')
+    assert (status, headers['X-File-Source'], body) == (200, 'store', b'MZ stored')
+
+    status, _, body = __get(url + '/locate?name=ntdll.dll&arch=x64&version=10.0.22621.1')
+    assert (status, json.loads(body)['source']) == (200, 'store')
+
+    assert __get(url + '/file?name=ntdll.dll&arch=x64&version=22621')[0] == 400
+    assert __get(url + '/file?name=..%2Fntdll.dll&arch=x64&version=10.0.22621.1')[0] == 400
+    assert json.loads(__get(url + '/health')[2]) == {'status': 'ok'}
+
+
+def test_missing_files_are_produced_once(service):
+    url, resolver = service
+    file_url = url + '/file?name=ntdll.dll&arch=x64&version=10.0.22621.2506'
+
+    with ThreadPoolExecutor(4) as pool:
+        futures = [pool.submit(__get, file_url) for _ in range(4)]
+        # Every request waits on the production before it is allowed to finish
+        while ServiceRequestHandler.service.getStats()['requests'] < 4:
+            time.sleep(0.01)
+        time.sleep(0.1)
+        resolver.release.set()
+        responses = [future.result() for future in futures]
+
+    assert [(status, headers['X-File-Source'], body) for status, headers, body in responses] == [(200, 'winbindex', b'MZ fetched')] * 4
+    assert resolver.requests == [('ntdll', '.dll', '10.0.22621.2506', 'x64')]
+    assert __get(url + '/file?name=ntdll.dll&arch=x64&version=10.0.22621.2506')[1]['X-File-Source'] == 'store'
+
+    assert __get(url + '/file?name=ntdll.dll&arch=x64&version=10.0.22621.404')[0] == 404
+    stats = json.loads(__get(url + '/stats')[2])
+    assert (stats['winbindex'], stats['store'], stats['unavailable']) == (4, 1, 1)
@@ -0,0 +1,52 @@
+import uuid
+import pytest
+from src.symbols.pdb import PdbFormatException, readPdbSignature
+from src.symbols.pe import PeFormatException, isPeFile, readPeDebugInfo
+from synthetic import buildPdb, buildPe
+
+
+GUID = uuid.UUID('3844dbb9-2017-4967-be1a-a4e5e6b2c6b0')
+
+
+def test_pdb_signature_uses_the_dbi_age(tmp_path):
+    pdb_path = tmp_path / 'ntkrnlmp.pdb'
+    pdb_path.write_bytes(buildPdb(GUID, 3, pdb_info_age=5))
+    signature = readPdbSignature(str(pdb_path))
+    assert signature.signature == '3844DBB920174967BE1AA4E5E6B2C6B0'
+    assert signature.age == 3
+    assert signature.pdb_info_age == 5
+
+
+def test_not_a_pdb(tmp_path):
+    pdb_path = tmp_path / 'broken.pdb'
+    pdb_path.write_bytes(b'Microsoft C/C++ program database 2.00\r\n'.ljust(1024, b'\x00'))
+    with pytest.raises(PdbFormatException):
+        readPdbSignature(str(pdb_path))
+
+
+def test_pe_debug_info_matches_its_pdb(tmp_path):
+    pe_path = tmp_path / 'ntoskrnl.exe'
+    pe_path.write_bytes(buildPe(0x5A1B2C3D, 0x1046000, r'd:\os\obj\ntkrnlmp.pdb', GUID, 3))
+    pdb_path = tmp_path / 'ntkrnlmp.pdb'
+    pdb_path.write_bytes(buildPdb(GUID, 3))
+    info = readPeDebugInfo(str(pe_path))
+    assert info.machine_type == 'X64'
+    assert info.pdb_name == 'ntkrnlmp.pdb'
+    assert info.getPeStoreKey() == '5A1B2C3D1046000'
+    assert info.getPdbStoreKey() == readPdbSignature(str(pdb_path)).signature + '3'
+
+
+def test_pe_without_codeview(tmp_path):
+    pe_path = tmp_path / 'a.dll'
+    pe_path.write_bytes(buildPe(0x10, 0x2000))
+    info = readPeDebugInfo(str(pe_path))
+    assert info.pdb_name is None and info.getPdbStoreKey() is None
+    assert isPeFile(str(pe_path))
+
+
+def test_not_a_pe(tmp_path):
+    path = tmp_path / 'a.txt'
+    path.write_bytes(b'text' * 32)
+    assert not isPeFile(str(path))
+    with pytest.raises(PeFormatException):
+        readPeDebugInfo(str(path))
@@ -0,0 +1,68 @@
+import os
+import pytest
+from src.sort.ledger import LedgerOutcome, SortLedger
+
+
+def __writeFile(path: str, data: bytes = b'MZ') -> str:
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def test_both_passes_keep_their_sections(tmp_path):
+    # sortBinaries opens both ledgers before walking, then saves them one after the other
+    output_dir = str(tmp_path)
+    bin_file = __writeFile(os.path.join(output_dir, 'a.dll'))
+    winsxs_file = __writeFile(os.path.join(output_dir, 'b.dll'))
+    bin_ledger = SortLedger(output_dir, 'bin')
+    winsxs_ledger = SortLedger(output_dir, 'winsxs')
+    with bin_ledger:
+        bin_ledger.record(bin_file, 'a.dll', LedgerOutcome.Processed)
+    with winsxs_ledger:
+        winsxs_ledger.record(winsxs_file, 'b.dll', LedgerOutcome.Processed)
+
+    assert SortLedger(output_dir, 'bin').isUpToDate(bin_file, output_dir)
+    assert SortLedger(output_dir, 'winsxs').isUpToDate(winsxs_file, output_dir)
+
+
+def test_sort_bin_skips_files_of_the_previous_run(tmp_path, monkeypatch):
+    try:
+        import src.sort.sort as sort
+    except Exception as ex:
+        pytest.skip(f'sort is not importable here ({ex})')
+    input_dir = tmp_path / 'in'
+    output_dir = tmp_path / 'out'
+    input_dir.mkdir()
+    output_dir.mkdir()
+    __writeFile(str(input_dir / 'ntdll.dll'))
+    parsed = []
+    def getBinaryFileNameWithVersion(path: str) -> str:
+        parsed.append(path)
+        return 'ntdll - 10.0.22621.1 x64.dll'
+    monkeypatch.setattr(sort, 'getBinaryFileNameWithVersion', getBinaryFileNameWithVersion)
+    # The sorted files are recorded in the binary catalog of the output directory
+    monkeypatch.setattr('src.utils.settings.Settings.s_output_dir', str(output_dir))
+    monkeypatch.setattr('src.store.binary_catalog.g_binary_catalogs', { })
+
+    sort.sortBinaries(str(input_dir), str(output_dir))
+    sort.sortBinaries(str(input_dir), str(output_dir))
+    assert len(parsed) == 1
+    from src.store.binary_catalog import closeBinaryCatalogs
+    closeBinaryCatalogs()
+
+
+def test_failed_missing_and_rescanned_files_are_not_up_to_date(tmp_path):
+    output_dir = str(tmp_path)
+    failed_file = __writeFile(os.path.join(output_dir, 'a.dll'))
+    processed_file = __writeFile(os.path.join(output_dir, 'b.dll'))
+    __writeFile(os.path.join(output_dir, 'b - 10.0.22621.1 x64.dll'))
+    with SortLedger(output_dir, 'bin') as ledger:
+        ledger.record(failed_file, '', LedgerOutcome.Failed)
+        ledger.record(processed_file, 'b - 10.0.22621.1 x64.dll', LedgerOutcome.Processed)
+
+    ledger = SortLedger(output_dir, 'bin')
+    assert not ledger.isUpToDate(failed_file, output_dir)
+    assert ledger.isUpToDate(processed_file, output_dir)
+    assert not SortLedger(output_dir, 'bin', rescan=True).isUpToDate(processed_file, output_dir)
+    os.remove(os.path.join(output_dir, 'b - 10.0.22621.1 x64.dll'))
+    assert not ledger.isUpToDate(processed_file, output_dir)
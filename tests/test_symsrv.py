@@ -0,0 +1,100 @@
+import os
+import uuid
+import pytest
+from src.externals.proc import ExternalProcedureException
+from src.symbols import symsrv
+from src.symbols.symsrv import SymbolServerFetcher, downloadPdbsForDirectory, makePdbRequest
+from src.utils.settings import Settings
+from synthetic import buildPdb, buildPe
+
+
+GUID_PLAIN = uuid.UUID('11111111-2222-3333-4444-555555555555')
+GUID_COMPRESSED = uuid.UUID('66666666-7777-8888-9999-aaaaaaaaaaaa')
+GUID_MISSING = uuid.UUID('bbbbbbbb-cccc-dddd-eeee-ffffffffffff')
+
+
+def __publish(root, pdb_name: str, store_key: str, served_name: str, data: bytes):
+    path = root / pdb_name / store_key / served_name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+
+
+def __fakeExpand(data: bytes):
+    # Stands in for 7z, which expands the CAB compressed .pd_ into the directory
+    def z7ExtractFiles(archive_path: str, output_dir: str, *args, **kwargs):
+        name = os.path.basename(archive_path).split('.')[0] + '.pdb'
+        with open(os.path.join(output_dir, name), 'wb') as f:
+            f.write(data)
+        return [name]
+    return z7ExtractFiles
+
+
+def test_download_pdbs_of_a_directory(http_root, tmp_path, monkeypatch):
+    root, url = http_root
+    __publish(root, 'plain.pdb', GUID_PLAIN.hex.upper() + '1', 'plain.pdb', buildPdb(GUID_PLAIN, 1))
+    __publish(root, 'packed.pdb', GUID_COMPRESSED.hex.upper() + '2', 'packed.pd_', b'MSCF')
+    monkeypatch.setattr(symsrv, 'z7ExtractFiles', __fakeExpand(buildPdb(GUID_COMPRESSED, 2)))
+    binaries = tmp_path / 'bin'
+    binaries.mkdir()
+    (binaries / 'plain.dll').write_bytes(buildPe(1, 0x2000, 'plain.pdb', GUID_PLAIN, 1))
+    (binaries / 'packed.dll').write_bytes(buildPe(2, 0x2000, 'packed.pdb', GUID_COMPRESSED, 2))
+    (binaries / 'missing.dll').write_bytes(buildPe(3, 0x2000, 'missing.pdb', GUID_MISSING, 1))
+    store = tmp_path / 'PDBs'
+    monkeypatch.setattr(Settings, 's_remote_pdb_store', url)
+    monkeypatch.setattr(Settings, 's_local_pdbs_dir', str(store))
+
+    downloaded = downloadPdbsForDirectory(str(binaries), max_workers=2)
+
+    assert sorted(os.path.relpath(path, store) for path in downloaded) == [
+        os.path.join('packed.pdb', GUID_COMPRESSED.hex.upper() + '2', 'packed.pdb'),
+        os.path.join('plain.pdb', GUID_PLAIN.hex.upper() + '1', 'plain.pdb'),
+    ]
+    # Nothing partial is left in the store, and the missing PDB leaves no empty directories
+    assert sorted(os.listdir(store)) == ['packed.pdb', 'plain.pdb']
+    assert os.listdir(store / 'packed.pdb' / (GUID_COMPRESSED.hex.upper() + '2')) == ['packed.pdb']
+
+
+def test_fetch_many_reports_missing_files(http_root, tmp_path):
+    root, url = http_root
+    __publish(root, 'plain.pdb', GUID_PLAIN.hex.upper() + '1', 'plain.pdb', buildPdb(GUID_PLAIN, 1))
+    fetcher = SymbolServerFetcher(url, str(tmp_path / 'PDBs'), max_workers=2)
+    found = makePdbRequest('plain.pdb', GUID_PLAIN.hex, 1)
+    missing = makePdbRequest('missing.pdb', GUID_MISSING.hex, 1)
+
+    results = fetcher.fetchMany([found, missing, found])
+
+    assert results[found] == fetcher.getLocalPath(found)
+    assert isinstance(results[missing], symsrv.SymbolServerException)
+    assert fetcher.in_flight == { }
+
+
+def test_pdb_of_another_guid_or_age_is_not_stored(http_root, tmp_path):
+    root, url = http_root
+    __publish(root, 'plain.pdb', GUID_PLAIN.hex.upper() + '1', 'plain.pdb', buildPdb(GUID_MISSING, 1))
+    __publish(root, 'aged.pdb', GUID_PLAIN.hex.upper() + '1', 'aged.pdb', buildPdb(GUID_PLAIN, 2))
+    fetcher = SymbolServerFetcher(url, str(tmp_path / 'PDBs'))
+
+    for name in ('plain.pdb', 'aged.pdb'):
+        request = makePdbRequest(name, GUID_PLAIN.hex, 1)
+        with pytest.raises(symsrv.SymbolServerException):
+            fetcher.fetch(request)
+        assert os.listdir(os.path.dirname(fetcher.getLocalPath(request))) == []
+    assert fetcher.in_flight == { }
+
+
+def test_failed_expansion_leaves_nothing_behind(http_root, tmp_path, monkeypatch):
+    root, url = http_root
+    __publish(root, 'packed.pdb', GUID_COMPRESSED.hex.upper() + '2', 'packed.pd_', b'MSCF')
+    def z7ExtractFiles(*args, **kwargs):
+        raise ExternalProcedureException('Data error')
+    monkeypatch.setattr(symsrv, 'z7ExtractFiles', z7ExtractFiles)
+    fetcher = SymbolServerFetcher(url, str(tmp_path / 'PDBs'))
+    request = makePdbRequest('packed.pdb', GUID_COMPRESSED.hex, 2)
+
+    with pytest.raises(symsrv.SymbolServerException):
+        fetcher.fetch(request)
+
+    assert os.listdir(os.path.dirname(fetcher.getLocalPath(request))) == []
+    # The corrupt download is not resumed, the next fetch downloads it again
+    monkeypatch.setattr(symsrv, 'z7ExtractFiles', __fakeExpand(buildPdb(GUID_COMPRESSED, 2)))
+    assert fetcher.fetch(request) == fetcher.getLocalPath(request)
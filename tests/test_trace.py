@@ -0,0 +1,62 @@
+import json
+import os
+import sys
+import threading
+import pytest
+from src.bench.generators import generatePsf
+from src.externals.proc import ExternalProcedureException, run
+from src.psf.psf_manifest import parsePsfExpressManifest
+from src.utils import trace
+from src.utils.trace import startTracing, stopTracing, traceSpan
+
+
+def __events(path) -> list:
+    with open(path, 'r', encoding='UTF-8') as f:
+        return json.load(f)['traceEvents']
+
+
+def test_spans_are_recorded_per_thread(tmp_path):
+    assert not traceSpan('off')
+    startTracing()
+    try:
+        with traceSpan('outer', 'test', file='a') as span:
+            span.addBytes(3)
+            span.addBytes(4)
+        def worker():
+            with traceSpan('worker', 'test'):
+                pass
+        thread = threading.Thread(target=worker, name='worker-thread')
+        thread.start()
+        thread.join()
+        with pytest.raises(ValueError):
+            with traceSpan('failing', 'test'):
+                raise ValueError('broken')
+    finally:
+        stopTracing(str(tmp_path / 'trace.json'))
+    assert trace.g_tracer is None
+
+    events = {event['name']: event for event in __events(tmp_path / 'trace.json') if event['ph'] == 'X'}
+    thread_names = [event['args']['name'] for event in __events(tmp_path / 'trace.json') if event['ph'] == 'M']
+
+    assert events['outer']['args'] == {'file': 'a', 'bytes': 7}
+    assert events['worker']['tid'] != events['outer']['tid']
+    assert 'worker-thread' in thread_names
+    assert events['failing']['args']['error'] == 'ValueError: broken'
+
+
+def test_processes_and_manifests_are_traced(tmp_path):
+    _, manifest_path = generatePsf(str(tmp_path), 10)
+    startTracing()
+    try:
+        run([sys.executable, '-c', 'pass'])
+        with pytest.raises(ExternalProcedureException):
+            run([sys.executable, '-c', 'raise SystemExit(3)'])
+        parsePsfExpressManifest(manifest_path, silent=True)
+    finally:
+        stopTracing(str(tmp_path / 'trace.json'))
+
+    events = [event for event in __events(tmp_path / 'trace.json') if event['ph'] == 'X']
+
+    assert [event['args']['returncode'] for event in events if event['cat'] == 'proc'] == [0, 3]
+    (manifest, ) = [event for event in events if event['name'] == 'parsePsfExpressManifest']
+    assert manifest['args']['bytes'] == os.path.getsize(manifest_path)
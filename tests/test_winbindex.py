@@ -0,0 +1,105 @@
+import gzip
+import hashlib
+import io
+import json
+import pytest
+
+
+def __winbindexModule():
+    try:
+        import src.externals.winbindex as winbindex
+    except Exception as ex:
+        pytest.skip(f'winbindex is not importable here ({ex})')
+    return winbindex
+
+
+def __info(version: str, arch: str = 'amd64', data: bytes = b'MZ', timestamp: int = 0x1234567, virtual_size: int = 0x2000) -> dict:
+    return {
+        'fileInfo': {'size': len(data), 'timestamp': timestamp, 'virtualSize': virtual_size, 'sha256': hashlib.sha256(data).hexdigest()},
+        'windowsVersions': {'11-22H2': {'KB5031354': {'assemblies': {'amd64_ntdll': {'assemblyIdentity': {'version': version, 'processorArchitecture': arch}}}}}},
+    }
+
+
+def test_json_object_is_read_one_value_at_a_time():
+    winbindex = __winbindexModule()
+    document = {'a': {'nested': [1, 2, {'b': 'c'}]}, 'long': 12345678901234567890, 'text': 'x, y: }'}
+
+    items = list(winbindex.iterateJsonObject(io.StringIO(json.dumps(document, indent=1)), read_size=3))
+
+    assert items == list(document.items())
+    assert list(winbindex.iterateJsonObject(io.StringIO('{ }'))) == []
+    with pytest.raises(winbindex.WinBIndexException):
+        list(winbindex.iterateJsonObject(io.StringIO('{"a": 1'), read_size=2))
+
+
+def test_arm64_entries_are_kept_but_not_their_wow_flavours():
+    winbindex = __winbindexModule()
+
+    assert winbindex.WinBIndexEntry.fromInfo('00' * 32, 'ntdll.dll', __info('10.0.22621.1', arch='arm64')).getOutputName() == 'ntdll - 10.0.22621.1 arm64.dll'
+    assert winbindex.WinBIndexEntry.fromInfo('00' * 32, 'ntdll.dll', __info('10.0.22621.1', arch='arm64.x86')) is None
+    assert winbindex.WinBIndexFilter(['arm64']).matches(winbindex.WinBIndexEntry.fromInfo('00' * 32, 'ntdll.dll', __info('10.0.22621.1', arch='arm64')))
+
+
+def test_info_helpers_of_the_old_module(monkeypatch):
+    winbindex = __winbindexModule()
+    monkeypatch.setattr('src.utils.settings.Settings.s_remote_pdb_store', 'https://symbols')
+    info = __info('10.0.20348.1')
+    info['windowsVersions']['11-22H2']['KB5031354']['assemblies']['amd64_ntdll']['attributes'] = [{'name': 'ntdll.dll'}]
+
+    assert winbindex.generateFileName(info) == 'ntdll - 10.0.20348.1 x64.dll'
+    assert winbindex.generateDownloadUrl(info) == 'https://symbols/ntdll.dll/12345672000/ntdll.dll'
+    assert winbindex.isWinBinDexFileBase(info) and winbindex.isWinBinDexFileBase(info, [20348])
+    assert not winbindex.isWinBinDexFileBase(info, [22621])
+    assert not winbindex.isWinBinDexFileBase(__info('10.0.20348.2'))
+
+
+def test_download_url_uses_the_symbol_server_key_of_the_binary(monkeypatch):
+    winbindex = __winbindexModule()
+    from src.symbols.pe import PeDebugInfo
+    monkeypatch.setattr('src.utils.settings.Settings.s_remote_pdb_store', 'https://symbols')
+
+    entry = winbindex.WinBIndexEntry.fromInfo('00' * 32, 'ntdll.dll', __info('10.0.22621.1', timestamp=0x1234567, virtual_size=0x2000))
+
+    assert entry.getDownloadUrl() == 'https://symbols/ntdll.dll/12345672000/ntdll.dll'
+    assert PeDebugInfo('X64', 0x1234567, 0x2000).getPeStoreKey() == '12345672000'
+
+
+def test_fetch_downloads_selected_binaries_once(http_root, tmp_path, monkeypatch):
+    winbindex = __winbindexModule()
+    root, url = http_root
+    base = b'MZ base'
+    entries = {
+        hashlib.sha256(base).hexdigest(): __info('10.0.22621.1', data=base),
+        hashlib.sha256(b'MZ update').hexdigest(): __info('10.0.22621.2428', data=b'MZ update', timestamp=0x7654321),
+        hashlib.sha256(b'MZ x86').hexdigest(): __info('10.0.22621.1', arch='x86', data=b'MZ x86', timestamp=0x1111111),
+    }
+    (root / 'index').mkdir()
+    (root / 'index' / 'ntdll.dll.json.gz').write_bytes(gzip.compress(json.dumps(entries).encode()))
+    monkeypatch.setattr('src.utils.settings.Settings.s_winbindex_url', url + '/index')
+    monkeypatch.setattr('src.utils.settings.Settings.s_remote_pdb_store', url + '/symbols')
+    monkeypatch.setattr('src.utils.settings.Settings.s_http_cache_dir', str(tmp_path / 'http_cache'))
+    for sha256, info in entries.items():
+        entry = winbindex.WinBIndexEntry.fromInfo(sha256, 'ntdll.dll', info)
+        binary = root / entry.getDownloadUrl()[len(url) + 1:]
+        binary.parent.mkdir(parents=True)
+        binary.write_bytes(base if info['fileInfo']['timestamp'] == 0x1234567 else b'MZ other')
+    output_dir = tmp_path / 'out'
+    monkeypatch.setattr('src.utils.settings.Settings.s_output_dir', str(output_dir))
+    monkeypatch.setattr('src.store.binary_catalog.g_binary_catalogs', { })
+
+    stats = winbindex.WinBIndexClient(output_dir=str(output_dir)).fetch(['ntdll.dll'], winbindex.WinBIndexFilter(['x64'], base_only=True))
+
+    assert [path.name for path in output_dir.iterdir() if not path.name.startswith('.')] == ['ntdll - 10.0.22621.1 x64.dll']
+    assert (output_dir / 'ntdll - 10.0.22621.1 x64.dll').read_bytes() == base
+    assert (stats.indexes, stats.entries, stats.selected, stats.downloaded) == (1, 3, 1, 1)
+
+    # The cached index is reused and the binary is already present
+    stats = winbindex.WinBIndexClient(output_dir=str(output_dir)).fetch(['ntdll.dll'], winbindex.WinBIndexFilter(['x64'], base_only=True))
+    assert (stats.indexes, stats.cached_indexes, stats.present) == (0, 1, 1)
+
+    # The other x86 file does not match its hash
+    stats = winbindex.WinBIndexClient(output_dir=str(output_dir)).fetch(['ntdll.dll'], winbindex.WinBIndexFilter(['x86']))
+    assert (stats.downloaded, stats.failed) == (0, 1)
+    from src.store.binary_catalog import closeBinaryCatalogs, getBinaryCatalog
+    assert [row['name'] for row in getBinaryCatalog().query()] == ['ntdll - 10.0.22621.1 x64.dll']
+    closeBinaryCatalogs()